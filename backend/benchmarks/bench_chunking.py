@@ -0,0 +1,72 @@
+"""
+文本切分效能測試：驗證 chunk_text 對頁數為線性時間
+
+產生指定頁數的合成文本（與 parse_pdf 相同的 [Page N] 格式），
+量測每頁平均耗時；線性時間下各頁數的每頁耗時應大致相同。
+
+使用方式（於 backend 目錄）：
+    python -m benchmarks.bench_chunking --pages 125 250 500 1000
+"""
+
+import argparse
+import sys
+import time
+
+from rag.chunking import ChunkingConfig, chunk_text
+
+SAMPLE_PARAGRAPH = (
+    "This thesis examines the effect of scaffolding on novice researchers. "
+    "本研究探討鷹架策略對初學研究者的影響，並分析其在文獻閱讀中的應用。 "
+)
+
+
+def build_sample_content(pages: int, lines_per_page: int = 45) -> str:
+    """產生每頁 lines_per_page 行的合成文本"""
+    return "\n\n".join(
+        f"[Page {page_num + 1}]\n" + "\n".join(
+            f"{page_num + 1}.{line} {SAMPLE_PARAGRAPH}" for line in range(lines_per_page)
+        )
+        for page_num in range(pages)
+    )
+
+
+def _time_chunk(content: str, config: ChunkingConfig, repeat: int) -> tuple:
+    best = float("inf")
+    chunks = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = chunk_text(content, None, config)
+        best = min(best, time.perf_counter() - start)
+    return best, len(chunks)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Chunking benchmark")
+    parser.add_argument("--pages", type=int, nargs="+", default=[125, 250, 500, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--max-ratio", type=float, default=2.0,
+        help="最大頁數與最小頁數的每頁耗時比超過此值時以非零狀態結束"
+    )
+    args = parser.parse_args()
+
+    config = ChunkingConfig()
+    print(f"{'pages':>6} {'chars':>10} {'chunks':>7} {'time(s)':>9} {'us/page':>9} {'ratio':>6}")
+
+    baseline = None
+    ratio = 1.0
+    for pages in sorted(args.pages):
+        content = build_sample_content(pages)
+        elapsed, chunk_count = _time_chunk(content, config, args.repeat)
+        per_page = elapsed / pages * 1e6
+        baseline = baseline or per_page
+        ratio = per_page / baseline
+        print(f"{pages:>6} {len(content):>10} {chunk_count:>7} {elapsed:>9.3f} {per_page:>9.1f} {ratio:>6.2f}")
+
+    if ratio > args.max_ratio:
+        print(f"每頁耗時隨頁數增加 {ratio:.2f} 倍，超過 {args.max_ratio}：切分不是線性時間")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
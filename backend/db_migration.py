@@ -45,3 +45,52 @@ def auto_migrate_highlights_table():
         print(f"Warning: Auto-migration failed: {e}")
         import traceback
         traceback.print_exc()
+
+
+# RAG 相關表格需要補上的欄位：{table_name: [(column_name, column_type), ...]}
+RAG_COLUMNS_TO_ADD = {
+    "documents": [
+        ("content_hash", "VARCHAR(64)"),
+        ("rag_fingerprint", "VARCHAR"),
+        ("batch_id", "VARCHAR"),
+        ("pages_indexed", "INTEGER DEFAULT 0"),
+    ],
+    "document_chunks": [
+        ("content_hash", "VARCHAR(64)"),
+    ],
+}
+
+
+def auto_migrate_rag_tables():
+    """
+    自動遷移 RAG 相關表格（documents、document_chunks），添加缺少的欄位與索引。
+    """
+    try:
+        with engine.begin() as conn:
+            inspector = inspect(engine)
+            table_names = inspector.get_table_names()
+
+            for table_name, columns_to_add in RAG_COLUMNS_TO_ADD.items():
+                # 表格不存在時由 Base.metadata.create_all 建立
+                if table_name not in table_names:
+                    continue
+
+                existing = {col["name"] for col in inspector.get_columns(table_name)}
+                for column_name, column_type in columns_to_add:
+                    if column_name not in existing:
+                        conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"))
+                        print(f"✓ Auto-migrated: Added '{column_name}' column to {table_name} table")
+
+            if "documents" in table_names:
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_documents_content_hash ON documents (content_hash)"
+                ))
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_documents_batch_id ON documents (batch_id)"
+                ))
+
+            print("✓ RAG tables migration check completed")
+    except Exception as e:
+        print(f"Warning: RAG tables auto-migration failed: {e}")
+        import traceback
+        traceback.print_exc()
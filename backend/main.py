@@ -3,10 +3,11 @@ from fastapi import FastAPI
 from dotenv import load_dotenv
 import os
 from db import Base, engine
-from db_migration import auto_migrate_highlights_table
+from db_migration import auto_migrate_highlights_table, auto_migrate_rag_tables
 from middleware.cors import setup_cors
 from middleware.exception_handler import setup_exception_handler
-from routes import auth, students, projects, documents, highlights, cohorts, chat, tasks, uploads, workflow, usage
+from services import ensure_default_bucket
+from routes import auth, students, projects, documents, highlights, cohorts, chat, tasks, uploads, workflow, usage, rag
 
 # 載入環境變數
 _env_paths = [
@@ -24,6 +25,7 @@ for _env_path in _env_paths:
 
 # 執行資料庫遷移
 auto_migrate_highlights_table()
+auto_migrate_rag_tables()
 Base.metadata.create_all(bind=engine)
 
 app = FastAPI(title="ThesisFlow API")
@@ -44,6 +46,20 @@ app.include_router(tasks.router)
 app.include_router(uploads.router)
 app.include_router(workflow.router)
 app.include_router(usage.router)
+app.include_router(rag.router)
+
+@app.on_event("startup")
+def check_storage_bucket():
+    # 上傳路徑不逐次檢查 bucket，只在啟動時確認一次
+    ensure_default_bucket()
+
+
+@app.on_event("shutdown")
+def stop_parse_sandbox():
+    # 關閉閒置的 PDF 解析沙箱行程（--reload 重新載入時也會執行）
+    from rag.parsers.sandbox import reset_parse_sandbox
+    reset_parse_sandbox()
+
 
 @app.get("/health")
 def health():
@@ -1,7 +1,7 @@
 import json
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, DateTime, Boolean, Integer, ForeignKey, Text, UniqueConstraint, Float
+from sqlalchemy import Column, String, DateTime, Boolean, Integer, ForeignKey, Text, UniqueConstraint, Float, LargeBinary
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from db import Base
@@ -63,9 +63,13 @@ class Document(Base):
     raw_preview = Column(Text, nullable=True)
 
     # RAG 相關欄位
-    rag_status = Column(String, default="pending")  # pending|processing|completed|failed
+    rag_status = Column(String, default="pending")  # pending|processing|partial|completed|failed
     rag_error = Column(Text, nullable=True)  # RAG 處理錯誤訊息
     chunk_count = Column(Integer, default=0)  # 切分後的 chunk 數量
+    pages_indexed = Column(Integer, default=0)  # 已寫入向量庫的頁數（partial 時可查詢前 N 頁）
+    content_hash = Column(String(64), nullable=True, index=True)  # 上傳檔案的 SHA-256（用於去重）
+    rag_fingerprint = Column(String, nullable=True)  # 完成 RAG 處理時的切分/Embedding 設定指紋
+    batch_id = Column(String, ForeignKey("upload_batches.id", ondelete="SET NULL"), nullable=True, index=True)  # 批次上傳 ID
 
     project = relationship("Project", back_populates="documents")
     highlights = relationship("Highlight", cascade="all, delete-orphan", back_populates="document")
@@ -73,6 +77,20 @@ class Document(Base):
     rag_logs = relationship("RagProcessingLog", cascade="all, delete-orphan", back_populates="document")
 
 
+class UploadBatch(Base):
+    """
+    批次上傳記錄
+
+    一次上傳多個 PDF（或 ZIP）時建立，用於追蹤整批文檔的 RAG 處理進度
+    """
+    __tablename__ = "upload_batches"
+    id = Column(String, primary_key=True, default=generate_uuid)
+    created_by = Column(String, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    total_count = Column(Integer, default=0)  # 成功上傳並加入佇列的文檔數
+    rejected_count = Column(Integer, default=0)  # 被拒絕的檔案數（格式不符、過大、上傳失敗）
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
 class Highlight(Base):
     __tablename__ = "highlights"
     id = Column(String, primary_key=True, default=generate_uuid)
@@ -180,6 +198,7 @@ class DocumentChunk(Base):
     content_preview = Column(String(200), nullable=True)  # 內容預覽（前 200 字元）
     page_numbers = Column(JSONB, default=list)  # 涵蓋的頁碼列表
     char_count = Column(Integer, default=0)  # 字元數
+    content_hash = Column(String(64), nullable=True)  # 內容雜湊（文本 + Embedding 設定），供增量索引比對
     created_at = Column(DateTime, default=datetime.utcnow)
 
     document = relationship("Document", back_populates="chunks")
@@ -197,3 +216,73 @@ class RagProcessingLog(Base):
 
     document = relationship("Document", back_populates="rag_logs")
 
+
+
+class RagJob(Base):
+    """
+    RAG 處理任務佇列
+
+    由 API 寫入，獨立的 worker 行程以 SELECT ... FOR UPDATE SKIP LOCKED 認領執行
+    """
+    __tablename__ = "rag_jobs"
+    id = Column(String, primary_key=True, default=generate_uuid)
+    document_id = Column(String, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    status = Column(String, nullable=False, default="queued", index=True)  # queued|running|succeeded|failed
+    attempts = Column(Integer, nullable=False, default=0)  # 已執行次數
+    max_attempts = Column(Integer, nullable=False, default=3)  # 最大嘗試次數
+    available_at = Column(DateTime, default=datetime.utcnow, index=True)  # 可被認領的時間（退避重試用）
+    locked_by = Column(String, nullable=True)  # 認領此任務的 worker ID
+    locked_until = Column(DateTime, nullable=True)  # 可見性逾時，超過後其他 worker 可重新認領
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    document = relationship("Document")
+
+
+class EmbeddingVector(Base):
+    """
+    Embedding 向量儲存
+
+    以 (部署, 維度, sha256(文本)) 為鍵保存 float16 向量，與向量庫（ChromaDB）分開保存：
+    相同文本（跨文檔重複的段落、重新上傳）不需再次呼叫 Azure，向量庫遺失時也可直接重建（見 rag.embedding_store）
+    """
+    __tablename__ = "embedding_vectors"
+    deployment = Column(String, primary_key=True)
+    dimensions = Column(Integer, primary_key=True)
+    text_hash = Column(String(64), primary_key=True)
+    vector = Column(LargeBinary, nullable=False)  # float16（little-endian）
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class RagReindexCheckpoint(Base):
+    """
+    重建索引的進度檢查點
+
+    python -m rag.reindex 每處理完一份文檔就寫入一筆，中斷後以相同 run_id 重新執行會跳過已完成的文檔
+    """
+    __tablename__ = "rag_reindex_checkpoints"
+    __table_args__ = (UniqueConstraint("run_id", "document_id", name="uq_reindex_checkpoint"),)
+    id = Column(String, primary_key=True, default=generate_uuid)
+    run_id = Column(String, nullable=False, index=True)
+    document_id = Column(String, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    status = Column(String, nullable=False)  # succeeded|failed
+    error = Column(Text, nullable=True)
+    duration_ms = Column(Integer, nullable=True)
+    embedding_tokens = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class EmbeddingRateBucket(Base):
+    """
+    Embedding 速率限制的共用額度
+
+    API、worker 與命令列工具以 SELECT ... FOR UPDATE 鎖定同一列後補充額度，並一次租用數秒份量在行程內扣除，
+    整個部署共用 AZURE_EMBEDDING_RPM / AZURE_EMBEDDING_TPM（見 rag.rate_limit）
+    """
+    __tablename__ = "embedding_rate_buckets"
+    name = Column(String, primary_key=True)
+    request_budget = Column(Float, nullable=False)  # 剩餘請求數
+    token_budget = Column(Float, nullable=False)  # 剩餘 token 數（可暫時為負）
+    updated_at = Column(Float, nullable=False)  # 上次補充的時間（epoch 秒）
@@ -4,30 +4,46 @@ RAG 模組入口
 提供統一的 RAG 功能介面
 """
 
-from .parsers import get_parser, ParseResult
-from .chunking import chunk_text, Chunk, ChunkingConfig
+from .parsers import get_parser, get_page_iterator, ParseResult, DocumentSource
+from .chunking import chunk_text, iter_chunks, Chunk, ChunkingConfig
 from .embedding import get_embedding_client, AzureEmbeddingClient
+from .query_cache import get_query_embedding_cache, QueryEmbeddingCache
 from .vector_store import (
     get_vector_store,
     init_vector_store,
     VectorStore,
     SearchResult
 )
+from .pipeline import run_streaming_pipeline, PipelineConfig, PipelineResult
+from .indexing import IncrementalIndexer, compute_chunk_hash, get_embedding_key
 
 __all__ = [
     # Parser
     "get_parser",
+    "get_page_iterator",
     "ParseResult",
+    "DocumentSource",
     # Chunking
     "chunk_text",
+    "iter_chunks",
     "Chunk",
     "ChunkingConfig",
     # Embedding
     "get_embedding_client",
     "AzureEmbeddingClient",
+    "get_query_embedding_cache",
+    "QueryEmbeddingCache",
     # Vector Store
     "get_vector_store",
     "init_vector_store",
     "VectorStore",
     "SearchResult",
+    # Pipeline
+    "run_streaming_pipeline",
+    "PipelineConfig",
+    "PipelineResult",
+    # Incremental indexing
+    "IncrementalIndexer",
+    "compute_chunk_hash",
+    "get_embedding_key",
 ]
@@ -2,19 +2,57 @@
 文本切分模組
 
 將解析後的文本切分成適合向量化的小段落
+
+整體為線性時間：
+    - 單次掃描移除 [Page N] 標記，同時記錄每頁在清理後文本中的起始位置
+    - 預先建立分隔符索引（各優先級的位置列表），每個 chunk 以二分搜尋找出結尾附近的切分點
+    - 頁碼以二分搜尋查詢
+
+大小單位可為字元數（預設）或估計的 token 數（見 rag.tokens），
+token 模式下中英文 chunk 的 token 數大致相同，Embedding 成本較平均。
+
+chunk_text 與 iter_chunks 共用同一個切分核心：文本以片段逐步讀入滑動視窗，
+視窗只保留尚未切分的部分，因此 iter_chunks 逐頁切分時的記憶體用量與文件長度無關。
 """
 
+import math
 import re
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass, field
-from typing import List, Optional, Set
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from .tokens import TokenEstimator, get_token_estimator
+
+# 切分邏輯的版本：切分位置或頁碼對應改變時遞增（納入 RAG 指紋，使既有結果不再被重用）
+CHUNKER_VERSION = 2
+
+_PAGE_MARKER_RE = re.compile(r'\[Page (\d+)\]\n?')
+
+# 句子邊界分隔符（優先級由高到低：同一個 chunk 內優先使用優先級較高者，其次取較靠後者）
+_DELIMITERS = ['。', '！', '？', '.', '!', '?', '；', ';', '，', ',', '\n', ' ']
+# 建立索引的分隔符（空格除外，見 _TextWindow）
+_INDEXED_DELIMITER_RES = [re.compile(re.escape(d)) for d in _DELIMITERS[:-1]]
+
+# 逐頁切分時頁與頁之間的分隔（與 parse_pdf 的完整文本格式相同）
+_PAGE_SEPARATOR = "\n\n"
+
+# 在 chunk 結尾往前多少字元內尋找分隔符
+_BOUNDARY_SEARCH_WINDOW = 100
 
 
 @dataclass
 class ChunkingConfig:
-    """切分配置"""
-    chunk_size: int = 500       # 每個 chunk 的目標字元數
-    chunk_overlap: int = 50     # chunk 間的重疊字元數
+    """
+    切分配置
+
+    size_unit 為 "tokens" 時，chunk_size / chunk_overlap / min_chunk_size 皆以估計的 token 數計算
+    （token_estimator 為 None 時使用 get_token_estimator()）；句子邊界的搜尋範圍仍為 100 字元。
+    """
+    chunk_size: int = 500       # 每個 chunk 的目標大小
+    chunk_overlap: int = 50     # chunk 間的重疊大小
     min_chunk_size: int = 100   # 最小 chunk 大小（避免過小的片段）
+    size_unit: str = "chars"    # chars（字元數）或 tokens（估計的 token 數）
+    token_estimator: Optional[TokenEstimator] = None
 
 
 @dataclass
@@ -37,11 +75,11 @@ def chunk_text(
 
     Args:
         content: 完整文本（含 [Page N] 標記）
-        pages: 按頁分割的內容列表（用於更精確的頁碼對應）
+        pages: 按頁分割的內容列表（未使用，保留以維持介面相容）
         config: 切分配置
 
     Returns:
-        List[Chunk]: 切分後的 chunks
+        List[Chunk]: 切分後的 chunks（char_start/char_end 為移除標記後的文本位置）
     """
     if not content or not content.strip():
         return []
@@ -49,238 +87,304 @@ def chunk_text(
     if config is None:
         config = ChunkingConfig()
 
-    # 建立頁碼位置索引
-    page_positions = _build_page_positions(content)
+    return list(_split_with_overlap(_marker_pieces(content), config))
 
-    # 執行切分
-    chunks = _split_with_overlap(content, config, page_positions)
 
-    return chunks
-
-
-def _build_page_positions(content: str) -> List[tuple]:
-    """
-    從文本中提取頁碼標記位置（基於原始文本）
-
-    Returns:
-        List[tuple]: [(page_number, start_pos, end_pos), ...]
-    """
-    # 匹配 [Page N] 標記
-    pattern = r'\[Page (\d+)\]'
-    positions = []
-
-    for match in re.finditer(pattern, content):
-        page_num = int(match.group(1))
-        start_pos = match.end()  # 頁碼標記結束後的位置
-        positions.append((page_num, start_pos))
-
-    # 計算每個頁面的結束位置
-    result = []
-    for i, (page_num, start_pos) in enumerate(positions):
-        if i + 1 < len(positions):
-            end_pos = positions[i + 1][1]
-        else:
-            end_pos = len(content)
-        result.append((page_num, start_pos, end_pos))
-
-    return result
-
-
-def _build_clean_page_positions(content: str) -> List[tuple]:
+def iter_chunks(
+    pages: Iterable[dict],
+    config: Optional[ChunkingConfig] = None
+) -> Iterator[Chunk]:
     """
-    建立清理後文本的頁碼位置索引
+    逐頁切分文本（串流版本的 chunk_text）
 
-    將原始文本中的 [Page N] 標記位置映射到清理後（無標記）文本的位置，
-    使得可以直接使用 clean_content 的 char_start/char_end 來查找頁碼。
+    結果與 chunk_text(build_content(pages)) 相同：空白頁略過，頁與頁之間以空行分隔，
+    char_start/char_end 為整份文本（無頁碼標記）中的位置。
+    只緩衝尚未切分的文本（約一個 chunk 加上目前的頁面），不需要完整文本。
 
     Args:
-        content: 原始文本（含 [Page N] 標記）
+        pages: 逐頁內容（{page_number, content}），可為產生器
+        config: 切分配置
 
-    Returns:
-        List[tuple]: [(page_number, clean_start, clean_end), ...]
-        其中 clean_start/clean_end 是移除標記後的字元位置
+    Yields:
+        Chunk: 依序產出的 chunks
     """
-    pattern = r'\[Page (\d+)\]\n?'
-    result: List[List] = []
-    cumulative_removed = 0  # 累計移除的字元數
-    last_match_end = 0
+    return _split_with_overlap(_page_pieces(pages), config or ChunkingConfig())
 
-    for match in re.finditer(pattern, content):
-        page_num = int(match.group(1))
-        marker_end = match.end()
 
-        # 此頁在清理後文本的起始位置
-        # 等於「上一個標記結束位置」減去「累計移除的標記字元數」
-        clean_start = last_match_end - cumulative_removed
+# 文本片段：(此片段開頭開始的頁碼或 None, 片段文本)
+_Piece = Tuple[Optional[int], str]
 
-        result.append([page_num, clean_start, -1])  # end 稍後更新
 
-        # 更新累計移除字元數（標記本身的長度）
-        cumulative_removed += marker_end - match.start()
-        last_match_end = marker_end
+def _marker_pieces(content: str) -> Iterator[_Piece]:
+    """依 [Page N] 標記（含其後的換行）拆分完整文本，標記本身不輸出"""
+    page_number = None
+    last_end = 0
+    for match in _PAGE_MARKER_RE.finditer(content):
+        yield page_number, content[last_end:match.start()]
+        page_number = int(match.group(1))
+        last_end = match.end()
+    yield page_number, content[last_end:]
 
-    # 更新每頁的 end 位置
-    for i in range(len(result) - 1):
-        result[i][2] = result[i + 1][1]
 
-    # 處理最後一頁的 end
-    if result:
-        # 清理後文本的總長度
-        clean_content_len = len(content) - cumulative_removed
-        result[-1][2] = clean_content_len
-
-    # 轉換為 tuple 並返回
-    if result:
-        return [(p, s, e) for p, s, e in result]
-
-    # 如果沒有任何頁碼標記，返回單一頁面覆蓋全部
-    clean_content = re.sub(r'\[Page \d+\]\n?', '', content)
-    return [(1, 0, len(clean_content))]
+def _page_pieces(pages: Iterable[dict]) -> Iterator[_Piece]:
+    """將逐頁內容轉為與 _marker_pieces(build_content(pages)) 相同的片段"""
+    first = True
+    for page in pages:
+        if not page["content"].strip():
+            continue
+        if not first:
+            yield None, _PAGE_SEPARATOR
+        first = False
+        yield page["page_number"], page["content"]
 
 
-def _get_page_numbers_for_range(
-    start: int,
-    end: int,
-    page_positions: List[tuple]
-) -> List[int]:
+class _TextWindow:
     """
-    根據字元範圍取得對應的頁碼列表
+    清理後文本的滑動視窗
 
-    Args:
-        start: 起始位置
-        end: 結束位置
-        page_positions: 頁碼位置索引
-
-    Returns:
-        List[int]: 涵蓋的頁碼列表
+    保存視窗內的文本，以及頁碼起點與分隔符的位置索引（皆為整份文本中的位置，遞增）。
+    token 模式另外保存連續 CJK 字元的範圍與其前的 CJK 字元累計數，任一範圍的 token 數以二分搜尋求得。
+    分隔符索引每個優先級一個位置列表（優先級即 _DELIMITERS 中的順序）；
+    空格只作為最後手段且數量遠多於標點，不建立索引，改在 chunk 結尾的搜尋範圍內以 rfind 查找
+    （範圍固定為 100 字元，不影響線性時間）。
     """
-    pages: Set[int] = set()
-
-    for page_num, page_start, page_end in page_positions:
-        # 檢查範圍是否有交集
-        if start < page_end and end > page_start:
-            pages.add(page_num)
 
-    return sorted(pages) if pages else [1]  # 預設為第一頁
+    def __init__(self, estimator: Optional[TokenEstimator] = None):
+        self.text = ""
+        self.offset = 0  # text[0] 在整份文本中的位置
+        self.page_numbers: List[int] = []
+        self.page_starts: List[int] = []
+        self.delimiters: List[List[int]] = [[] for _ in _INDEXED_DELIMITER_RES]
+        # token 模式（estimator 不為 None）：CJK 範圍 [start, end) 與其前的 CJK 字元數
+        self.estimator = estimator
+        self.cjk_starts: List[int] = []
+        self.cjk_ends: List[int] = []
+        self.cjk_before: List[int] = []
+        self._cjk_total = 0
+
+    @property
+    def end(self) -> int:
+        """目前已讀入的文本長度（整份文本中的位置）"""
+        return self.offset + len(self.text)
+
+    def append(self, page_number: Optional[int], text: str) -> None:
+        """讀入一個片段；page_number 不為 None 時，該頁從片段開頭開始"""
+        base = self.end
+        if page_number is not None:
+            self.page_numbers.append(page_number)
+            self.page_starts.append(base)
+        if not text:
+            return
+        for positions, pattern in zip(self.delimiters, _INDEXED_DELIMITER_RES):
+            positions.extend(base + match.start() for match in pattern.finditer(text))
+        if self.estimator is not None:
+            for start, end in self.estimator.cjk_spans(text):
+                self.cjk_starts.append(base + start)
+                self.cjk_ends.append(base + end)
+                self.cjk_before.append(self._cjk_total)
+                self._cjk_total += end - start
+        self.text += text
+
+    def discard_before(self, position: int) -> None:
+        """
+        捨棄 position 之前的文本與索引
+
+        只在可捨棄的部分超過視窗一半時才實際搬移，使總成本維持線性。
+        """
+        dead = position - self.offset
+        if dead <= len(self.text) // 2:
+            return
+        self.text = self.text[dead:]
+        self.offset = position
+        for positions in self.delimiters:
+            del positions[:bisect_left(positions, position)]
+        # 保留 position 所在的頁面（起始位置 <= position 的最後一頁）
+        keep = bisect_right(self.page_starts, position) - 1
+        if keep > 0:
+            del self.page_numbers[:keep]
+            del self.page_starts[:keep]
+        dead_runs = bisect_right(self.cjk_ends, position)
+        del self.cjk_starts[:dead_runs]
+        del self.cjk_ends[:dead_runs]
+        del self.cjk_before[:dead_runs]
+
+    def slice(self, start: int, end: int) -> str:
+        return self.text[start - self.offset:end - self.offset]
+
+    # --- 大小單位（字元數或估計的 token 數） ---
+
+    def size_of(self, text: str) -> int:
+        """文本的大小"""
+        return len(text) if self.estimator is None else self.estimator.estimate(text)
+
+    def max_chars(self, size: int) -> int:
+        """大小 size 最多對應的字元數"""
+        if self.estimator is None:
+            return size
+        return math.ceil(size * self.estimator.max_chars_per_token)
+
+    def _cjk_upto(self, position: int) -> int:
+        """position 之前的 CJK 字元數"""
+        i = bisect_right(self.cjk_starts, position) - 1
+        if i < 0:
+            return self.cjk_before[0] if self.cjk_before else self._cjk_total
+        return self.cjk_before[i] + min(position, self.cjk_ends[i]) - self.cjk_starts[i]
+
+    def _tokens(self, start: int, end: int) -> float:
+        cjk = self._cjk_upto(end) - self._cjk_upto(start)
+        return self.estimator.cost(cjk, end - start - cjk)
+
+    def advance(self, position: int, size: int) -> int:
+        """從 position 往後、大小不超過 size 的最遠位置（至少前進 1 個字元，不超過已讀入的結尾）"""
+        if self.estimator is None:
+            return min(position + size, self.end)
+        lo, hi = position + 1, min(position + self.max_chars(size), self.end)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self._tokens(position, mid) <= size:
+                lo = mid
+            else:
+                hi = mid - 1
+        return min(lo, self.end)
+
+    def retreat(self, position: int, size: int) -> int:
+        """從 position 往前、大小不超過 size 的最遠位置"""
+        if self.estimator is None:
+            return position - size
+        lo, hi = max(position - self.max_chars(size), self.offset), position
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._tokens(mid, position) <= size:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def find_boundary(self, start: int, end: int, min_end: int) -> int:
+        """
+        在 chunk [start, end) 結尾附近尋找最佳的切分位置
+
+        只考慮 [max(min_end, end - 100), end) 內、且位置大於 min_end 的分隔符
+        （min_end 為達到最小 chunk 大小的位置）：
+        依優先級取第一個存在的分隔符中最靠後的一個，切分位置包含該分隔符。
+
+        Returns:
+            int: 切分位置；找不到合適的分隔符時返回 end
+        """
+        search_start = max(min_end, end - _BOUNDARY_SEARCH_WINDOW)
+        for positions in self.delimiters:
+            i = bisect_left(positions, end) - 1
+            if i >= 0 and positions[i] >= search_start and positions[i] > min_end:
+                return positions[i] + 1
+
+        pos = self.text.rfind(" ", search_start - self.offset, end - self.offset)
+        if pos >= 0 and pos + self.offset > min_end:
+            return pos + self.offset + 1
+        return end
+
+    def pages_for_range(self, start: int, end: int) -> List[int]:
+        """
+        取得字元範圍 [start, end) 涵蓋的頁碼
+
+        第 i 頁的範圍為 [page_starts[i], page_starts[i + 1])；最後一頁的結尾尚未讀入，
+        以目前已讀入的結尾代替（必定 >= end）。
+
+        Returns:
+            List[int]: 涵蓋的頁碼（遞增）；範圍不在任何頁面內時預設為第一頁
+        """
+        starts = self.page_starts
+        # 起始位置 <= start 的最後一頁（其前共用同一起點的空白頁不與範圍相交）到起始位置 < end 的最後一頁
+        first = max(bisect_right(starts, start) - 1, 0)
+        last = bisect_left(starts, end)
+        pages = set()
+        for i in range(first, last):
+            page_end = starts[i + 1] if i + 1 < len(starts) else self.end
+            if start < page_end and end > starts[i]:
+                pages.add(self.page_numbers[i])
+        return sorted(pages) if pages else [1]
 
 
 def _split_with_overlap(
-    content: str,
-    config: ChunkingConfig,
-    _page_positions: List[tuple]  # 保留參數以維持向後相容，實際使用 _build_clean_page_positions
-) -> List[Chunk]:
+    pieces: Iterable[_Piece],
+    config: ChunkingConfig
+) -> Iterator[Chunk]:
     """
     使用重疊方式切分文本，在句子邊界切分
 
+    文本以片段逐步讀入視窗：每個 chunk 只需要知道 current_pos 之後 chunk_size 的範圍外是否還有內容，
+    因此視窗只需涵蓋 current_pos 前後各一個 chunk_overlap / chunk_size 的範圍，已切分的部分隨即捨棄。
+
     Args:
-        content: 完整文本
+        pieces: 依序的文本片段（已移除頁碼標記）
         config: 切分配置
-        _page_positions: [已棄用] 此參數不再使用，頁碼改由內部重新計算
 
-    Returns:
-        List[Chunk]: 切分結果
+    Yields:
+        Chunk: 切分結果
     """
-    # 移除頁碼標記以便處理
-    clean_content = re.sub(r'\[Page \d+\]\n?', '', content)
+    if config.size_unit == "tokens":
+        window = _TextWindow(config.token_estimator or get_token_estimator())
+    elif config.size_unit == "chars":
+        window = _TextWindow()
+    else:
+        raise ValueError(f"不支援的切分單位: {config.size_unit}")
+    fill_chars = window.max_chars(config.chunk_size)
+    overlap_chars = window.max_chars(config.chunk_overlap)
+    pieces = iter(pieces)
+    exhausted = False
 
-    if not clean_content.strip():
-        return []
-
-    # 建立清理後文本的頁碼位置索引
-    clean_page_positions = _build_clean_page_positions(content)
-
-    chunks = []
     current_pos = 0
     chunk_index = 0
+    last_chunk_start = 0
+
+    while True:
+        # 下一個 chunk 至少從 current_pos - chunk_overlap + 1 開始，之前的文本不會再用到
+        window.discard_before(current_pos - overlap_chars)
+        while not exhausted and window.end <= current_pos + fill_chars:
+            piece = next(pieces, None)
+            if piece is None:
+                exhausted = True
+            else:
+                window.append(*piece)
+
+        # 未讀完時視窗結尾必定超過 chunk_size 對應的最大範圍，以下判斷與使用完整長度相同
+        content_length = window.end
+        if current_pos >= content_length:
+            break
 
-    while current_pos < len(clean_content):
         # 計算 chunk 結束位置
-        end_pos = min(current_pos + config.chunk_size, len(clean_content))
+        end_pos = window.advance(current_pos, config.chunk_size)
+        has_more = end_pos < content_length
 
         # 如果不是最後一個 chunk，嘗試在句子邊界切分
-        if end_pos < len(clean_content):
-            end_pos = _find_sentence_boundary(
-                clean_content,
-                current_pos,
-                end_pos,
-                config.min_chunk_size
-            )
+        if has_more:
+            min_end = window.advance(current_pos, config.min_chunk_size) if config.min_chunk_size else current_pos
+            end_pos = window.find_boundary(current_pos, end_pos, min_end)
 
         # 提取 chunk 內容
-        chunk_content = clean_content[current_pos:end_pos].strip()
+        chunk_content = window.slice(current_pos, end_pos).strip()
 
         # 跳過過小的 chunks（除非是最後一個）
-        if len(chunk_content) < config.min_chunk_size and current_pos + config.chunk_size < len(clean_content):
+        if has_more and window.size_of(chunk_content) < config.min_chunk_size:
             current_pos = end_pos
             continue
 
         if chunk_content:
-            # 直接使用位置計算頁碼（不再需要文本搜尋）
-            page_numbers = _get_page_numbers_for_range(
-                current_pos,
-                end_pos,
-                clean_page_positions
-            )
-
-            chunk = Chunk(
+            yield Chunk(
                 index=chunk_index,
                 content=chunk_content,
                 char_start=current_pos,
                 char_end=end_pos,
-                page_numbers=page_numbers
+                page_numbers=window.pages_for_range(current_pos, end_pos)
             )
-            chunks.append(chunk)
             chunk_index += 1
+            last_chunk_start = current_pos
 
         # 移動到下一個位置（考慮重疊）
-        if end_pos >= len(clean_content):
+        if end_pos >= content_length:
             break
 
-        current_pos = end_pos - config.chunk_overlap
+        current_pos = window.retreat(end_pos, config.chunk_overlap)
 
         # 避免無限循環：確保 current_pos 有向前推進
-        last_chunk_start = chunks[-1].char_start if chunks else 0
         if current_pos <= last_chunk_start:
             current_pos = end_pos
-
-    return chunks
-
-
-def _find_sentence_boundary(
-    text: str,
-    start: int,
-    end: int,
-    min_size: int
-) -> int:
-    """
-    在給定範圍內尋找最佳的句子邊界
-
-    優先順序：句號 > 分號 > 逗號 > 空格
-
-    Args:
-        text: 完整文本
-        start: 搜尋起始位置
-        end: 搜尋結束位置
-        min_size: 最小 chunk 大小
-
-    Returns:
-        int: 最佳切分位置
-    """
-    # 句子結束標點（優先級由高到低）
-    delimiters = ['。', '！', '？', '.', '!', '?', '；', ';', '，', ',', '\n']
-
-    search_start = max(start + min_size, end - 100)  # 在結尾附近搜尋
-
-    for delimiter in delimiters:
-        # 從後往前搜尋分隔符
-        pos = text.rfind(delimiter, search_start, end)
-        if pos > start + min_size:
-            return pos + 1  # 包含分隔符
-
-    # 找不到合適的邊界，嘗試在空格處切分
-    pos = text.rfind(' ', search_start, end)
-    if pos > start + min_size:
-        return pos + 1
-
-    # 都找不到，使用原始結束位置
-    return end
@@ -2,13 +2,29 @@
 Azure OpenAI Embedding 模組
 
 使用 Azure OpenAI 的 text-embedding-3-large 模型生成向量
+
+批次向量化（embed_texts / aembed_texts）以 AsyncAzureOpenAI 並行送出：
+所有請求在同一個背景事件迴圈中執行，共用連線池、並行上限（AIMD）與行程內的 RPM/TPM 額度，
+同步呼叫端（worker 執行緒）送出協程後等待結果即可。
+
+批次向量化先查詢 Embedding 向量儲存（見 embedding_store.py），只為未命中的文本呼叫 API；
+離線模式（offline=True）下完全不呼叫 API，未命中時拋出 EmbeddingStoreMissError。
+
+向量維度由 AZURE_EMBEDDING_DIMENSIONS 設定（text-embedding-3 系列的 dimensions 參數），
+縮減後的向量等同原生向量取前 N 維再正規化，既有向量可直接轉換（見 reproject.py）。
+
+對話查詢（aembed_query）經由微批次器合併同時到達的查詢，以一個批次請求送出（見 query_batcher.py）。
 """
 
 import os
+import asyncio
 import logging
-from typing import List, Optional
+import threading
+from concurrent.futures import Future
+from typing import Coroutine, Dict, List, Optional, Tuple
 
-from openai import AzureOpenAI
+import httpx
+from openai import NOT_GIVEN, AsyncAzureOpenAI, AzureOpenAI, DefaultAsyncHttpxClient
 from openai import (
     RateLimitError,
     APIConnectionError,
@@ -23,6 +39,12 @@ from tenacity import (
     before_sleep_log,
 )
 
+from .embedding_store import EmbeddingStore, EmbeddingStoreMissError, get_embedding_store
+from .metrics import EmbeddingUsage
+from .query_batcher import QueryMicroBatcher
+from .rate_limit import AdaptiveConcurrencyLimiter, EmbeddingRateLimiter, get_embedding_rate_limiter
+from .tokens import TokenEstimator, get_token_estimator, pack_by_tokens
+
 logger = logging.getLogger(__name__)
 
 # 可重試的異常類型
@@ -33,6 +55,65 @@ RETRYABLE_EXCEPTIONS = (
     InternalServerError,  # 500: 伺服器內部錯誤
 )
 
+# 非同步路徑：每個批次的最大嘗試次數與沒有 Retry-After 時的指數退避範圍（秒）
+ASYNC_MAX_ATTEMPTS = 5
+_BACKOFF_MIN_SECONDS = 2
+_BACKOFF_MAX_SECONDS = 10
+
+# text-embedding-3-large 的原生維度
+NATIVE_EMBEDDING_DIMENSION = 3072
+
+# AZURE_EMBEDDING_DIMENSIONS: 向量維度（例如 256 / 512 / 1024；0 表示原生維度）
+EMBEDDING_DIMENSIONS = int(os.getenv("AZURE_EMBEDDING_DIMENSIONS", "0")) or NATIVE_EMBEDDING_DIMENSION
+
+
+def truncate_embedding(vector: List[float], dimensions: int) -> List[float]:
+    """
+    縮減向量維度：取前 dimensions 維並重新正規化
+
+    text-embedding-3 系列以 Matryoshka 方式訓練，結果與以 dimensions 參數呼叫 API 相同。
+    """
+    head = vector[:dimensions]
+    norm = sum(x * x for x in head) ** 0.5
+    return [x / norm for x in head] if norm else list(head)
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """從錯誤回應的 retry-after-ms / retry-after 標頭取得建議的等待秒數"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:  # HTTP 日期格式，改用指數退避
+        return None
+    return None
+
+
+class _EventLoopThread:
+    """在背景執行緒中持續執行的事件迴圈"""
+
+    def __init__(self, name: str):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro: Coroutine) -> Future:
+        """在事件迴圈中執行協程（可從任何執行緒呼叫）"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+
 
 class AzureEmbeddingClient:
     """
@@ -70,6 +151,11 @@ class AzureEmbeddingClient:
             "2024-12-01-preview"
         )
 
+        # 向量維度（原生維度時不送出 dimensions 參數）
+        self.dimensions = EMBEDDING_DIMENSIONS
+        if not 0 < self.dimensions <= NATIVE_EMBEDDING_DIMENSION:
+            raise ValueError(f"AZURE_EMBEDDING_DIMENSIONS 必須介於 1 與 {NATIVE_EMBEDDING_DIMENSION} 之間")
+
         if not self.endpoint:
             raise ValueError("AZURE_EMBEDDING_ENDPOINT 未設定")
         if not self.api_key:
@@ -82,8 +168,29 @@ class AzureEmbeddingClient:
             api_version=self.api_version
         )
 
-        # 批次處理設定
-        self.batch_size = 16  # Azure OpenAI 建議的批次大小
+        # 批次處理設定：依估計的 token 數打包，每個請求不超過 batch_max_tokens 與 batch_size 筆
+        self.batch_size = int(os.getenv("AZURE_EMBEDDING_BATCH_MAX_ITEMS", "256"))
+        self.batch_max_tokens = int(os.getenv("AZURE_EMBEDDING_BATCH_MAX_TOKENS", "16000"))
+        self.token_estimator: TokenEstimator = get_token_estimator()
+
+        # 速率限制：預設為跨行程共用的 RPM/TPM 額度（重建索引時可再加上較低的上限）
+        self.rate_limiter: Optional[EmbeddingRateLimiter] = get_embedding_rate_limiter(self.deployment)
+
+        # 並行送出的批次數上限（收到 429 時自動降低，之後逐步恢復）
+        self.max_concurrency = int(os.getenv("AZURE_EMBEDDING_CONCURRENCY", "4"))
+
+        # 非同步路徑（背景事件迴圈、AsyncAzureOpenAI、並行上限），第一次使用時建立
+        self._loop_thread: Optional[_EventLoopThread] = None
+        self._loop_lock = threading.Lock()
+        self._async_client: Optional[AsyncAzureOpenAI] = None
+        self.concurrency: Optional[AdaptiveConcurrencyLimiter] = None
+        self.query_batcher: Optional[QueryMicroBatcher] = None
+
+        # 向量儲存（以內容雜湊保存已購買的向量）；offline 為 True 時只使用儲存中的向量
+        self.store: Optional[EmbeddingStore] = get_embedding_store(
+            self.deployment, self.get_embedding_dimension()
+        )
+        self.offline = False
 
     @retry(
         stop=stop_after_attempt(3),
@@ -107,71 +214,280 @@ class AzureEmbeddingClient:
 
         response = self.client.embeddings.create(
             input=text,
-            model=self.deployment
+            model=self.deployment,
+            dimensions=self._dimensions_param()
         )
 
         return response.data[0].embedding
 
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10),
-        retry=retry_if_exception_type(RETRYABLE_EXCEPTIONS),
-        before_sleep=before_sleep_log(logger, logging.WARNING),
-        reraise=True,
-    )
-    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+    async def _aembed_query(self, text: str) -> List[float]:
+        # 批次器的狀態只在背景事件迴圈中存取
+        if self.query_batcher is None:
+            self.query_batcher = QueryMicroBatcher(self._aembed_batch)
+        return await self.query_batcher.embed(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """
+        生成查詢文本的向量（可在任何事件迴圈中 await）
+
+        同時到達的查詢在短時間窗內合併為一個批次請求，結果分送給各呼叫端；
+        重試、並行上限與速率限制與批次向量化相同。
+
+        Args:
+            text: 查詢文本
+
+        Returns:
+            List[float]: 向量
+        """
+        if not text or not text.strip():
+            raise ValueError("文本不能為空")
+
+        future = self._get_loop().submit(self._aembed_query(text))
+        return await asyncio.wrap_future(future)
+
+    def _get_loop(self) -> _EventLoopThread:
+        with self._loop_lock:
+            if self._loop_thread is None:
+                self._loop_thread = _EventLoopThread("embedding-loop")
+            return self._loop_thread
+
+    def _ensure_async_client(self) -> None:
+        """在事件迴圈中建立非同步客戶端與並行上限（只在背景事件迴圈中呼叫）"""
+        if self._async_client is not None:
+            return
+        # 關閉 SDK 內建重試，429 交由本模組處理（調整並行上限並遵守 Retry-After）
+        self._async_client = AsyncAzureOpenAI(
+            azure_endpoint=self.endpoint,
+            api_key=self.api_key,
+            api_version=self.api_version,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency * 2,
+                    max_keepalive_connections=self.max_concurrency
+                )
+            )
+        )
+        self.concurrency = AdaptiveConcurrencyLimiter(self.max_concurrency)
+
+    async def _aembed_batch(
+        self,
+        batch: List[str],
+        usage: Optional[EmbeddingUsage] = None
+    ) -> List[List[float]]:
         """
         內部方法：處理單一批次（帶重試機制）
 
         Args:
             batch: 要向量化的文本批次
+            usage: 統計物件（可選），每次嘗試都會計入請求數
 
         Returns:
             List[List[float]]: 該批次的向量列表
         """
-        response = self.client.embeddings.create(
-            input=batch,
-            model=self.deployment
-        )
-        return [item.embedding for item in response.data]
+        self._ensure_async_client()
+        estimated_tokens = sum(self.token_estimator.estimate(text) for text in batch)
+
+        attempt = 0
+        while True:
+            attempt += 1
+            async with self.concurrency.slot() as started_at:
+                if self.rate_limiter is not None:
+                    await self.rate_limiter.acquire_async(estimated_tokens)
+                if usage is not None:
+                    usage.add_request()
+                try:
+                    response = await self._async_client.embeddings.create(
+                        input=batch,
+                        model=self.deployment,
+                        dimensions=self._dimensions_param()
+                    )
+                except RETRYABLE_EXCEPTIONS as e:
+                    if self.rate_limiter is not None:
+                        self.rate_limiter.record_tokens(0, estimated_tokens)
+                    retry_after = _retry_after_seconds(e)
+                    if isinstance(e, RateLimitError):
+                        self.concurrency.on_throttle(started_at, retry_after)
+                        if usage is not None:
+                            usage.add_throttle()
+                    if attempt == ASYNC_MAX_ATTEMPTS:
+                        raise
+                    wait = retry_after or min(
+                        max(2 ** attempt, _BACKOFF_MIN_SECONDS), _BACKOFF_MAX_SECONDS
+                    )
+                    logger.warning(
+                        "Embedding 請求失敗（%s），%.1f 秒後重試（第 %d 次，並行上限 %d）",
+                        type(e).__name__, wait, attempt, int(self.concurrency.limit)
+                    )
+                else:
+                    tokens = (getattr(response.usage, "prompt_tokens", 0) if response.usage else 0) or 0
+                    if self.rate_limiter is not None:
+                        self.rate_limiter.record_tokens(tokens, estimated_tokens)
+                    self.concurrency.on_success()
+                    if usage is not None:
+                        usage.add_batch(tokens)
+                    return [item.embedding for item in response.data]
+            # 在名額之外等待，不佔用並行上限
+            await asyncio.sleep(wait)
+
+    async def _aembed_batches(
+        self,
+        batches: List[List[str]],
+        usage: Optional[EmbeddingUsage] = None
+    ) -> List[List[float]]:
+        """並行處理多個批次，結果依原順序合併；任一批次失敗時取消其餘批次"""
+        tasks = [asyncio.ensure_future(self._aembed_batch(batch, usage)) for batch in batches]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return [vector for result in results for vector in result]
+
+    def _submit(self, texts: List[str], usage: Optional[EmbeddingUsage]) -> Optional[Future]:
+        valid_texts = [t for t in texts if t and t.strip()] if texts else []
+        if not valid_texts:
+            return None
+        return self._get_loop().submit(self._aembed_batches(self.pack_batches(valid_texts), usage))
+
+    def _lookup(
+        self,
+        texts: List[str],
+        usage: Optional[EmbeddingUsage]
+    ) -> Tuple[List[str], Dict[str, List[float]], List[str]]:
+        """
+        查詢向量儲存
+
+        Returns:
+            Tuple: (有效文本, 已取得的向量 {文本: 向量}, 需要呼叫 API 的文本（去除重複）)
+        """
+        valid_texts = [t for t in texts if t and t.strip()] if texts else []
+        found: Dict[str, List[float]] = {}
+        if self.store is not None and valid_texts:
+            try:
+                found = self.store.get_many(valid_texts)
+            except Exception as e:
+                if self.offline:
+                    raise
+                # 儲存無法使用時退回呼叫 API，不影響處理流程
+                logger.warning(f"Embedding 儲存查詢失敗，改為呼叫 API: {e}")
+
+        missing = list(dict.fromkeys(t for t in valid_texts if t not in found))
+        if self.offline and missing:
+            raise EmbeddingStoreMissError(
+                f"{len(missing)} 段文本不在 Embedding 儲存中（離線模式不呼叫 API）"
+            )
+        if usage is not None and found:
+            usage.add_store_hits(sum(1 for t in valid_texts if t in found))
+        return valid_texts, found, missing
+
+    def _remember(
+        self,
+        found: Dict[str, List[float]],
+        missing: List[str],
+        vectors: List[List[float]]
+    ) -> None:
+        """將 API 取得的向量加入結果並寫入向量儲存"""
+        found.update(zip(missing, vectors))
+        if self.store is not None:
+            try:
+                self.store.put_many(missing, vectors)
+            except Exception as e:
+                logger.warning(f"Embedding 儲存寫入失敗: {e}")
+
+    def embed_texts(
+        self,
+        texts: List[str],
+        usage: Optional[EmbeddingUsage] = None
+    ) -> List[List[float]]:
+        """
+        批次生成多個文本的向量（批次並行送出）
 
-    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        Args:
+            texts: 要向量化的文本列表（空文本會被略過）
+            usage: 統計物件（可選），累加批次數、請求數（含重試）、429 次數、token 數與儲存命中數
+
+        Returns:
+            List[List[float]]: 向量列表（與有效文本一一對應）
+
+        Raises:
+            EmbeddingStoreMissError: 離線模式下有文本不在向量儲存中
         """
-        批次生成多個文本的向量
+        valid_texts, found, missing = self._lookup(texts, usage)
+        future = self._submit(missing, usage)
+        if future is not None:
+            self._remember(found, missing, future.result())
+        return [found[t] for t in valid_texts]
+
+    async def aembed_texts(
+        self,
+        texts: List[str],
+        usage: Optional[EmbeddingUsage] = None
+    ) -> List[List[float]]:
+        """
+        embed_texts 的 asyncio 版本（可在任何事件迴圈中 await）
 
         Args:
-            texts: 要向量化的文本列表
+            texts: 要向量化的文本列表（空文本會被略過）
+            usage: 統計物件（可選）
 
         Returns:
-            List[List[float]]: 向量列表
+            List[List[float]]: 向量列表（與有效文本一一對應）
         """
-        if not texts:
-            return []
+        # 向量儲存為同步的資料庫存取，在執行緒中執行以免阻塞事件迴圈
+        valid_texts, found, missing = await asyncio.to_thread(self._lookup, texts, usage)
+        future = self._submit(missing, usage)
+        if future is not None:
+            vectors = await asyncio.wrap_future(future)
+            await asyncio.to_thread(self._remember, found, missing, vectors)
+        return [found[t] for t in valid_texts]
+
+    def close(self) -> None:
+        """關閉非同步客戶端並停止背景事件迴圈"""
+        with self._loop_lock:
+            loop_thread, self._loop_thread = self._loop_thread, None
+        if loop_thread is None:
+            return
+        if self._async_client is not None:
+            try:
+                loop_thread.submit(self._async_client.close()).result(timeout=5)
+            except Exception:  # noqa: BLE001 - 關閉失敗不影響結束流程
+                logger.debug("關閉 Embedding 非同步客戶端失敗", exc_info=True)
+            self._async_client = None
+        self.query_batcher = None
+        loop_thread.stop()
+
+    def pack_batches(self, texts: List[str]) -> List[List[str]]:
+        """
+        依估計的 token 數將文本打包成請求批次
 
-        # 過濾空文本
-        valid_texts = [t for t in texts if t and t.strip()]
-        if not valid_texts:
-            return []
+        每批不超過 batch_max_tokens 個 token 與 batch_size 筆，減少請求數且避免超過單次請求上限。
 
-        embeddings: List[List[float]] = []
+        Args:
+            texts: 要向量化的文本列表
 
-        # 批次處理（使用帶重試的 _embed_batch 方法）
-        for i in range(0, len(valid_texts), self.batch_size):
-            batch = valid_texts[i:i + self.batch_size]
-            batch_embeddings = self._embed_batch(batch)
-            embeddings.extend(batch_embeddings)
+        Returns:
+            List[List[str]]: 依序的批次
+        """
+        return list(pack_by_tokens(
+            texts,
+            self.token_estimator.estimate,
+            self.batch_max_tokens,
+            self.batch_size
+        ))
 
-        return embeddings
+    def _dimensions_param(self):
+        return self.dimensions if self.dimensions != NATIVE_EMBEDDING_DIMENSION else NOT_GIVEN
 
     def get_embedding_dimension(self) -> int:
         """
         取得向量維度
 
         Returns:
-            int: 向量維度（text-embedding-3-large 為 3072）
+            int: 向量維度（AZURE_EMBEDDING_DIMENSIONS，未設定時為 text-embedding-3-large 的 3072）
         """
-        # text-embedding-3-large 的維度
-        return 3072
+        return self.dimensions
 
 
 # 模組級別的客戶端實例（延遲初始化）
@@ -198,4 +514,6 @@ def reset_embedding_client() -> None:
     重置 Embedding 客戶端（主要用於測試）
     """
     global _embedding_client
+    if _embedding_client is not None:
+        _embedding_client.close()
     _embedding_client = None
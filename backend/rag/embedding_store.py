@@ -0,0 +1,250 @@
+"""
+Embedding 向量儲存模組
+
+向量原本只存在 ChromaDB 的 document_chunks collection 中：向量庫遺失或需要重建時，
+所有向量都得重新向 Azure 購買。此模組另外在 Postgres 保存向量：
+    - 鍵為 (部署, 維度, sha256(文本))，與文檔無關：跨文檔重複的段落、重新上傳的文檔都能直接重用
+    - 向量以 float16 保存（3072 維約 6 KB），對餘弦相似度的影響遠小於檢索排序的差異
+    - embed_texts 先查詢儲存，只為未命中的文本呼叫 API
+
+向量庫遺失時：
+    python -m rag.reindex --all --offline       # 只使用儲存中的向量重建（不呼叫 API）
+既有部署第一次啟用時，先從向量庫匯入既有向量：
+    python -m rag.embedding_store --backfill
+"""
+
+import os
+import argparse
+import hashlib
+import logging
+import struct
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+
+logger = logging.getLogger(__name__)
+
+# RAG_EMBEDDING_STORE: 是否啟用 Embedding 向量儲存
+EMBEDDING_STORE_ENABLED = os.getenv("RAG_EMBEDDING_STORE", "true").lower() == "true"
+
+# 單次查詢 / 寫入的筆數
+_BATCH_SIZE = 500
+
+
+class EmbeddingStoreMissError(Exception):
+    """離線模式下有文本不在 Embedding 儲存中"""
+
+
+def text_hash(text: str) -> str:
+    """文本的儲存鍵"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def encode_vector(vector: List[float]) -> bytes:
+    """向量 → float16 bytes"""
+    return struct.pack(f"<{len(vector)}e", *vector)
+
+
+def decode_vector(blob: bytes) -> List[float]:
+    """float16 bytes → 向量"""
+    return list(struct.unpack(f"<{len(blob) // 2}e", blob))
+
+
+class EmbeddingStore:
+    """
+    單一 Embedding 設定（部署 + 維度）的向量儲存
+
+    Args:
+        engine: SQLAlchemy engine
+        table: embedding_vectors 資料表（models.EmbeddingVector.__table__）
+        deployment: Embedding 部署名稱
+        dimensions: 向量維度
+    """
+
+    def __init__(self, engine, table, deployment: str, dimensions: int):
+        self.engine = engine
+        self.table = table
+        self.deployment = deployment
+        self.dimensions = dimensions
+        self._table_ready = False
+        self._lock = threading.Lock()
+
+    def _ensure_table(self) -> None:
+        # API 行程由 create_all 建立；worker 與命令列工具第一次使用時建立
+        if not self._table_ready:
+            with self._lock:
+                if not self._table_ready:
+                    self.table.create(bind=self.engine, checkfirst=True)
+                    self._table_ready = True
+
+    def get_many(self, texts: Iterable[str]) -> Dict[str, List[float]]:
+        """
+        查詢文本的向量
+
+        Args:
+            texts: 文本（可重複）
+
+        Returns:
+            Dict[str, List[float]]: {文本: 向量}，只包含命中的文本
+        """
+        by_hash = {text_hash(text): text for text in texts}
+        if not by_hash:
+            return {}
+        self._ensure_table()
+
+        found: Dict[str, List[float]] = {}
+        hashes = list(by_hash)
+        with self.engine.connect() as conn:
+            for i in range(0, len(hashes), _BATCH_SIZE):
+                rows = conn.execute(
+                    select(self.table.c.text_hash, self.table.c.vector).where(
+                        self.table.c.deployment == self.deployment,
+                        self.table.c.dimensions == self.dimensions,
+                        self.table.c.text_hash.in_(hashes[i:i + _BATCH_SIZE]),
+                    )
+                )
+                for row in rows:
+                    found[by_hash[row.text_hash]] = decode_vector(row.vector)
+        return found
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]) -> int:
+        """
+        寫入文本的向量（已存在者略過）
+
+        Returns:
+            int: 送出的筆數
+        """
+        return self.put_hashed({text_hash(text): vector for text, vector in zip(texts, vectors)})
+
+    def put_hashed(self, vectors: Dict[str, List[float]]) -> int:
+        """
+        以儲存鍵寫入向量（已存在者略過；維度不符者忽略）
+
+        Returns:
+            int: 送出的筆數
+        """
+        rows = {
+            key: encode_vector(vector)
+            for key, vector in vectors.items()
+            if len(vector) == self.dimensions
+        }
+        if not rows:
+            return 0
+        self._ensure_table()
+
+        items = list(rows.items())
+        with self.engine.begin() as conn:
+            for i in range(0, len(items), _BATCH_SIZE):
+                conn.execute(
+                    insert(self.table).values([
+                        {
+                            "deployment": self.deployment,
+                            "dimensions": self.dimensions,
+                            "text_hash": key,
+                            "vector": blob,
+                        }
+                        for key, blob in items[i:i + _BATCH_SIZE]
+                    ]).on_conflict_do_nothing()
+                )
+        return len(items)
+
+    def iter_vectors(self, batch_size: int = _BATCH_SIZE) -> Iterator[Tuple[List[str], List[List[float]]]]:
+        """
+        依儲存鍵順序分批讀出此設定的所有向量
+
+        Yields:
+            Tuple[List[str], List[List[float]]]: (儲存鍵列表, 向量列表)
+        """
+        self._ensure_table()
+        last_key = ""
+        while True:
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    select(self.table.c.text_hash, self.table.c.vector).where(
+                        self.table.c.deployment == self.deployment,
+                        self.table.c.dimensions == self.dimensions,
+                        self.table.c.text_hash > last_key,
+                    ).order_by(self.table.c.text_hash).limit(batch_size)
+                ).all()
+            if not rows:
+                return
+            last_key = rows[-1].text_hash
+            yield [row.text_hash for row in rows], [decode_vector(row.vector) for row in rows]
+
+    def count(self) -> int:
+        """此設定已保存的向量數"""
+        self._ensure_table()
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(func.count()).select_from(self.table).where(
+                    self.table.c.deployment == self.deployment,
+                    self.table.c.dimensions == self.dimensions,
+                )
+            ).scalar_one()
+
+
+def get_embedding_store(deployment: str, dimensions: int) -> Optional[EmbeddingStore]:
+    """
+    取得指定 Embedding 設定的向量儲存
+
+    Returns:
+        Optional[EmbeddingStore]: 停用（RAG_EMBEDDING_STORE=false）時為 None
+    """
+    if not EMBEDDING_STORE_ENABLED:
+        return None
+
+    import models
+    from db import engine
+
+    return EmbeddingStore(engine, models.EmbeddingVector.__table__, deployment, dimensions)
+
+
+def backfill_from_vector_store(store: EmbeddingStore, batch_size: int = _BATCH_SIZE) -> int:
+    """
+    將向量庫中既有的向量匯入儲存（向量庫中的文本即 chunk 內容，與 embed_texts 的輸入相同）
+
+    Returns:
+        int: 處理的 chunk 數
+    """
+    from .vector_store import get_vector_store
+
+    total = 0
+    for texts, vectors in get_vector_store().iter_embeddings(batch_size):
+        store.put_many(texts, vectors)
+        total += len(texts)
+        print(f"backfilled {total} chunks", flush=True)
+    return total
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Embedding 向量儲存管理")
+    parser.add_argument("--backfill", action="store_true", help="從向量庫（ChromaDB）匯入既有向量")
+    parser.add_argument("--stats", action="store_true", help="顯示目前 Embedding 設定已保存的向量數")
+    args = parser.parse_args(argv)
+
+    import db  # noqa: F401 - 匯入時載入 env.local（Embedding 客戶端的設定來自環境變數）
+    from rag import get_embedding_client
+
+    client = get_embedding_client()
+    if client.store is None:
+        parser.error("Embedding 向量儲存未啟用（RAG_EMBEDDING_STORE=false）")
+
+    if args.backfill:
+        from .vector_store import require_shared_vector_store
+        try:
+            require_shared_vector_store("rag.embedding_store --backfill")
+        except RuntimeError as e:
+            parser.error(str(e))
+        backfill_from_vector_store(client.store)
+    if args.stats or not args.backfill:
+        print(
+            f"{client.deployment} ({client.get_embedding_dimension()} dims): "
+            f"{client.store.count():,} vectors"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,204 @@
+"""
+增量索引模組
+
+以 chunk 內容雜湊比對向量庫中既有的 chunks：
+    - 內容未變的 chunk 保留原向量（位置改變時只更新 metadata）
+    - 只為新增或內容改變的 chunk 計算 Embedding
+    - 已不存在的 chunk 從向量庫刪除（漸進式索引時，已重新寫入的頁面先刪除，其餘在完成時刪除）
+
+向量庫中的 chunk ID 以內容雜湊產生（{document_id}_{hash}），
+因此切分結果平移（插入/刪除段落）時，未變更的 chunk 仍能對應到原本的向量。
+"""
+
+import hashlib
+from collections import Counter
+from typing import Dict, List, Optional
+
+from .embedding import AzureEmbeddingClient
+from .metrics import EmbeddingUsage
+from .vector_store import VectorStore
+
+# chunk ID 中使用的雜湊長度
+_CHUNK_ID_HASH_LENGTH = 24
+
+
+def get_embedding_key(embedding_client: AzureEmbeddingClient, dimensions: Optional[int] = None) -> str:
+    """
+    取得 Embedding 設定鍵（模型部署 + 維度）
+
+    只有這兩者相同時，相同文本的向量才可互相重用；切分設定不影響向量本身。
+    dimensions 可覆寫客戶端的維度（轉換向量維度時計算目標設定的鍵）。
+    """
+    return f"{embedding_client.deployment}:{dimensions or embedding_client.get_embedding_dimension()}"
+
+
+def compute_chunk_hash(content: str, embedding_key: str) -> str:
+    """計算 chunk 內容雜湊（文本 + Embedding 設定）"""
+    return hashlib.sha256(f"{embedding_key}\n{content}".encode("utf-8")).hexdigest()
+
+
+def assign_chunk_ids(
+    document_id: str,
+    chunk_data: List[dict],
+    embedding_key: str,
+    occurrences: Counter
+) -> None:
+    """
+    為 chunks 計算內容雜湊與 chunk ID（同一文檔內重複的內容以序號區分）
+
+    Args:
+        document_id: 文檔 ID
+        chunk_data: 依 chunk 順序的 chunk 列表，會被補上 content_hash 與 chunk_id（已有 chunk_id 者略過）
+        embedding_key: Embedding 設定鍵
+        occurrences: 文檔內各 chunk ID 已出現的次數（分批呼叫時共用）
+    """
+    for chunk in chunk_data:
+        if "chunk_id" in chunk:
+            continue
+        content_hash = compute_chunk_hash(chunk["content"], embedding_key)
+        base_id = f"{document_id}_{content_hash[:_CHUNK_ID_HASH_LENGTH]}"
+        occurrence = occurrences[base_id]
+        occurrences[base_id] += 1
+
+        chunk["content_hash"] = content_hash
+        chunk["chunk_id"] = base_id if occurrence == 0 else f"{base_id}_{occurrence}"
+
+
+class IncrementalIndexer:
+    """
+    單一文檔的增量索引器
+
+    使用方式：
+        indexer = IncrementalIndexer(document_id, vector_store, embedding_client)
+        embeddings = indexer.embed(chunk_data)     # 可分批呼叫
+        indexer.store(chunk_data, embeddings)
+        indexer.delete_stale(pages_indexed)        # 可選：刪除已重新寫入頁面的舊 chunks
+        indexer.finish()                           # 刪除其餘已不存在的 chunks
+    """
+
+    def __init__(
+        self,
+        document_id: str,
+        vector_store: VectorStore,
+        embedding_client: AzureEmbeddingClient
+    ):
+        self.document_id = document_id
+        self.vector_store = vector_store
+        self.embedding_client = embedding_client
+        self.embedding_key = get_embedding_key(embedding_client)
+
+        # 向量庫中既有的 chunks：{chunk_id: metadata}
+        self.existing: Dict[str, dict] = vector_store.get_chunk_metadata(document_id)
+        self.kept_ids: set = set()
+        self._occurrences: Counter = Counter()
+
+        self.embedded_count = 0   # 實際計算 Embedding 的 chunk 數
+        self.reused_count = 0     # 重用既有向量的 chunk 數
+        self.deleted_count = 0    # 從向量庫刪除的 chunk 數
+        self.usage = EmbeddingUsage()
+
+    def _assign_ids(self, chunk_data: List[dict]) -> None:
+        assign_chunk_ids(self.document_id, chunk_data, self.embedding_key, self._occurrences)
+
+    def embed(self, chunk_data: List[dict]) -> List[Optional[List[float]]]:
+        """
+        只為向量庫中不存在的 chunks 計算 Embedding
+
+        Args:
+            chunk_data: chunk 列表（index, content, page_numbers），會被補上 content_hash 與 chunk_id
+
+        Returns:
+            List[Optional[List[float]]]: 與 chunk_data 對應的向量，重用既有向量者為 None
+        """
+        self._assign_ids(chunk_data)
+
+        pending = [i for i, c in enumerate(chunk_data) if c["chunk_id"] not in self.existing]
+        embeddings: List[Optional[List[float]]] = [None] * len(chunk_data)
+
+        if pending:
+            vectors = self.embedding_client.embed_texts(
+                [chunk_data[i]["content"] for i in pending],
+                self.usage
+            )
+            if len(vectors) != len(pending):
+                raise ValueError("Embedding 數量與 chunk 數量不匹配")
+            for i, vector in zip(pending, vectors):
+                embeddings[i] = vector
+
+        self.embedded_count += len(pending)
+        self.reused_count += len(chunk_data) - len(pending)
+        return embeddings
+
+    def store(self, chunk_data: List[dict], embeddings: List[Optional[List[float]]]) -> int:
+        """
+        寫入新的 chunks，並更新位置改變的既有 chunks 的 metadata
+
+        Returns:
+            int: 寫入後此批次在向量庫中的 chunk 數量
+        """
+        new_chunks, new_embeddings = [], []
+        moved_chunks = []
+
+        for chunk, embedding in zip(chunk_data, embeddings):
+            chunk_id = chunk["chunk_id"]
+            self.kept_ids.add(chunk_id)
+
+            if embedding is not None:
+                new_chunks.append(chunk)
+                new_embeddings.append(embedding)
+                continue
+
+            metadata = self.existing[chunk_id]
+            page_numbers = ",".join(map(str, chunk["page_numbers"]))
+            if metadata.get("chunk_index") != chunk["index"] or metadata.get("page_numbers") != page_numbers:
+                moved_chunks.append(chunk)
+
+        if new_chunks:
+            self.vector_store.add_chunks(self.document_id, new_chunks, new_embeddings)
+        if moved_chunks:
+            self.vector_store.update_chunk_metadata(self.document_id, moved_chunks)
+
+        return len(chunk_data)
+
+    def delete_stale(self, pages_indexed: int) -> int:
+        """
+        刪除起始頁在已完整寫入範圍內、但不在新切分結果中的既有 chunks
+
+        漸進式索引提交 partial 前呼叫，檢索已索引的頁面時不會同時取得新舊兩個版本。
+        被刪除的 chunk 不再視為既有（之後的頁面出現相同內容時重新計算 Embedding）。
+
+        Args:
+            pages_indexed: 已完整寫入向量庫的頁數
+
+        Returns:
+            int: 刪除的 chunk 數量
+        """
+        stale_ids = [
+            chunk_id for chunk_id, metadata in self.existing.items()
+            if chunk_id not in self.kept_ids and _first_page(metadata) <= pages_indexed
+        ]
+        return self._delete(stale_ids)
+
+    def finish(self) -> int:
+        """
+        刪除向量庫中已不存在於新切分結果的 chunks
+
+        Returns:
+            int: 刪除的 chunk 總數（含 delete_stale 已刪除者）
+        """
+        self._delete([chunk_id for chunk_id in self.existing if chunk_id not in self.kept_ids])
+        return self.deleted_count
+
+    def _delete(self, chunk_ids: List[str]) -> int:
+        if chunk_ids:
+            self.vector_store.delete_chunks(chunk_ids)
+            for chunk_id in chunk_ids:
+                del self.existing[chunk_id]
+        self.deleted_count += len(chunk_ids)
+        return len(chunk_ids)
+
+
+def _first_page(metadata: dict) -> float:
+    """chunk metadata 的起始頁（沒有頁碼時視為無限大，只在 finish 時刪除）"""
+    pages = [int(p) for p in str(metadata.get("page_numbers") or "").split(",") if p]
+    return min(pages) if pages else float("inf")
@@ -0,0 +1,105 @@
+"""
+RAG 處理指標模組
+
+記錄每個處理階段的耗時、輸入大小、Embedding token 與重試次數、行程記憶體峰值，
+寫入 RagProcessingLog 的 metadata，供 /api/rag/metrics 彙總百分位數。
+"""
+
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator
+
+try:
+    import resource
+except ImportError:  # Windows 沒有 resource 模組
+    resource = None
+
+
+def peak_rss_mb() -> float:
+    """
+    取得目前行程的記憶體峰值（MB）
+
+    注意：這是行程層級的最高水位，長時間執行的 worker 會反映到目前為止處理過的最大文檔。
+    """
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 為單位，macOS 以 bytes 為單位
+    if sys.platform == "darwin":
+        return round(peak / (1024 * 1024), 1)
+    return round(peak / 1024, 1)
+
+
+@dataclass
+class EmbeddingUsage:
+    """Embedding 呼叫統計（由 AzureEmbeddingClient 累加）"""
+    batches: int = 0          # 送出的批次數
+    requests: int = 0         # 實際 API 請求數（含重試）
+    prompt_tokens: int = 0    # 回應中回報的 token 數
+    throttled: int = 0        # 收到速率限制（429）的次數
+    store_hits: int = 0       # 由 Embedding 向量儲存取得（未呼叫 API）的文本數
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @property
+    def retries(self) -> int:
+        return max(self.requests - self.batches, 0)
+
+    def add_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def add_throttle(self) -> None:
+        with self._lock:
+            self.throttled += 1
+
+    def add_store_hits(self, count: int) -> None:
+        with self._lock:
+            self.store_hits += count
+
+    def add_batch(self, prompt_tokens: int) -> None:
+        with self._lock:
+            self.batches += 1
+            self.prompt_tokens += prompt_tokens
+
+    def to_dict(self) -> Dict[str, int]:
+        return {
+            "embedding_batches": self.batches,
+            "embedding_requests": self.requests,
+            "embedding_tokens": self.prompt_tokens,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "embedding_store_hits": self.store_hits,
+        }
+
+
+class StageTimer:
+    """
+    累計單一階段的執行時間
+
+    串流模式下各階段交錯執行，以累計的實際工作時間（不含等待佇列的時間）作為階段耗時。
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    @contextmanager
+    def measure(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds += time.perf_counter() - start
+
+    @property
+    def duration_ms(self) -> int:
+        return int(self.seconds * 1000)
+
+
+def stage_metrics(duration_ms: int, **fields) -> dict:
+    """組合階段指標（附上記憶體峰值），供 log_rag_event 的 metadata 使用"""
+    metrics = {"duration_ms": duration_ms, "peak_rss_mb": peak_rss_mb()}
+    metrics.update(fields)
+    return metrics
@@ -0,0 +1,219 @@
+"""
+文本正規化模組
+
+在解析之後、切分之前清理頁面文本，減少被切分與向量化的無用內容：
+    - 移除跨頁重複的頁首 / 頁尾（書眉、期刊標題、版權聲明）與頁碼
+    - 修復行尾連字號斷字（exam-\\nple → example）
+    - NFKC 正規化（全形英數、連字 ﬁ → fi 等）
+
+頁首頁尾的判斷依據「位置 + 頻率」：只考慮每頁最前與最後幾行，
+將數字替換為 # 後，在足夠多頁的同一區域重複出現的行視為版面元素。
+每頁只掃描一次，整體為線性時間。
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+# 正規化邏輯的版本：規則改變時遞增（納入 RAG 指紋，使既有結果不再被重用）
+NORMALIZER_VERSION = 1
+
+# 單獨成行的頁碼：12、- 12 -、Page 12、12 / 300、第 12 頁、xii
+_PAGE_NUMBER_RE = re.compile(
+    r"^[\W_]*(?:page\s*)?(?:\d+|(?=[ivxlcdm])m{0,3}(?:cm|cd|d?c{0,3})(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3}))"
+    r"(?:\s*(?:of|/)\s*\d+)?[\W_]*$"
+    r"|^第\s*\d+\s*頁$",
+    re.IGNORECASE,
+)
+_DIGITS_RE = re.compile(r"\d+")
+# 行尾斷字：字母 + 連字號（前一個字元必須是字母，避免誤併「-」項目符號或區間「1-」）
+_HYPHEN_END_RE = re.compile(r"[^\W\d_]-$")
+
+
+@dataclass
+class NormalizeConfig:
+    """
+    正規化配置
+
+    Attributes:
+        edge_lines: 每頁視為頁首 / 頁尾候選的行數（各自）
+        min_pages: 重複行至少出現的頁數
+        min_ratio: 重複行至少出現在多少比例的頁面（奇偶頁書眉不同，因此不宜設太高）
+        sample_pages: 串流處理時用來判斷頁首頁尾的前置頁數（None 表示使用全部頁面）
+    """
+    edge_lines: int = 3
+    min_pages: int = 3
+    min_ratio: float = 0.3
+    sample_pages: Optional[int] = None
+
+
+@dataclass
+class NormalizeStats:
+    """正規化統計：輸入 / 輸出字元數與各項清理的數量"""
+    input_chars: int = 0
+    output_chars: int = 0
+    boilerplate_lines: int = 0
+    page_number_lines: int = 0
+    hyphen_joins: int = 0
+
+    @property
+    def removed_chars(self) -> int:
+        return self.input_chars - self.output_chars
+
+    def to_dict(self) -> dict:
+        return {
+            "normalize_input_chars": self.input_chars,
+            "normalize_removed_chars": self.removed_chars,
+            "boilerplate_lines": self.boilerplate_lines,
+            "page_number_lines": self.page_number_lines,
+            "hyphen_joins": self.hyphen_joins,
+        }
+
+
+def _line_key(line: str) -> str:
+    """比對用的行鍵：NFKC、小寫、數字替換為 #、壓縮空白"""
+    line = unicodedata.normalize("NFKC", line).lower()
+    return " ".join(_DIGITS_RE.sub("#", line).split())
+
+
+def _edge_lines(lines: List[str], edge_lines: int) -> Tuple[List[int], List[int]]:
+    """
+    頁首 / 頁尾區域的行索引（只計非空行）
+
+    區域大小不超過非空行數的 1/3，避免短頁面的正文整頁被當成頁首頁尾。
+    """
+    non_empty = [i for i, line in enumerate(lines) if line.strip()]
+    edge = min(edge_lines, len(non_empty) // 3) or min(len(non_empty), 1)
+    return non_empty[:edge], non_empty[-edge:] if edge else []
+
+
+def _edge_candidates(lines: List[str], edge_lines: int) -> Set[Tuple[str, str]]:
+    """每頁頁首 / 頁尾區域的候選 (區域, 行鍵)；同一頁內重複只計一次"""
+    head, foot = _edge_lines(lines, edge_lines)
+    candidates = {("head", _line_key(lines[i])) for i in head}
+    candidates.update(("foot", _line_key(lines[i])) for i in foot)
+    return candidates
+
+
+def detect_boilerplate(
+    pages: Iterable[dict],
+    config: Optional[NormalizeConfig] = None
+) -> Set[Tuple[str, str]]:
+    """
+    找出跨頁重複的頁首 / 頁尾行
+
+    Args:
+        pages: 頁面列表（{page_number, content}）
+        config: 正規化配置
+
+    Returns:
+        Set[Tuple[str, str]]: 視為版面元素的 (區域, 行鍵)
+    """
+    config = config or NormalizeConfig()
+    counts: Counter = Counter()
+    page_count = 0
+    for page in pages:
+        page_count += 1
+        counts.update(_edge_candidates(page["content"].split("\n"), config.edge_lines))
+
+    threshold = max(config.min_pages, math.ceil(page_count * config.min_ratio))
+    return {key for key, count in counts.items() if count >= threshold and key[1]}
+
+
+def normalize_page_text(
+    content: str,
+    boilerplate: Set[Tuple[str, str]],
+    stats: NormalizeStats,
+    config: Optional[NormalizeConfig] = None
+) -> str:
+    """
+    正規化單頁文本（單次線性掃描）
+
+    Args:
+        content: 頁面文本（_clean_text 的輸出）
+        boilerplate: detect_boilerplate 的結果
+        stats: 累計統計（就地更新）
+        config: 正規化配置
+
+    Returns:
+        str: 正規化後的文本
+    """
+    config = config or NormalizeConfig()
+    stats.input_chars += len(content)
+
+    lines = content.split("\n")
+    head_lines, foot_lines = _edge_lines(lines, config.edge_lines)
+    head, foot = set(head_lines), set(foot_lines)
+
+    output: List[str] = []
+    for i, line in enumerate(lines):
+        if i in head or i in foot:
+            if _PAGE_NUMBER_RE.match(line.strip()):
+                stats.page_number_lines += 1
+                continue
+            key = _line_key(line)
+            if (i in head and ("head", key) in boilerplate) or (i in foot and ("foot", key) in boilerplate):
+                stats.boilerplate_lines += 1
+                continue
+
+        line = unicodedata.normalize("NFKC", line)
+
+        # 上一行以斷字連字號結尾，且本行以小寫字母開頭：合併為同一個字
+        if output and line[:1].islower() and _HYPHEN_END_RE.search(output[-1]):
+            output[-1] = output[-1][:-1] + line
+            stats.hyphen_joins += 1
+            continue
+        output.append(line)
+
+    # 移除頁首頁尾後可能留下開頭 / 結尾的空行
+    text = "\n".join(output).strip("\n")
+    stats.output_chars += len(text)
+    return text
+
+
+def normalize_pages(
+    pages: Iterable[dict],
+    stats: NormalizeStats,
+    config: Optional[NormalizeConfig] = None
+) -> Iterator[dict]:
+    """
+    正規化逐頁內容
+
+    config.sample_pages 為 None 時先讀完全部頁面再判斷頁首頁尾（批次模式）；
+    否則只緩衝前 sample_pages 頁作為判斷依據，其餘頁面直接串流通過，記憶體用量固定。
+
+    帶有 layout（版面模式）的頁面不做修改，避免區塊字元範圍失效。
+
+    Args:
+        pages: 逐頁內容（{page_number, content}）
+        stats: 累計統計（就地更新）
+        config: 正規化配置
+
+    Yields:
+        dict: 正規化後的頁面（新的 dict，不修改輸入）
+    """
+    config = config or NormalizeConfig()
+    pages = iter(pages)
+
+    if config.sample_pages is None:
+        sample = list(pages)
+    else:
+        sample = list(islice(pages, config.sample_pages))
+    boilerplate = detect_boilerplate(sample, config)
+
+    def _normalize(page: dict) -> dict:
+        if "layout" in page:
+            return page
+        return {
+            **page,
+            "content": normalize_page_text(page["content"], boilerplate, stats, config),
+        }
+
+    for page in sample:
+        yield _normalize(page)
+    for page in pages:
+        yield _normalize(page)
@@ -0,0 +1,276 @@
+"""
+解析結果快取模組
+
+將 PDF 的逐頁解析結果以 gzip 壓縮的 JSONL 檔案保存在本地目錄，
+以「內容雜湊 + 解析器版本」為鍵：
+    - 重新處理、重建索引、切分實驗可直接讀取頁面文本，不需重新開啟與解析 PDF
+    - 目錄總大小超過上限時，依最後存取時間（mtime）淘汰最舊的檔案（LRU）
+    - 最近使用的文檔另外保留在行程記憶體中，單頁查詢不需解壓縮
+"""
+
+import gzip
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_FILE_SUFFIX = ".jsonl.gz"
+
+
+class PageCacheWriter:
+    """
+    逐頁寫入快取（供串流管線邊解析邊寫入）
+
+    先寫入臨時檔案，commit() 時才以 os.replace 原子地放到正式位置；
+    未 commit 即關閉（例如解析失敗）時刪除臨時檔案。
+    """
+
+    def __init__(self, cache: "PageCache", key: str):
+        self._cache = cache
+        self._key = key
+        self._tmp_path = os.path.join(cache.cache_dir, f".{key}.{uuid.uuid4().hex}.tmp")
+        self._file = gzip.open(self._tmp_path, "wt", encoding="utf-8", compresslevel=cache.compress_level)
+        self._committed = False
+
+    def write(self, page: dict) -> None:
+        record = {"page_number": page["page_number"], "content": page["content"]}
+        if "layout" in page:
+            record["layout"] = page["layout"]
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+        self._file.write("\n")
+
+    def commit(self) -> None:
+        self._file.close()
+        os.replace(self._tmp_path, self._cache._path(self._key))
+        self._committed = True
+        self._cache._evict()
+
+    def close(self) -> None:
+        if self._committed:
+            return
+        try:
+            self._file.close()
+        finally:
+            try:
+                os.unlink(self._tmp_path)
+            except OSError:
+                pass
+
+
+class PageCache:
+    """
+    本地目錄的解析結果快取
+
+    所有方法皆為 best-effort：讀寫失敗只記錄警告，不影響 RAG 處理流程。
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int,
+        memory_entries: int = 8,
+        compress_level: int = 6
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.compress_level = compress_level
+        self._memory: "OrderedDict[str, List[dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(content_hash: str, parser_key: str) -> str:
+        """快取鍵：內容雜湊 + 解析器版本（解析器輸出改變時自動失效）"""
+        return f"{content_hash}-{parser_key}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}{_FILE_SUFFIX}")
+
+    def _remember(self, key: str, pages: List[dict]) -> None:
+        if self.memory_entries <= 0:
+            return
+        with self._lock:
+            self._memory[key] = pages
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get_pages(self, content_hash: str, parser_key: str) -> Optional[List[dict]]:
+        """
+        讀取快取的頁面列表
+
+        Returns:
+            Optional[List[dict]]: [{page_number, content}]，未命中時返回 None
+        """
+        key = self.make_key(content_hash, parser_key)
+        with self._lock:
+            pages = self._memory.get(key)
+            if pages is not None:
+                self._memory.move_to_end(key)
+                return pages
+
+        path = self._path(key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                pages = [json.loads(line) for line in f if line.strip()]
+            os.utime(path)  # 更新存取時間，供 LRU 淘汰使用
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Failed to read page cache {path}: {e}")
+            return None
+
+        self._remember(key, pages)
+        return pages
+
+    def get_page_text(self, content_hash: str, parser_key: str, page_number: int) -> Optional[str]:
+        """讀取單頁文本（page_number 從 1 開始），未命中時返回 None"""
+        pages = self.get_pages(content_hash, parser_key)
+        if pages is None or page_number < 1 or page_number > len(pages):
+            return None
+        return pages[page_number - 1]["content"]
+
+    def put_pages(self, content_hash: str, parser_key: str, pages: Iterable[dict]) -> None:
+        """寫入完整的頁面列表"""
+        pages = list(pages)
+        writer = None
+        try:
+            writer = self.writer(content_hash, parser_key)
+            for page in pages:
+                writer.write(page)
+            writer.commit()
+            self._remember(self.make_key(content_hash, parser_key), pages)
+        except Exception as e:
+            logger.warning(f"Failed to write page cache for {content_hash}: {e}")
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def writer(self, content_hash: str, parser_key: str) -> PageCacheWriter:
+        """建立逐頁寫入器"""
+        return PageCacheWriter(self, self.make_key(content_hash, parser_key))
+
+    def tee_pages(
+        self,
+        pages: Iterable[dict],
+        content_hash: str,
+        parser_key: str
+    ) -> Iterator[dict]:
+        """
+        包裝逐頁產生器：產出每一頁的同時寫入快取，完整走完才 commit
+
+        中途失敗或提前結束時不寫入（避免留下不完整的快取）。
+        """
+        writer = None
+        try:
+            writer = self.writer(content_hash, parser_key)
+        except Exception as e:
+            logger.warning(f"Failed to open page cache writer for {content_hash}: {e}")
+
+        try:
+            for page in pages:
+                if writer is not None:
+                    try:
+                        writer.write(page)
+                    except Exception as e:
+                        logger.warning(f"Failed to write page cache for {content_hash}: {e}")
+                        writer.close()
+                        writer = None
+                yield page
+
+            if writer is not None:
+                try:
+                    writer.commit()
+                except Exception as e:
+                    logger.warning(f"Failed to commit page cache for {content_hash}: {e}")
+        finally:
+            if writer is not None:
+                writer.close()
+            close = getattr(pages, "close", None)
+            if close:
+                close()
+
+    def invalidate(self, content_hash: str, parser_key: str) -> None:
+        key = self.make_key(content_hash, parser_key)
+        with self._lock:
+            self._memory.pop(key, None)
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        """目錄總大小超過上限時，依最後存取時間淘汰最舊的檔案"""
+        try:
+            entries = []
+            total = 0
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if not entry.name.endswith(_FILE_SUFFIX):
+                        continue
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+            if total <= self.max_bytes:
+                return
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(path)
+                    total -= size
+                except OSError:
+                    pass
+        except Exception as e:
+            logger.warning(f"Failed to evict page cache: {e}")
+
+
+# 模組級別的快取實例（延遲初始化）
+_page_cache: Optional[PageCache] = None
+_page_cache_initialized = False
+
+
+def get_page_cache() -> Optional[PageCache]:
+    """
+    取得解析結果快取單例
+
+    RAG_PAGE_CACHE_MAX_MB 設為 0 時停用快取，返回 None。
+
+    Returns:
+        Optional[PageCache]: 快取實例
+    """
+    global _page_cache, _page_cache_initialized
+
+    if not _page_cache_initialized:
+        _page_cache_initialized = True
+        max_mb = int(os.getenv("RAG_PAGE_CACHE_MAX_MB", "1024"))
+        if max_mb > 0:
+            try:
+                _page_cache = PageCache(
+                    cache_dir=os.getenv("RAG_PAGE_CACHE_DIR", "./page_cache"),
+                    max_bytes=max_mb * 1024 * 1024,
+                    memory_entries=int(os.getenv("RAG_PAGE_CACHE_MEMORY_ENTRIES", "8")),
+                )
+            except OSError as e:
+                logger.warning(f"Page cache disabled: {e}")
+
+    return _page_cache
+
+
+def reset_page_cache() -> None:
+    """
+    重置解析結果快取（主要用於測試）
+    """
+    global _page_cache, _page_cache_initialized
+    _page_cache = None
+    _page_cache_initialized = False
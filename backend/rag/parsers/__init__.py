@@ -10,8 +10,21 @@ Parser 工廠模組 - 提供統一的解析器選擇介面
     - Phase 3 (未來): 新增 Azure Document Intelligence、Marker 等進階解析器
 """
 
-from typing import Callable, TypedDict, List, Optional
+from typing import Callable, Iterator, NotRequired, TypedDict, List, Optional
 from .pymupdf_parser import parse_pdf as pymupdf_parse
+from .pymupdf_parser import iter_pages as pymupdf_iter_pages
+from .pymupdf_parser import parse_page_range as pymupdf_parse_page_range
+from .pymupdf_parser import PARSER_VERSION as PYMUPDF_PARSER_VERSION
+from .pymupdf_parser import build_content
+from .pymupdf_parser import extract_pages, extract_page_text
+from .handle_pool import get_handle_pool, reset_handle_pool
+from .layout import (
+    LAYOUT_PARSER_VERSION, PageLayout, parse_pdf_layout, iter_pages_layout, parse_page_range_layout,
+)
+from .sandbox import (
+    ParseSandboxError, parse_in_sandbox, iter_pages_in_sandbox, get_sandbox_stats, reset_parse_sandbox,
+)
+from .source import DocumentSource, SourceLike, as_document_source
 
 
 class PageContent(TypedDict):
@@ -21,9 +34,11 @@ class PageContent(TypedDict):
     Attributes:
         page_number: 頁碼（從 1 開始）
         content: 該頁擷取的文字內容
+        layout: 版面模式的區塊索引（見 PageLayout.to_dict()），其他模式不提供
     """
     page_number: int
     content: str
+    layout: NotRequired[dict]
 
 
 class ParseResult(TypedDict):
@@ -46,8 +61,14 @@ class ParseResult(TypedDict):
     error: Optional[str]
 
 
-# 解析器函數的類型別名：接受檔案路徑，返回 ParseResult
-ParserFunction = Callable[[str], ParseResult]
+# 解析器函數的類型別名：接受文檔來源（檔案路徑、bytes / memoryview 或 DocumentSource），返回 ParseResult
+ParserFunction = Callable[[SourceLike], ParseResult]
+
+# 逐頁解析函數的類型別名：接受文檔來源，逐頁產出 PageContent
+PageIteratorFunction = Callable[[SourceLike], Iterator[PageContent]]
+
+# 頁面範圍解析函數的類型別名：接受文檔來源與 [start, end)（0-indexed），返回 {page_count, pages}
+PageRangeFunction = Callable[[SourceLike, int, int], dict]
 
 
 def get_parser(parser_type: str = "pymupdf") -> ParserFunction:
@@ -55,7 +76,7 @@ def get_parser(parser_type: str = "pymupdf") -> ParserFunction:
     取得指定類型的 PDF 解析器
 
     Args:
-        parser_type: 解析器類型，目前僅支援 "pymupdf"
+        parser_type: 解析器類型，目前支援 "pymupdf" 與 "pymupdf_layout"
                     階段三將新增 "azure_di" 和 "marker"
 
     Returns:
@@ -66,6 +87,8 @@ def get_parser(parser_type: str = "pymupdf") -> ParserFunction:
     """
     if parser_type == "pymupdf":
         return pymupdf_parse
+    elif parser_type == "pymupdf_layout":
+        return parse_pdf_layout
     # 階段三擴展：
     # elif parser_type == "azure_di":
     #     from .azure_parser import parse_pdf as azure_parse
@@ -77,4 +100,83 @@ def get_parser(parser_type: str = "pymupdf") -> ParserFunction:
         raise ValueError(f"不支援的解析器類型: {parser_type}")
 
 
-__all__ = ["get_parser", "ParseResult", "PageContent"]
+def get_page_iterator(parser_type: str = "pymupdf") -> PageIteratorFunction:
+    """
+    取得指定類型的逐頁解析器（供串流處理管線使用）
+
+    Args:
+        parser_type: 解析器類型，目前支援 "pymupdf" 與 "pymupdf_layout"
+
+    Returns:
+        逐頁解析函數
+
+    Raises:
+        ValueError: 不支援的解析器類型
+    """
+    if parser_type == "pymupdf":
+        return pymupdf_iter_pages
+    elif parser_type == "pymupdf_layout":
+        return iter_pages_layout
+    else:
+        raise ValueError(f"不支援的解析器類型: {parser_type}")
+
+
+def get_page_range_parser(parser_type: str = "pymupdf") -> PageRangeFunction:
+    """
+    取得指定類型的頁面範圍解析器（供沙箱平行解析分段使用）
+
+    各範圍的結果依頁碼合併後，與 get_parser(parser_type) 的 pages 相同。
+
+    Args:
+        parser_type: 解析器類型，目前支援 "pymupdf" 與 "pymupdf_layout"
+
+    Returns:
+        頁面範圍解析函數
+
+    Raises:
+        ValueError: 不支援的解析器類型
+    """
+    if parser_type == "pymupdf":
+        return pymupdf_parse_page_range
+    elif parser_type == "pymupdf_layout":
+        return parse_page_range_layout
+    else:
+        raise ValueError(f"不支援的解析器類型: {parser_type}")
+
+
+def get_parser_cache_key(parser_type: str = "pymupdf") -> str:
+    """
+    取得解析器的快取鍵（解析器類型 + 版本），供解析結果快取使用
+
+    Raises:
+        ValueError: 不支援的解析器類型
+    """
+    if parser_type == "pymupdf":
+        return f"pymupdf-{PYMUPDF_PARSER_VERSION}"
+    elif parser_type == "pymupdf_layout":
+        return f"pymupdf_layout-{LAYOUT_PARSER_VERSION}"
+    else:
+        raise ValueError(f"不支援的解析器類型: {parser_type}")
+
+
+__all__ = [
+    "get_parser",
+    "get_page_iterator",
+    "get_page_range_parser",
+    "get_parser_cache_key",
+    "build_content",
+    "extract_pages",
+    "extract_page_text",
+    "get_handle_pool",
+    "reset_handle_pool",
+    "ParseSandboxError",
+    "parse_in_sandbox",
+    "iter_pages_in_sandbox",
+    "get_sandbox_stats",
+    "reset_parse_sandbox",
+    "ParseResult",
+    "PageLayout",
+    "PageContent",
+    "DocumentSource",
+    "as_document_source",
+]
@@ -0,0 +1,175 @@
+"""
+PDF 文件控制代碼池
+
+逐頁讀取（閱讀器面板、單頁 API）時，同一份 PDF 會被連續讀取多頁；
+每次都 fitz.open 整份文件的成本遠大於提取一頁文本。此模組提供：
+    - 已開啟 fitz.Document 的 LRU 池（以檔案路徑 + 修改時間 + 大小為鍵，檔案改變時自動失效）
+    - 已清理頁面文本的有界 memo
+
+fitz.Document 不是執行緒安全的，每個控制代碼各自持有一把鎖；
+池以行程 ID 區分，fork 出的子行程不會沿用父行程開啟的控制代碼。
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+# PDF_HANDLE_POOL_SIZE: 同時保持開啟的 PDF 數量（0 表示停用，每次讀取都重新開啟）
+# PDF_PAGE_TEXT_MEMO_SIZE: 保留的已清理頁面文本數量（0 表示停用）
+HANDLE_POOL_SIZE = int(os.getenv("PDF_HANDLE_POOL_SIZE", "8"))
+PAGE_TEXT_MEMO_SIZE = int(os.getenv("PDF_PAGE_TEXT_MEMO_SIZE", "2048"))
+
+# (絕對路徑, 修改時間, 檔案大小)
+FileKey = Tuple[str, int, int]
+
+
+class _PooledDocument:
+    """池中的單一控制代碼：fitz 文件 + 保護它的鎖"""
+
+    def __init__(self, doc: "fitz.Document"):
+        self.doc = doc
+        self.lock = threading.Lock()
+
+
+class DocumentHandlePool:
+    """
+    fitz.Document 控制代碼與頁面文本的 LRU 池
+
+    Args:
+        max_handles: 最多保持開啟的文件數
+        max_pages: 最多保留的頁面文本數
+    """
+
+    def __init__(self, max_handles: int = HANDLE_POOL_SIZE, max_pages: int = PAGE_TEXT_MEMO_SIZE):
+        self.max_handles = max_handles
+        self.max_pages = max_pages
+        self._handles: "OrderedDict[FileKey, _PooledDocument]" = OrderedDict()
+        self._texts: "OrderedDict[Tuple[FileKey, int], str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def file_key(file_path: str) -> FileKey:
+        """
+        取得檔案的池鍵
+
+        Raises:
+            FileNotFoundError: 檔案不存在
+        """
+        stat = os.stat(file_path)
+        return (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+
+    def get_text(self, key: FileKey, page_index: int) -> Optional[str]:
+        """查詢頁面文本 memo（page_index 為 0-indexed），未命中時返回 None"""
+        with self._lock:
+            text = self._texts.get((key, page_index))
+            if text is not None:
+                self._texts.move_to_end((key, page_index))
+            return text
+
+    def put_text(self, key: FileKey, page_index: int, text: str) -> None:
+        if self.max_pages <= 0:
+            return
+        with self._lock:
+            self._texts[(key, page_index)] = text
+            self._texts.move_to_end((key, page_index))
+            while len(self._texts) > self.max_pages:
+                self._texts.popitem(last=False)
+
+    def use(self, key: FileKey, fn: Callable[["fitz.Document"], object]) -> object:
+        """
+        以池中的控制代碼執行 fn(doc)（持有該控制代碼的鎖）
+
+        池停用時直接開啟並在執行後關閉。
+        """
+        if self.max_handles <= 0:
+            doc = fitz.open(key[0])
+            try:
+                return fn(doc)
+            finally:
+                doc.close()
+
+        with self._lock:
+            pooled = self._handles.get(key)
+            if pooled is not None:
+                self._handles.move_to_end(key)
+
+        if pooled is None:
+            # 在池鎖之外開啟，避免大型文件阻塞其他文件的讀取
+            opened = _PooledDocument(fitz.open(key[0]))
+            evicted = []
+            with self._lock:
+                pooled = self._handles.get(key)
+                if pooled is None:
+                    pooled = opened
+                    self._handles[key] = pooled
+                    while len(self._handles) > self.max_handles:
+                        evicted.append(self._handles.popitem(last=False)[1])
+                else:
+                    evicted.append(opened)
+            # 被淘汰的控制代碼若正被其他執行緒使用，等它用完再關閉
+            for stale in evicted:
+                _close_when_idle(stale)
+
+        with pooled.lock:
+            # 控制代碼可能在取得鎖之前被淘汰並關閉，此時改用臨時開啟的文件
+            if pooled.doc.is_closed:
+                doc = fitz.open(key[0])
+                try:
+                    return fn(doc)
+                finally:
+                    doc.close()
+            return fn(pooled.doc)
+
+    def clear(self) -> None:
+        """關閉所有控制代碼並清空 memo"""
+        with self._lock:
+            handles = list(self._handles.values())
+            self._handles.clear()
+            self._texts.clear()
+        for pooled in handles:
+            _close_when_idle(pooled)
+
+
+def _close_when_idle(pooled: _PooledDocument) -> None:
+    with pooled.lock:
+        if not pooled.doc.is_closed:
+            pooled.doc.close()
+
+
+# 模組級別的池實例（每個行程各自一份）
+_pool: Optional[DocumentHandlePool] = None
+_pool_pid: Optional[int] = None
+_pool_init_lock = threading.Lock()
+
+
+def get_handle_pool() -> DocumentHandlePool:
+    """
+    取得目前行程的控制代碼池單例
+
+    Returns:
+        DocumentHandlePool: 池實例
+    """
+    global _pool, _pool_pid
+
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_init_lock:
+            if _pool is None or _pool_pid != pid:
+                # fork 後父行程的控制代碼不可共用，直接捨棄（不關閉，避免影響父行程）
+                _pool = DocumentHandlePool()
+                _pool_pid = pid
+    return _pool
+
+
+def reset_handle_pool() -> None:
+    """
+    關閉並重置控制代碼池（主要用於測試）
+    """
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.clear()
+    _pool = None
+    _pool_pid = None
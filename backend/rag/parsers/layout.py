@@ -0,0 +1,304 @@
+"""
+版面感知解析模式
+
+以 get_text("blocks") 逐區塊提取文本，除了頁面文本外，另外產出每頁的區塊索引：
+    - 每個區塊的相對座標框（0-1，左上角為原點，與 Highlight 的 x/y/width/height 一致）
+    - 每個區塊在頁面文本中的字元範圍 [start, end)
+
+索引以 array 保存（而非 dict 列表），序列化後也只有兩個扁平數值列表；
+座標 → 文本、文本 → 座標的查詢皆以二分搜尋完成，不需掃描整頁。
+
+頁面文本為各區塊清理後的文本以空行串接（區塊即段落），
+字元範圍直接對應 chunking 使用的頁面內容。
+"""
+
+import re
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterator, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+from .pymupdf_parser import PARSER_VERSION, _clean_text, build_content
+from .source import SourceLike, as_document_source
+
+# 版面模式的版本：區塊切分或索引格式改變時遞增，使解析結果快取失效
+LAYOUT_PARSER_VERSION = f"{PARSER_VERSION}-layout1"
+
+# 區塊之間的分隔（字元範圍不含分隔符）
+BLOCK_SEPARATOR = "\n\n"
+
+# 座標序列化時保留的小數位數
+_COORD_DIGITS = 4
+
+
+class PageLayout:
+    """
+    單頁的區塊索引
+
+    區塊依文本順序（閱讀順序）編號；另外保存依 y0 排序的索引排列與 y1 前綴最大值，
+    讓矩形查詢能以兩次二分搜尋縮小候選範圍。
+
+    Attributes:
+        content: 頁面文本
+        boxes: 區塊座標 [x0, y0, x1, y1, ...]（相對座標，每個區塊 4 個值）
+        spans: 區塊字元範圍 [start, end, ...]（每個區塊 2 個值，依 start 遞增）
+    """
+
+    __slots__ = ("content", "boxes", "spans", "_starts", "_by_y0", "_y0_sorted", "_max_y1")
+
+    def __init__(self, content: str, boxes: array, spans: array):
+        self.content = content
+        self.boxes = boxes
+        self.spans = spans
+        self._starts = spans[0::2]
+
+        count = len(spans) // 2
+        self._by_y0 = array("i", sorted(range(count), key=lambda i: boxes[i * 4 + 1]))
+        self._y0_sorted = array("f", (boxes[i * 4 + 1] for i in self._by_y0))
+        self._max_y1 = array("f")
+        running = 0.0
+        for i in self._by_y0:
+            running = max(running, boxes[i * 4 + 3])
+            self._max_y1.append(running)
+
+    def __len__(self) -> int:
+        return len(self.spans) // 2
+
+    def box(self, index: int) -> Tuple[float, float, float, float]:
+        """區塊的 (x, y, width, height)"""
+        x0, y0, x1, y1 = self.boxes[index * 4:index * 4 + 4]
+        return x0, y0, x1 - x0, y1 - y0
+
+    def span(self, index: int) -> Tuple[int, int]:
+        """區塊的字元範圍 (start, end)"""
+        return self.spans[index * 2], self.spans[index * 2 + 1]
+
+    def blocks_in_rect(self, x: float, y: float, width: float, height: float) -> List[int]:
+        """
+        與矩形相交的區塊（依文本順序）
+
+        y0 已排序、y1 前綴最大值單調遞增，兩次二分搜尋即可找出垂直方向可能相交的區間，
+        只需檢查該區間內的區塊。
+        """
+        top, bottom, left, right = y, y + height, x, x + width
+        lo = bisect_left(self._max_y1, top)
+        hi = bisect_right(self._y0_sorted, bottom)
+
+        hits = []
+        for i in self._by_y0[lo:hi]:
+            x0, y0, x1, y1 = self.boxes[i * 4:i * 4 + 4]
+            if y1 >= top and x0 <= right and x1 >= left:
+                hits.append(i)
+        hits.sort()
+        return hits
+
+    def text_of(self, indices: List[int]) -> str:
+        """指定區塊的文本（以區塊分隔符串接）"""
+        return BLOCK_SEPARATOR.join(
+            self.content[self.spans[i * 2]:self.spans[i * 2 + 1]] for i in indices
+        )
+
+    def text_in_rect(self, x: float, y: float, width: float, height: float) -> str:
+        """矩形內的文本（相交區塊的文本依閱讀順序串接）"""
+        return self.text_of(self.blocks_in_rect(x, y, width, height))
+
+    def block_at_offset(self, offset: int) -> Optional[int]:
+        """包含字元位置 offset 的區塊，落在區塊之間的分隔符時返回 None"""
+        index = bisect_right(self._starts, offset) - 1
+        if index < 0 or offset >= self.spans[index * 2 + 1]:
+            return None
+        return index
+
+    def blocks_for_range(self, start: int, end: int) -> List[int]:
+        """與字元範圍 [start, end) 重疊的區塊"""
+        first = max(bisect_right(self._starts, start) - 1, 0)
+        last = bisect_left(self._starts, end)
+        return [i for i in range(first, last) if self.spans[i * 2 + 1] > start]
+
+    def find_text(self, snippet: str) -> Optional[Tuple[int, int]]:
+        """
+        在頁面文本中尋找片段，返回字元範圍
+
+        先精確比對，找不到時忽略空白差異（換行、連續空白）再比對一次。
+        """
+        snippet = snippet.strip()
+        if not snippet:
+            return None
+        start = self.content.find(snippet)
+        if start >= 0:
+            return start, start + len(snippet)
+        pattern = r"\s+".join(re.escape(word) for word in snippet.split())
+        match = re.search(pattern, self.content)
+        return (match.start(), match.end()) if match else None
+
+    def to_dict(self) -> dict:
+        """序列化（不含頁面文本，頁面文本已存在 page["content"]）"""
+        return {
+            "boxes": [round(v, _COORD_DIGITS) for v in self.boxes],
+            "spans": list(self.spans),
+        }
+
+    @classmethod
+    def from_dict(cls, content: str, data: dict) -> "PageLayout":
+        return cls(content, array("f", data.get("boxes", [])), array("i", data.get("spans", [])))
+
+
+def extract_page_layout(page: "fitz.Page") -> PageLayout:
+    """
+    提取單頁的文本與區塊索引
+
+    Args:
+        page: fitz 頁面
+
+    Returns:
+        PageLayout: 頁面文本與區塊索引
+    """
+    rect = page.rect
+    width = rect.width or 1.0
+    height = rect.height or 1.0
+
+    parts: List[str] = []
+    boxes = array("f")
+    spans = array("i")
+    offset = 0
+
+    # 與純文字模式相同，採用 PDF 內容串流的原始順序（多欄排版通常已是閱讀順序）
+    for x0, y0, x1, y1, text, _block_no, block_type in page.get_text("blocks"):
+        if block_type != 0:  # 略過圖片區塊
+            continue
+        text = _clean_text(text).strip()
+        if not text:
+            continue
+        if parts:
+            offset += len(BLOCK_SEPARATOR)
+        parts.append(text)
+        boxes.extend((
+            (x0 - rect.x0) / width,
+            (y0 - rect.y0) / height,
+            (x1 - rect.x0) / width,
+            (y1 - rect.y0) / height,
+        ))
+        spans.extend((offset, offset + len(text)))
+        offset += len(text)
+
+    return PageLayout(BLOCK_SEPARATOR.join(parts), boxes, spans)
+
+
+def parse_pdf_layout(source: SourceLike) -> dict:
+    """
+    以版面模式解析 PDF
+
+    回傳格式與 parse_pdf 相同，另外每頁附帶 layout（PageLayout.to_dict()）。
+
+    Args:
+        source: PDF 來源（檔案路徑、bytes / memoryview 或 DocumentSource）
+
+    Returns:
+        dict: 解析結果（content / pages / metadata / success / error）
+    """
+    start_time = time.time()
+
+    try:
+        source = as_document_source(source)
+        if not source.exists():
+            return {
+                "content": "",
+                "pages": [],
+                "metadata": {},
+                "success": False,
+                "error": f"檔案不存在: {source.name}"
+            }
+
+        pages = list(iter_pages_layout(source))
+        return {
+            "content": build_content(pages),
+            "pages": pages,
+            "metadata": {
+                "page_count": len(pages),
+                "file_size": source.size,
+                "parse_time_seconds": round(time.time() - start_time, 3),
+                "parser": "pymupdf_layout",
+                "file_path": source.name
+            },
+            "success": True,
+            "error": None
+        }
+
+    except fitz.FileDataError as e:
+        return {
+            "content": "",
+            "pages": [],
+            "metadata": {},
+            "success": False,
+            "error": f"PDF 檔案損壞或格式錯誤: {str(e)}"
+        }
+    except Exception as e:
+        return {
+            "content": "",
+            "pages": [],
+            "metadata": {},
+            "success": False,
+            "error": f"解析 PDF 時發生錯誤: {str(e)}"
+        }
+
+
+def iter_pages_layout(source: SourceLike) -> Iterator[dict]:
+    """
+    以版面模式逐頁解析 PDF（供串流處理管線使用）
+
+    Yields:
+        dict: {page_number, content, layout}
+
+    Raises:
+        FileNotFoundError: 檔案不存在
+        fitz.FileDataError: PDF 檔案損壞或格式錯誤
+    """
+    source = as_document_source(source)
+    if not source.exists():
+        raise FileNotFoundError(f"檔案不存在: {source.name}")
+
+    doc = source.open()
+    try:
+        for page_index in range(len(doc)):
+            layout = extract_page_layout(doc[page_index])
+            yield {
+                "page_number": page_index + 1,
+                "content": layout.content,
+                "layout": layout.to_dict()
+            }
+    finally:
+        doc.close()
+
+
+def parse_page_range_layout(source: SourceLike, start: int, end: int) -> dict:
+    """
+    以版面模式解析頁面範圍 [start, end)（0-indexed），供沙箱平行解析分段使用
+
+    Returns:
+        dict: {page_count: 文件總頁數, pages: 範圍內的 {page_number, content, layout}}
+
+    Raises:
+        FileNotFoundError: 檔案不存在
+        fitz.FileDataError: PDF 檔案損壞或格式錯誤
+    """
+    source = as_document_source(source)
+    if not source.exists():
+        raise FileNotFoundError(f"檔案不存在: {source.name}")
+
+    doc = source.open()
+    try:
+        page_count = len(doc)
+        pages = []
+        for page_index in range(start, min(end, page_count)):
+            layout = extract_page_layout(doc[page_index])
+            pages.append({
+                "page_number": page_index + 1,
+                "content": layout.content,
+                "layout": layout.to_dict()
+            })
+    finally:
+        doc.close()
+
+    return {"page_count": page_count, "pages": pages}
@@ -4,19 +4,24 @@ PyMuPDF PDF 解析器
 使用 PyMuPDF (fitz) 提取 PDF 文本內容
 """
 
-import os
 import time
-from typing import List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional
 
 import fitz  # PyMuPDF
 
+from .handle_pool import get_handle_pool
+from .source import SourceLike, as_document_source
 
-def parse_pdf(file_path: str) -> dict:
+# 解析器版本：文本提取或清理邏輯改變時遞增，使解析結果快取失效
+PARSER_VERSION = f"1-mupdf{fitz.VersionBind}"
+
+
+def parse_pdf(source: SourceLike) -> dict:
     """
-    解析 PDF 檔案，提取文本內容
+    解析 PDF，提取文本內容
 
     Args:
-        file_path: PDF 檔案路徑
+        source: PDF 來源（檔案路徑、bytes / memoryview 或 DocumentSource）
 
     Returns:
         dict: 解析結果
@@ -29,47 +34,40 @@ def parse_pdf(file_path: str) -> dict:
     start_time = time.time()
 
     try:
+        source = as_document_source(source)
+
         # 檢查檔案是否存在
-        if not os.path.exists(file_path):
+        if not source.exists():
             return {
                 "content": "",
                 "pages": [],
                 "metadata": {},
                 "success": False,
-                "error": f"檔案不存在: {file_path}"
+                "error": f"檔案不存在: {source.name}"
             }
 
         # 取得檔案大小
-        file_size = os.path.getsize(file_path)
+        file_size = source.size
 
         # 開啟 PDF
-        doc = fitz.open(file_path)
-
-        pages: List[dict] = []
-        full_content_parts: List[str] = []
+        doc = source.open()
+        page_count = len(doc)
 
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            # 提取文本，保留佈局
-            text = page.get_text("text")
-
-            # 清理文本：移除多餘空白但保留段落結構
-            text = _clean_text(text)
+        try:
+            page_texts = [_extract_clean_page(doc, i) for i in range(page_count)]
+        finally:
+            doc.close()
 
-            page_data = {
+        pages: List[dict] = [
+            {
                 "page_number": page_num + 1,  # 1-indexed
                 "content": text
             }
-            pages.append(page_data)
-
-            # 加入頁碼標記到完整文本
-            if text.strip():
-                full_content_parts.append(f"[Page {page_num + 1}]\n{text}")
-
-        doc.close()
+            for page_num, text in enumerate(page_texts)
+        ]
 
         # 組合完整文本
-        full_content = "\n\n".join(full_content_parts)
+        full_content = build_content(pages)
 
         # 計算處理時間
         parse_time = time.time() - start_time
@@ -82,7 +80,7 @@ def parse_pdf(file_path: str) -> dict:
                 "file_size": file_size,
                 "parse_time_seconds": round(parse_time, 3),
                 "parser": "pymupdf",
-                "file_path": file_path
+                "file_path": source.name
             },
             "success": True,
             "error": None
@@ -106,6 +104,92 @@ def parse_pdf(file_path: str) -> dict:
         }
 
 
+def iter_pages(source: SourceLike) -> Iterator[dict]:
+    """
+    逐頁解析 PDF，每次產出一頁的內容
+
+    與 parse_pdf 不同，不會組合完整文本，記憶體用量與文件長度無關，
+    供串流處理管線使用。
+
+    Args:
+        source: PDF 來源（檔案路徑、bytes / memoryview 或 DocumentSource）
+
+    Yields:
+        dict: {page_number, content}（page_number 從 1 開始）
+
+    Raises:
+        FileNotFoundError: 檔案不存在
+        fitz.FileDataError: PDF 檔案損壞或格式錯誤
+    """
+    source = as_document_source(source)
+    if not source.exists():
+        raise FileNotFoundError(f"檔案不存在: {source.name}")
+
+    doc = source.open()
+    try:
+        for page_index in range(len(doc)):
+            yield {
+                "page_number": page_index + 1,
+                "content": _extract_clean_page(doc, page_index)
+            }
+    finally:
+        doc.close()
+
+
+def parse_page_range(source: SourceLike, start: int, end: int) -> dict:
+    """
+    解析頁面範圍 [start, end)（0-indexed），供沙箱平行解析分段使用
+
+    end 超出總頁數時截斷；start == end 時只讀取總頁數。
+
+    Returns:
+        dict: {page_count: 文件總頁數, pages: 範圍內的 {page_number, content}}
+
+    Raises:
+        FileNotFoundError: 檔案不存在
+        fitz.FileDataError: PDF 檔案損壞或格式錯誤
+    """
+    source = as_document_source(source)
+    if not source.exists():
+        raise FileNotFoundError(f"檔案不存在: {source.name}")
+
+    doc = source.open()
+    try:
+        page_count = len(doc)
+        pages = [
+            {
+                "page_number": page_index + 1,
+                "content": _extract_clean_page(doc, page_index)
+            }
+            for page_index in range(start, min(end, page_count))
+        ]
+    finally:
+        doc.close()
+
+    return {"page_count": page_count, "pages": pages}
+
+
+def build_content(pages: List[dict]) -> str:
+    """
+    由逐頁內容組合完整文本（非空白頁加上 [Page N] 標記，頁與頁之間以空行分隔）
+
+    供 parse_pdf 與解析結果快取共用，確保兩者產生相同的文本。
+    """
+    return "\n\n".join(
+        f"[Page {page['page_number']}]\n{page['content']}"
+        for page in pages
+        if page["content"].strip()
+    )
+
+
+def _extract_clean_page(doc: "fitz.Document", page_index: int) -> str:
+    """提取並清理單頁文本（page_index 為 0-indexed）"""
+    # 提取文本，保留佈局
+    text = doc[page_index].get_text("text")
+    # 清理文本：移除多餘空白但保留段落結構
+    return _clean_text(text)
+
+
 def _clean_text(text: str) -> str:
     """
     清理提取的文本
@@ -136,27 +220,89 @@ def _clean_text(text: str) -> str:
     return '\n'.join(cleaned_lines)
 
 
-def extract_page_text(file_path: str, page_number: int) -> Optional[str]:
+def extract_pages(
+    file_path: str,
+    page_numbers: Iterable[int],
+    content_hash: Optional[str] = None
+) -> List[Optional[str]]:
     """
-    提取單一頁面的文本
+    批次提取多個頁面的文本
+
+    透過控制代碼池重用已開啟的 fitz 文件，並記住已清理的頁面文本，
+    連續讀取同一份文件的多頁時只需開啟一次。
 
     Args:
         file_path: PDF 檔案路徑
-        page_number: 頁碼（1-indexed）
+        page_numbers: 頁碼列表（1-indexed，可重複）
+        content_hash: 檔案的 SHA-256（可選），提供時先查詢解析結果快取，命中則不開啟 PDF
 
     Returns:
-        str: 頁面文本，若失敗則返回 None
+        List[Optional[str]]: 與 page_numbers 對應的頁面文本，頁碼超出範圍或讀取失敗時為 None
     """
+    page_numbers = list(page_numbers)
+    results: List[Optional[str]] = [None] * len(page_numbers)
+
+    if content_hash:
+        from ..page_cache import get_page_cache
+
+        cache = get_page_cache()
+        cached_pages = cache.get_pages(content_hash, f"pymupdf-{PARSER_VERSION}") if cache else None
+        if cached_pages is not None:
+            for i, page_number in enumerate(page_numbers):
+                if 1 <= page_number <= len(cached_pages):
+                    results[i] = cached_pages[page_number - 1]["content"]
+            return results
+
+    pool = get_handle_pool()
     try:
-        doc = fitz.open(file_path)
-        if page_number < 1 or page_number > len(doc):
-            doc.close()
-            return None
+        key = pool.file_key(file_path)
+    except OSError:
+        return results
+
+    missing: List[int] = []
+    for i, page_number in enumerate(page_numbers):
+        text = pool.get_text(key, page_number - 1)
+        if text is None:
+            missing.append(page_number - 1)
+        else:
+            results[i] = text
 
-        page = doc[page_number - 1]
-        text = page.get_text("text")
-        doc.close()
+    if missing:
+        def _extract(doc: "fitz.Document") -> Dict[int, str]:
+            return {
+                page_index: _extract_clean_page(doc, page_index)
+                for page_index in dict.fromkeys(missing)
+                if 0 <= page_index < len(doc)
+            }
+
+        try:
+            texts = pool.use(key, _extract)
+        except Exception:
+            return results
+
+        for page_index, text in texts.items():
+            pool.put_text(key, page_index, text)
+        for i, page_number in enumerate(page_numbers):
+            if results[i] is None:
+                results[i] = texts.get(page_number - 1)
 
-        return _clean_text(text)
-    except Exception:
-        return None
+    return results
+
+
+def extract_page_text(
+    file_path: str,
+    page_number: int,
+    content_hash: Optional[str] = None
+) -> Optional[str]:
+    """
+    提取單一頁面的文本
+
+    Args:
+        file_path: PDF 檔案路徑
+        page_number: 頁碼（1-indexed）
+        content_hash: 檔案的 SHA-256（可選），提供時先查詢解析結果快取，命中則不開啟 PDF
+
+    Returns:
+        str: 頁面文本，若失敗則返回 None
+    """
+    return extract_pages(file_path, [page_number], content_hash)[0]
@@ -0,0 +1,566 @@
+"""
+PDF 解析沙箱
+
+在獨立的子行程中執行解析器，並以 resource 限制 CPU 時間與位址空間（記憶體）、
+以牆鐘時間限制等待時間。損壞或異常龐大的 PDF 只會讓沙箱行程被終止，
+不會拖垮 API / worker 行程或同一行程中的其他任務。
+
+沙箱行程會被重用（spawn 啟動需匯入 rag 套件，成本約數秒）：
+    - CPU 限制以「目前累計用量 + 本次上限」設定 soft limit，每個任務各自計算
+    - 任務失敗（逾時、超過限制、異常結束）後該行程即被丟棄，下次使用時重新啟動
+    - 只傳遞檔案路徑給沙箱：記憶體中的來源先寫入臨時檔案（任務結束後刪除），
+      避免整份內容經由管道 pickle 複製到子行程
+
+頁數達到 PDF_PARALLEL_MIN_PAGES 的文檔以頁面平行解析（批次模式）：
+頁面範圍切成數段，分派到多個沙箱行程，各自以路徑開啟同一份檔案解析自己的頁面，
+再依頁碼合併，結果與單一行程解析相同。逐頁串流模式維持單一行程依序產出。
+
+失敗會拋出 ParseSandboxError（kind: timeout / cpu_limit / memory_limit / killed / crash），
+並累計在行程內的計數器（get_sandbox_stats，只反映呼叫端行程；跨行程的失敗統計見 RagProcessingLog）。
+"""
+
+import atexit
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows 沒有 resource 模組，只套用牆鐘逾時
+    resource = None
+
+from .source import SourceLike, as_document_source
+
+logger = logging.getLogger(__name__)
+
+# PDF_SANDBOX_ENABLED: 是否在沙箱行程中解析（false 時在呼叫端行程直接解析）
+# PDF_SANDBOX_PROCESSES: 同時可用的沙箱行程數（超過時排隊等待）
+# PDF_SANDBOX_CPU_SECONDS: 單份文檔解析的 CPU 時間上限（秒，0 表示不限制）
+# PDF_SANDBOX_MEMORY_MB: 沙箱行程的位址空間上限（MB，0 表示不限制）
+# PDF_SANDBOX_TIMEOUT: 單份文檔等待解析結果的時間上限（秒）
+SANDBOX_ENABLED = os.getenv("PDF_SANDBOX_ENABLED", "true").lower() == "true"
+SANDBOX_PROCESSES = max(int(os.getenv("PDF_SANDBOX_PROCESSES", "2")), 1)
+SANDBOX_CPU_SECONDS = int(os.getenv("PDF_SANDBOX_CPU_SECONDS", "120"))
+SANDBOX_MEMORY_MB = int(os.getenv("PDF_SANDBOX_MEMORY_MB", "2048"))
+SANDBOX_TIMEOUT = float(os.getenv("PDF_SANDBOX_TIMEOUT", "180"))
+
+# PDF_PARSE_WORKERS: 單份文檔平行解析使用的沙箱行程數（0 表示使用全部沙箱行程，1 表示停用平行解析）
+# PDF_PARALLEL_MIN_PAGES: 頁數達到此門檻才啟用平行解析
+PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", "0"))
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+
+# 失敗類型（同時作為計數器與 RagProcessingLog metadata 的值）
+FAILURE_KINDS = ("timeout", "cpu_limit", "memory_limit", "killed", "crash")
+
+
+class ParseSandboxError(Exception):
+    """
+    沙箱解析失敗
+
+    Attributes:
+        kind: 失敗類型（見 FAILURE_KINDS）
+    """
+
+    def __init__(self, kind: str, message: str):
+        super().__init__(message)
+        self.kind = kind
+
+
+@dataclass
+class SandboxLimits:
+    """
+    沙箱限制
+
+    Attributes:
+        cpu_seconds: 單份文檔的 CPU 時間上限（秒，0 表示不限制）
+        memory_mb: 位址空間上限（MB，0 表示不限制）
+        timeout_seconds: 等待解析結果的時間上限（秒）
+    """
+    cpu_seconds: int = SANDBOX_CPU_SECONDS
+    memory_mb: int = SANDBOX_MEMORY_MB
+    timeout_seconds: float = SANDBOX_TIMEOUT
+
+
+# 行程內的執行與失敗計數
+_stats: Counter = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(key: str) -> None:
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def get_sandbox_stats() -> dict:
+    """
+    取得目前行程的沙箱計數
+
+    計數只存在於記憶體中，只反映目前行程（不對外提供；跨行程的失敗統計由
+    /api/rag/parser-sandbox 從 RagProcessingLog 彙總）。
+
+    Returns:
+        dict: {runs, timeout, cpu_limit, memory_limit, killed, crash}
+    """
+    with _stats_lock:
+        return {key: _stats.get(key, 0) for key in ("runs",) + FAILURE_KINDS}
+
+
+# --- 子行程 ---
+
+def _is_memory_error(error: BaseException) -> bool:
+    """MemoryError 或 MuPDF 配置記憶體失敗"""
+    return isinstance(error, MemoryError) or "malloc" in str(error).lower()
+
+
+def _set_cpu_limit(cpu_seconds: int) -> None:
+    """以目前累計用量 + cpu_seconds 設定 CPU soft limit（超過時收到 SIGXCPU 而結束）"""
+    if resource is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if cpu_seconds <= 0:
+        resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(math.ceil(usage.ru_utime + usage.ru_stime + cpu_seconds))
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _sandbox_main(conn, memory_mb: int) -> None:
+    """
+    沙箱行程主迴圈：接收任務 → 解析 → 回傳結果
+
+    任務格式：(mode, parser_type, path, cpu_seconds, page_range)
+        - mode "parse"：完整解析，回傳 ("result", ParseResult)
+        - mode "range"：解析 page_range = (start, end) 的頁面，回傳 ("result", {page_count, pages})
+        - mode "pages"：逐頁串流，回傳 ("page", PageContent) ... ("done", None)
+    失敗時回傳 ("error", (kind, message))
+    """
+    # 由父行程負責中止，忽略終端機的 Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if resource is not None and memory_mb > 0:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    from . import get_parser, get_page_iterator, get_page_range_parser
+
+    while True:
+        try:
+            mode, parser_type, path, cpu_seconds, page_range = conn.recv()
+        except (EOFError, OSError):
+            return
+
+        _set_cpu_limit(cpu_seconds)
+        try:
+            if mode == "parse":
+                result = get_parser(parser_type)(path)
+                conn.send(("result", result))
+            elif mode == "range":
+                result = get_page_range_parser(parser_type)(path, *page_range)
+                conn.send(("result", result))
+            else:
+                for page in get_page_iterator(parser_type)(path):
+                    conn.send(("page", page))
+                conn.send(("done", None))
+        except Exception as e:
+            kind = "memory_limit" if _is_memory_error(e) else "error"
+            conn.send(("error", (kind, str(e))))
+
+
+# --- 父行程 ---
+
+def _spool_to_file(data: bytes) -> str:
+    """將記憶體中的 PDF 寫入臨時檔案，返回路徑"""
+    fd, path = tempfile.mkstemp(prefix="pdf-sandbox-", suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+    except BaseException:
+        _remove_spool(path)
+        raise
+    return path
+
+
+def _remove_spool(path: Optional[str]) -> None:
+    if path is None:
+        return
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+class _SandboxWorker:
+    """單一沙箱行程與其通訊管道"""
+
+    def __init__(self, memory_mb: int):
+        ctx = multiprocessing.get_context("spawn")
+        self.conn, child_conn = ctx.Pipe()
+        # daemon：父行程結束時由 multiprocessing 終止，不會等待閒置的沙箱而卡住
+        self.process = ctx.Process(
+            target=_sandbox_main,
+            args=(child_conn, memory_mb),
+            name="pdf-sandbox",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+
+    @property
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(5)
+        self.conn.close()
+
+
+class ParseSandbox:
+    """
+    沙箱行程池
+
+    Args:
+        processes: 最多同時存在的沙箱行程數
+        limits: 沙箱限制（平行解析時 CPU 上限與逾時由每個頁面範圍各自計算）
+        parse_workers: 單份文檔平行解析使用的行程數（0 表示 processes，上限為 processes）
+        parallel_min_pages: 頁數達到此門檻才啟用平行解析
+    """
+
+    def __init__(
+        self,
+        processes: int = SANDBOX_PROCESSES,
+        limits: Optional[SandboxLimits] = None,
+        parse_workers: int = PARSE_WORKERS,
+        parallel_min_pages: int = PARALLEL_MIN_PAGES,
+    ):
+        self.limits = limits or SandboxLimits()
+        self.parse_workers = min(parse_workers or processes, processes)
+        self.parallel_min_pages = parallel_min_pages
+        self._slots = threading.BoundedSemaphore(processes)
+        self._idle: "queue.LifoQueue[_SandboxWorker]" = queue.LifoQueue()
+
+    def _acquire(self) -> _SandboxWorker:
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    worker = self._idle.get_nowait()
+                except queue.Empty:
+                    return _SandboxWorker(self.limits.memory_mb)
+                if worker.alive:
+                    return worker
+                worker.kill()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, worker: _SandboxWorker, healthy: bool) -> None:
+        try:
+            if healthy and worker.alive:
+                self._idle.put(worker)
+            else:
+                worker.kill()
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def _spooled(self, source: SourceLike) -> Iterator[str]:
+        """
+        取得可交給沙箱開啟的檔案路徑
+
+        檔案型來源直接使用原路徑；記憶體中的來源寫入一個臨時檔案（離開時刪除），
+        同一次解析的所有任務（含平行解析的各頁面範圍）共用這個檔案。
+        """
+        source = as_document_source(source)
+        if source.is_file_backed:
+            yield source.path
+            return
+        spool_path = _spool_to_file(source.data)
+        try:
+            yield spool_path
+        finally:
+            _remove_spool(spool_path)
+
+    def _submit(self, worker: _SandboxWorker, mode: str, parser_type: str, path: str,
+                page_range: Optional[Tuple[int, int]] = None) -> None:
+        """送出任務"""
+        _count("runs")
+        worker.conn.send((mode, parser_type, path, self.limits.cpu_seconds, page_range))
+
+    def _receive(self, worker: _SandboxWorker, budget: list) -> Tuple[str, object]:
+        """
+        等待沙箱的下一則訊息
+
+        budget[0] 為剩餘的等待時間（秒），只計算實際等待沙箱的時間
+        （串流模式下游處理較慢時不會被誤判為逾時）。
+        """
+        started = time.monotonic()
+        try:
+            ready = worker.conn.poll(max(budget[0], 0))
+        finally:
+            budget[0] -= time.monotonic() - started
+        if not ready:
+            worker.kill()
+            raise self._failure("timeout")
+        try:
+            return worker.conn.recv()
+        except (EOFError, OSError):
+            worker.process.join(5)
+            raise self._failure(self._exit_kind(worker.process.exitcode), worker.process.exitcode)
+
+    @staticmethod
+    def _exit_kind(exitcode: Optional[int]) -> str:
+        sigxcpu = getattr(signal, "SIGXCPU", None)
+        if sigxcpu is not None and exitcode == -sigxcpu:
+            return "cpu_limit"
+        if exitcode == -signal.SIGKILL:
+            return "killed"
+        return "crash"
+
+    def _failure(self, kind: str, exitcode: Optional[int] = None) -> ParseSandboxError:
+        _count(kind)
+        messages = {
+            "timeout": f"PDF 解析逾時（超過 {self.limits.timeout_seconds:g} 秒），已中止",
+            "cpu_limit": f"PDF 解析超過 CPU 時間上限（{self.limits.cpu_seconds} 秒），已中止",
+            "memory_limit": f"PDF 解析超過記憶體上限（{self.limits.memory_mb} MB），已中止",
+            "killed": "PDF 解析行程被系統終止（可能超過記憶體上限）",
+            "crash": f"PDF 解析行程異常結束（exit code {exitcode}）",
+        }
+        logger.warning(f"PDF parse sandbox failure: kind={kind}, exitcode={exitcode}")
+        return ParseSandboxError(kind, messages[kind])
+
+    def _raise_child_error(self, payload: Tuple[str, str]) -> None:
+        kind, message = payload
+        if kind == "memory_limit":
+            raise self._failure("memory_limit")
+        raise Exception(message)
+
+    def _run(self, mode: str, parser_type: str, path: str,
+             page_range: Optional[Tuple[int, int]] = None) -> object:
+        """在一個沙箱行程中執行單次回傳的任務（"parse" / "range"），返回結果"""
+        worker = self._acquire()
+        healthy = False
+        try:
+            self._submit(worker, mode, parser_type, path, page_range)
+            kind, payload = self._receive(worker, [self.limits.timeout_seconds])
+            healthy = True
+            if kind == "error":
+                healthy = payload[0] != "memory_limit"
+                self._raise_child_error(payload)
+            return payload
+        finally:
+            self._release(worker, healthy)
+
+    def _page_ranges(self, page_count: int) -> List[Tuple[int, int]]:
+        """
+        將頁面切成連續範圍 [start, end)
+
+        段數為平行度的兩倍（不超過頁數），單一範圍較慢時其他行程可繼續處理剩餘範圍。
+        """
+        segments = min(page_count, self.parse_workers * 2)
+        step = -(-page_count // segments)
+        return [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+
+    def _parse_parallel(self, parser_type: str, source: SourceLike, path: str) -> Optional[dict]:
+        """
+        頁面平行解析：各頁面範圍分派到不同沙箱行程，依頁碼合併
+
+        Returns:
+            Optional[dict]: ParseResult；頁數未達門檻或無法讀取頁數時返回 None（改用單一行程解析）
+        """
+        from .pymupdf_parser import build_content
+
+        start_time = time.time()
+        source = as_document_source(source)
+        try:
+            page_count = self._run("range", parser_type, path, (0, 0))["page_count"]
+        except ParseSandboxError:
+            raise
+        except Exception:
+            # 檔案不存在或損壞：交給單一行程解析，由解析器回報錯誤
+            return None
+        if page_count < max(self.parallel_min_pages, 2):
+            return None
+
+        ranges = self._page_ranges(page_count)
+        with ThreadPoolExecutor(max_workers=self.parse_workers, thread_name_prefix="pdf-parse") as executor:
+            futures = [
+                executor.submit(self._run, "range", parser_type, path, page_range)
+                for page_range in ranges
+            ]
+            try:
+                pages = [page for future in futures for page in future.result()["pages"]]
+            except ParseSandboxError:
+                for future in futures:
+                    future.cancel()
+                raise
+            except Exception as e:
+                for future in futures:
+                    future.cancel()
+                return {
+                    "content": "",
+                    "pages": [],
+                    "metadata": {},
+                    "success": False,
+                    "error": f"解析 PDF 時發生錯誤: {str(e)}"
+                }
+
+        return {
+            "content": build_content(pages),
+            "pages": pages,
+            "metadata": {
+                "page_count": len(pages),
+                "file_size": source.size,
+                "parse_time_seconds": round(time.time() - start_time, 3),
+                "parser": parser_type,
+                "file_path": source.name,
+                "parse_workers": min(self.parse_workers, len(ranges))
+            },
+            "success": True,
+            "error": None
+        }
+
+    def parse(self, parser_type: str, source: SourceLike) -> dict:
+        """
+        在沙箱中執行 get_parser(parser_type)(source)
+
+        頁數達到 parallel_min_pages 且平行度大於 1 時，以頁面平行解析（結果相同）。
+
+        Raises:
+            ParseSandboxError: 逾時、超過資源限制或沙箱行程異常結束
+        """
+        with self._spooled(source) as path:
+            if self.parse_workers > 1:
+                result = self._parse_parallel(parser_type, source, path)
+                if result is not None:
+                    return result
+            return self._run("parse", parser_type, path)
+
+    def iter_pages(self, parser_type: str, source: SourceLike) -> Iterator[dict]:
+        """
+        在沙箱中執行 get_page_iterator(parser_type)(source)，逐頁產出
+
+        呼叫端提前結束迭代時，沙箱行程會被終止（無法中途取消解析）。
+
+        Raises:
+            ParseSandboxError: 逾時、超過資源限制或沙箱行程異常結束
+        """
+        with self._spooled(source) as path:
+            yield from self._iter_pages(parser_type, path)
+
+    def _iter_pages(self, parser_type: str, path: str) -> Iterator[dict]:
+        worker = self._acquire()
+        healthy = False
+        try:
+            self._submit(worker, "pages", parser_type, path)
+            budget = [self.limits.timeout_seconds]
+            while True:
+                kind, payload = self._receive(worker, budget)
+                if kind == "page":
+                    yield payload
+                elif kind == "done":
+                    healthy = True
+                    return
+                else:
+                    healthy = payload[0] != "memory_limit"
+                    self._raise_child_error(payload)
+        finally:
+            self._release(worker, healthy)
+
+    def shutdown(self) -> None:
+        """關閉所有閒置的沙箱行程"""
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                return
+
+
+# 模組級別的沙箱實例（延遲初始化）
+_sandbox: Optional[ParseSandbox] = None
+_sandbox_lock = threading.Lock()
+
+
+def get_parse_sandbox() -> ParseSandbox:
+    """
+    取得沙箱行程池單例
+
+    Returns:
+        ParseSandbox: 沙箱實例
+    """
+    global _sandbox
+
+    if _sandbox is None:
+        with _sandbox_lock:
+            if _sandbox is None:
+                _sandbox = ParseSandbox()
+    return _sandbox
+
+
+def reset_parse_sandbox() -> None:
+    """
+    關閉並重置沙箱行程池（主要用於測試與行程結束前清理）
+    """
+    global _sandbox
+    with _sandbox_lock:
+        if _sandbox is not None:
+            _sandbox.shutdown()
+        _sandbox = None
+
+
+# 行程結束前關閉閒置的沙箱行程（API 與 worker 的關閉流程也會明確呼叫）
+atexit.register(reset_parse_sandbox)
+
+
+def parse_in_sandbox(parser_type: str, source: SourceLike) -> dict:
+    """
+    解析 PDF（PDF_SANDBOX_ENABLED 時在沙箱行程中執行）
+
+    Args:
+        parser_type: 解析器類型（同 get_parser）
+        source: PDF 來源
+
+    Returns:
+        dict: ParseResult
+
+    Raises:
+        ParseSandboxError: 沙箱解析失敗
+    """
+    if not SANDBOX_ENABLED:
+        from . import get_parser
+        return get_parser(parser_type)(source)
+    return get_parse_sandbox().parse(parser_type, source)
+
+
+def iter_pages_in_sandbox(parser_type: str, source: SourceLike) -> Iterator[dict]:
+    """
+    逐頁解析 PDF（PDF_SANDBOX_ENABLED 時在沙箱行程中執行）
+
+    Args:
+        parser_type: 解析器類型（同 get_page_iterator）
+        source: PDF 來源
+
+    Yields:
+        dict: PageContent
+
+    Raises:
+        ParseSandboxError: 沙箱解析失敗
+    """
+    if not SANDBOX_ENABLED:
+        from . import get_page_iterator
+        return get_page_iterator(parser_type)(source)
+    return get_parse_sandbox().iter_pages(parser_type, source)
@@ -0,0 +1,167 @@
+"""
+文檔來源模組
+
+統一解析器的輸入：檔案路徑、記憶體中的 bytes / memoryview、mmap 的檔案，
+或從 MinIO 串流讀取的物件，讓解析器不需要先把內容寫成臨時檔案。
+
+PyMuPDF 只接受 bytes 作為記憶體串流（bytearray 等型別會在 fitz 內部被複製），
+因此：
+    - bytes、以 bytes 為底的完整 memoryview 直接交給 fitz，不複製
+    - 以檔案為底的來源（路徑、mmap）交由 MuPDF 直接讀檔，不在 Python 端載入
+    - 其他型別才轉成 bytes（複製一次）
+"""
+
+import hashlib
+import mmap
+import os
+from typing import BinaryIO, Optional, Union
+
+import fitz  # PyMuPDF
+
+# 串流讀取的區塊大小
+_READ_SIZE = 1024 * 1024
+
+
+class DocumentSource:
+    """
+    PDF 文檔來源
+
+    以 from_path / from_bytes / from_mmap / from_stream 建立，
+    open() 返回 fitz.Document；使用完畢後呼叫 close()（或使用 with）釋放 mmap 與自有的臨時檔案。
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        data: Optional[bytes] = None,
+        owns_path: bool = False,
+        _mapping: Optional[mmap.mmap] = None
+    ):
+        if (path is None) == (data is None):
+            raise ValueError("DocumentSource 需要 path 或 data 其中之一")
+        self.path = path
+        self.data = data
+        self._owns_path = owns_path
+        self._mapping = _mapping
+
+    # --- 建立 ---
+
+    @classmethod
+    def from_path(cls, path: str, owns_path: bool = False) -> "DocumentSource":
+        """
+        以檔案路徑建立來源
+
+        Args:
+            path: PDF 檔案路徑
+            owns_path: close() 時是否刪除檔案（用於呼叫端交付的臨時檔案）
+        """
+        return cls(path=path, owns_path=owns_path)
+
+    @classmethod
+    def from_bytes(cls, data: Union[bytes, bytearray, memoryview]) -> "DocumentSource":
+        """以記憶體中的內容建立來源（bytes 與以 bytes 為底的完整 memoryview 不複製）"""
+        if isinstance(data, memoryview):
+            if isinstance(data.obj, bytes) and data.contiguous and data.nbytes == len(data.obj):
+                data = data.obj
+            elif isinstance(data.obj, mmap.mmap):
+                data = data.obj[:]
+            else:
+                data = data.tobytes()
+        elif not isinstance(data, bytes):
+            data = bytes(data)
+        return cls(data=data)
+
+    @classmethod
+    def from_mmap(cls, path: str, owns_path: bool = False) -> "DocumentSource":
+        """
+        以 mmap 映射檔案建立來源
+
+        解析時由 MuPDF 直接讀檔；mmap 供 content_hash() 等操作在不載入整份檔案的情況下讀取內容。
+        """
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else None
+        return cls(path=path, owns_path=owns_path, _mapping=mapping)
+
+    @classmethod
+    def from_stream(cls, stream: BinaryIO) -> "DocumentSource":
+        """
+        從串流（如 MinIO get_object 的 Body）讀取內容建立來源，不落地
+
+        分段讀取後合併為單一 bytes（只在合併時複製一次）。
+        """
+        parts = []
+        for block in iter(lambda: stream.read(_READ_SIZE), b""):
+            parts.append(block)
+        return cls(data=b"".join(parts))
+
+    # --- 使用 ---
+
+    @property
+    def name(self) -> str:
+        """供 metadata 與錯誤訊息使用的名稱"""
+        return self.path or "<memory>"
+
+    @property
+    def size(self) -> int:
+        """內容大小（bytes）"""
+        if self.data is not None:
+            return len(self.data)
+        return os.path.getsize(self.path)
+
+    @property
+    def is_file_backed(self) -> bool:
+        """是否以檔案為底（可由其他行程直接開啟，例如解析沙箱）"""
+        return self.path is not None
+
+    def exists(self) -> bool:
+        return self.data is not None or os.path.exists(self.path)
+
+    def open(self) -> "fitz.Document":
+        """開啟為 fitz.Document"""
+        if self.data is not None:
+            return fitz.open(stream=self.data, filetype="pdf")
+        return fitz.open(self.path)
+
+    def content_hash(self) -> str:
+        """計算內容的 SHA-256（bytes / mmap 直接計算，路徑來源以串流讀取）"""
+        if self.data is not None:
+            return hashlib.sha256(self.data).hexdigest()
+        if self._mapping is not None:
+            return hashlib.sha256(self._mapping).hexdigest()
+        hasher = hashlib.sha256()
+        with open(self.path, "rb") as f:
+            for block in iter(lambda: f.read(_READ_SIZE), b""):
+                hasher.update(block)
+        return hasher.hexdigest()
+
+    def close(self) -> None:
+        if self._mapping is not None:
+            self._mapping.close()
+            self._mapping = None
+        if self._owns_path and self.path:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            self._owns_path = False
+
+    def __enter__(self) -> "DocumentSource":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+# 解析器接受的輸入型別
+SourceLike = Union[str, bytes, bytearray, memoryview, DocumentSource]
+
+
+def as_document_source(source: SourceLike) -> DocumentSource:
+    """將檔案路徑或記憶體內容轉為 DocumentSource（已是 DocumentSource 時直接返回）"""
+    if isinstance(source, DocumentSource):
+        return source
+    if isinstance(source, (str, os.PathLike)):
+        return DocumentSource.from_path(os.fspath(source))
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return DocumentSource.from_bytes(source)
+    raise TypeError(f"不支援的文檔來源型別: {type(source).__name__}")
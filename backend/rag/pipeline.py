@@ -0,0 +1,281 @@
+"""
+串流處理管線模組
+
+將 Parse → Chunk → Embed → Store 四個階段以有界佇列串接，各階段在獨立執行緒執行：
+    - 解析器逐頁產出，不需等待整份 PDF 解析完成
+    - 切分器逐頁讀入並送出 chunks，只緩衝尚未切分的文本
+    - Embedding 依估計的 token 數打包成批次送出，網路等待時間與解析、切分重疊
+    - 每個批次的向量一回來就寫入向量庫
+
+佇列有上限（backpressure），下游較慢時上游會暫停，
+因此記憶體用量取決於佇列大小與批次大小，而非文件長度。
+"""
+
+import queue
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional
+
+from .chunking import Chunk, ChunkingConfig, iter_chunks
+from .metrics import StageTimer
+from .tokens import TokenEstimator, get_token_estimator
+
+# 佇列結束標記
+_END = object()
+
+# 阻塞操作的輪詢間隔（秒），用於檢查取消旗標
+_POLL_INTERVAL = 0.1
+
+# 接收 chunk 資料列表（index, content, page_numbers），返回對應的向量；
+# 向量可為 None，表示沿用向量庫中既有的向量（見 IncrementalIndexer）
+EmbedFunction = Callable[[List[dict]], List[Optional[List[float]]]]
+StoreFunction = Callable[[List[dict], List[Optional[List[float]]]], int]
+
+
+@dataclass
+class PipelineConfig:
+    """串流管線配置"""
+    queue_size: int = 4          # 各階段之間佇列的最大項目數
+    page_window: int = 8         # 解析與切分之間每個佇列項目可緩衝的頁數（頁面佇列大小 = queue_size × page_window）
+    embed_batch_size: int = 16   # 每個 Embedding 批次的 chunk 數上限
+    embed_batch_tokens: int = 0  # 每個 Embedding 批次的估計 token 數上限（0 表示只限制 chunk 數）
+    token_estimator: Optional[TokenEstimator] = None  # None 時使用 get_token_estimator()
+    embed_concurrency: int = 1   # 每次向量化最多合併的就緒批次數（交由 Embedding 客戶端並行送出）
+
+
+@dataclass
+class PipelineResult:
+    """串流管線執行結果"""
+    page_count: int = 0
+    chunk_count: int = 0
+    batch_count: int = 0
+    indexed_count: int = 0
+    char_count: int = 0
+    # 各階段累計的實際工作時間（毫秒，不含等待佇列的時間）
+    parse_ms: int = 0
+    chunk_ms: int = 0
+    embed_ms: int = 0
+    store_ms: int = 0
+    # 供寫入 DocumentChunk 的精簡記錄：{index, content_preview, page_numbers, char_count, content_hash}
+    chunk_records: List[dict] = field(default_factory=list)
+
+
+class _PipelineState:
+    """各階段共用的取消旗標與錯誤記錄"""
+
+    def __init__(self):
+        self.cancel = threading.Event()
+        self.errors: List[BaseException] = []
+        self._lock = threading.Lock()
+
+    def fail(self, error: BaseException) -> None:
+        with self._lock:
+            self.errors.append(error)
+        self.cancel.set()
+
+    def put(self, q: queue.Queue, item) -> bool:
+        """放入佇列；佇列已滿時等待（backpressure），管線取消時放棄"""
+        while not self.cancel.is_set():
+            try:
+                q.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, q: queue.Queue):
+        """取出佇列項目；管線取消時返回 _END"""
+        while not self.cancel.is_set():
+            try:
+                return q.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return _END
+
+
+def run_streaming_pipeline(
+    pages: Iterable[dict],
+    embed_fn: EmbedFunction,
+    store_fn: StoreFunction,
+    chunking_config: Optional[ChunkingConfig] = None,
+    pipeline_config: Optional[PipelineConfig] = None
+) -> PipelineResult:
+    """
+    執行串流處理管線
+
+    Args:
+        pages: 逐頁產出的頁面內容（{page_number, content}），通常來自 get_page_iterator
+        embed_fn: 批次向量化函數，接收 chunk 資料列表，返回對應的向量列表
+        store_fn: 批次寫入函數，接收 (chunk 資料列表, 向量列表)，返回寫入數量
+        chunking_config: 切分配置
+        pipeline_config: 管線配置
+
+    Returns:
+        PipelineResult: 各階段統計與 chunk 記錄
+
+    Raises:
+        任一階段發生的第一個例外
+    """
+    chunking_config = chunking_config or ChunkingConfig()
+    pipeline_config = pipeline_config or PipelineConfig()
+
+    state = _PipelineState()
+    result = PipelineResult()
+
+    page_queue: queue.Queue = queue.Queue(maxsize=pipeline_config.queue_size * pipeline_config.page_window)
+    chunk_queue: queue.Queue = queue.Queue(maxsize=pipeline_config.queue_size)
+    embedded_queue: queue.Queue = queue.Queue(maxsize=pipeline_config.queue_size)
+
+    timers = {name: StageTimer() for name in ("parse", "chunk", "embed", "store")}
+
+    def parse_stage():
+        page_iter = iter(pages)
+        try:
+            while True:
+                with timers["parse"].measure():
+                    page = next(page_iter, _END)
+                if page is _END:
+                    break
+                if not state.put(page_queue, page):
+                    break
+                result.page_count += 1
+                result.char_count += len(page["content"])
+            state.put(page_queue, _END)
+        finally:
+            # 提前結束時關閉產生器，釋放 PDF 檔案
+            close = getattr(pages, "close", None)
+            if close:
+                close()
+
+    chunk_wait = StageTimer()
+
+    def queued_pages():
+        while True:
+            with chunk_wait.measure():
+                page = state.get(page_queue)
+            if page is _END:
+                return
+            yield page
+
+    def chunk_stage():
+        # 逐頁切分：結果與 batch 模式對完整文本切分相同，切分器只緩衝尚未切分的文本
+        chunks = iter_chunks(queued_pages(), chunking_config)
+        estimator = pipeline_config.token_estimator or get_token_estimator()
+        max_tokens = pipeline_config.embed_batch_tokens
+        batch: List[Chunk] = []
+        batch_tokens = 0
+        while True:
+            with timers["chunk"].measure():
+                chunk = next(chunks, _END)
+            if chunk is _END:
+                break
+            # 與 pack_by_tokens 相同的規則：加入後會超過上限時先送出目前的批次
+            tokens = estimator.estimate(chunk.content) if max_tokens else 0
+            if batch and (len(batch) >= pipeline_config.embed_batch_size or batch_tokens + tokens > max_tokens > 0):
+                if not state.put(chunk_queue, batch):
+                    return
+                batch = []
+                batch_tokens = 0
+            batch.append(chunk)
+            batch_tokens += tokens
+
+        # 取消時 queued_pages 也會結束，不可把不完整的結果當作正常結束送出
+        if state.cancel.is_set():
+            return
+        if batch and not state.put(chunk_queue, batch):
+            return
+        state.put(chunk_queue, _END)
+
+    def embed_stage():
+        ended = False
+        while not ended:
+            batch = state.get(chunk_queue)
+            if batch is _END:
+                break
+            # 佇列中已就緒的批次一起送出（最多 embed_concurrency 批），由 Embedding 客戶端並行處理；
+            # 寫入仍依原批次與順序進行
+            batches = [batch]
+            while len(batches) < pipeline_config.embed_concurrency:
+                try:
+                    batch = chunk_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if batch is _END:
+                    ended = True
+                    break
+                batches.append(batch)
+
+            batch_data = [
+                [
+                    {
+                        "index": c.index,
+                        "content": c.content,
+                        "page_numbers": c.page_numbers
+                    }
+                    for c in batch
+                ]
+                for batch in batches
+            ]
+            chunk_data = [c for data in batch_data for c in data]
+            with timers["embed"].measure():
+                embeddings = embed_fn(chunk_data)
+            if len(embeddings) != len(chunk_data):
+                raise ValueError("Embedding 數量與 chunk 數量不匹配")
+
+            offset = 0
+            for data in batch_data:
+                if not state.put(embedded_queue, (data, embeddings[offset:offset + len(data)])):
+                    return
+                offset += len(data)
+        state.put(embedded_queue, _END)
+
+    def run_stage(target):
+        def runner():
+            try:
+                target()
+            except BaseException as e:  # noqa: B902 - 需將任何錯誤回報給主執行緒
+                state.fail(e)
+        return threading.Thread(target=runner, daemon=True)
+
+    threads = [run_stage(parse_stage), run_stage(chunk_stage), run_stage(embed_stage)]
+    for t in threads:
+        t.start()
+
+    # Store 階段在呼叫端執行緒執行（向量庫客戶端不一定是執行緒安全的）
+    try:
+        while True:
+            item = state.get(embedded_queue)
+            if item is _END:
+                break
+            chunk_data, embeddings = item
+            with timers["store"].measure():
+                result.indexed_count += store_fn(chunk_data, embeddings)
+            result.batch_count += 1
+            result.chunk_count += len(chunk_data)
+            result.chunk_records.extend(
+                {
+                    "index": c["index"],
+                    "content_preview": c["content"][:200] if c["content"] else None,
+                    "page_numbers": c["page_numbers"],
+                    "char_count": len(c["content"]),
+                    "content_hash": c.get("content_hash")
+                }
+                for c in chunk_data
+            )
+    except BaseException as e:
+        state.fail(e)
+    finally:
+        state.cancel.set()
+        for t in threads:
+            t.join()
+
+    if state.errors:
+        raise state.errors[0]
+
+    result.parse_ms = timers["parse"].duration_ms
+    # 切分計時包含等待頁面佇列的時間（在切分產生器內），需扣除
+    result.chunk_ms = max(timers["chunk"].duration_ms - chunk_wait.duration_ms, 0)
+    result.embed_ms = timers["embed"].duration_ms
+    result.store_ms = timers["store"].duration_ms
+
+    return result
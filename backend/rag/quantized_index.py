@@ -0,0 +1,226 @@
+"""
+量化向量索引模組
+
+檢索時以量化後的向量（int8 或 1-bit）先對文檔內所有 chunks 粗排，
+只取前 n_results × oversample 個候選，再以原始向量精確重排：
+    - int8：每個向量依最大絕對值縮放到 [-127, 127]，約為 float32 的 1/4 大小
+    - binary：只保留每一維的正負號（np.packbits），約為 float32 的 1/32 大小，以漢明距離粗排
+
+量化向量依文檔分別保存（{目錄}/{document_id}.{mode}.npz），第一次檢索該文檔時由向量庫建立。
+寫入向量庫時更新文檔的版本檔（{document_id}.version），其他行程（worker 與 API）
+下次檢索時發現版本不同即重建，不需要在寫入端計算量化向量。
+"""
+
+import os
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_MODES = ("none", "int8", "binary")
+
+# RAG_VECTOR_QUANTIZATION: 檢索時的粗排方式（none 表示直接使用向量庫的 HNSW 檢索）
+# RAG_QUANTIZED_OVERSAMPLE: 粗排候選數為 n_results 的幾倍
+VECTOR_QUANTIZATION = os.getenv("RAG_VECTOR_QUANTIZATION", "none").lower()
+QUANTIZED_OVERSAMPLE = int(os.getenv("RAG_QUANTIZED_OVERSAMPLE", "4"))
+
+# 記憶體中保留的文檔數
+_MEMORY_DOCUMENTS = 256
+
+EmbeddingLoader = Callable[[str], Tuple[List[str], np.ndarray]]
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """將每個向量正規化為單位長度（零向量保持不變）"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def quantize(vectors: np.ndarray, mode: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    量化向量
+
+    Args:
+        vectors: (n, d) 向量
+        mode: int8 或 binary
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (量化碼, 每個向量的縮放比例；binary 時為空陣列)
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    if mode == "binary":
+        return np.packbits(vectors > 0, axis=1), np.empty(0, dtype=np.float32)
+    if mode == "int8":
+        peak = np.abs(vectors).max(axis=1)
+        scales = np.where(peak == 0, 1, 127 / np.where(peak == 0, 1, peak)).astype(np.float32)
+        codes = np.round(vectors * scales[:, None]).astype(np.int8)
+        return codes, scales
+    raise ValueError(f"不支援的量化方式: {mode}")
+
+
+def quantized_scores(query: np.ndarray, codes: np.ndarray, scales: np.ndarray, mode: str) -> np.ndarray:
+    """
+    以量化碼計算查詢與每個向量的相似度（越大越相似，只用於排序）
+
+    Args:
+        query: (d,) 查詢向量
+        codes, scales: quantize 的結果
+        mode: int8 或 binary
+    """
+    query_codes, query_scales = quantize(query, mode)
+    if mode == "binary":
+        distances = np.unpackbits(np.bitwise_xor(codes, query_codes[0]), axis=1).sum(axis=1)
+        return -distances.astype(np.float32)
+    dots = codes.astype(np.int32) @ query_codes[0].astype(np.int32)
+    return dots / (scales * query_scales[0])
+
+
+def bytes_per_vector(dimensions: int, mode: str) -> int:
+    """每個向量的大小（bytes）：none 為 float32，int8 含縮放比例"""
+    if mode == "binary":
+        return (dimensions + 7) // 8
+    if mode == "int8":
+        return dimensions + 4
+    return dimensions * 4
+
+
+@dataclass
+class _Entry:
+    version: str
+    ids: List[str]
+    codes: np.ndarray
+    scales: np.ndarray
+
+
+class QuantizedIndex:
+    """
+    依文檔保存的量化向量（執行緒安全）
+
+    Args:
+        directory: 保存目錄
+        mode: int8 或 binary
+        loader: 由向量庫讀取文檔所有 chunks 的 (chunk ID, 向量)
+    """
+
+    def __init__(self, directory: str, mode: str, loader: EmbeddingLoader):
+        if mode not in ("int8", "binary"):
+            raise ValueError(f"不支援的量化方式: {mode}")
+        self.directory = directory
+        self.mode = mode
+        self.loader = loader
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _version_path(self, document_id: str) -> str:
+        return os.path.join(self.directory, f"{document_id}.version")
+
+    def _data_path(self, document_id: str) -> str:
+        return os.path.join(self.directory, f"{document_id}.{self.mode}.npz")
+
+    def _current_version(self, document_id: str) -> str:
+        try:
+            with open(self._version_path(document_id), encoding="utf-8") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return ""
+
+    @staticmethod
+    def touch(directory: str, document_ids: Iterable[str]) -> None:
+        """
+        標記文檔的向量已變更（寫入向量庫後呼叫，不論本行程是否啟用量化檢索）
+
+        Args:
+            directory: 保存目錄
+            document_ids: 文檔 ID
+        """
+        os.makedirs(directory, exist_ok=True)
+        for document_id in set(document_ids):
+            path = os.path.join(directory, f"{document_id}.version")
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(uuid.uuid4().hex)
+            os.replace(tmp_path, path)
+
+    def _load(self, document_id: str, version: str) -> Optional[_Entry]:
+        try:
+            with np.load(self._data_path(document_id), allow_pickle=False) as data:
+                if str(data["version"]) != version:
+                    return None
+                return _Entry(version, data["ids"].tolist(), data["codes"], data["scales"])
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            return None
+
+    def _build(self, document_id: str, version: str) -> _Entry:
+        # 先取得版本再讀取向量：讀取期間若有寫入，版本已不同，下次檢索會重建
+        ids, vectors = self.loader(document_id)
+        if ids:
+            codes, scales = quantize(normalize_rows(vectors), self.mode)
+        else:
+            codes, scales = np.empty((0, 0), dtype=np.uint8), np.empty(0, dtype=np.float32)
+        entry = _Entry(version, list(ids), codes, scales)
+
+        path = self._data_path(document_id)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp.npz"
+        try:
+            np.savez(tmp_path, version=np.array(version), ids=np.array(entry.ids, dtype=str),
+                     codes=codes, scales=scales)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to save quantized index for {document_id}: {e}")
+        return entry
+
+    def _get(self, document_id: str) -> _Entry:
+        version = self._current_version(document_id)
+        with self._lock:
+            entry = self._entries.get(document_id)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(document_id)
+                return entry
+
+        entry = self._load(document_id, version) or self._build(document_id, version)
+        with self._lock:
+            self._entries[document_id] = entry
+            self._entries.move_to_end(document_id)
+            while len(self._entries) > _MEMORY_DOCUMENTS:
+                self._entries.popitem(last=False)
+        return entry
+
+    def candidates(self, document_ids: List[str], query_embedding: List[float], limit: int) -> List[str]:
+        """
+        以量化向量粗排，返回最相似的 chunk ID
+
+        Args:
+            document_ids: 限定的文檔 ID
+            query_embedding: 查詢向量
+            limit: 候選數
+
+        Returns:
+            List[str]: chunk ID（依粗排分數由高至低）
+        """
+        query = normalize_rows(query_embedding)
+        ids: List[str] = []
+        scores = []
+        for document_id in dict.fromkeys(document_ids):
+            entry = self._get(document_id)
+            if not entry.ids:
+                continue
+            ids.extend(entry.ids)
+            scores.append(quantized_scores(query, entry.codes, entry.scales, self.mode))
+        if not ids:
+            return []
+
+        all_scores = np.concatenate(scores)
+        if len(ids) > limit:
+            top = np.argpartition(-all_scores, limit - 1)[:limit]
+        else:
+            top = np.arange(len(ids))
+        top = top[np.argsort(-all_scores[top], kind="stable")]
+        return [ids[i] for i in top]
@@ -0,0 +1,112 @@
+"""
+查詢向量微批次模組
+
+課堂中大量對話請求同時到達時，每則訊息各自送出單一文本的 Embedding 請求。
+此模組收集短時間窗內（預設 10 ms）到達的查詢，合併為一個批次請求，再將結果分送給各呼叫端：
+    - 第一個查詢到達時開始計時，時間窗結束或累積 max_items 筆時送出
+    - 同一批次中相同的文本只送出一次
+    - 批次失敗時所有等待中的呼叫端收到同一個錯誤
+
+批次器只在 Embedding 客戶端的背景事件迴圈中使用（見 AzureEmbeddingClient.aembed_query）。
+"""
+
+import os
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# AZURE_EMBEDDING_QUERY_BATCH_WAIT_MS: 收集查詢的時間窗（毫秒）
+# AZURE_EMBEDDING_QUERY_BATCH_MAX_ITEMS: 每個批次的查詢數上限（達到時立即送出）
+QUERY_BATCH_WAIT_MS = float(os.getenv("AZURE_EMBEDDING_QUERY_BATCH_WAIT_MS", "10"))
+QUERY_BATCH_MAX_ITEMS = int(os.getenv("AZURE_EMBEDDING_QUERY_BATCH_MAX_ITEMS", "32"))
+
+
+class QueryMicroBatcher:
+    """
+    將短時間內到達的單一文本向量化合併為批次請求
+
+    Args:
+        embed_batch: 批次向量化協程函數（接收文本列表，返回對應的向量列表）
+        max_wait_ms: 收集查詢的時間窗（毫秒）
+        max_items: 每個批次的查詢數上限
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], Awaitable[List[List[float]]]],
+        max_wait_ms: float = QUERY_BATCH_WAIT_MS,
+        max_items: int = QUERY_BATCH_MAX_ITEMS
+    ):
+        self.embed_batch = embed_batch
+        self.max_wait = max(max_wait_ms, 0) / 1000
+        self.max_items = max(max_items, 1)
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+        self._stats = {"queries": 0, "batches": 0, "errors": 0, "max_batch_size": 0}
+
+    async def embed(self, text: str) -> List[float]:
+        """
+        加入目前的批次並等待結果（須在批次器所屬的事件迴圈中呼叫）
+
+        Returns:
+            List[float]: 文本的向量
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        self._stats["queries"] += 1
+
+        if len(self._pending) >= self.max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        """送出目前收集的查詢"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._send(batch))
+        # 保留參考，避免任務在完成前被回收
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        self._stats["batches"] += 1
+        self._stats["max_batch_size"] = max(self._stats["max_batch_size"], len(batch))
+        try:
+            vectors = await self.embed_batch(texts)
+            if len(vectors) != len(texts):
+                raise ValueError("Embedding 數量與查詢數量不匹配")
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.warning(f"查詢向量批次失敗（{len(texts)} 筆）: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_text = dict(zip(texts, vectors))
+        for text, future in batch:
+            # 呼叫端已取消（例如連線中斷）時略過
+            if not future.done():
+                future.set_result(by_text[text])
+
+    def stats(self) -> Dict[str, float]:
+        """
+        取得批次統計（行程自啟動以來）
+
+        Returns:
+            Dict: queries / batches / errors / max_batch_size 與平均批次大小
+        """
+        stats: Dict[str, float] = dict(self._stats)
+        stats["mean_batch_size"] = round(stats["queries"] / stats["batches"], 2) if stats["batches"] else 0.0
+        return stats
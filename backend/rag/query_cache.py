@@ -0,0 +1,192 @@
+"""
+查詢向量快取模組
+
+對話檢索時每則訊息都要向量化一次查詢（約 200–500 ms），課堂中同一節點常在數分鐘內
+收到大量相同或幾乎相同的問題。此模組在行程內快取查詢向量：
+    - 鍵為 (Embedding 設定鍵, 正規化後的查詢文本)：設定鍵為部署 + 維度（見 rag.indexing.get_embedding_key），
+      查詢文本經 NFKC、去除頭尾空白、合併連續空白、不分大小寫
+    - LRU 限制筆數，並以 TTL 讓部署更新後的向量自然過期
+    - 同一鍵同時只會有一個 API 請求，其他請求等待同一結果（single-flight）
+    - 向量以 array('f') 保存（3072 維約 12 KB，list[float] 約 100 KB）
+"""
+
+import os
+import asyncio
+import logging
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# RAG_QUERY_CACHE_MAX_ENTRIES: 快取筆數上限（0 表示停用）
+# RAG_QUERY_CACHE_TTL_SECONDS: 每筆向量的有效時間
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("RAG_QUERY_CACHE_MAX_ENTRIES", "1024"))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("RAG_QUERY_CACHE_TTL_SECONDS", "600"))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """查詢文本的快取鍵（寬窄字元、空白與大小寫不同的查詢視為相同）"""
+    text = unicodedata.normalize("NFKC", query)
+    return _WHITESPACE_RE.sub(" ", text).strip().casefold()
+
+
+class QueryEmbeddingCache:
+    """
+    執行緒安全的查詢向量快取（LRU + TTL + single-flight）
+
+    Args:
+        max_entries: 筆數上限（0 表示停用，每次都呼叫 API）
+        ttl_seconds: 每筆向量的有效時間（秒）
+        clock: 時間來源（預設 time.monotonic）
+    """
+
+    def __init__(
+        self,
+        max_entries: int = QUERY_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = QUERY_CACHE_TTL_SECONDS,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, array]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "expired": 0, "evictions": 0, "errors": 0}
+
+    def _lookup(self, key: Tuple[str, str]) -> Tuple[Optional[List[float]], Optional[Future], bool]:
+        """
+        查詢快取（持有鎖時呼叫）
+
+        Returns:
+            Tuple: (命中的向量, 進行中的請求, 是否由呼叫端負責送出請求)
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, vector = entry
+            if expires_at > self._clock():
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return vector.tolist(), None, False
+            del self._entries[key]
+            self._stats["expired"] += 1
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self._stats["coalesced"] += 1
+            return None, future, False
+
+        self._stats["misses"] += 1
+        future = Future()
+        self._inflight[key] = future
+        return None, future, True
+
+    def _store(self, key: Tuple[str, str], vector: List[float]) -> None:
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl_seconds, array("f", vector))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    async def get_or_embed(
+        self,
+        query: str,
+        embedding_key: str,
+        embed: Callable[[str], Awaitable[List[float]]]
+    ) -> List[float]:
+        """
+        取得查詢向量：命中時直接返回；未命中時呼叫 embed，同時間相同鍵的其他請求等待同一結果
+
+        Args:
+            query: 查詢文本
+            embedding_key: Embedding 設定鍵（get_embedding_key，部署 + 維度；維度不同的向量不可混用）
+            embed: 向量化協程函數（例如 AzureEmbeddingClient.aembed_query）
+
+        Returns:
+            List[float]: 查詢向量
+        """
+        if self.max_entries <= 0:
+            return await embed(query)
+
+        key = (embedding_key, normalize_query(query))
+        with self._lock:
+            vector, future, owner = self._lookup(key)
+        if vector is not None:
+            return vector
+        if not owner:
+            # 等待其他請求的結果；失敗時各自拋出同一個錯誤，不重複呼叫 API
+            return list(await asyncio.wrap_future(future))
+
+        try:
+            vector = await embed(query)
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+                self._stats["errors"] += 1
+            future.set_exception(e)
+            # 沒有其他請求等待時避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+
+        self._store(key, vector)
+        with self._lock:
+            self._inflight.pop(key, None)
+        future.set_result(vector)
+        return vector
+
+    def clear(self) -> None:
+        """清除快取（進行中的請求不受影響）"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        取得快取統計（行程自啟動以來）
+
+        Returns:
+            Dict: hits / misses / coalesced（等待進行中請求的次數）/ expired / evictions / errors、
+            目前筆數、進行中的請求數與命中率（hits + coalesced 視為命中）
+        """
+        with self._lock:
+            stats: Dict[str, float] = dict(self._stats)
+            stats["size"] = len(self._entries)
+            stats["inflight"] = len(self._inflight)
+        lookups = stats["hits"] + stats["coalesced"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["coalesced"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+# 模組級別的快取實例（延遲初始化）
+_query_cache: Optional[QueryEmbeddingCache] = None
+
+
+def get_query_embedding_cache() -> QueryEmbeddingCache:
+    """
+    取得查詢向量快取單例
+
+    Returns:
+        QueryEmbeddingCache: 快取實例
+    """
+    global _query_cache
+
+    if _query_cache is None:
+        _query_cache = QueryEmbeddingCache()
+
+    return _query_cache
+
+
+def reset_query_embedding_cache() -> None:
+    """
+    重置查詢向量快取（主要用於測試）
+    """
+    global _query_cache
+    _query_cache = None
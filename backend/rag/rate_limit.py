@@ -0,0 +1,424 @@
+"""
+Embedding 速率限制模組
+
+以每分鐘請求數（RPM）與每分鐘 token 數（TPM）限制 Embedding API 呼叫，
+避免耗盡 Azure OpenAI 配額而影響線上服務；另提供依 429 回應自動調整的並行上限（AIMD）。
+
+額度預設保存在 Postgres（embedding_rate_buckets），API、所有 worker 行程與命令列工具共用同一份配額
+（各行程一次租用數秒份量的額度，在行程內扣除）；
+AZURE_EMBEDDING_RATE_LIMIT_SHARED=false 時每個行程各自計算（此時 RPM/TPM 應設為總配額除以行程數）。
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger(__name__)
+
+# Embedding 部署的配額（0 表示不限制）
+# AZURE_EMBEDDING_RATE_LIMIT_SHARED: 是否跨行程共用配額（false 時為每個行程各自的配額）
+EMBEDDING_RPM = int(os.getenv("AZURE_EMBEDDING_RPM", "0"))
+EMBEDDING_TPM = int(os.getenv("AZURE_EMBEDDING_TPM", "0"))
+EMBEDDING_RATE_LIMIT_SHARED = os.getenv("AZURE_EMBEDDING_RATE_LIMIT_SHARED", "true").lower() == "true"
+# AZURE_EMBEDDING_RATE_LEASE_SECONDS: 共用配額時每次向資料庫租用幾秒份量的額度
+EMBEDDING_RATE_LEASE_SECONDS = float(os.getenv("AZURE_EMBEDDING_RATE_LEASE_SECONDS", "2"))
+
+
+class EmbeddingRateLimiter:
+    """
+    執行緒安全的 RPM/TPM 限制器（滑動補充的 token bucket）
+
+    - acquire(tokens) / acquire_async(tokens)：送出請求前呼叫，超過 RPM 或 TPM 額度時等待，
+      並先以估計的 token 數預扣 TPM 額度
+    - record_tokens(tokens, reserved)：收到回應後以實際用量修正預扣的額度
+      （額度可暫時為負，之後的請求會等待補回）
+
+    requests_per_minute / tokens_per_minute 為 0 或 None 表示不限制，此時只累計用量。
+    指定 parent 時，請求須同時取得本限制器與 parent 的額度（例如重建索引在共用配額之下再設較低的上限）。
+    """
+
+    # 補充額度的時間來源
+    _clock = staticmethod(time.monotonic)
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        parent: Optional["EmbeddingRateLimiter"] = None
+    ):
+        self.requests_per_minute = requests_per_minute or 0
+        self.tokens_per_minute = tokens_per_minute or 0
+        self.parent = parent
+        self._request_budget = float(self.requests_per_minute)
+        self._token_budget = float(self.tokens_per_minute)
+        self._updated = self._clock()
+        self._lock = threading.Lock()
+
+        self.total_requests = 0
+        self.total_tokens = 0
+
+    def _refill(self) -> None:
+        now = self._clock()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._request_budget = min(
+                self._request_budget + elapsed * self.requests_per_minute / 60,
+                self.requests_per_minute
+            )
+        if self.tokens_per_minute:
+            self._token_budget = min(
+                self._token_budget + elapsed * self.tokens_per_minute / 60,
+                self.tokens_per_minute
+            )
+
+    def _wait_seconds(self) -> float:
+        """距離可送出下一個請求還需等待的秒數"""
+        wait = 0.0
+        if self.requests_per_minute and self._request_budget < 1:
+            wait = max(wait, (1 - self._request_budget) * 60 / self.requests_per_minute)
+        if self.tokens_per_minute and self._token_budget < 0:
+            wait = max(wait, -self._token_budget * 60 / self.tokens_per_minute)
+        return wait
+
+    def _take(self, tokens: int) -> float:
+        """補充額度後嘗試扣除一個請求與 tokens（持有鎖時呼叫）；成功返回 0，否則返回需等待的秒數"""
+        self._refill()
+        wait = self._wait_seconds()
+        if wait <= 0:
+            if self.requests_per_minute:
+                self._request_budget -= 1
+            if self.tokens_per_minute:
+                self._token_budget -= tokens
+            self.total_requests += 1
+        return wait
+
+    def _try_acquire(self, tokens: int) -> float:
+        """嘗試取得請求額度並預扣 tokens；成功返回 0，否則返回需等待的秒數"""
+        with self._lock:
+            return self._take(tokens)
+
+    def acquire(self, tokens: int = 0) -> None:
+        """取得一個請求額度（必要時阻塞），並預扣估計的 token 數"""
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                break
+            time.sleep(min(wait, 1.0))
+        if self.parent is not None:
+            self.parent.acquire(tokens)
+
+    async def acquire_async(self, tokens: int = 0) -> None:
+        """acquire 的 asyncio 版本（等待時不阻塞事件迴圈）"""
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                break
+            await asyncio.sleep(min(wait, 1.0))
+        if self.parent is not None:
+            await self.parent.acquire_async(tokens)
+
+    def record_tokens(self, tokens: int, reserved: int = 0) -> None:
+        """以實際用量扣除 token 額度（reserved 為 acquire 時預扣的數量，請求失敗時 tokens 為 0 即歸還）"""
+        with self._lock:
+            self._refill()
+            if self.tokens_per_minute:
+                self._token_budget -= tokens - reserved
+            self.total_tokens += tokens
+        if self.parent is not None:
+            self.parent.record_tokens(tokens, reserved)
+
+
+class SharedEmbeddingRateLimiter(EmbeddingRateLimiter):
+    """
+    跨行程共用的 RPM/TPM 限制器（額度保存在 Postgres 的單一列）
+
+    各行程以 SELECT ... FOR UPDATE 鎖定該列後，一次租用數秒（lease_seconds）份量的額度，
+    之後的請求在行程內扣除租用的額度，用完或租期結束才再回到資料庫（查詢的單次 Embedding
+    也不必每次鎖定該列）。租期結束時未用完的額度與實際用量的差額於下一次租用時一併歸還，
+    行程異常結束時最多損失一個租期的額度。
+    資料庫往返期間不持有執行緒鎖；同一行程同時只有一個執行緒向資料庫租用，其他執行緒等待其結果。
+    資料庫無法使用時暫時改以行程內的額度限制，恢復後自動回到共用額度。
+
+    Args:
+        engine: SQLAlchemy engine
+        table: embedding_rate_buckets 資料表（models.EmbeddingRateBucket.__table__）
+        name: 額度名稱（同一個 Embedding 部署的行程使用相同名稱）
+        requests_per_minute / tokens_per_minute: 整個部署的配額
+        lease_seconds: 每次租用的額度相當於幾秒的配額
+    """
+
+    # 跨行程比較補充時間，使用牆鐘時間
+    _clock = staticmethod(time.time)
+
+    def __init__(
+        self,
+        engine,
+        table,
+        name: str,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        lease_seconds: float = EMBEDDING_RATE_LEASE_SECONDS
+    ):
+        super().__init__(requests_per_minute, tokens_per_minute)
+        self.engine = engine
+        self.table = table
+        self.name = name
+        self.lease_seconds = lease_seconds
+        # 租用中的額度（token 可因實際用量超過預扣而為負）與租期
+        self._leased_requests = 0.0
+        self._leased_tokens = 0.0
+        self._lease_expires = 0.0
+        self._leasing = False
+        self._lease_done = threading.Condition(self._lock)
+        self._row_ready = False
+        self._degraded = False
+
+    def _ensure_row(self, conn) -> None:
+        # API 行程由 create_all 建立資料表；worker 與命令列工具第一次使用時建立
+        if self._row_ready:
+            return
+        self.table.create(bind=conn, checkfirst=True)
+        conn.execute(insert(self.table).values(
+            name=self.name,
+            request_budget=float(self.requests_per_minute),
+            token_budget=float(self.tokens_per_minute),
+            updated_at=self._clock(),
+        ).on_conflict_do_nothing())
+        self._row_ready = True
+
+    def _spend_leased(self, tokens: int) -> bool:
+        """以租用的額度扣除一個請求與 tokens（持有鎖時呼叫）；額度不足或租期已過時返回 False"""
+        if self._clock() >= self._lease_expires:
+            return False
+        if self.requests_per_minute and self._leased_requests < 1:
+            return False
+        if self.tokens_per_minute and self._leased_tokens < tokens:
+            return False
+        self._leased_requests -= 1
+        self._leased_tokens -= tokens
+        self.total_requests += 1
+        return True
+
+    def _lease_shared(self, tokens: int, returned_requests: float, returned_tokens: float) -> float:
+        """
+        歸還未用完的額度並租用新的額度（不持有執行緒鎖時呼叫）
+
+        Returns:
+            float: 0 表示已租用並扣除本次請求，否則為共用額度補回前需等待的秒數
+        """
+        rpm, tpm = self.requests_per_minute, self.tokens_per_minute
+        with self.engine.begin() as conn:
+            self._ensure_row(conn)
+            row = conn.execute(
+                select(self.table.c.request_budget, self.table.c.token_budget, self.table.c.updated_at)
+                .where(self.table.c.name == self.name)
+                .with_for_update()
+            ).one()
+            now = self._clock()
+            elapsed = max(now - row.updated_at, 0.0)
+            request_budget = min(row.request_budget + elapsed * rpm / 60 + returned_requests, rpm)
+            token_budget = min(row.token_budget + elapsed * tpm / 60 + returned_tokens, tpm)
+
+            wait = 0.0
+            if rpm and request_budget < 1:
+                wait = max(wait, (1 - request_budget) * 60 / rpm)
+            if tpm and token_budget < 0:
+                wait = max(wait, -token_budget * 60 / tpm)
+
+            leased_requests = leased_tokens = 0.0
+            if wait <= 0:
+                if rpm:
+                    leased_requests = max(min(rpm * self.lease_seconds / 60, int(request_budget)), 1)
+                    request_budget -= leased_requests
+                if tpm:
+                    # 與行程內的限制器相同：額度非負即可送出，預扣後可暫時為負
+                    leased_tokens = max(min(tpm * self.lease_seconds / 60, token_budget), tokens)
+                    token_budget -= leased_tokens
+
+            conn.execute(
+                update(self.table).where(self.table.c.name == self.name).values(
+                    request_budget=request_budget,
+                    token_budget=token_budget,
+                    updated_at=now,
+                )
+            )
+
+        if wait <= 0:
+            with self._lock:
+                self._leased_requests = leased_requests - 1
+                self._leased_tokens = leased_tokens - tokens
+                self._lease_expires = now + self.lease_seconds
+                self.total_requests += 1
+        return wait
+
+    def _try_acquire(self, tokens: int) -> float:
+        with self._lock:
+            while self._leasing:
+                self._lease_done.wait()
+            if self._spend_leased(tokens):
+                return 0.0
+            # 取出未用完的額度，於租用時歸還共用額度
+            self._leasing = True
+            returned_requests = self._leased_requests if self.requests_per_minute else 0.0
+            returned_tokens = self._leased_tokens if self.tokens_per_minute else 0.0
+            self._leased_requests = self._leased_tokens = 0.0
+
+        try:
+            wait = self._lease_shared(tokens, returned_requests, returned_tokens)
+        except SQLAlchemyError as e:
+            with self._lock:
+                # 未歸還的額度留待下次租用
+                self._leased_requests += returned_requests
+                self._leased_tokens += returned_tokens
+                if not self._degraded:
+                    logger.warning(f"Shared embedding rate limit unavailable, using per-process budget: {e}")
+                    self._degraded = True
+                return self._take(tokens)
+        finally:
+            with self._lock:
+                self._leasing = False
+                self._lease_done.notify_all()
+
+        if self._degraded:
+            logger.info("Shared embedding rate limit restored")
+            self._degraded = False
+        return wait
+
+    async def acquire_async(self, tokens: int = 0) -> None:
+        """acquire 的 asyncio 版本（租用的額度足夠時直接扣除，資料庫往返與等待都不阻塞事件迴圈）"""
+        while True:
+            with self._lock:
+                if not self._leasing and self._spend_leased(tokens):
+                    return
+            wait = await asyncio.to_thread(self._try_acquire, tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(min(wait, 1.0))
+
+    def record_tokens(self, tokens: int, reserved: int = 0) -> None:
+        """以實際用量修正租用的 token 額度（差額於下一次租用時歸還共用額度）"""
+        with self._lock:
+            if self.tokens_per_minute:
+                if self._degraded:
+                    self._token_budget -= tokens - reserved
+                else:
+                    self._leased_tokens -= tokens - reserved
+            self.total_tokens += tokens
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD 並行上限（asyncio）
+
+    - 每個請求成功後上限增加 1 / 上限（約每輪增加 1），直到 max_limit
+    - 收到速率限制（429）時上限減半；同一輪（減半之前送出）的其他 429 不再重複減半
+    - 帶有 Retry-After 時，所有新請求暫停到指定時間之後
+
+    只能在單一事件迴圈中使用。
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.max_limit = max(max_limit, 1)
+        self.min_limit = max(min(min_limit, self.max_limit), 1)
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.throttled = 0  # 收到的 429 次數
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[float]:
+        """
+        取得一個並行名額（必要時等待）
+
+        Yields:
+            float: 取得名額的時間（time.monotonic()），回報 429 時傳給 on_throttle
+        """
+        async with self._condition:
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    break
+                try:
+                    await asyncio.wait_for(self._condition.wait(), timeout=wait if wait > 0 else None)
+                except asyncio.TimeoutError:
+                    pass
+            self.in_flight += 1
+        try:
+            yield time.monotonic()
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def on_success(self) -> None:
+        self.limit = min(self.limit + 1 / self.limit, self.max_limit)
+
+    def on_throttle(self, started_at: float, retry_after: Optional[float] = None) -> None:
+        """
+        回報速率限制
+
+        Args:
+            started_at: 該請求取得名額的時間
+            retry_after: 回應中的 Retry-After 秒數
+        """
+        self.throttled += 1
+        now = time.monotonic()
+        if started_at >= self._last_decrease:
+            self.limit = max(self.limit / 2, self.min_limit)
+            self._last_decrease = now
+        if retry_after:
+            self._paused_until = max(self._paused_until, now + retry_after)
+
+
+_rate_limiter: Optional[EmbeddingRateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_embedding_rate_limiter(deployment: str = "") -> EmbeddingRateLimiter:
+    """
+    取得 Embedding 速率限制器（AZURE_EMBEDDING_RPM / AZURE_EMBEDDING_TPM）
+
+    有設定配額且 AZURE_EMBEDDING_RATE_LIMIT_SHARED 時為跨行程共用的限制器，否則為行程內的限制器。
+
+    Args:
+        deployment: Embedding 部署名稱（共用額度的名稱，第一次呼叫時決定）
+
+    Returns:
+        EmbeddingRateLimiter: 限制器實例
+    """
+    global _rate_limiter
+
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                if EMBEDDING_RATE_LIMIT_SHARED and (EMBEDDING_RPM or EMBEDDING_TPM):
+                    import models
+                    from db import engine
+
+                    _rate_limiter = SharedEmbeddingRateLimiter(
+                        engine, models.EmbeddingRateBucket.__table__,
+                        f"embedding:{deployment}", EMBEDDING_RPM, EMBEDDING_TPM
+                    )
+                else:
+                    _rate_limiter = EmbeddingRateLimiter(EMBEDDING_RPM, EMBEDDING_TPM)
+
+    return _rate_limiter
+
+
+def reset_embedding_rate_limiter() -> None:
+    """
+    重置速率限制器（主要用於測試）
+    """
+    global _rate_limiter
+    _rate_limiter = None
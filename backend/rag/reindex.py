@@ -0,0 +1,381 @@
+"""
+重建 RAG 索引
+
+變更切分設定或 Embedding 部署後，從 MinIO 取回既有 PDF 重新執行 process_document_rag，
+不需要重新上傳。每份文檔完成後寫入檢查點，中斷後以相同 run_id 重新執行會從中斷處繼續。
+
+每份文檔處理前以 start_rag_job 建立由本行程持有的執行中任務（與 worker 互斥），
+文檔已在 rag_jobs 佇列中等待或執行時略過（不寫入檢查點，重新執行時再處理）。
+
+使用方式（在 backend 目錄執行）：
+    python -m rag.reindex --all                        # 全部 PDF 文檔
+    python -m rag.reindex --stale                      # 設定指紋與目前設定不同的文檔
+    python -m rag.reindex --status failed              # 處理失敗的文檔
+    python -m rag.reindex --project <project_id>       # 指定專案
+    python -m rag.reindex --all --concurrency 8 --embedding-tpm 500000
+    python -m rag.reindex --all --offline              # 只使用 Embedding 儲存中的向量（向量庫遺失時重建）
+"""
+
+import os
+import argparse
+import logging
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+# 載入環境變數（需在匯入 db 之前，DATABASE_URL 於匯入時讀取）
+_env_paths = [
+    ".env",
+    "backend/.env",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"),
+    "env.local",
+    "backend/env.local",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "env.local"),
+]
+for _env_path in _env_paths:
+    if os.path.exists(_env_path):
+        load_dotenv(_env_path)
+        break
+
+logger = logging.getLogger("rag.reindex")
+
+
+def select_documents(
+    db,
+    all_documents: bool = False,
+    project_id: Optional[str] = None,
+    statuses: Optional[List[str]] = None,
+    stale: bool = False,
+    fingerprint: Optional[str] = None,
+    document_ids: Optional[List[str]] = None
+) -> List[str]:
+    """
+    依條件選出要重建索引的 PDF 文檔（條件之間為 AND）
+
+    已在 rag_jobs 佇列中等待或執行中的文檔會被略過，避免與 worker 重複處理。
+
+    Returns:
+        List[str]: 文檔 ID（依上傳時間排序）
+    """
+    import models
+    from rag_jobs import ACTIVE_JOB_STATUSES
+    from rag_services import get_rag_fingerprint
+
+    query = db.query(models.Document.id).filter(models.Document.type == "pdf")
+
+    if project_id:
+        query = query.filter(models.Document.project_id == project_id)
+    if statuses:
+        query = query.filter(models.Document.rag_status.in_(statuses))
+    if stale:
+        current = get_rag_fingerprint()
+        query = query.filter(
+            (models.Document.rag_fingerprint.is_(None))
+            | (models.Document.rag_fingerprint != current)
+        )
+    if fingerprint:
+        query = query.filter(models.Document.rag_fingerprint == fingerprint)
+    if document_ids:
+        query = query.filter(models.Document.id.in_(document_ids))
+    if not any([all_documents, project_id, statuses, stale, fingerprint, document_ids]):
+        raise ValueError("請指定選擇條件（--all、--project、--status、--stale、--fingerprint 或 --document）")
+
+    active = db.query(models.RagJob.document_id).filter(
+        models.RagJob.status.in_(ACTIVE_JOB_STATUSES)
+    )
+    query = query.filter(~models.Document.id.in_(active))
+
+    return [row.id for row in query.order_by(models.Document.uploaded_at.asc())]
+
+
+def completed_document_ids(db, run_id: str) -> set:
+    """取得此 run_id 已成功處理的文檔"""
+    import models
+
+    return {
+        row.document_id
+        for row in db.query(models.RagReindexCheckpoint.document_id).filter(
+            models.RagReindexCheckpoint.run_id == run_id,
+            models.RagReindexCheckpoint.status == "succeeded",
+        )
+    }
+
+
+def save_checkpoint(
+    db,
+    run_id: str,
+    document_id: str,
+    status: str,
+    error: Optional[str],
+    duration_ms: int,
+    embedding_tokens: int
+) -> None:
+    """寫入（或覆寫）文檔的檢查點"""
+    import models
+
+    checkpoint = db.query(models.RagReindexCheckpoint).filter(
+        models.RagReindexCheckpoint.run_id == run_id,
+        models.RagReindexCheckpoint.document_id == document_id,
+    ).first()
+    if checkpoint is None:
+        checkpoint = models.RagReindexCheckpoint(run_id=run_id, document_id=document_id)
+        db.add(checkpoint)
+    checkpoint.status = status
+    checkpoint.error = (error or "")[:500] or None
+    checkpoint.duration_ms = duration_ms
+    checkpoint.embedding_tokens = embedding_tokens
+    db.commit()
+
+
+def _embedding_tokens(db, document_id: str, since) -> int:
+    """從本次處理的 embedding 事件取得 token 用量"""
+    import models
+
+    log = db.query(models.RagProcessingLog).filter(
+        models.RagProcessingLog.document_id == document_id,
+        models.RagProcessingLog.stage == "embedding",
+        models.RagProcessingLog.created_at >= since,
+    ).order_by(models.RagProcessingLog.created_at.desc()).first()
+    if not log or not log.metadata_:
+        return 0
+    return int(log.metadata_.get("embedding_tokens") or 0)
+
+
+def reindex_document(document_id: str, run_id: str) -> tuple:
+    """
+    重建單一文檔的索引：取得任務 → 從 MinIO 串流讀取 → process_document_rag → 寫入檢查點
+
+    處理期間持有該文檔的 RAG 任務（rag_jobs）並以背景 heartbeat 延長租約，
+    worker 不會同時處理同一份文檔；租約遺失時中止處理並記為失敗。
+
+    Returns:
+        tuple: (狀態 succeeded / failed / skipped, 錯誤訊息, embedding token 數)
+    """
+    from datetime import datetime
+
+    import models
+    from db import SessionLocal
+    from rag_jobs import DEFAULT_VISIBILITY_TIMEOUT, RagJobLease, complete_rag_job, fail_rag_job, start_rag_job
+    from rag_services import process_document_rag, open_storage_source, has_cached_pages
+
+    db = SessionLocal()
+    started = time.perf_counter()
+    started_at = datetime.utcnow()
+    tokens = 0
+    source = None
+    job = None
+    worker_id = f"reindex:{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    try:
+        doc = db.query(models.Document).filter(models.Document.id == document_id).first()
+        if not doc:
+            db.close()
+            return "failed", "文檔不存在", 0
+
+        job = start_rag_job(db, document_id, worker_id)
+        if job is None:
+            db.close()
+            return "skipped", "文檔已在 RAG 任務佇列中", 0
+
+        with RagJobLease(job.id, worker_id, DEFAULT_VISIBILITY_TIMEOUT) as lease:
+            try:
+                # 解析結果快取命中時不需要取得 PDF
+                if not has_cached_pages(doc.content_hash):
+                    source = open_storage_source(doc.object_key)
+                success, error = process_document_rag(document_id, None, db, source=source, cancel=lease.lost)
+                tokens = _embedding_tokens(db, document_id, started_at)
+            finally:
+                if source is not None:
+                    source.close()
+        if lease.lost.is_set():
+            success, error = False, "任務租約遺失，文檔已改由其他 worker 處理"
+    except Exception as e:
+        db.rollback()
+        success, error = False, str(e)
+
+    try:
+        if job is not None and not lease.lost.is_set():
+            if success:
+                complete_rag_job(db, job, worker_id)
+            else:
+                # 失敗由重建索引的檢查點記錄，不交由 worker 重試
+                fail_rag_job(db, job, worker_id, error or "未知錯誤", retry=False)
+        save_checkpoint(
+            db, run_id, document_id,
+            "succeeded" if success else "failed",
+            error,
+            int((time.perf_counter() - started) * 1000),
+            tokens,
+        )
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Failed to save checkpoint for {document_id}: {e}")
+    finally:
+        db.close()
+
+    return ("succeeded" if success else "failed"), error, tokens
+
+
+class ThroughputReporter:
+    """累計並輸出處理進度與吞吐量（docs/min、tokens/min）"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self.tokens = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, document_id: str, status: str, tokens: int, error: Optional[str]) -> None:
+        with self._lock:
+            self.done += 1
+            self.tokens += tokens
+            if status == "failed":
+                self.failed += 1
+            elif status == "skipped":
+                self.skipped += 1
+            minutes = max(time.monotonic() - self.started, 1e-6) / 60
+            status = {"succeeded": "ok", "skipped": f"skipped: {error}"}.get(status, f"FAILED: {error}")
+            print(
+                f"[{self.done}/{self.total}] {document_id} {status} | "
+                f"{self.done / minutes:.1f} docs/min, {self.tokens / minutes:,.0f} tokens/min, "
+                f"failed={self.failed}, skipped={self.skipped}",
+                flush=True,
+            )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="重建 RAG 索引（從 MinIO 取回 PDF 重新處理）")
+    parser.add_argument("--all", action="store_true", help="選擇全部 PDF 文檔")
+    parser.add_argument("--project", help="只處理指定專案的文檔")
+    parser.add_argument(
+        "--status",
+        action="append",
+        choices=["pending", "processing", "partial", "completed", "failed"],
+        help="依 rag_status 選擇（可重複指定）",
+    )
+    parser.add_argument("--stale", action="store_true", help="只處理設定指紋與目前設定不同的文檔")
+    parser.add_argument("--fingerprint", help="只處理以指定設定指紋完成的文檔")
+    parser.add_argument("--document", action="append", help="指定文檔 ID（可重複指定）")
+    parser.add_argument(
+        "--concurrency", "-c",
+        type=int,
+        default=int(os.getenv("RAG_REINDEX_CONCURRENCY", "4")),
+        help="同時處理的文檔數",
+    )
+    parser.add_argument(
+        "--embedding-rpm",
+        type=int,
+        default=int(os.getenv("RAG_REINDEX_EMBEDDING_RPM", "0")),
+        help="Embedding 每分鐘請求數上限（0 表示不限制）",
+    )
+    parser.add_argument(
+        "--embedding-tpm",
+        type=int,
+        default=int(os.getenv("RAG_REINDEX_EMBEDDING_TPM", "0")),
+        help="Embedding 每分鐘 token 數上限（0 表示不限制）",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="不呼叫 Embedding API，只使用 Embedding 儲存中的向量（有文本未命中的文檔記為失敗）",
+    )
+    parser.add_argument(
+        "--run-id",
+        help="檢查點 ID；以相同 run_id 重新執行會略過已完成的文檔（預設依目前設定指紋產生）",
+    )
+    parser.add_argument("--restart", action="store_true", help="忽略既有檢查點，全部重新處理")
+    parser.add_argument("--dry-run", action="store_true", help="只列出會處理的文檔數")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "WARNING"),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+    import models
+    from db import SessionLocal, engine
+    from rag import get_embedding_client
+    from rag.rate_limit import EmbeddingRateLimiter
+    from rag_services import get_rag_fingerprint
+
+    from rag.vector_store import require_shared_vector_store
+    try:
+        require_shared_vector_store("rag.reindex")
+    except RuntimeError as e:
+        parser.error(str(e))
+
+    models.RagReindexCheckpoint.__table__.create(bind=engine, checkfirst=True)
+
+    run_id = args.run_id or f"reindex-{get_rag_fingerprint()}"
+
+    db = SessionLocal()
+    try:
+        try:
+            document_ids = select_documents(
+                db,
+                all_documents=args.all,
+                project_id=args.project,
+                statuses=args.status,
+                stale=args.stale,
+                fingerprint=args.fingerprint,
+                document_ids=args.document,
+            )
+        except ValueError as e:
+            parser.error(str(e))
+        done = set() if args.restart else completed_document_ids(db, run_id)
+    finally:
+        db.close()
+
+    pending = [doc_id for doc_id in document_ids if doc_id not in done]
+    print(
+        f"run_id={run_id}: selected {len(document_ids)} documents, "
+        f"{len(document_ids) - len(pending)} already done, {len(pending)} to process",
+        flush=True,
+    )
+    if args.dry_run or not pending:
+        return 0
+
+    # 所有執行緒共用 Embedding 客戶端，速率限制對整個重建流程生效；
+    # 指定的上限在部署的共用額度之下另外生效（重建索引不會佔用 API 與 worker 的額度以外的配額）
+    if args.embedding_rpm or args.embedding_tpm:
+        client = get_embedding_client()
+        client.rate_limiter = EmbeddingRateLimiter(
+            args.embedding_rpm, args.embedding_tpm, parent=client.rate_limiter
+        )
+    if args.offline:
+        if get_embedding_client().store is None:
+            parser.error("--offline 需要啟用 Embedding 向量儲存（RAG_EMBEDDING_STORE=true）")
+        get_embedding_client().offline = True
+
+    reporter = ThroughputReporter(len(pending))
+    with ThreadPoolExecutor(max_workers=max(args.concurrency, 1)) as executor:
+        futures = {executor.submit(reindex_document, doc_id, run_id): doc_id for doc_id in pending}
+        try:
+            for future in as_completed(futures):
+                status, error, tokens = future.result()
+                reporter.record(futures[future], status, tokens, error)
+        except KeyboardInterrupt:
+            print("Interrupted; waiting for in-flight documents (rerun with the same --run-id to resume)")
+            for future in futures:
+                future.cancel()
+            raise
+
+    print(
+        f"Finished: {reporter.done - reporter.failed - reporter.skipped} succeeded, {reporter.failed} failed, "
+        f"{reporter.skipped} skipped (queued for the worker), "
+        f"{reporter.tokens:,} embedding tokens",
+        flush=True,
+    )
+    return 1 if reporter.failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
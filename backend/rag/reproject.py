@@ -0,0 +1,318 @@
+"""
+轉換向量維度
+
+text-embedding-3 系列的縮減維度向量等同原生向量取前 N 維再正規化，
+因此既有的向量庫可直接轉換為較低維度的 collection，不需要重新呼叫 Embedding API。
+
+使用方式（在 backend 目錄執行）：
+    python -m rag.reproject --dimensions 512 --measure                   # 評估召回率與索引大小
+    python -m rag.reproject --dimensions 512 --apply --embedding-store   # 轉換向量庫與 Embedding 儲存
+
+轉換後設定 AZURE_EMBEDDING_DIMENSIONS=512 並重新啟動 API 與 worker。
+原本的 collection 保留不動，改回原設定即可回復。
+"""
+
+import os
+import argparse
+import logging
+import random
+import time
+from collections import Counter
+from typing import Dict, List
+
+from dotenv import load_dotenv
+
+# 載入環境變數（需在匯入 db 之前，DATABASE_URL 於匯入時讀取）
+_env_paths = [
+    ".env",
+    "backend/.env",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"),
+    "env.local",
+    "backend/env.local",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "env.local"),
+]
+for _env_path in _env_paths:
+    if os.path.exists(_env_path):
+        load_dotenv(_env_path)
+        break
+
+import numpy as np
+
+from .embedding import NATIVE_EMBEDDING_DIMENSION
+from .quantized_index import QUANTIZED_OVERSAMPLE, bytes_per_vector, normalize_rows, quantize, quantized_scores
+from .vector_store import VectorStore, require_shared_vector_store
+
+logger = logging.getLogger("rag.reproject")
+
+# 評估的量化方式（none 為縮減維度後的精確檢索）
+_MEASURE_MODES = ("none", "int8", "binary")
+
+
+def list_document_ids(store: VectorStore, batch_size: int = 1000) -> List[str]:
+    """列出 collection 中的所有文檔 ID"""
+    document_ids: Dict[str, None] = {}
+    offset = 0
+    while True:
+        results = store.collection.get(limit=batch_size, offset=offset, include=["metadatas"])
+        if not results or not results['ids']:
+            return list(document_ids)
+        for metadata in results['metadatas']:
+            document_ids[metadata['document_id']] = None
+        offset += len(results['ids'])
+
+
+def load_document(store: VectorStore, document_id: str) -> List[dict]:
+    """
+    讀取文檔的所有 chunks（含向量），依 chunk 順序排列
+
+    Returns:
+        List[dict]: chunk 列表（index, content, page_numbers, embedding）
+    """
+    results = store.collection.get(
+        where={"document_id": document_id},
+        include=["embeddings", "documents", "metadatas"]
+    )
+    if not results or not results['ids']:
+        return []
+
+    chunks = []
+    for content, metadata, embedding in zip(results['documents'], results['metadatas'], results['embeddings']):
+        chunks.append({
+            "index": metadata['chunk_index'],
+            "content": content,
+            "page_numbers": [int(p) for p in metadata.get('page_numbers', '1').split(',') if p],
+            "embedding": embedding,
+        })
+    chunks.sort(key=lambda c: c["index"])
+    return chunks
+
+
+def reproject_document(
+    source: VectorStore,
+    target: VectorStore,
+    document_id: str,
+    embedding_key: str
+) -> int:
+    """
+    將文檔的向量轉換為目標維度並寫入目標 collection（可重複執行）
+
+    chunk ID 含 Embedding 設定（部署 + 維度），依目標設定重新計算，之後的增量索引才能重用這些向量。
+
+    Returns:
+        int: 寫入的 chunk 數
+    """
+    from .indexing import assign_chunk_ids
+
+    chunks = load_document(source, document_id)
+    target.delete_document(document_id)
+    if not chunks:
+        return 0
+
+    vectors = np.asarray([c.pop("embedding") for c in chunks], dtype=np.float32)
+    reduced = normalize_rows(vectors[:, :target.dimensions])
+    assign_chunk_ids(document_id, chunks, embedding_key, Counter())
+    return target.add_chunks(document_id, chunks, reduced.tolist())
+
+
+def reproject_embedding_store(deployment: str, source_dimensions: int, target_dimensions: int) -> int:
+    """
+    將 Embedding 儲存中來源維度的向量轉換為目標維度（已存在者略過）
+
+    Returns:
+        int: 處理的向量數
+    """
+    from .embedding_store import get_embedding_store
+
+    source = get_embedding_store(deployment, source_dimensions)
+    target = get_embedding_store(deployment, target_dimensions)
+    if source is None or target is None:
+        raise ValueError("Embedding 向量儲存未啟用（RAG_EMBEDDING_STORE=false）")
+
+    total = 0
+    for keys, vectors in source.iter_vectors():
+        reduced = normalize_rows(np.asarray(vectors, dtype=np.float32)[:, :target_dimensions])
+        target.put_hashed(dict(zip(keys, reduced.tolist())))
+        total += len(keys)
+        print(f"embedding store: {total:,} vectors", flush=True)
+    return total
+
+
+def update_fingerprints(source_dimensions: int, target_dimensions: int) -> int:
+    """
+    將以來源維度完成的文檔指紋改為目標維度的指紋（避免 reindex --stale 重新處理已轉換的文檔）
+
+    Returns:
+        int: 更新的文檔數
+    """
+    import models
+    from db import SessionLocal
+    from rag_services import get_rag_fingerprint
+
+    db = SessionLocal()
+    try:
+        updated = db.query(models.Document).filter(
+            models.Document.rag_fingerprint == get_rag_fingerprint(dimensions=source_dimensions)
+        ).update(
+            {models.Document.rag_fingerprint: get_rag_fingerprint(dimensions=target_dimensions)},
+            synchronize_session=False
+        )
+        db.commit()
+        return updated
+    finally:
+        db.close()
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    if len(scores) <= k:
+        return np.argsort(-scores)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def measure_recall(
+    source: VectorStore,
+    dimensions: int,
+    k: int = 3,
+    sample: int = 200,
+    oversample: int = QUANTIZED_OVERSAMPLE,
+    seed: int = 0
+) -> Dict[str, dict]:
+    """
+    以既有 chunks 作為查詢，評估縮減維度與量化粗排的召回率
+
+    每個查詢在所屬文檔內檢索（與對話檢索相同），以來源維度的精確檢索結果為標準，
+    計算 recall@k。查詢向量取自 chunk 本身（排除自己），只是實際問題的近似。
+
+    Returns:
+        Dict[str, dict]: {量化方式: {"recall": 平均 recall@k, "query_ms": 平均檢索時間, "bytes_per_vector": 大小}}
+    """
+    rng = random.Random(seed)
+    document_ids = list_document_ids(source)
+    rng.shuffle(document_ids)
+
+    recalls: Dict[str, List[float]] = {mode: [] for mode in _MEASURE_MODES}
+    seconds: Dict[str, float] = {mode: 0.0 for mode in _MEASURE_MODES}
+    queries = 0
+    for document_id in document_ids:
+        if queries >= sample:
+            break
+        chunks = load_document(source, document_id)
+        if len(chunks) <= k:
+            continue
+        full = normalize_rows(np.asarray([c["embedding"] for c in chunks], dtype=np.float32))
+        reduced = normalize_rows(full[:, :dimensions])
+        codes = {mode: quantize(reduced, mode) for mode in ("int8", "binary")}
+
+        query_rows = rng.sample(range(len(chunks)), min(len(chunks), sample - queries, 10))
+        for q in query_rows:
+            queries += 1
+            exact_scores = full @ full[q]
+            exact_scores[q] = -np.inf
+            expected = set(_top_k(exact_scores, k).tolist())
+
+            for mode in _MEASURE_MODES:
+                started = time.perf_counter()
+                if mode == "none":
+                    scores = reduced @ reduced[q]
+                else:
+                    scores = quantized_scores(reduced[q], *codes[mode], mode)
+                scores[q] = -np.inf
+                if mode != "none":
+                    # 粗排候選以縮減維度的向量精確重排
+                    candidates = _top_k(scores, k * oversample + 1)
+                    candidates = candidates[candidates != q]
+                    rerank = reduced[candidates] @ reduced[q]
+                    found = candidates[_top_k(rerank, k)]
+                else:
+                    found = _top_k(scores, k)
+                seconds[mode] += time.perf_counter() - started
+                recalls[mode].append(len(expected & set(found.tolist())) / k)
+
+    return {
+        mode: {
+            "recall": round(float(np.mean(recalls[mode])), 4) if recalls[mode] else None,
+            "query_ms": round(seconds[mode] / queries * 1000, 3) if queries else None,
+            "bytes_per_vector": bytes_per_vector(dimensions, mode),
+        }
+        for mode in _MEASURE_MODES
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="轉換向量庫的向量維度（不呼叫 Embedding API）")
+    parser.add_argument("--dimensions", type=int, required=True, help="目標維度（例如 256、512、1024）")
+    parser.add_argument(
+        "--source-dimensions",
+        type=int,
+        default=NATIVE_EMBEDDING_DIMENSION,
+        help=f"來源 collection 的維度（預設 {NATIVE_EMBEDDING_DIMENSION}）",
+    )
+    parser.add_argument("--measure", action="store_true", help="評估目標維度與量化粗排的 recall@k")
+    parser.add_argument("--k", type=int, default=3, help="評估的 k（對話檢索預設取 3 段）")
+    parser.add_argument("--sample", type=int, default=200, help="評估的查詢數")
+    parser.add_argument("--apply", action="store_true", help="轉換向量庫並更新文檔的設定指紋")
+    parser.add_argument("--embedding-store", action="store_true", help="同時轉換 Embedding 儲存中的向量")
+    args = parser.parse_args(argv)
+
+    if not (args.measure or args.apply):
+        parser.error("請指定 --measure 或 --apply")
+    if not 0 < args.dimensions < args.source_dimensions:
+        parser.error("目標維度必須小於來源維度")
+
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "WARNING"),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+    try:
+        require_shared_vector_store("rag.reproject")
+    except RuntimeError as e:
+        parser.error(str(e))
+
+    source = VectorStore(dimensions=args.source_dimensions, quantization="none")
+    total_chunks = source.collection.count()
+    print(f"{source.collection_name}: {total_chunks:,} chunks ({args.source_dimensions} dims)", flush=True)
+
+    if args.measure:
+        report = measure_recall(source, args.dimensions, k=args.k, sample=args.sample)
+        source_bytes = bytes_per_vector(args.source_dimensions, "none")
+        print(f"recall@{args.k} vs {args.source_dimensions} dims (first pass oversample x{QUANTIZED_OVERSAMPLE}):")
+        for mode, row in report.items():
+            size_mb = total_chunks * row["bytes_per_vector"] / (1024 * 1024)
+            print(
+                f"  {args.dimensions} dims, {mode:<6} recall={row['recall']}  "
+                f"{row['bytes_per_vector']:,} B/vector ({row['bytes_per_vector'] / source_bytes:.1%}), "
+                f"{size_mb:,.1f} MB total, {row['query_ms']} ms/query",
+                flush=True,
+            )
+
+    if not args.apply:
+        return 0
+
+    from rag import get_embedding_client
+    from .indexing import get_embedding_key
+
+    client = get_embedding_client()
+    embedding_key = get_embedding_key(client, args.dimensions)
+    target = VectorStore(dimensions=args.dimensions, quantization="none")
+
+    document_ids = list_document_ids(source)
+    written = 0
+    for i, document_id in enumerate(document_ids, 1):
+        written += reproject_document(source, target, document_id, embedding_key)
+        print(f"[{i}/{len(document_ids)}] {document_id} -> {target.collection_name} ({written:,} chunks)", flush=True)
+
+    if args.embedding_store:
+        reproject_embedding_store(client.deployment, args.source_dimensions, args.dimensions)
+
+    updated = update_fingerprints(args.source_dimensions, args.dimensions)
+    print(
+        f"Done: {written:,} chunks in {target.collection_name}, {updated} document fingerprints updated. "
+        f"Set AZURE_EMBEDDING_DIMENSIONS={args.dimensions} and restart the API and workers.",
+        flush=True,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,121 @@
+"""
+離線 token 數估計模組
+
+切分大小與 Embedding 批次打包需要 token 數，但逐段呼叫 tokenizer 成本高且需要額外依賴。
+此模組以文字系統估計：text-embedding-3 系列使用的 cl100k_base 中，
+中文（尤其繁體）平均每字約 1–1.5 個 token，英文平均每 4 個字元約 1 個 token；
+中英混合的論文若以字元數切分，每個 chunk 的 token 數可相差約 3 倍。
+
+估計值只用於控制大小，不需與 API 計費完全一致；比率可透過環境變數依實際用量校準。
+"""
+
+import math
+import os
+import re
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+# RAG_TOKENS_PER_CJK_CHAR: 每個 CJK 字元的 token 數
+# RAG_CHARS_PER_LATIN_TOKEN: 其他字元（拉丁字母、數字、空白、標點）每個 token 的字元數
+TOKENS_PER_CJK_CHAR = float(os.getenv("RAG_TOKENS_PER_CJK_CHAR", "1.2"))
+CHARS_PER_LATIN_TOKEN = float(os.getenv("RAG_CHARS_PER_LATIN_TOKEN", "4.0"))
+
+# CJK 符號與標點、假名、中日韓統一表意文字（含擴充 A）、諺文、相容表意文字、全形字元
+_CJK_RE = re.compile(
+    r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]+"
+)
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class TokenEstimator:
+    """
+    依文字系統估計 token 數
+
+    文本分為「CJK 字元」與「其他字元」兩類，各自有固定的比率，
+    因此任一範圍的 token 數只需該範圍內的 CJK 字元數即可算出（切分器以此做區間查詢）。
+    對應其他 tokenizer 時調整比率，或覆寫 cjk_spans 改變分類方式。
+
+    Attributes:
+        cjk_tokens_per_char: 每個 CJK 字元的 token 數
+        latin_chars_per_token: 其他字元每個 token 的字元數
+    """
+    cjk_tokens_per_char: float = TOKENS_PER_CJK_CHAR
+    latin_chars_per_token: float = CHARS_PER_LATIN_TOKEN
+
+    @property
+    def max_chars_per_token(self) -> float:
+        """每個 token 最多對應的字元數（由 token 預算推算字元上限用）"""
+        return max(self.latin_chars_per_token, 1 / self.cjk_tokens_per_char)
+
+    def cjk_spans(self, text: str) -> Iterator[Tuple[int, int]]:
+        """文本中連續 CJK 字元的範圍 [start, end)"""
+        for match in _CJK_RE.finditer(text):
+            yield match.span()
+
+    def cost(self, cjk_chars: int, other_chars: int) -> float:
+        """由兩類字元數計算 token 數（未取整）"""
+        return cjk_chars * self.cjk_tokens_per_char + other_chars / self.latin_chars_per_token
+
+    def estimate(self, text: str) -> int:
+        """
+        估計文本的 token 數
+
+        Returns:
+            int: token 數（無條件進位）
+        """
+        cjk_chars = sum(end - start for start, end in self.cjk_spans(text))
+        return math.ceil(self.cost(cjk_chars, len(text) - cjk_chars))
+
+
+_default_estimator: Optional[TokenEstimator] = None
+
+
+def get_token_estimator() -> TokenEstimator:
+    """
+    取得預設的 token 估計器（以環境變數校準）
+
+    Returns:
+        TokenEstimator: 估計器實例
+    """
+    global _default_estimator
+
+    if _default_estimator is None:
+        _default_estimator = TokenEstimator()
+
+    return _default_estimator
+
+
+def pack_by_tokens(
+    items: Iterable[T],
+    cost: Callable[[T], int],
+    max_tokens: int,
+    max_items: int
+) -> Iterator[List[T]]:
+    """
+    依序將項目打包成批次：每批不超過 max_tokens 個 token 與 max_items 個項目
+
+    單一項目超過 max_tokens 時單獨成一批。max_tokens 為 0 表示只限制項目數。
+
+    Args:
+        items: 依序的項目
+        cost: 項目的 token 數
+        max_tokens: 每批 token 上限
+        max_items: 每批項目上限
+
+    Yields:
+        List[T]: 批次
+    """
+    batch: List[T] = []
+    batch_tokens = 0
+    for item in items:
+        tokens = cost(item) if max_tokens else 0
+        if batch and (len(batch) >= max_items or batch_tokens + tokens > max_tokens > 0):
+            yield batch
+            batch = []
+            batch_tokens = 0
+        batch.append(item)
+        batch_tokens += tokens
+    if batch:
+        yield batch
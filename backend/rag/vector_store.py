@@ -2,15 +2,34 @@
 ChromaDB Vector Store 模組
 
 使用 ChromaDB 儲存和檢索文檔向量
+
+設定 CHROMA_HOST 時以 HttpClient 連線到 Chroma 伺服器，API、worker 與命令列工具共用同一個索引。
+未設定時使用嵌入式 PersistentClient：每個行程各自在記憶體中載入 HNSW 索引，
+其他行程的寫入不會出現在本行程的檢索結果中，多個行程同時寫入也可能損毀索引，
+因此嵌入式模式只能由單一行程使用（RAG_PROCESSING_MODE=background 的本地開發環境）。
+
+每個向量維度使用各自的 collection（原生 3072 維為 document_chunks，其他為 document_chunks_{N}d），
+維度記錄在 collection metadata 中；切換 AZURE_EMBEDDING_DIMENSIONS 前以 rag.reproject 轉換既有向量。
+啟用 RAG_VECTOR_QUANTIZATION 時，指定文檔的檢索先以量化向量粗排，再以原始向量精確重排（見 quantized_index.py）。
 """
 
 import os
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import chromadb
+import numpy as np
 from chromadb.config import Settings
 
+from .embedding import EMBEDDING_DIMENSIONS, NATIVE_EMBEDDING_DIMENSION
+from .quantized_index import (
+    QUANTIZATION_MODES,
+    QUANTIZED_OVERSAMPLE,
+    VECTOR_QUANTIZATION,
+    QuantizedIndex,
+    normalize_rows,
+)
+
 
 @dataclass
 class SearchResult:
@@ -23,6 +42,25 @@ class SearchResult:
     chunk_index: int        # chunk 在文檔中的索引
 
 
+def is_shared_vector_store() -> bool:
+    """是否連線到 Chroma 伺服器（多個行程可同時讀寫）"""
+    return bool(os.getenv("CHROMA_HOST"))
+
+
+def require_shared_vector_store(component: str) -> None:
+    """
+    確認已設定 Chroma 伺服器（在 API 之外讀寫向量庫的行程啟動時呼叫）
+
+    Raises:
+        RuntimeError: 未設定 CHROMA_HOST
+    """
+    if not is_shared_vector_store():
+        raise RuntimeError(
+            f"{component} 需要 Chroma 伺服器（設定 CHROMA_HOST）："
+            "嵌入式 Chroma 只能由單一行程使用，其他行程的寫入不會被 API 檢索到，同時寫入也可能損毀索引"
+        )
+
+
 class VectorStore:
     """
     ChromaDB Vector Store 封裝
@@ -32,39 +70,108 @@ class VectorStore:
 
     COLLECTION_NAME = "document_chunks"
 
-    def __init__(self, persist_directory: Optional[str] = None):
+    def __init__(
+        self,
+        persist_directory: Optional[str] = None,
+        dimensions: Optional[int] = None,
+        quantization: Optional[str] = None
+    ):
         """
         初始化 Vector Store
 
         Args:
             persist_directory: 持久化目錄（預設從環境變數讀取）
+            dimensions: 向量維度（預設為 AZURE_EMBEDDING_DIMENSIONS）
+            quantization: 檢索粗排方式 none / int8 / binary（預設為 RAG_VECTOR_QUANTIZATION）
         """
         self.persist_directory = persist_directory or os.getenv(
             "CHROMA_PERSIST_DIRECTORY",
             "./chroma_data"
         )
 
-        # 確保目錄存在
-        os.makedirs(self.persist_directory, exist_ok=True)
-
         # 從環境變數讀取是否允許重置資料庫
         # 注意：生產環境應設為 false 以避免意外資料遺失
         allow_reset = os.getenv("CHROMA_ALLOW_RESET", "false").lower() == "true"
+        settings = Settings(
+            anonymized_telemetry=False,
+            allow_reset=allow_reset
+        )
 
-        # 初始化 ChromaDB 客戶端（持久化模式）
-        self.client = chromadb.PersistentClient(
-            path=self.persist_directory,
-            settings=Settings(
-                anonymized_telemetry=False,
-                allow_reset=allow_reset
+        self.host = os.getenv("CHROMA_HOST")
+        if self.host:
+            # 伺服器模式：所有行程經由同一個 Chroma 伺服器讀寫
+            self.client = chromadb.HttpClient(
+                host=self.host,
+                port=int(os.getenv("CHROMA_PORT", "8000")),
+                ssl=os.getenv("CHROMA_SSL", "false").lower() == "true",
+                settings=settings
+            )
+        else:
+            # 嵌入式模式（持久化到本地目錄，只能由單一行程使用）
+            os.makedirs(self.persist_directory, exist_ok=True)
+            self.client = chromadb.PersistentClient(
+                path=self.persist_directory,
+                settings=settings
             )
-        )
 
-        # 取得或建立 collection
+        # 取得或建立此維度的 collection
+        self.dimensions = dimensions or EMBEDDING_DIMENSIONS
+        self.collection_name = self.collection_name_for(self.dimensions)
         self.collection = self.client.get_or_create_collection(
-            name=self.COLLECTION_NAME,
-            metadata={"hnsw:space": "cosine"}  # 使用餘弦相似度
+            name=self.collection_name,
+            metadata={
+                "hnsw:space": "cosine",  # 使用餘弦相似度
+                "embedding_dimensions": self.dimensions,
+            }
         )
+        recorded = (self.collection.metadata or {}).get("embedding_dimensions")
+        if recorded is not None and recorded != self.dimensions:
+            raise ValueError(
+                f"collection {self.collection_name} 的向量維度為 {recorded}，與設定的 {self.dimensions} 不符"
+            )
+
+        # 量化粗排：版本檔由所有寫入端更新，量化向量只在檢索端建立
+        # 伺服器模式下 API 與 worker 需共用此目錄（RAG_QUANTIZED_DIR）
+        self.quantized_directory = os.path.join(
+            os.getenv("RAG_QUANTIZED_DIR") or os.path.join(self.persist_directory, "quantized"),
+            self.collection_name
+        )
+        self.quantization = (quantization or VECTOR_QUANTIZATION).lower()
+        if self.quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"RAG_VECTOR_QUANTIZATION 必須是 {', '.join(QUANTIZATION_MODES)} 之一")
+        self.quantized: Optional[QuantizedIndex] = None
+        if self.quantization != "none":
+            self.quantized = QuantizedIndex(
+                self.quantized_directory, self.quantization, self._document_embeddings
+            )
+
+    @classmethod
+    def collection_name_for(cls, dimensions: int) -> str:
+        """指定向量維度的 collection 名稱（原生維度沿用既有名稱）"""
+        if dimensions == NATIVE_EMBEDDING_DIMENSION:
+            return cls.COLLECTION_NAME
+        return f"{cls.COLLECTION_NAME}_{dimensions}d"
+
+    def _touch(self, document_ids) -> None:
+        """
+        標記文檔的向量已變更（量化向量下次檢索時重建）
+
+        RAG_VECTOR_QUANTIZATION=none 且尚無量化目錄時不寫入版本檔；目錄已存在（曾經或其他行程
+        啟用量化檢索）時仍需更新，避免之後啟用時沿用過期的量化向量。
+        """
+        if self.quantization == "none" and not os.path.isdir(self.quantized_directory):
+            return
+        QuantizedIndex.touch(self.quantized_directory, document_ids)
+
+    def _document_embeddings(self, document_id: str) -> Tuple[List[str], np.ndarray]:
+        """讀取文檔所有 chunks 的 (chunk ID, 向量)，供建立量化向量"""
+        results = self.collection.get(
+            where={"document_id": document_id},
+            include=["embeddings"]
+        )
+        if not results or not results['ids']:
+            return [], np.empty((0, self.dimensions), dtype=np.float32)
+        return results['ids'], np.asarray(results['embeddings'], dtype=np.float32)
 
     def add_chunks(
         self,
@@ -81,6 +188,8 @@ class VectorStore:
                 - index: int
                 - content: str
                 - page_numbers: List[int]
+                - chunk_id: str（可選，預設為 {document_id}_{index}）
+                - content_hash: str（可選，供增量索引比對）
             embeddings: 對應的向量列表
 
         Returns:
@@ -91,20 +200,18 @@ class VectorStore:
 
         if len(chunks) != len(embeddings):
             raise ValueError("chunks 和 embeddings 數量不匹配")
+        if any(len(e) != self.dimensions for e in embeddings):
+            raise ValueError(f"向量維度與 collection 的 {self.dimensions} 維不符")
 
         ids = []
         documents = []
         metadatas = []
 
         for chunk in chunks:
-            chunk_id = f"{document_id}_{chunk['index']}"
+            chunk_id = chunk.get('chunk_id') or f"{document_id}_{chunk['index']}"
             ids.append(chunk_id)
             documents.append(chunk['content'])
-            metadatas.append({
-                "document_id": document_id,
-                "chunk_index": chunk['index'],
-                "page_numbers": ",".join(map(str, chunk['page_numbers']))
-            })
+            metadatas.append(self._build_metadata(document_id, chunk))
 
         # 批次新增到 ChromaDB
         self.collection.add(
@@ -113,9 +220,81 @@ class VectorStore:
             documents=documents,
             metadatas=metadatas
         )
+        self._touch([document_id])
 
         return len(ids)
 
+    @staticmethod
+    def _build_metadata(document_id: str, chunk: dict) -> dict:
+        """建立 chunk 的 metadata"""
+        metadata = {
+            "document_id": document_id,
+            "chunk_index": chunk['index'],
+            "page_numbers": ",".join(map(str, chunk['page_numbers']))
+        }
+        if chunk.get('content_hash'):
+            metadata["content_hash"] = chunk['content_hash']
+        return metadata
+
+    def get_chunk_metadata(self, document_id: str) -> Dict[str, dict]:
+        """
+        取得文檔所有 chunks 的 metadata（不含向量與內容）
+
+        Args:
+            document_id: 文檔 ID
+
+        Returns:
+            Dict[str, dict]: {chunk_id: metadata}
+        """
+        results = self.collection.get(
+            where={"document_id": document_id},
+            include=["metadatas"]
+        )
+
+        if not results or not results['ids']:
+            return {}
+
+        return dict(zip(results['ids'], results['metadatas']))
+
+    def update_chunk_metadata(self, document_id: str, chunks: List[dict]) -> int:
+        """
+        更新既有 chunks 的 metadata（位置或頁碼改變，但內容與向量不變）
+
+        Args:
+            document_id: 文檔 ID
+            chunks: chunk 列表（需包含 chunk_id、index、page_numbers）
+
+        Returns:
+            int: 更新的 chunk 數量
+        """
+        if not chunks:
+            return 0
+
+        self.collection.update(
+            ids=[c['chunk_id'] for c in chunks],
+            metadatas=[self._build_metadata(document_id, c) for c in chunks]
+        )
+        return len(chunks)
+
+    def delete_chunks(self, chunk_ids: List[str]) -> int:
+        """
+        依 chunk ID 刪除 chunks
+
+        Args:
+            chunk_ids: chunk ID 列表
+
+        Returns:
+            int: 刪除的 chunk 數量
+        """
+        if not chunk_ids:
+            return 0
+
+        results = self.collection.get(ids=chunk_ids, include=["metadatas"])
+        self.collection.delete(ids=chunk_ids)
+        if results and results['metadatas']:
+            self._touch(m['document_id'] for m in results['metadatas'])
+        return len(chunk_ids)
+
     def search(
         self,
         query_embedding: List[float],
@@ -141,6 +320,9 @@ class VectorStore:
             else:
                 where_filter = {"document_id": {"$in": document_ids}}
 
+        if self.quantized is not None and document_ids:
+            return self._search_quantized(query_embedding, document_ids, n_results)
+
         # 執行搜尋
         results = self.collection.query(
             query_embeddings=[query_embedding],
@@ -171,6 +353,47 @@ class VectorStore:
 
         return search_results
 
+    def _search_quantized(
+        self,
+        query_embedding: List[float],
+        document_ids: List[str],
+        n_results: int
+    ) -> List[SearchResult]:
+        """以量化向量粗排取得候選，再以原始向量計算餘弦距離重排"""
+        candidate_ids = self.quantized.candidates(
+            document_ids, query_embedding, n_results * max(QUANTIZED_OVERSAMPLE, 1)
+        )
+        if not candidate_ids:
+            return []
+
+        results = self.collection.get(
+            ids=candidate_ids,
+            include=["embeddings", "documents", "metadatas"]
+        )
+        if not results or not results['ids']:
+            return []
+
+        vectors = normalize_rows(np.asarray(results['embeddings'], dtype=np.float32))
+        distances = 1 - vectors @ normalize_rows(query_embedding)
+        order = np.argsort(distances, kind="stable")[:n_results]
+
+        search_results = []
+        for i in order:
+            metadata = results['metadatas'][i]
+            page_numbers = [
+                int(p) for p in metadata.get('page_numbers', '1').split(',')
+                if p
+            ]
+            search_results.append(SearchResult(
+                chunk_id=results['ids'][i],
+                document_id=metadata['document_id'],
+                content=results['documents'][i],
+                score=float(distances[i]),
+                page_numbers=page_numbers,
+                chunk_index=metadata['chunk_index']
+            ))
+        return search_results
+
     def delete_document(self, document_id: str) -> int:
         """
         刪除指定文檔的所有 chunks
@@ -196,9 +419,54 @@ class VectorStore:
         self.collection.delete(
             where={"document_id": document_id}
         )
+        self._touch([document_id])
 
         return count
 
+    def copy_document(self, source_document_id: str, target_document_id: str) -> int:
+        """
+        複製文檔的所有 chunks（含向量）到另一個文檔 ID
+
+        用於內容相同的文檔去重，避免重新計算 Embedding。
+
+        Args:
+            source_document_id: 來源文檔 ID
+            target_document_id: 目標文檔 ID
+
+        Returns:
+            int: 複製的 chunk 數量
+        """
+        results = self.collection.get(
+            where={"document_id": source_document_id},
+            include=["embeddings", "documents", "metadatas"]
+        )
+
+        if not results or not results['ids']:
+            return 0
+
+        ids = []
+        metadatas = []
+        source_prefix = f"{source_document_id}_"
+        for chunk_id, metadata in zip(results['ids'], results['metadatas']):
+            new_metadata = dict(metadata)
+            new_metadata["document_id"] = target_document_id
+            # 保留原 chunk ID 的後綴（索引或內容雜湊），只替換文檔 ID
+            if chunk_id.startswith(source_prefix):
+                ids.append(f"{target_document_id}_{chunk_id[len(source_prefix):]}")
+            else:
+                ids.append(f"{target_document_id}_{metadata['chunk_index']}")
+            metadatas.append(new_metadata)
+
+        self.collection.add(
+            ids=ids,
+            embeddings=results['embeddings'],
+            documents=results['documents'],
+            metadatas=metadatas
+        )
+        self._touch([target_document_id])
+
+        return len(ids)
+
     def get_document_chunks(self, document_id: str) -> List[dict]:
         """
         取得指定文檔的所有 chunks
@@ -232,6 +500,25 @@ class VectorStore:
 
         return chunks
 
+    def iter_embeddings(self, batch_size: int = 500) -> Iterator[Tuple[List[str], List[List[float]]]]:
+        """
+        分批讀出所有 chunks 的文本與向量
+
+        Yields:
+            Tuple[List[str], List[List[float]]]: (文本列表, 向量列表)
+        """
+        offset = 0
+        while True:
+            results = self.collection.get(
+                limit=batch_size,
+                offset=offset,
+                include=["documents", "embeddings"]
+            )
+            if not results or not results['ids']:
+                return
+            yield results['documents'], [list(map(float, e)) for e in results['embeddings']]
+            offset += len(results['ids'])
+
     def count_chunks(self, document_id: Optional[str] = None) -> int:
         """
         計算 chunk 數量
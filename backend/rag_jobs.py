@@ -0,0 +1,427 @@
+"""
+RAG 任務佇列
+
+以 Postgres 的 rag_jobs 表作為持久化佇列：
+    - API 端只負責 enqueue，不在請求行程內執行 RAG 處理
+    - worker 以 SELECT ... FOR UPDATE SKIP LOCKED 認領任務，多個 worker 不會互相阻塞
+    - 認領後設定可見性逾時（locked_until），worker 當機時任務會在逾時後被重新認領
+    - 失敗時以指數退避重新排程，超過 max_attempts 後標記為 failed
+    - 完成 / 失敗只在 worker 仍持有租約時寫入，租約遺失的 worker 停止處理並捨棄結果
+    - 佇列以外的處理（重建索引）以 start_rag_job 直接建立執行中的任務，與 worker 互斥
+"""
+
+import os
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import or_, and_, text
+from sqlalchemy.orm import Session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+# 預設設定（可由環境變數覆寫）
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("RAG_JOB_MAX_ATTEMPTS", "3"))
+DEFAULT_VISIBILITY_TIMEOUT = int(os.getenv("RAG_JOB_VISIBILITY_TIMEOUT", "600"))  # 秒
+RETRY_BACKOFF_BASE = int(os.getenv("RAG_JOB_BACKOFF_BASE", "30"))  # 秒
+RETRY_BACKOFF_MAX = int(os.getenv("RAG_JOB_BACKOFF_MAX", "900"))  # 秒
+
+# 全域同時執行的任務上限（0 表示不限制），避免大量批次匯入時壓垮 Embedding 配額與資料庫
+MAX_RUNNING_JOBS = int(os.getenv("RAG_MAX_RUNNING_JOBS", "0"))
+
+# 認領任務時使用的 advisory lock 鍵（僅在設定 MAX_RUNNING_JOBS 時使用）
+_CLAIM_LOCK_KEY = 7_349_201
+
+# 建立任務時以文檔為單位的 advisory lock 命名空間（與文檔 ID 的雜湊組成兩段式鍵）
+_DOCUMENT_LOCK_NAMESPACE = 7_349_202
+
+ACTIVE_JOB_STATUSES = ("queued", "running")
+
+
+def _lock_documents(db: Session, document_ids: List[str]) -> None:
+    """
+    鎖定文檔的任務建立流程（交易結束時自動釋放）
+
+    「檢查沒有進行中的任務 → 建立任務」需在同一把鎖內完成，避免 API 與重建索引同時為同一份文檔建立任務。
+    依文檔 ID 排序取得鎖，避免批次建立時互相死結；非 Postgres（測試用的 SQLite）不需要鎖定。
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for document_id in sorted(set(document_ids)):
+        db.execute(
+            text("SELECT pg_advisory_xact_lock(:namespace, hashtext(:document_id))"),
+            {"namespace": _DOCUMENT_LOCK_NAMESPACE, "document_id": document_id},
+        )
+
+
+def enqueue_rag_job(
+    db: Session,
+    document_id: str,
+    max_attempts: Optional[int] = None
+) -> models.RagJob:
+    """
+    將文檔加入 RAG 處理佇列
+
+    若該文檔已有尚未完成的任務，直接返回既有任務，避免重複處理。
+
+    Args:
+        db: 資料庫 session
+        document_id: 文檔 ID
+        max_attempts: 最大嘗試次數（預設 RAG_JOB_MAX_ATTEMPTS）
+
+    Returns:
+        models.RagJob: 任務記錄
+    """
+    _lock_documents(db, [document_id])
+    existing = db.query(models.RagJob).filter(
+        models.RagJob.document_id == document_id,
+        models.RagJob.status.in_(ACTIVE_JOB_STATUSES)
+    ).first()
+    if existing:
+        db.commit()
+        return existing
+
+    job = models.RagJob(
+        document_id=document_id,
+        status="queued",
+        max_attempts=max_attempts or DEFAULT_MAX_ATTEMPTS,
+        available_at=datetime.utcnow(),
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def enqueue_rag_jobs(
+    db: Session,
+    document_ids: List[str],
+    max_attempts: Optional[int] = None
+) -> int:
+    """
+    批次將多個文檔加入 RAG 處理佇列（單一交易）
+
+    Args:
+        db: 資料庫 session
+        document_ids: 文檔 ID 列表
+        max_attempts: 最大嘗試次數（預設 RAG_JOB_MAX_ATTEMPTS）
+
+    Returns:
+        int: 新建立的任務數
+    """
+    if not document_ids:
+        return 0
+
+    _lock_documents(db, document_ids)
+    active = {
+        row.document_id
+        for row in db.query(models.RagJob.document_id).filter(
+            models.RagJob.document_id.in_(document_ids),
+            models.RagJob.status.in_(ACTIVE_JOB_STATUSES)
+        )
+    }
+
+    now = datetime.utcnow()
+    jobs = [
+        models.RagJob(
+            document_id=document_id,
+            status="queued",
+            max_attempts=max_attempts or DEFAULT_MAX_ATTEMPTS,
+            available_at=now,
+        )
+        for document_id in document_ids
+        if document_id not in active
+    ]
+    db.add_all(jobs)
+    db.commit()
+    return len(jobs)
+
+
+def start_rag_job(
+    db: Session,
+    document_id: str,
+    worker_id: str,
+    visibility_timeout: int = DEFAULT_VISIBILITY_TIMEOUT,
+    max_attempts: Optional[int] = None
+) -> Optional[models.RagJob]:
+    """
+    不經過佇列，直接為文檔建立由 worker_id 持有的執行中任務（供重建索引等佇列以外的處理使用）
+
+    文檔已有等待中或執行中的任務時不建立（由 worker 處理），返回 None。
+    建立後 worker 不會認領該任務，API 也不會再為該文檔建立任務；
+    呼叫端應以 RagJobLease 延長租約，並以 complete_rag_job / fail_rag_job 結束任務。
+    呼叫端異常結束時，任務在可見性逾時後由 worker 重新認領處理。
+
+    Returns:
+        Optional[models.RagJob]: 建立的任務，文檔已有進行中的任務時返回 None
+    """
+    _lock_documents(db, [document_id])
+    active = db.query(models.RagJob.id).filter(
+        models.RagJob.document_id == document_id,
+        models.RagJob.status.in_(ACTIVE_JOB_STATUSES)
+    ).first()
+    if active:
+        db.rollback()
+        return None
+
+    now = datetime.utcnow()
+    job = models.RagJob(
+        document_id=document_id,
+        status="running",
+        attempts=1,
+        max_attempts=max_attempts or DEFAULT_MAX_ATTEMPTS,
+        available_at=now,
+        locked_by=worker_id,
+        locked_until=now + timedelta(seconds=visibility_timeout),
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def claim_rag_job(
+    db: Session,
+    worker_id: str,
+    visibility_timeout: int = DEFAULT_VISIBILITY_TIMEOUT
+) -> Optional[models.RagJob]:
+    """
+    認領一個可執行的任務
+
+    可執行的任務包含：
+        - status=queued 且已到達 available_at
+        - status=running 但 locked_until 已過期（前一個 worker 當機或逾時）
+
+    逾時的任務若已用完嘗試次數（worker 行程在處理期間被終止，fail_rag_job 未執行），
+    直接標記為 failed，不再重新執行（避免會使 worker 當機的 PDF 被無限重試）。
+
+    Args:
+        db: 資料庫 session
+        worker_id: worker 識別碼
+        visibility_timeout: 可見性逾時（秒）
+
+    Returns:
+        Optional[models.RagJob]: 認領到的任務，沒有可執行任務時返回 None
+    """
+    while True:
+        now = datetime.utcnow()
+
+        if MAX_RUNNING_JOBS > 0:
+            # 序列化認領流程，確保執行中任務數不超過全域上限（交易結束時自動釋放）
+            db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _CLAIM_LOCK_KEY})
+            running = db.query(models.RagJob).filter(
+                models.RagJob.status == "running",
+                models.RagJob.locked_until >= now,
+            ).count()
+            if running >= MAX_RUNNING_JOBS:
+                db.rollback()
+                return None
+
+        job = db.query(models.RagJob).filter(
+            or_(
+                and_(
+                    models.RagJob.status == "queued",
+                    models.RagJob.available_at <= now,
+                ),
+                and_(
+                    models.RagJob.status == "running",
+                    models.RagJob.locked_until < now,
+                ),
+            )
+        ).order_by(
+            models.RagJob.available_at.asc()
+        ).with_for_update(skip_locked=True).first()
+
+        if not job:
+            # 釋放交易，避免長時間持有 snapshot
+            db.rollback()
+            return None
+
+        if job.status == "running" and (job.attempts or 0) >= job.max_attempts:
+            _fail_abandoned_job(db, job)
+            continue
+
+        job.status = "running"
+        job.attempts = (job.attempts or 0) + 1
+        job.locked_by = worker_id
+        job.locked_until = now + timedelta(seconds=visibility_timeout)
+        db.commit()
+        db.refresh(job)
+        return job
+
+
+def _fail_abandoned_job(db: Session, job: models.RagJob) -> None:
+    """將已用完嘗試次數、且最後一次執行未回報結果的任務標記為失敗"""
+    error = f"RAG 處理期間 worker 行程異常結束（已嘗試 {job.attempts} 次）"
+    job.status = "failed"
+    job.last_error = error
+    job.locked_by = None
+    job.locked_until = None
+
+    doc = db.query(models.Document).filter(models.Document.id == job.document_id).first()
+    if doc:
+        doc.rag_status = "failed"
+        doc.rag_error = error
+    db.commit()
+    logger.error(f"RAG job abandoned: job_id={job.id}, document_id={job.document_id}, attempts={job.attempts}")
+
+
+def extend_rag_job_lease(
+    db: Session,
+    job_id: str,
+    worker_id: str,
+    visibility_timeout: int = DEFAULT_VISIBILITY_TIMEOUT
+) -> bool:
+    """
+    延長任務的可見性逾時（heartbeat）
+
+    Returns:
+        bool: 是否仍持有該任務（False 表示已被其他 worker 重新認領）
+    """
+    updated = db.query(models.RagJob).filter(
+        models.RagJob.id == job_id,
+        models.RagJob.status == "running",
+        models.RagJob.locked_by == worker_id,
+    ).update(
+        {"locked_until": datetime.utcnow() + timedelta(seconds=visibility_timeout)},
+        synchronize_session=False
+    )
+    db.commit()
+    return updated > 0
+
+
+def complete_rag_job(db: Session, job: models.RagJob, worker_id: str) -> bool:
+    """
+    標記任務完成（僅在 worker 仍持有任務時）
+
+    Returns:
+        bool: 是否已更新（False 表示租約已過期且任務已被其他 worker 重新認領）
+    """
+    updated = _update_owned_job(db, job, worker_id, {
+        "status": "succeeded",
+        "locked_by": None,
+        "locked_until": None,
+        "last_error": None,
+    })
+    db.commit()
+    return updated
+
+
+def fail_rag_job(db: Session, job: models.RagJob, worker_id: str, error: str, retry: bool = True) -> bool:
+    """
+    標記任務失敗，尚有重試次數時以指數退避重新排程（僅在 worker 仍持有任務時）
+
+    Args:
+        db: 資料庫 session
+        job: 任務記錄
+        worker_id: 認領任務的 worker 識別碼
+        error: 錯誤訊息
+        retry: 是否允許重試（False 時直接標記為 failed）
+
+    Returns:
+        bool: 是否已更新（False 表示租約已過期且任務已被其他 worker 重新認領）；
+              是否重新排程見 job.status
+    """
+    values = {
+        "last_error": (error or "")[:500],
+        "locked_by": None,
+        "locked_until": None,
+    }
+    reschedule = retry and job.attempts < job.max_attempts
+    if reschedule:
+        delay = min(RETRY_BACKOFF_BASE * (2 ** (job.attempts - 1)), RETRY_BACKOFF_MAX)
+        values.update(status="queued", available_at=datetime.utcnow() + timedelta(seconds=delay))
+    else:
+        values["status"] = "failed"
+
+    if not _update_owned_job(db, job, worker_id, values):
+        db.commit()
+        return False
+
+    if reschedule:
+        # 讓前端持續輪詢，而不是停在 failed
+        doc = db.query(models.Document).filter(models.Document.id == job.document_id).first()
+        if doc:
+            doc.rag_status = "pending"
+        db.commit()
+        logger.warning(
+            f"RAG job rescheduled: job_id={job.id}, document_id={job.document_id}, "
+            f"attempt={job.attempts}/{job.max_attempts}, retry_in={delay}s"
+        )
+        return True
+
+    db.commit()
+    logger.error(
+        f"RAG job failed permanently: job_id={job.id}, document_id={job.document_id}, error={error}"
+    )
+    return True
+
+
+def _update_owned_job(db: Session, job: models.RagJob, worker_id: str, values: dict) -> bool:
+    """以 WHERE id AND locked_by 條件更新任務（不 commit），返回是否仍由 worker_id 持有"""
+    updated = db.query(models.RagJob).filter(
+        models.RagJob.id == job.id,
+        models.RagJob.status == "running",
+        models.RagJob.locked_by == worker_id,
+    ).update(values, synchronize_session="fetch")
+    if not updated:
+        logger.warning(
+            f"RAG job no longer owned, result discarded: job_id={job.id}, "
+            f"document_id={job.document_id}, worker_id={worker_id}"
+        )
+    return updated > 0
+
+
+class RagJobLease:
+    """
+    在背景執行緒定期延長任務租約（heartbeat）
+
+    無法延長時（已被其他 worker 重新認領，或超過可見性逾時都無法連線資料庫）設定 lost，
+    處理流程應以 lost 作為取消旗標，停止寫入並捨棄結果。
+
+    使用方式：
+        with RagJobLease(job.id, worker_id, visibility_timeout) as lease:
+            process_document_rag(..., cancel=lease.lost)
+    """
+
+    def __init__(self, job_id: str, worker_id: str, visibility_timeout: int = DEFAULT_VISIBILITY_TIMEOUT):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.visibility_timeout = visibility_timeout
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"rag-lease-{job_id}", daemon=True)
+
+    def _run(self) -> None:
+        from db import SessionLocal
+
+        interval = max(self.visibility_timeout // 3, 1)
+        renewed_at = time.monotonic()
+        while not self._stop.wait(interval):
+            db = SessionLocal()
+            try:
+                if not extend_rag_job_lease(db, self.job_id, self.worker_id, self.visibility_timeout):
+                    logger.warning(f"Lost lease on RAG job {self.job_id}")
+                    self.lost.set()
+                    return
+                renewed_at = time.monotonic()
+            except Exception as e:
+                logger.warning(f"Failed to extend lease for RAG job {self.job_id}: {e}")
+                if time.monotonic() - renewed_at >= self.visibility_timeout:
+                    logger.warning(f"Lease on RAG job {self.job_id} expired while the database was unreachable")
+                    self.lost.set()
+                    return
+            finally:
+                db.close()
+
+    def __enter__(self) -> "RagJobLease":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
@@ -5,22 +5,198 @@ RAG 處理服務
 """
 
 import os
+import json
+import hashlib
+import threading
+import time
 import tempfile
 import logging
-from typing import Optional, Tuple
+from dataclasses import asdict
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
 import models
 from rag import (
-    get_parser,
     chunk_text,
     ChunkingConfig,
     get_embedding_client,
     get_vector_store,
+    run_streaming_pipeline,
+    PipelineConfig,
+    IncrementalIndexer,
+    DocumentSource,
 )
+from rag.chunking import CHUNKER_VERSION
+from rag.tokens import get_token_estimator
+from rag.metrics import StageTimer, stage_metrics
+from rag.page_cache import get_page_cache
+from rag.normalize import NORMALIZER_VERSION, NormalizeConfig, NormalizeStats, normalize_pages
+from rag.parsers import (
+    build_content, get_parser_cache_key, PageLayout,
+    ParseSandboxError, parse_in_sandbox, iter_pages_in_sandbox,
+)
+from rag.parsers.sandbox import SANDBOX_ENABLED
 
 logger = logging.getLogger(__name__)
 
+# RAG 處理使用的解析器與切分設定
+# 注意：變更設定會改變 RAG 指紋，既有文檔的結果將不再被去重機制重用
+# - pymupdf（預設）：純文字擷取
+# - pymupdf_layout：版面感知，頁面文本以區塊（段落）組成，並產出區塊座標索引
+PARSER_TYPE = os.getenv("RAG_PARSER_TYPE", "pymupdf")
+
+# 解析後的文本正規化（移除跨頁重複的頁首頁尾與頁碼、修復斷字、NFKC）
+# 串流模式以前 RAG_NORMALIZE_SAMPLE_PAGES 頁判斷頁首頁尾
+NORMALIZE_TEXT = os.getenv("RAG_NORMALIZE_TEXT", "true").lower() == "true"
+NORMALIZE_SAMPLE_PAGES = int(os.getenv("RAG_NORMALIZE_SAMPLE_PAGES", "32"))
+
+# 漸進式索引：每完成 RAG_PROGRESSIVE_WAVE_PAGES 頁就更新 pages_indexed，
+# 第一批完成後文檔即為 partial（可供查詢），不必等整份文檔處理完（0 表示停用）
+PROGRESSIVE_WAVE_PAGES = int(os.getenv("RAG_PROGRESSIVE_WAVE_PAGES", "20"))
+
+# Highlight 座標與文本互查使用的解析器（結果寫入解析結果快取）
+LAYOUT_PARSER_TYPE = "pymupdf_layout"
+
+# 處理模式：
+# - batch（預設）：解析、切分、向量化、寫入依序完成
+# - streaming：各階段以有界佇列串接並行，記憶體用量與文件長度無關
+RAG_PIPELINE_MODE = os.getenv("RAG_PIPELINE_MODE", "batch").lower()
+PIPELINE_PAGE_WINDOW = int(os.getenv("RAG_PIPELINE_PAGE_WINDOW", "8"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("RAG_PIPELINE_QUEUE_SIZE", "4"))
+# 切分單位：chars（字元數，預設）或 tokens（估計的 token 數，中英文 chunk 的 Embedding 成本較平均）
+CHUNK_UNIT = os.getenv("RAG_CHUNK_UNIT", "chars").lower()
+if CHUNK_UNIT == "tokens":
+    DEFAULT_CHUNKING_CONFIG = ChunkingConfig(
+        chunk_size=int(os.getenv("RAG_CHUNK_TOKENS", "256")),
+        chunk_overlap=int(os.getenv("RAG_CHUNK_OVERLAP_TOKENS", "32")),
+        min_chunk_size=int(os.getenv("RAG_MIN_CHUNK_TOKENS", "48")),
+        size_unit="tokens",
+        token_estimator=get_token_estimator()
+    )
+else:
+    DEFAULT_CHUNKING_CONFIG = ChunkingConfig(
+        chunk_size=500,
+        chunk_overlap=50,
+        min_chunk_size=100
+    )
+
+
+def get_rag_fingerprint(
+    config: Optional[ChunkingConfig] = None,
+    embedding_client=None,
+    dimensions: Optional[int] = None
+) -> str:
+    """
+    計算 RAG 設定指紋（解析器 + 切分設定與版本 + Embedding 模型）
+
+    只有指紋相同的文檔才能直接重用彼此的切分結果與向量。
+    dimensions 可覆寫 Embedding 維度（轉換向量維度時計算來源與目標設定的指紋）。
+    """
+    config = config or DEFAULT_CHUNKING_CONFIG
+    embedding_client = embedding_client or get_embedding_client()
+    payload = {
+        "parser": PARSER_TYPE,
+        "normalizer": NORMALIZER_VERSION if NORMALIZE_TEXT else None,
+        "chunking": {**asdict(config), "version": CHUNKER_VERSION},
+        "embedding": {
+            "deployment": embedding_client.deployment,
+            "dimension": dimensions or embedding_client.get_embedding_dimension(),
+        },
+    }
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+# 從 MinIO 讀取 PDF 時，小於此大小直接讀入記憶體，否則下載到臨時檔案並以 mmap 開啟
+# （解析沙箱啟用時一律下載到臨時檔案，見 open_storage_source）
+SOURCE_MEMORY_LIMIT = int(os.getenv("RAG_SOURCE_MEMORY_LIMIT_MB", "64")) * 1024 * 1024
+
+
+def open_storage_source(object_key: str) -> DocumentSource:
+    """
+    從 MinIO 取得 PDF 的文檔來源
+
+    解析沙箱啟用時，物件內容以串流直接寫入一個臨時檔案，沙箱行程以路徑開啟：
+    只寫入一次，不在記憶體中保留完整副本（讀入記憶體後沙箱仍需再寫成臨時檔案）。
+    未啟用沙箱時，一般大小的檔案以串流讀入記憶體，直接交給解析器，不落地；
+    超過 RAG_SOURCE_MEMORY_LIMIT_MB 的檔案才下載到臨時檔案。
+    臨時檔案於 close() 時刪除，使用完畢後需呼叫 close()。
+    """
+    from services import get_s3_client
+
+    bucket = os.getenv("MINIO_BUCKET")
+    response = get_s3_client().get_object(Bucket=bucket, Key=object_key)
+    body = response["Body"]
+    try:
+        if not SANDBOX_ENABLED and response.get("ContentLength", 0) <= SOURCE_MEMORY_LIMIT:
+            return DocumentSource.from_stream(body)
+
+        fd, tmp_path = tempfile.mkstemp(prefix="pdf-source-", suffix=".pdf")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                for block in body.iter_chunks(1024 * 1024):
+                    tmp_file.write(block)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        return DocumentSource.from_mmap(tmp_path, owns_path=True)
+    finally:
+        body.close()
+
+
+def has_cached_pages(content_hash: Optional[str]) -> bool:
+    """解析結果快取中是否已有此內容的頁面（命中時處理流程不需要取得 PDF）"""
+    if not content_hash:
+        return False
+    cache = get_page_cache()
+    return cache is not None and cache.get_pages(content_hash, get_parser_cache_key(PARSER_TYPE)) is not None
+
+
+@lru_cache(maxsize=256)
+def get_page_layout(content_hash: str, object_key: str, page_number: int) -> Optional[PageLayout]:
+    """
+    取得文檔單頁的區塊索引（供 Highlight 座標與文本互查）
+
+    優先讀取解析結果快取（RAG_PARSER_TYPE=pymupdf_layout 時即為處理時產生的結果），
+    未命中時從 MinIO 取回 PDF 以版面模式解析並寫入快取。
+    建好的 PageLayout 以 LRU 保留在記憶體，重複查詢同一頁只需二分搜尋。
+
+    Args:
+        content_hash: 文檔內容雜湊
+        object_key: MinIO 物件鍵
+        page_number: 頁碼（1-indexed）
+
+    Returns:
+        Optional[PageLayout]: 區塊索引，頁碼超出範圍時返回 None
+
+    Raises:
+        Exception: PDF 解析失敗
+    """
+    cache = get_page_cache()
+    parser_key = get_parser_cache_key(LAYOUT_PARSER_TYPE)
+    pages = cache.get_pages(content_hash, parser_key) if cache else None
+
+    if pages is None:
+        source = open_storage_source(object_key)
+        try:
+            parse_result = parse_in_sandbox(LAYOUT_PARSER_TYPE, source)
+        finally:
+            source.close()
+        if not parse_result["success"]:
+            raise Exception(f"PDF 解析失敗: {parse_result.get('error', '未知錯誤')}")
+        pages = parse_result["pages"]
+        if cache:
+            cache.put_pages(content_hash, parser_key, pages)
+
+    if page_number < 1 or page_number > len(pages):
+        return None
+    page = pages[page_number - 1]
+    return PageLayout.from_dict(page["content"], page.get("layout") or {})
+
 
 def log_rag_event(
     db: Session,
@@ -50,185 +226,674 @@ def log_rag_event(
         logger.error(f"Failed to log rag event: {e}")
 
 
-def process_document_rag(
+class RagEventJournal:
+    """
+    單一文檔處理過程的事件暫存
+
+    處理過程中的事件先暫存在記憶體，與 chunk 記錄、文檔狀態在同一個交易中批次寫入，
+    避免每個事件各自 commit。失敗時由呼叫端立即 commit，確保前端看得到錯誤。
+    """
+
+    def __init__(self, document_id: str):
+        self.document_id = document_id
+        self._entries: List[dict] = []
+
+    def log(
+        self,
+        stage: str,
+        status: str,
+        message: Optional[str] = None,
+        metadata: Optional[dict] = None
+    ) -> None:
+        """暫存事件（記錄當下時間，寫入時保留原本的事件順序與時間）"""
+        self._entries.append({
+            "document_id": self.document_id,
+            "stage": stage,
+            "status": status,
+            "message": message,
+            "metadata_": metadata or {},
+            "created_at": datetime.utcnow(),
+        })
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def truncate(self, size: int) -> None:
+        """捨棄 size 之後暫存的事件（對應的資料庫變更被 rollback 時使用）"""
+        del self._entries[size:]
+
+    def commit(self, db: Session) -> int:
+        """
+        將暫存的事件批次寫入，並與 session 中其他變更一起 commit
+
+        commit 失敗時事件仍保留在暫存中，呼叫端 rollback 後可再次寫入。
+
+        Returns:
+            int: 寫入的事件數
+        """
+        count = len(self._entries)
+        if count:
+            db.execute(insert(models.RagProcessingLog), self._entries)
+        db.commit()
+        self._entries = []
+        return count
+
+
+def insert_chunk_records(db: Session, document_id: str, chunk_records: List[dict]) -> int:
+    """
+    以單一 executemany 批次寫入 DocumentChunk（不 commit）
+
+    Args:
+        db: 資料庫 session
+        document_id: 文檔 ID
+        chunk_records: chunk 記錄（index, content_preview, page_numbers, char_count, content_hash）
+
+    Returns:
+        int: 寫入的筆數
+    """
+    if not chunk_records:
+        return 0
+    db.execute(
+        insert(models.DocumentChunk),
+        [
+            {
+                "id": f"{document_id}_{c['index']}",
+                "document_id": document_id,
+                "chunk_index": c["index"],
+                "content_preview": c["content_preview"],
+                "page_numbers": c["page_numbers"],
+                "char_count": c["char_count"],
+                "content_hash": c.get("content_hash"),
+            }
+            for c in chunk_records
+        ]
+    )
+    return len(chunk_records)
+
+
+def clone_rag_from_duplicate(
     document_id: str,
-    file_content: bytes,
-    db: Session
-) -> Tuple[bool, Optional[str]]:
+    db: Session,
+    started: Optional[float] = None,
+    journal: Optional[RagEventJournal] = None
+) -> bool:
     """
-    處理文檔的 RAG 流程（Parse → Chunk → Embed → Store）
+    若已有內容相同（content_hash 相同）且設定指紋相同的已完成文檔，
+    直接複製其 chunk 記錄與向量，不重新解析與計算 Embedding。
 
     Args:
         document_id: 文檔 ID
-        file_content: PDF 檔案內容
         db: 資料庫 session
+        started: 處理開始時間（time.perf_counter），用於記錄總耗時
+        journal: 事件暫存（可選），成功時與 chunk 記錄一起寫入
 
     Returns:
-        Tuple[bool, Optional[str]]: (是否成功, 錯誤訊息)
+        bool: 是否已由既有文檔複製完成
     """
     doc = db.query(models.Document).filter(models.Document.id == document_id).first()
-    if not doc:
-        return False, "文檔不存在"
+    if not doc or not doc.content_hash:
+        return False
 
-    # 更新狀態為處理中
-    doc.rag_status = "processing"
-    db.commit()
+    started = started if started is not None else time.perf_counter()
+    journal = journal or RagEventJournal(document_id)
+    checkpoint = len(journal)
+    try:
+        fingerprint = get_rag_fingerprint()
+        source = db.query(models.Document).filter(
+            models.Document.content_hash == doc.content_hash,
+            models.Document.rag_status == "completed",
+            models.Document.rag_fingerprint == fingerprint,
+            models.Document.id != document_id
+        ).order_by(models.Document.uploaded_at.asc()).first()
+        if not source:
+            return False
 
-    log_rag_event(db, document_id, "start", "pending", "開始 RAG 處理流程")
+        vector_store = get_vector_store()
+        vector_store.delete_document(document_id)
+        copied = vector_store.copy_document(source.id, document_id)
+        if copied == 0:
+            return False
+
+        # 複製 chunk 記錄
+        db.query(models.DocumentChunk).filter(
+            models.DocumentChunk.document_id == document_id
+        ).delete()
+        source_chunks = db.query(models.DocumentChunk).filter(
+            models.DocumentChunk.document_id == source.id
+        ).all()
+        insert_chunk_records(db, document_id, [
+            {
+                "index": c.chunk_index,
+                "content_preview": c.content_preview,
+                "page_numbers": c.page_numbers,
+                "char_count": c.char_count,
+                "content_hash": c.content_hash
+            }
+            for c in source_chunks
+        ])
+
+        doc.rag_status = "completed"
+        doc.rag_error = None
+        doc.chunk_count = copied
+        doc.pages_indexed = source.pages_indexed or 0
+        doc.rag_fingerprint = fingerprint
+
+        journal.log(
+            "dedup",
+            "success",
+            f"與既有文檔內容相同，直接重用 {copied} 個向量",
+            {"source_document_id": source.id, "chunk_count": copied}
+        )
+        journal.log(
+            "complete",
+            "success",
+            "RAG 處理流程全部完成",
+            stage_metrics(int((time.perf_counter() - started) * 1000), chunk_count=copied, pipeline="dedup")
+        )
+        journal.commit(db)
+    except Exception as e:
+        # 去重失敗時退回完整處理流程（本次新增的事件隨交易一併捨棄）
+        db.rollback()
+        journal.truncate(checkpoint)
+        logger.warning(f"RAG 去重失敗，改為完整處理: document_id={document_id}, error={e}")
+        return False
 
-    try:
-        # Step 1: 將檔案內容寫入臨時檔案
-        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp_file:
-            tmp_file.write(file_content)
-            tmp_path = tmp_file.name
+    logger.info(f"RAG 去重完成: document_id={document_id}, source={source.id}, chunks={copied}")
+    return True
 
-        try:
-            # Step 2: 解析 PDF
-            parser = get_parser("pymupdf")
-            parse_result = parser(tmp_path)
+
+class RagProcessingCancelled(Exception):
+    """處理被取消（例如 worker 的任務租約已遺失，文檔改由其他 worker 處理）"""
+
+
+class ProgressiveStatus:
+    """
+    漸進式索引狀態
+
+    chunk 依頁碼順序寫入向量庫；第一次有完整頁面寫入後即提交 rag_status="partial"，
+    之後已寫入的頁數每增加 wave_pages 頁再更新一次 pages_indexed，讓檢索可以先使用已索引的頁面。
+    重新處理既有文檔時，每次提交前先刪除已索引頁面的舊 chunks（見 IncrementalIndexer.delete_stale），
+    partial 期間的檢索不會混用同一頁的新舊 chunks。
+
+    Attributes:
+        pages_indexed: 已完整寫入向量庫的頁數
+        page_count: 文檔總頁數（處理完成時設定）
+        indexer: 寫入向量庫的增量索引器（由索引流程設定）
+        cancel: 取消旗標（設定後，下一次寫入向量庫或提交狀態前中止處理）
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        doc: models.Document,
+        wave_pages: int = PROGRESSIVE_WAVE_PAGES,
+        cancel: Optional[threading.Event] = None
+    ):
+        self.db = db
+        self.doc = doc
+        self.wave_pages = wave_pages
+        self.cancel = cancel
+        self.pages_indexed = 0
+        self.page_count = 0
+        self.indexer: Optional[IncrementalIndexer] = None
+        self._reported = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.wave_pages > 0
+
+    def check_cancelled(self) -> None:
+        """
+        Raises:
+            RagProcessingCancelled: 已設定取消旗標
+        """
+        if self.cancel is not None and self.cancel.is_set():
+            raise RagProcessingCancelled(f"RAG 處理已取消: document_id={self.doc.id}")
+
+    def stored(self, chunk_data: List[dict], next_page: Optional[int] = None) -> None:
+        """
+        記錄一批已寫入向量庫的 chunk
+
+        Args:
+            chunk_data: 剛寫入的 chunk（依頁碼順序）
+            next_page: 下一個尚未寫入的 chunk 的起始頁（未知時以本批最後一個 chunk 的最後一頁估計，
+                       該頁可能仍有內容在下一批）
+        """
+        if next_page is None:
+            last_pages = chunk_data[-1]["page_numbers"] if chunk_data else []
+            if not last_pages:
+                return
+            next_page = max(last_pages)
+        self.advance(next_page - 1)
+
+    def advance(self, pages_indexed: int) -> None:
+        """更新已索引頁數，達到下一批門檻時提交 partial 狀態"""
+        self.check_cancelled()
+        self.pages_indexed = max(self.pages_indexed, pages_indexed)
+        if not self.enabled or self.pages_indexed <= self._reported:
+            return
+        if self._reported and self.pages_indexed < self._reported + self.wave_pages:
+            return
+        if self.indexer is not None:
+            self.indexer.delete_stale(self.pages_indexed)
+        self.doc.rag_status = "partial"
+        self.doc.pages_indexed = self.pages_indexed
+        self.db.commit()
+        self._reported = self.pages_indexed
+        logger.info(f"RAG 漸進式索引: document_id={self.doc.id}, pages_indexed={self.pages_indexed}")
+
+
+def _split_first_wave(chunk_data: List[dict], wave_pages: int) -> Tuple[List[dict], List[dict]]:
+    """將 chunk 分為第一批（只涵蓋前 wave_pages 頁）與其餘部分"""
+    split = len(chunk_data)
+    for i, chunk in enumerate(chunk_data):
+        if chunk["page_numbers"] and max(chunk["page_numbers"]) > wave_pages:
+            split = i
+            break
+    return chunk_data[:split], chunk_data[split:]
+
+
+def _index_document_batch(
+    document_id: str,
+    source: DocumentSource,
+    config: ChunkingConfig,
+    journal: RagEventJournal,
+    content_hash: Optional[str] = None,
+    progress: Optional[ProgressiveStatus] = None
+) -> Tuple[List[dict], int]:
+    """
+    批次模式：解析整份 PDF → 全部切分 → 全部向量化 → 全部寫入向量庫
+
+    提供 content_hash 時先查詢解析結果快取，命中則不開啟 PDF。
+    提供 progress 時，前 wave_pages 頁的 chunk 先完成向量化與寫入（文檔轉為 partial），再處理其餘部分。
+
+    Returns:
+        Tuple[List[dict], int]: (chunk 記錄, 寫入向量庫的數量)
+    """
+    # Step 2: 解析 PDF（或讀取解析結果快取）
+    cache = get_page_cache() if content_hash else None
+    parser_key = get_parser_cache_key(PARSER_TYPE)
+    parse_timer = StageTimer()
+    with parse_timer.measure():
+        pages = cache.get_pages(content_hash, parser_key) if cache else None
+        cache_hit = pages is not None
+        if cache_hit:
+            content = build_content(pages)
+        else:
+            if source is None:
+                raise Exception("解析結果快取未命中，且未提供 PDF 內容")
+            # 在沙箱行程中解析（CPU 時間、記憶體與逾時限制），異常的 PDF 不會影響本行程
+            parse_result = parse_in_sandbox(PARSER_TYPE, source)
 
             if not parse_result["success"]:
                 raise Exception(f"PDF 解析失敗: {parse_result.get('error', '未知錯誤')}")
 
             content = parse_result["content"]
             pages = parse_result["pages"]
+            if cache:
+                cache.put_pages(content_hash, parser_key, pages)
+
+    # Step 2.5: 文本正規化（快取保存的是原始解析結果，正規化規則改變不需重新解析）
+    normalize_stats = NormalizeStats()
+    if NORMALIZE_TEXT:
+        with parse_timer.measure():
+            pages = list(normalize_pages(pages, normalize_stats))
+            content = build_content(pages)
+
+    if not content or not content.strip():
+        raise Exception("PDF 內容為空")
+    if progress:
+        progress.page_count = len(pages)
+
+    journal.log(
+        "parsing", 
+        "success", 
+        f"PDF 解析完成，共 {len(pages)} 頁",
+        stage_metrics(
+            parse_timer.duration_ms,
+            page_count=len(pages),
+            input_bytes=0 if cache_hit else source.size,
+            output_chars=len(content),
+            cache_hit=cache_hit,
+            **normalize_stats.to_dict()
+        )
+    )
+
+    # Step 3: 切分文本
+    chunk_timer = StageTimer()
+    with chunk_timer.measure():
+        chunks = chunk_text(content, pages, config)
+
+    if not chunks:
+        raise Exception("切分結果為空")
+
+    journal.log(
+        "chunking", 
+        "success", 
+        f"文本切分完成，共 {len(chunks)} 個片段",
+        stage_metrics(chunk_timer.duration_ms, chunk_count=len(chunks), input_chars=len(content))
+    )
+
+    # Step 4: 生成 Embeddings（增量：只為新增或內容改變的 chunk 計算）
+    indexer = IncrementalIndexer(document_id, get_vector_store(), get_embedding_client())
+    if progress:
+        progress.indexer = indexer
+    chunk_data = [
+        {
+            "index": c.index,
+            "content": c.content,
+            "page_numbers": c.page_numbers
+        }
+        for c in chunks
+    ]
+    # 漸進式：切分結果與非漸進式相同，只是分兩批向量化與寫入
+    if progress and progress.enabled:
+        waves = [w for w in _split_first_wave(chunk_data, progress.wave_pages) if w]
+    else:
+        waves = [chunk_data]
+
+    embed_timer = StageTimer()
+    store_timer = StageTimer()
+    added_count = 0
+    for wave_index, wave in enumerate(waves):
+        with embed_timer.measure():
+            embeddings = indexer.embed(wave)
+        if progress:
+            progress.check_cancelled()
+        with store_timer.measure():
+            added_count += indexer.store(wave, embeddings)
+        if progress and wave_index < len(waves) - 1:
+            progress.stored(wave, next_page=min(waves[wave_index + 1][0]["page_numbers"], default=None))
+
+    journal.log(
+        "embedding", 
+        "success", 
+        f"Embedding 生成完成，新增 {indexer.embedded_count} 個向量，重用 {indexer.reused_count} 個",
+        stage_metrics(
+            embed_timer.duration_ms,
+            embedding_count=indexer.embedded_count,
+            reused_count=indexer.reused_count,
+            input_chars=sum(len(c["content"]) for c in chunk_data),
+            **indexer.usage.to_dict()
+        )
+    )
+
+    # Step 5: 儲存到 ChromaDB（新向量已隨各批寫入；刪除已不存在的 chunk）
+    if progress:
+        progress.check_cancelled()
+    with store_timer.measure():
+        deleted_count = indexer.finish()
+
+    journal.log(
+        "indexing", 
+        "success", 
+        f"向量庫索引完成，儲存 {added_count} 筆資料",
+        stage_metrics(store_timer.duration_ms, indexed_count=added_count, deleted_count=deleted_count)
+    )
+
+    chunk_records = [
+        {
+            "index": c["index"],
+            "content_preview": c["content"][:200] if c["content"] else None,
+            "page_numbers": c["page_numbers"],
+            "char_count": len(c["content"]),
+            "content_hash": c["content_hash"]
+        }
+        for c in chunk_data
+    ]
+    return chunk_records, added_count
+
+
+def _index_document_streaming(
+    document_id: str,
+    source: DocumentSource,
+    config: ChunkingConfig,
+    journal: RagEventJournal,
+    content_hash: Optional[str] = None,
+    progress: Optional[ProgressiveStatus] = None
+) -> Tuple[List[dict], int]:
+    """
+    串流模式：逐頁解析，切分、向量化、寫入以有界佇列串接並行處理
 
-            if not content or not content.strip():
-                raise Exception("PDF 內容為空")
+    記憶體用量與文件長度無關，解析與 Embedding 的網路等待時間重疊。
+    提供 content_hash 時，解析結果快取命中則直接讀取頁面，否則邊解析邊寫入快取。
+    提供 progress 時，每批寫入向量庫後更新已索引頁數（寫入在呼叫端執行緒，可直接使用 db session）。
 
-            log_rag_event(
-                db, 
-                document_id, 
-                "parsing", 
-                "success", 
-                f"PDF 解析完成，共 {len(pages)} 頁",
-                {"page_count": len(pages)}
-            )
+    Returns:
+        Tuple[List[dict], int]: (chunk 記錄, 寫入向量庫的數量)
+    """
+    embedding_client = get_embedding_client()
+    indexer = IncrementalIndexer(document_id, get_vector_store(), embedding_client)
+    if progress:
+        progress.indexer = indexer
+
+    cache = get_page_cache() if content_hash else None
+    parser_key = get_parser_cache_key(PARSER_TYPE)
+    cached_pages = cache.get_pages(content_hash, parser_key) if cache else None
+    cache_hit = cached_pages is not None
+    if cache_hit:
+        pages = iter(cached_pages)
+    else:
+        if source is None:
+            raise Exception("解析結果快取未命中，且未提供 PDF 內容")
+        pages = iter_pages_in_sandbox(PARSER_TYPE, source)
+        if cache:
+            pages = cache.tee_pages(pages, content_hash, parser_key)
+    normalize_stats = NormalizeStats()
+    if NORMALIZE_TEXT:
+        pages = normalize_pages(pages, normalize_stats, NormalizeConfig(sample_pages=NORMALIZE_SAMPLE_PAGES))
+    def store(chunk_data: List[dict], embeddings: List[List[float]]) -> int:
+        if progress:
+            progress.check_cancelled()
+        count = indexer.store(chunk_data, embeddings)
+        if progress:
+            progress.stored(chunk_data)
+        return count
+
+    result = run_streaming_pipeline(
+        pages,
+        indexer.embed,
+        store,
+        config,
+        PipelineConfig(
+            queue_size=PIPELINE_QUEUE_SIZE,
+            page_window=PIPELINE_PAGE_WINDOW,
+            embed_batch_size=embedding_client.batch_size,
+            embed_batch_tokens=embedding_client.batch_max_tokens,
+            token_estimator=embedding_client.token_estimator,
+            embed_concurrency=embedding_client.max_concurrency,
+        )
+    )
+
+    if result.chunk_count == 0:
+        raise Exception("PDF 內容為空")
+    if progress:
+        progress.page_count = result.page_count
+
+    # 刪除已不存在於新切分結果的 chunks
+    if progress:
+        progress.check_cancelled()
+    finish_timer = StageTimer()
+    with finish_timer.measure():
+        deleted_count = indexer.finish()
+
+    journal.log(
+        "parsing",
+        "success",
+        f"PDF 解析完成，共 {result.page_count} 頁",
+        stage_metrics(
+            result.parse_ms,
+            page_count=result.page_count,
+            input_bytes=0 if cache_hit else source.size,
+            output_chars=result.char_count,
+            pipeline="streaming",
+            cache_hit=cache_hit,
+            **normalize_stats.to_dict()
+        )
+    )
+    journal.log(
+        "chunking",
+        "success",
+        f"文本切分完成，共 {result.chunk_count} 個片段",
+        stage_metrics(result.chunk_ms, chunk_count=result.chunk_count, input_chars=result.char_count)
+    )
+    journal.log(
+        "embedding",
+        "success",
+        f"Embedding 生成完成，新增 {indexer.embedded_count} 個向量，重用 {indexer.reused_count} 個",
+        stage_metrics(
+            result.embed_ms,
+            embedding_count=indexer.embedded_count,
+            reused_count=indexer.reused_count,
+            batch_count=result.batch_count,
+            input_chars=sum(c["char_count"] for c in result.chunk_records),
+            **indexer.usage.to_dict()
+        )
+    )
+    journal.log(
+        "indexing",
+        "success",
+        f"向量庫索引完成，儲存 {result.indexed_count} 筆資料",
+        stage_metrics(
+            result.store_ms + finish_timer.duration_ms,
+            indexed_count=result.indexed_count,
+            deleted_count=deleted_count
+        )
+    )
 
-            # Step 3: 切分文本
-            config = ChunkingConfig(
-                chunk_size=500,
-                chunk_overlap=50,
-                min_chunk_size=100
-            )
-            chunks = chunk_text(content, pages, config)
-
-            if not chunks:
-                raise Exception("切分結果為空")
-
-            log_rag_event(
-                db, 
-                document_id, 
-                "chunking", 
-                "success", 
-                f"文本切分完成，共 {len(chunks)} 個片段",
-                {"chunk_count": len(chunks)}
-            )
+    return result.chunk_records, result.indexed_count
 
-            # Step 4: 生成 Embeddings
-            embedding_client = get_embedding_client()
-            chunk_contents = [c.content for c in chunks]
-            embeddings = embedding_client.embed_texts(chunk_contents)
-
-            if len(embeddings) != len(chunks):
-                raise Exception("Embedding 數量與 chunk 數量不匹配")
-
-            log_rag_event(
-                db, 
-                document_id, 
-                "embedding", 
-                "success", 
-                f"Embedding 生成完成，共 {len(embeddings)} 個向量",
-                {"embedding_count": len(embeddings)}
-            )
 
-            # Step 5: 儲存到 ChromaDB
-            vector_store = get_vector_store()
-
-            # 先刪除舊的向量（如果有）
-            vector_store.delete_document(document_id)
-
-            # 準備 chunk 資料
-            chunk_data = [
-                {
-                    "index": c.index,
-                    "content": c.content,
-                    "page_numbers": c.page_numbers
-                }
-                for c in chunks
-            ]
-
-            # 新增到向量庫
-            added_count = vector_store.add_chunks(document_id, chunk_data, embeddings)
-
-            log_rag_event(
-                db, 
-                document_id, 
-                "indexing", 
-                "success", 
-                f"向量庫索引完成，儲存 {added_count} 筆資料",
-                {"indexed_count": added_count}
-            )
+def process_document_rag(
+    document_id: str,
+    file_content: Optional[bytes],
+    db: Session,
+    file_path: Optional[str] = None,
+    source: Optional[DocumentSource] = None,
+    cancel: Optional[threading.Event] = None
+) -> Tuple[bool, Optional[str]]:
+    """
+    處理文檔的 RAG 流程（Parse → Chunk → Embed → Store）
 
-            # Step 6: 在資料庫中記錄 chunk 資訊
-            # 先刪除舊的 chunk 記錄
-            db.query(models.DocumentChunk).filter(
-                models.DocumentChunk.document_id == document_id
-            ).delete()
-
-            # 建立新的 chunk 記錄
-            for c in chunks:
-                chunk_record = models.DocumentChunk(
-                    id=f"{document_id}_{c.index}",
-                    document_id=document_id,
-                    chunk_index=c.index,
-                    content_preview=c.content[:200] if c.content else None,
-                    page_numbers=c.page_numbers,
-                    char_count=len(c.content)
-                )
-                db.add(chunk_record)
+    PDF 內容依 source → file_path → file_content 的優先順序取得，
+    記憶體中的內容直接交給解析器，不寫入臨時檔案。
+    文檔已有 content_hash 且解析結果快取命中時（見 has_cached_pages），三者皆可為 None。
+
+    Args:
+        document_id: 文檔 ID
+        file_content: PDF 檔案內容（已提供 file_path 或 source 時可為 None）
+        db: 資料庫 session
+        file_path: 已落地的 PDF 檔案路徑
+        source: 文檔來源（由呼叫端負責 close）
+        cancel: 取消旗標（例如 worker 的任務租約遺失）；設定後在下一次寫入前中止，
+                不寫入完成或失敗狀態（文檔已由其他處理流程接手）
+
+    Returns:
+        Tuple[bool, Optional[str]]: (是否成功, 錯誤訊息)
+    """
+    doc = db.query(models.Document).filter(models.Document.id == document_id).first()
+    if not doc:
+        return False, "文檔不存在"
 
-            # 更新文檔狀態
-            doc.rag_status = "completed"
-            doc.rag_error = None
-            doc.chunk_count = added_count
+    # 處理過程的事件暫存在 journal，與 chunk 記錄在同一個交易中寫入
+    journal = RagEventJournal(document_id)
+
+    # 更新狀態為處理中（與 start 事件同一個交易）
+    doc.rag_status = "processing"
+    doc.pages_indexed = 0
+    journal.log("start", "pending", "開始 RAG 處理流程")
+    journal.commit(db)
+    started = time.perf_counter()
+
+    try:
+        # Step 0: 取得文檔來源（記憶體中的內容直接交給解析器，不寫入臨時檔案）
+        if source is None:
+            if file_path:
+                source = DocumentSource.from_path(file_path)
+            elif file_content is not None:
+                source = DocumentSource.from_bytes(file_content)
+
+        # Step 1: 內容去重（相同檔案直接重用既有結果）
+        if not doc.content_hash and source is not None:
+            doc.content_hash = source.content_hash()
             db.commit()
 
-            log_rag_event(
-                db, 
-                document_id, 
-                "complete", 
-                "success", 
-                "RAG 處理流程全部完成"
+        if clone_rag_from_duplicate(document_id, db, started, journal):
+            return True, None
+
+        # Step 2-5: 解析 → 切分 → 向量化 → 寫入向量庫
+        config = DEFAULT_CHUNKING_CONFIG
+        progress = ProgressiveStatus(db, doc, cancel=cancel)
+        if RAG_PIPELINE_MODE == "streaming":
+            chunk_records, added_count = _index_document_streaming(
+                document_id, source, config, journal, doc.content_hash, progress
+            )
+        else:
+            chunk_records, added_count = _index_document_batch(
+                document_id, source, config, journal, doc.content_hash, progress
             )
 
-            logger.info(f"RAG 處理完成: document_id={document_id}, chunks={added_count}")
-            return True, None
+        # Step 6: 在資料庫中記錄 chunk 資訊（chunk 記錄、文檔狀態、處理事件在同一個交易中寫入）
+        progress.check_cancelled()
+        # 先刪除舊的 chunk 記錄
+        db.query(models.DocumentChunk).filter(
+            models.DocumentChunk.document_id == document_id
+        ).delete()
+
+        # 批次建立新的 chunk 記錄
+        insert_chunk_records(db, document_id, chunk_records)
+
+        # 更新文檔狀態
+        doc.rag_status = "completed"
+        doc.rag_error = None
+        doc.chunk_count = added_count
+        doc.pages_indexed = progress.page_count
+        doc.rag_fingerprint = get_rag_fingerprint(config)
+
+        journal.log(
+            "complete", 
+            "success", 
+            "RAG 處理流程全部完成",
+            stage_metrics(
+                int((time.perf_counter() - started) * 1000),
+                chunk_count=added_count,
+                pipeline=RAG_PIPELINE_MODE
+            )
+        )
+        journal.commit(db)
 
-        finally:
-            # 清理臨時檔案
-            try:
-                os.unlink(tmp_path)
-            except Exception:
-                pass
+        logger.info(f"RAG 處理完成: document_id={document_id}, chunks={added_count}")
+        return True, None
+
+    except RagProcessingCancelled as e:
+        # 文檔已由其他處理流程接手，不寫入失敗狀態
+        db.rollback()
+        logger.warning(str(e))
+        return False, str(e)
 
     except Exception as e:
         error_msg = str(e)
         logger.error(f"RAG 處理失敗: document_id={document_id}, error={error_msg}")
 
-        # 更新文檔狀態為失敗
-        doc.rag_status = "failed"
-        doc.rag_error = error_msg[:500]  # 限制錯誤訊息長度
-        db.commit()
-
-        log_rag_event(
-            db, 
-            document_id, 
-            "failed", 
-            "error", 
-            f"處理失敗: {error_msg}",
-            {"error": error_msg}
-        )
+        # 捨棄未完成的變更，立即寫入失敗狀態與目前為止的處理事件
+        try:
+            db.rollback()
+            doc.rag_status = "failed"
+            doc.rag_error = error_msg[:500]  # 限制錯誤訊息長度
+            journal.log(
+                "failed", 
+                "error", 
+                f"處理失敗: {error_msg}",
+                stage_metrics(
+                    int((time.perf_counter() - started) * 1000),
+                    error=error_msg,
+                    **({"sandbox_failure": e.kind} if isinstance(e, ParseSandboxError) else {})
+                )
+            )
+            journal.commit(db)
+        except Exception as log_err:
+            db.rollback()
+            logger.error(f"Failed to record rag failure: document_id={document_id}, error={log_err}")
 
         return False, error_msg
 
@@ -260,7 +925,7 @@ def get_document_rag_status(document_id: str, db: Session) -> dict:
         db: 資料庫 session
 
     Returns:
-        dict: {status, error, chunk_count}
+        dict: {status, error, chunk_count, pages_indexed}
     """
     doc = db.query(models.Document).filter(models.Document.id == document_id).first()
     if not doc:
@@ -269,5 +934,6 @@ def get_document_rag_status(document_id: str, db: Session) -> dict:
     return {
         "status": doc.rag_status,
         "error": doc.rag_error,
-        "chunk_count": doc.chunk_count
+        "chunk_count": doc.chunk_count,
+        "pages_indexed": doc.pages_indexed or 0
     }
@@ -11,7 +11,7 @@ from typing import Optional
 
 # RAG 相關導入
 try:
-    from rag import get_embedding_client, get_vector_store
+    from rag import get_embedding_client, get_embedding_key, get_query_embedding_cache, get_vector_store
     RAG_AVAILABLE = True
 except ImportError:
     RAG_AVAILABLE = False
@@ -49,13 +49,16 @@ async def retrieve_rag_context(
             logger.warning(f"Document not found: {document_id}")
             return None
 
-        if doc.rag_status != "completed":
+        # partial：前幾頁已寫入向量庫，可先檢索已索引的部分
+        if doc.rag_status not in ("completed", "partial"):
             logger.info(f"Document RAG not ready: {document_id}, status={doc.rag_status}")
             return None
 
-        # 生成查詢向量
+        # 生成查詢向量（相同問題重用快取；未命中的查詢與同時到達的其他查詢合併為一個批次請求）
         embedding_client = get_embedding_client()
-        query_embedding = embedding_client.embed_text(query)
+        query_embedding = await get_query_embedding_cache().get_or_embed(
+            query, get_embedding_key(embedding_client), embedding_client.aembed_query
+        )
 
         # 搜尋相關 chunks（只搜尋當前文檔）
         vector_store = get_vector_store()
@@ -1,31 +1,62 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from db import get_db, SessionLocal
 import models
 import schemas
 from auth import get_current_user
-from services import presign_upload, presign_get, get_s3_client
+from services import (
+    presign_upload, presign_get, get_s3_client, UploadTooLargeError, upload_fileobj_to_minio,
+)
 # 注意：log_rag_event 定義於 rag_services.py:25，用於記錄 RAG 處理事件到 RagProcessingLog 表
-from rag_services import process_document_rag, delete_document_vectors, log_rag_event
+from rag_services import (
+    process_document_rag, delete_document_vectors, log_rag_event, open_storage_source, has_cached_pages,
+    get_page_layout,
+)
+from rag_jobs import enqueue_rag_job, enqueue_rag_jobs
+from rag.vector_store import is_shared_vector_store
+from sqlalchemy import func
 import uuid
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 import os
+import asyncio
+import tempfile
+import zipfile
 import logging
 
 logger = logging.getLogger(__name__)
 
 # 檔案大小限制：100 MB
 MAX_FILE_SIZE = 100 * 1024 * 1024
+# 每次從請求讀取的大小：1 MB
+UPLOAD_READ_SIZE = 1024 * 1024
+
+# RAG 處理模式：
+# - queue：寫入 rag_jobs 佇列，由獨立的 worker 行程（python -m worker）執行；需要 Chroma 伺服器（CHROMA_HOST）
+# - background：在 API 行程內以 BackgroundTasks 執行（僅建議本地開發使用）
+# 未設定時，有 Chroma 伺服器則為 queue，否則為 background（嵌入式 Chroma 只能由 API 行程讀寫）
+RAG_PROCESSING_MODE = os.getenv(
+    "RAG_PROCESSING_MODE",
+    "queue" if is_shared_vector_store() else "background"
+).lower()
+if RAG_PROCESSING_MODE == "queue" and not is_shared_vector_store():
+    logger.warning(
+        "RAG_PROCESSING_MODE=queue 但未設定 CHROMA_HOST：worker 無法啟動，文檔不會被處理"
+    )
+
+# 批次上傳：單次最多檔案數（ZIP 內的 PDF 也計入）與同時上傳到 MinIO 的檔案數
+MAX_BATCH_FILES = int(os.getenv("UPLOAD_BATCH_MAX_FILES", "200"))
+UPLOAD_BATCH_CONCURRENCY = max(int(os.getenv("UPLOAD_BATCH_CONCURRENCY", "4")), 1)
 
 
-def process_rag_background(document_id: str, file_content: bytes):
-    """背景執行 RAG 處理"""
+def process_rag_background(document_id: str, file_path: str):
+    """背景執行 RAG 處理（file_path 為上傳時寫入的臨時檔案，處理完成後刪除）"""
     db = SessionLocal()
     try:
         # 狀態更新由 rag_services.process_document_rag 統一處理
         # 執行 RAG 處理
-        success, error = process_document_rag(document_id, file_content, db)
+        success, error = process_document_rag(document_id, None, db, file_path=file_path)
         if not success:
             logger.warning(f"RAG processing failed for document {document_id}: {error}")
     except Exception as e:
@@ -38,6 +69,38 @@ def process_rag_background(document_id: str, file_content: bytes):
             db.commit()
     finally:
         db.close()
+        try:
+            os.unlink(file_path)
+        except Exception:
+            pass
+
+
+def process_rag_from_storage(document_id: str):
+    """背景執行 RAG 處理（從 MinIO 串流讀取檔案；用於批次上傳的 background 模式）"""
+    db = SessionLocal()
+    source = None
+    try:
+        doc = db.query(models.Document).filter(models.Document.id == document_id).first()
+        if not doc:
+            return
+        # 解析結果快取命中時不需要取得 PDF
+        if not has_cached_pages(doc.content_hash):
+            source = open_storage_source(doc.object_key)
+        success, error = process_document_rag(document_id, None, db, source=source)
+        if not success:
+            logger.warning(f"RAG processing failed for document {document_id}: {error}")
+    except Exception as e:
+        logger.error(f"RAG background processing error for document {document_id}: {e}")
+        db.rollback()
+        doc = db.query(models.Document).filter(models.Document.id == document_id).first()
+        if doc:
+            doc.rag_status = "failed"
+            doc.rag_error = str(e)[:500]
+            db.commit()
+    finally:
+        if source is not None:
+            source.close()
+        db.close()
 
 # Ensure forward refs are resolved (for Pydantic v1 compatibility)
 try:
@@ -104,6 +167,7 @@ def list_documents(
                         highlights=highlights,
                         rag_status=d.rag_status or "pending",
                         chunk_count=d.chunk_count or 0,
+                        pages_indexed=d.pages_indexed or 0,
                     )
                 )
             except Exception as e:
@@ -167,6 +231,7 @@ def get_document(
         highlights=highlights,
         rag_status=doc.rag_status or "pending",
         chunk_count=doc.chunk_count or 0,
+        pages_indexed=doc.pages_indexed or 0,
     )
 
 
@@ -202,6 +267,7 @@ def create_document(
         highlights=[],
         rag_status=doc.rag_status or "pending",
         chunk_count=doc.chunk_count or 0,
+        pages_indexed=doc.pages_indexed or 0,
     )
 
 @router.post("/upload", response_model=schemas.DocumentOut)
@@ -221,53 +287,35 @@ async def upload_document(
 
     # 生成 object_key
     object_key = f"uploads/{uuid.uuid4()}_{file.filename}"
+    content_type = file.content_type or "application/octet-stream"
+    is_pdf = file.content_type == "application/pdf"
 
-    # 實際上傳文件到 MinIO
-    try:
-        bucket = os.getenv("MINIO_BUCKET")
-        s3_client = get_s3_client()
+    # 串流上傳到 MinIO（與批次上傳共用 upload_fileobj_to_minio，整個迴圈在 threadpool 執行）：
+    # - 邊讀邊檢查大小與計算內容雜湊（用於 RAG 去重），超過限制立即中止
+    # - 以 multipart 分段上傳，記憶體中最多只保留一個分段
+    # bucket 於 API 啟動時確認（services.ensure_default_bucket）
+    bucket = os.getenv("MINIO_BUCKET")
+    s3_client = get_s3_client()
 
-        # 確保 bucket 存在
-        try:
-            s3_client.head_bucket(Bucket=bucket)
-        except s3_client.exceptions.ClientError:
-            # Bucket 不存在，嘗試創建
-            try:
-                s3_client.create_bucket(Bucket=bucket)
-            except Exception as create_err:
-                print(f"Warning: Could not create bucket {bucket}: {create_err}")
-
-        # 分塊讀取文件內容並檢查大小
-        chunks = []
-        total_size = 0
-        while True:
-            chunk = await file.read(1024 * 1024)  # 每次讀取 1 MB
-            if not chunk:
-                break
-            total_size += len(chunk)
-            if total_size > MAX_FILE_SIZE:
-                raise HTTPException(
-                    status_code=413,
-                    detail=f"檔案大小超過限制 ({MAX_FILE_SIZE // (1024 * 1024)} MB)"
-                )
-            chunks.append(chunk)
+    # background 模式需要在本機處理檔案，邊上傳邊寫入臨時檔案（只落地一次）
+    spool = None
+    if is_pdf and RAG_PROCESSING_MODE == "background":
+        spool = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
 
-        file_content = b''.join(chunks)
-        
-        # 上傳到 MinIO
-        s3_client.put_object(
-            Bucket=bucket,
-            Key=object_key,
-            Body=file_content,
-            ContentType=file.content_type or "application/octet-stream"
+    try:
+        total_size, content_hash = await run_in_threadpool(
+            upload_fileobj_to_minio,
+            s3_client, bucket, file.file, object_key, content_type,
+            MAX_FILE_SIZE, UPLOAD_READ_SIZE, spool,
         )
-        
-        # 驗證上傳成功
-        try:
-            s3_client.head_object(Bucket=bucket, Key=object_key)
-        except Exception as verify_err:
-            print(f"Warning: Could not verify uploaded file {object_key}: {verify_err}")
+        if spool:
+            spool.close()
     except Exception as e:
+        if spool:
+            spool.close()
+            os.unlink(spool.name)
+        if isinstance(e, UploadTooLargeError):
+            raise HTTPException(status_code=413, detail=str(e))
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to upload file to MinIO: {str(e)}")
@@ -286,19 +334,23 @@ async def upload_document(
         title=title,
         object_key=object_key,
         content_type=file.content_type,
-        size=file.size,
+        size=total_size,
         type=doc_type,
         raw_preview=None,
+        content_hash=content_hash,
         rag_status="pending" if doc_type == "pdf" else "not_applicable",
     )
     db.add(doc)
     db.commit()
     db.refresh(doc)
 
-    # 若為 PDF，背景執行 RAG 處理（非同步）
+    # 若為 PDF，交由 worker 執行 RAG 處理（非同步）
     if doc_type == "pdf":
-        log_rag_event(db, doc.id, "upload", "success", "檔案上傳完成，等待處理", {"size": file.size})
-        background_tasks.add_task(process_rag_background, doc.id, file_content)
+        log_rag_event(db, doc.id, "upload", "success", "檔案上傳完成，等待處理", {"size": total_size})
+        if RAG_PROCESSING_MODE == "background":
+            background_tasks.add_task(process_rag_background, doc.id, spool.name)
+        else:
+            enqueue_rag_job(db, doc.id)
 
     return schemas.DocumentOut(
         id=doc.id,
@@ -313,8 +365,230 @@ async def upload_document(
         highlights=[],
         rag_status=doc.rag_status or "pending",
         chunk_count=doc.chunk_count or 0,
+        pages_indexed=doc.pages_indexed or 0,
+    )
+
+def _is_zip_upload(file: UploadFile) -> bool:
+    return (
+        file.content_type in ("application/zip", "application/x-zip-compressed")
+        or (file.filename or "").lower().endswith(".zip")
+    )
+
+
+def _is_pdf_name(filename: str) -> bool:
+    return filename.lower().endswith(".pdf")
+
+
+def _expand_upload_files(files: List[UploadFile], entries: list, rejected: list, archives: list) -> None:
+    """
+    展開批次上傳的檔案（讀取 ZIP 目錄會阻塞，須在執行緒池中呼叫）
+
+    結果直接加入呼叫端的列表，發生例外時已開啟的 ZIP 仍會在 archives 中，由呼叫端關閉。
+
+    Args:
+        files: 上傳的檔案
+        entries: 上傳項目 (檔名, 開啟檔案物件的函數)
+        rejected: 不接受的檔案
+        archives: 已開啟的 ZIP 檔案
+    """
+    for file in files:
+        filename = file.filename or "upload"
+        if _is_zip_upload(file):
+            try:
+                archive = zipfile.ZipFile(file.file)
+            except zipfile.BadZipFile:
+                rejected.append(schemas.UploadBatchRejected(filename=filename, error="無效的 ZIP 檔案"))
+                continue
+            archives.append(archive)
+            for info in archive.infolist():
+                name = os.path.basename(info.filename)
+                if info.is_dir() or not name or name.startswith("."):
+                    continue
+                if not _is_pdf_name(name):
+                    rejected.append(schemas.UploadBatchRejected(filename=info.filename, error="僅支援 PDF 檔案"))
+                    continue
+                if info.file_size > MAX_FILE_SIZE:
+                    rejected.append(schemas.UploadBatchRejected(
+                        filename=info.filename,
+                        error=f"檔案大小超過限制 ({MAX_FILE_SIZE // (1024 * 1024)} MB)"
+                    ))
+                    continue
+                entries.append((name, lambda a=archive, i=info: a.open(i)))
+        elif file.content_type == "application/pdf" or _is_pdf_name(filename):
+            entries.append((filename, lambda f=file: f.file))
+        else:
+            rejected.append(schemas.UploadBatchRejected(filename=filename, error="僅支援 PDF 檔案"))
+
+
+@router.post("/upload-batch", response_model=schemas.UploadBatchOut)
+async def upload_document_batch(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    批次上傳 PDF（多個檔案或 ZIP 壓縮檔）
+
+    - 每個檔案（或 ZIP 內的每個 PDF）串流上傳到 MinIO，同時最多 UPLOAD_BATCH_CONCURRENCY 個
+    - ZIP 目錄與內容在執行緒池中讀取，文檔記錄與 RAG 任務以單一交易批次寫入
+    - 個別檔案失敗不影響其他檔案，會列在 rejected 中
+    - 以 GET /api/documents/upload-batch/{batch_id} 查詢整批處理進度
+    """
+    bucket = os.getenv("MINIO_BUCKET")
+    s3_client = get_s3_client()
+
+    entries = []
+    rejected = []
+    archives = []
+    try:
+        await run_in_threadpool(_expand_upload_files, files, entries, rejected, archives)
+
+        if len(entries) > MAX_BATCH_FILES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"單次批次上傳最多 {MAX_BATCH_FILES} 個檔案（收到 {len(entries)} 個）"
+            )
+        if not entries:
+            raise HTTPException(status_code=400, detail="沒有可上傳的 PDF 檔案")
+
+        semaphore = asyncio.Semaphore(UPLOAD_BATCH_CONCURRENCY)
+
+        def upload_entry(filename, open_entry, object_key):
+            fileobj = open_entry()
+            try:
+                return upload_fileobj_to_minio(
+                    s3_client, bucket, fileobj, object_key, "application/pdf",
+                    MAX_FILE_SIZE, UPLOAD_READ_SIZE
+                )
+            finally:
+                # ZIP 內的項目需關閉；UploadFile 由 FastAPI 關閉
+                if isinstance(fileobj, zipfile.ZipExtFile):
+                    fileobj.close()
+
+        async def upload_one(filename, open_entry):
+            object_key = f"uploads/{uuid.uuid4()}_{filename}"
+            async with semaphore:
+                try:
+                    size, content_hash = await run_in_threadpool(upload_entry, filename, open_entry, object_key)
+                    return filename, object_key, size, content_hash, None
+                except UploadTooLargeError as e:
+                    return filename, object_key, 0, None, str(e)
+                except Exception as e:
+                    logger.warning(f"Batch upload failed for {filename}: {e}")
+                    return filename, object_key, 0, None, f"上傳失敗: {str(e)[:200]}"
+
+        results = await asyncio.gather(*(upload_one(name, open_entry) for name, open_entry in entries))
+    finally:
+        for archive in archives:
+            archive.close()
+
+    # 單一交易寫入批次、文檔與 upload 事件
+    batch = models.UploadBatch(created_by=current_user.id)
+    db.add(batch)
+    db.flush()
+
+    documents = []
+    for filename, object_key, size, content_hash, error in results:
+        if error:
+            rejected.append(schemas.UploadBatchRejected(filename=filename, error=error))
+            continue
+        doc = models.Document(
+            id=str(uuid.uuid4()),
+            project_id=None,
+            title=os.path.splitext(filename)[0] or filename,
+            object_key=object_key,
+            content_type="application/pdf",
+            size=size,
+            type="pdf",
+            raw_preview=None,
+            content_hash=content_hash,
+            batch_id=batch.id,
+            rag_status="pending",
+        )
+        documents.append(doc)
+        db.add(doc)
+        db.add(models.RagProcessingLog(
+            document_id=doc.id,
+            stage="upload",
+            status="success",
+            message="檔案上傳完成，等待處理",
+            metadata_={"size": size, "batch_id": batch.id},
+        ))
+
+    batch.total_count = len(documents)
+    batch.rejected_count = len(rejected)
+    db.commit()
+
+    document_ids = [doc.id for doc in documents]
+    if RAG_PROCESSING_MODE == "background":
+        for document_id in document_ids:
+            background_tasks.add_task(process_rag_from_storage, document_id)
+    else:
+        enqueue_rag_jobs(db, document_ids)
+
+    logger.info(
+        f"Upload batch {batch.id}: {len(document_ids)} documents queued, {len(rejected)} rejected"
     )
 
+    return schemas.UploadBatchOut(
+        batch_id=batch.id,
+        total_count=len(document_ids),
+        document_ids=document_ids,
+        rejected=rejected,
+    )
+
+
+@router.get("/upload-batch/{batch_id}", response_model=schemas.UploadBatchProgressOut)
+def get_upload_batch_progress(
+    batch_id: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """查詢批次上傳的整體 RAG 處理進度"""
+    batch = db.query(models.UploadBatch).filter(models.UploadBatch.id == batch_id).first()
+    if not batch:
+        raise HTTPException(status_code=404, detail="Upload batch not found")
+
+    counts = dict(
+        db.query(models.Document.rag_status, func.count(models.Document.id))
+        .filter(models.Document.batch_id == batch_id)
+        .group_by(models.Document.rag_status)
+        .all()
+    )
+    completed = counts.get("completed", 0)
+    failed = counts.get("failed", 0)
+    processing = counts.get("processing", 0) + counts.get("partial", 0)
+    queued = counts.get("pending", 0)
+
+    # 全部處理完畢時以最後一筆完成/失敗事件計算耗時，否則以目前時間計算
+    end_time = datetime.utcnow()
+    if queued == 0 and processing == 0:
+        last_event = db.query(func.max(models.RagProcessingLog.created_at)).join(
+            models.Document, models.Document.id == models.RagProcessingLog.document_id
+        ).filter(
+            models.Document.batch_id == batch_id,
+            models.RagProcessingLog.stage.in_(("complete", "failed")),
+        ).scalar()
+        if last_event:
+            end_time = last_event
+
+    elapsed = max((end_time - batch.created_at).total_seconds(), 0)
+    docs_per_minute = (completed + failed) / (elapsed / 60) if elapsed > 0 else 0
+
+    return schemas.UploadBatchProgressOut(
+        batch_id=batch.id,
+        total_count=batch.total_count or 0,
+        queued=queued,
+        processing=processing,
+        completed=completed,
+        failed=failed,
+        elapsed_seconds=round(elapsed, 1),
+        docs_per_minute=round(docs_per_minute, 2),
+        created_at=int(batch.created_at.timestamp() * 1000),
+    )
+
+
 @router.post("/bind")
 def bind_documents(
     payload: dict,
@@ -399,6 +673,7 @@ def update_document(
         highlights=highlights,
         rag_status=doc.rag_status or "pending",
         chunk_count=doc.chunk_count or 0,
+        pages_indexed=doc.pages_indexed or 0,
     )
 
 @router.post("/{doc_id}/highlights", response_model=schemas.HighlightOut)
@@ -507,6 +782,79 @@ def get_document_rag_logs(
     ]
 
 
+@router.get("/{doc_id}/layout", response_model=schemas.DocumentLayoutLookupOut)
+def lookup_document_layout(
+    doc_id: str,
+    page: int = Query(..., ge=1),
+    x: Optional[float] = Query(None),
+    y: Optional[float] = Query(None),
+    width: Optional[float] = Query(None, ge=0),
+    height: Optional[float] = Query(None, ge=0),
+    text: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Highlight 座標與文本互查
+
+    - 提供 x/y/width/height（相對座標 0-1）：返回矩形內的文本
+    - 提供 text：返回片段在頁面上的區塊座標
+    """
+    doc = db.query(models.Document).filter(models.Document.id == doc_id).first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    # 驗證權限
+    if current_user.role == "student":
+        if doc.project_id:
+            cohort_ids = [m.cohort_id for m in current_user.memberships]
+            cohorts = db.query(models.Cohort).filter(models.Cohort.id.in_(cohort_ids)).all()
+            project_ids = {c.project_id for c in cohorts if c.project_id}
+            if doc.project_id not in project_ids:
+                raise HTTPException(status_code=403, detail="Forbidden")
+
+    has_rect = None not in (x, y, width, height)
+    if not has_rect and not text:
+        raise HTTPException(status_code=400, detail="請提供 x/y/width/height 或 text")
+    if doc.type != "pdf" or not doc.object_key:
+        raise HTTPException(status_code=400, detail="僅支援 PDF 文檔")
+    if not doc.content_hash:
+        raise HTTPException(status_code=409, detail="文檔尚未處理完成")
+
+    try:
+        layout = get_page_layout(doc.content_hash, doc.object_key, page)
+    except Exception as e:
+        logger.error(f"Failed to load layout for document {doc_id}: {e}")
+        raise HTTPException(status_code=500, detail="無法解析文檔版面")
+    if layout is None:
+        raise HTTPException(status_code=404, detail="Page not found")
+
+    def _block_out(index: int) -> schemas.LayoutBlockOut:
+        bx, by, bw, bh = layout.box(index)
+        start, end = layout.span(index)
+        return schemas.LayoutBlockOut(x=bx, y=by, width=bw, height=bh, start=start, end=end)
+
+    if has_rect:
+        indices = layout.blocks_in_rect(x, y, width, height)
+        return schemas.DocumentLayoutLookupOut(
+            page=page,
+            text=layout.text_of(indices),
+            blocks=[_block_out(i) for i in indices],
+        )
+
+    found = layout.find_text(text)
+    if found is None:
+        return schemas.DocumentLayoutLookupOut(page=page)
+    start, end = found
+    return schemas.DocumentLayoutLookupOut(
+        page=page,
+        text=layout.content[start:end],
+        start=start,
+        end=end,
+        blocks=[_block_out(i) for i in layout.blocks_for_range(start, end)],
+    )
+
+
 @router.delete("/{doc_id}")
 def delete_document(
     doc_id: str,
@@ -0,0 +1,148 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from sqlalchemy import func, Float, Integer
+from datetime import datetime, timedelta
+from typing import Optional
+from db import get_db
+import models
+import schemas
+from auth import get_current_user
+from rag.parsers.sandbox import FAILURE_KINDS
+from rag.embedding import get_embedding_client
+from rag.query_cache import get_query_embedding_cache
+
+router = APIRouter(prefix="/api/rag", tags=["rag"])
+
+# 可彙總的指標（對應 RagProcessingLog.metadata 中由 rag.metrics.stage_metrics 寫入的欄位）
+METRIC_FIELDS = (
+    "duration_ms",
+    "peak_rss_mb",
+    "input_bytes",
+    "input_chars",
+    "chunk_count",
+    "embedding_tokens",
+    "retries",
+)
+
+
+@router.get("/metrics", response_model=schemas.RagMetricsOut)
+def get_rag_metrics(
+    hours: float = Query(24, gt=0, le=24 * 90, description="統計的時間範圍（小時）"),
+    metric: str = Query("duration_ms", description="要計算百分位數的指標"),
+    stage: Optional[str] = Query(None, description="只統計指定階段"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """
+    RAG 處理各階段的 p50/p95/p99 統計
+
+    以 RagProcessingLog 中成功事件的 metadata 計算，
+    complete 階段代表整份文檔的總耗時，failed 階段代表失敗前的耗時。
+    """
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Only teacher can view RAG metrics")
+    if metric not in METRIC_FIELDS:
+        raise HTTPException(status_code=400, detail=f"metric 必須是 {', '.join(METRIC_FIELDS)} 之一")
+
+    since = datetime.utcnow() - timedelta(hours=hours)
+    log = models.RagProcessingLog
+    value = log.metadata_[metric].astext.cast(Float)
+    tokens = func.coalesce(func.sum(log.metadata_["embedding_tokens"].astext.cast(Integer)), 0)
+    retries = func.coalesce(func.sum(log.metadata_["retries"].astext.cast(Integer)), 0)
+
+    query = db.query(
+        log.stage,
+        func.count(log.id),
+        func.percentile_cont(0.5).within_group(value),
+        func.percentile_cont(0.95).within_group(value),
+        func.percentile_cont(0.99).within_group(value),
+        func.avg(value),
+        func.max(value),
+        tokens,
+        retries,
+    ).filter(
+        log.created_at >= since,
+        log.metadata_.has_key(metric),
+    )
+    if stage:
+        query = query.filter(log.stage == stage)
+
+    rows = query.group_by(log.stage).order_by(log.stage).all()
+
+    def _round(v):
+        return round(float(v), 2) if v is not None else None
+
+    return schemas.RagMetricsOut(
+        metric=metric,
+        window_hours=hours,
+        since=int(since.timestamp() * 1000),
+        stages=[
+            schemas.RagStageMetricsOut(
+                stage=row[0],
+                count=row[1],
+                p50=_round(row[2]),
+                p95=_round(row[3]),
+                p99=_round(row[4]),
+                mean=_round(row[5]),
+                max=_round(row[6]),
+                total_embedding_tokens=int(row[7] or 0),
+                total_retries=int(row[8] or 0),
+            )
+            for row in rows
+        ],
+    )
+
+
+@router.get("/parser-sandbox", response_model=schemas.ParserSandboxStatsOut)
+def get_parser_sandbox_stats(
+    hours: float = Query(24, gt=0, le=24 * 90, description="統計的時間範圍（小時）"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """
+    PDF 解析沙箱的失敗次數（逾時、CPU / 記憶體超限、行程被終止或異常結束）
+
+    以 failed 事件 metadata 中的 sandbox_failure 統計，涵蓋所有 API 與 worker 行程。
+    """
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Only teacher can view RAG metrics")
+
+    since = datetime.utcnow() - timedelta(hours=hours)
+    log = models.RagProcessingLog
+    kind = log.metadata_["sandbox_failure"].astext
+    rows = db.query(kind, func.count(log.id)).filter(
+        log.created_at >= since,
+        log.stage == "failed",
+        log.metadata_.has_key("sandbox_failure"),
+    ).group_by(kind).all()
+
+    failures = {k: 0 for k in FAILURE_KINDS}
+    failures.update({row[0]: row[1] for row in rows})
+
+    return schemas.ParserSandboxStatsOut(
+        window_hours=hours,
+        since=int(since.timestamp() * 1000),
+        failures=failures,
+    )
+
+
+@router.get("/query-cache", response_model=schemas.QueryEmbeddingCacheStatsOut)
+def get_query_cache_stats(
+    current_user: models.User = Depends(get_current_user),
+):
+    """對話查詢向量快取的命中統計與未命中查詢的微批次統計（僅此 API 行程）"""
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Only teacher can view RAG metrics")
+
+    cache = get_query_embedding_cache()
+    try:
+        batcher = get_embedding_client().query_batcher
+    except ValueError:  # Embedding 端點未設定
+        batcher = None
+    return schemas.QueryEmbeddingCacheStatsOut(
+        enabled=cache.max_entries > 0,
+        max_entries=cache.max_entries,
+        ttl_seconds=cache.ttl_seconds,
+        batcher=batcher.stats() if batcher is not None else {},
+        **cache.stats(),
+    )
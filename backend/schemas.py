@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import List, Optional, Any, TYPE_CHECKING
+from typing import Dict, List, Optional, Any, TYPE_CHECKING
 from pydantic import BaseModel, Field
 
 if TYPE_CHECKING:
@@ -71,13 +71,40 @@ class DocumentOut(BaseModel):
     raw_preview: Optional[str] = None
     highlights: List["HighlightOut"] = Field(default_factory=list)
     # RAG 相關欄位
-    rag_status: str = "pending"  # pending|processing|completed|failed
+    rag_status: str = "pending"  # pending|processing|partial|completed|failed
     chunk_count: int = 0
+    pages_indexed: int = 0
 
     class Config:
         from_attributes = True
 
 
+class UploadBatchRejected(BaseModel):
+    filename: str
+    error: str
+
+
+class UploadBatchOut(BaseModel):
+    """批次上傳結果"""
+    batch_id: str
+    total_count: int
+    document_ids: List[str] = Field(default_factory=list)
+    rejected: List[UploadBatchRejected] = Field(default_factory=list)
+
+
+class UploadBatchProgressOut(BaseModel):
+    """批次上傳的 RAG 處理進度"""
+    batch_id: str
+    total_count: int
+    queued: int = 0
+    processing: int = 0
+    completed: int = 0
+    failed: int = 0
+    elapsed_seconds: float = 0
+    docs_per_minute: float = 0
+    created_at: int
+
+
 class DocumentChunkOut(BaseModel):
     """文檔切片輸出格式"""
     id: str
@@ -329,6 +356,30 @@ class WorkflowStateOut(BaseModel):
         from_attributes = True
 
 
+class LayoutBlockOut(BaseModel):
+    """版面區塊：相對座標（0-1）與在頁面文本中的字元範圍"""
+    x: float
+    y: float
+    width: float
+    height: float
+    start: int
+    end: int
+
+
+class DocumentLayoutLookupOut(BaseModel):
+    """
+    Highlight 座標與文本互查結果
+
+    - 以座標查詢：text 為矩形內的文本，blocks 為相交的區塊
+    - 以文本查詢：start/end 為片段在頁面文本中的位置，blocks 為涵蓋片段的區塊
+    """
+    page: int
+    text: str = ""
+    start: Optional[int] = None
+    end: Optional[int] = None
+    blocks: List[LayoutBlockOut] = Field(default_factory=list)
+
+
 class RagProcessingLogOut(BaseModel):
     id: str
     document_id: str
@@ -343,6 +394,60 @@ class RagProcessingLogOut(BaseModel):
         populate_by_name = True
 
 
+class RagStageMetricsOut(BaseModel):
+    """單一 RAG 處理階段的百分位數統計"""
+    stage: str
+    count: int
+    p50: Optional[float] = None
+    p95: Optional[float] = None
+    p99: Optional[float] = None
+    mean: Optional[float] = None
+    max: Optional[float] = None
+    total_embedding_tokens: int = 0
+    total_retries: int = 0
+
+
+class RagMetricsOut(BaseModel):
+    metric: str
+    window_hours: float
+    since: int
+    stages: List[RagStageMetricsOut] = Field(default_factory=list)
+
+
+class ParserSandboxStatsOut(BaseModel):
+    """
+    PDF 解析沙箱的失敗統計
+
+    failures：時間範圍內因沙箱失敗而處理失敗的文檔數（依失敗類型，由處理事件彙總，涵蓋所有行程）
+    """
+    window_hours: float
+    since: int
+    failures: Dict[str, int] = Field(default_factory=dict)
+
+
+class QueryEmbeddingCacheStatsOut(BaseModel):
+    """
+    對話查詢向量快取的統計（API 行程自啟動以來）
+
+    - coalesced：等待同一查詢進行中請求的次數（未另外呼叫 API）
+    - hit_rate：(hits + coalesced) / 查詢次數
+    - batcher：未命中查詢的微批次統計（queries / batches / mean_batch_size 等）
+    """
+    enabled: bool
+    max_entries: int
+    ttl_seconds: float
+    size: int
+    inflight: int
+    hits: int
+    misses: int
+    coalesced: int
+    expired: int
+    evictions: int
+    errors: int
+    hit_rate: float
+    batcher: Dict[str, float] = Field(default_factory=dict)
+
+
 # Rebuild forward refs (required for ForwardRef)
 # This must be called after all models are defined
 # Try Pydantic v2 method first, then fall back to v1
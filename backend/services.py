@@ -1,6 +1,8 @@
 import os
 import uuid
+import hashlib
 import logging
+from typing import Tuple
 import httpx
 import boto3
 from botocore.client import Config
@@ -87,6 +89,161 @@ def presign_get(object_key: str):
     return url
 
 
+def ensure_bucket(client, bucket: str) -> None:
+    """確保 bucket 存在，不存在時嘗試建立"""
+    try:
+        client.head_bucket(Bucket=bucket)
+    except client.exceptions.ClientError:
+        try:
+            client.create_bucket(Bucket=bucket)
+        except Exception as create_err:
+            print(f"Warning: Could not create bucket {bucket}: {create_err}")
+
+
+def ensure_default_bucket() -> None:
+    """
+    啟動時確認 MINIO_BUCKET 存在（上傳路徑不再逐次檢查）
+
+    MinIO 暫時無法連線時只記錄警告，不阻止 API 啟動。
+    """
+    bucket = os.getenv("MINIO_BUCKET")
+    if not bucket:
+        return
+    try:
+        ensure_bucket(get_s3_client(), bucket)
+    except Exception as e:
+        logger.warning(f"Could not verify MinIO bucket {bucket}: {e}")
+
+
+# Multipart 上傳的分段大小（S3 規定除最後一段外至少 5 MB）
+MULTIPART_PART_SIZE = max(
+    int(os.getenv("UPLOAD_PART_SIZE_MB", "5")), 5
+) * 1024 * 1024
+
+
+class S3MultipartUpload:
+    """
+    S3/MinIO multipart 上傳封裝
+
+    所有方法皆為同步的 boto3 呼叫，在 async 路由中應透過 run_in_threadpool 執行，
+    避免阻塞 event loop。
+    """
+
+    def __init__(self, client, bucket: str, object_key: str, content_type: str):
+        self.client = client
+        self.bucket = bucket
+        self.object_key = object_key
+        self.content_type = content_type
+        self.upload_id = None
+        self.parts = []
+
+    def start(self) -> None:
+        response = self.client.create_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.object_key,
+            ContentType=self.content_type,
+        )
+        self.upload_id = response["UploadId"]
+
+    def upload_part(self, data: bytes) -> None:
+        part_number = len(self.parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.object_key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+    def complete(self) -> None:
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.object_key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts},
+        )
+
+    def abort(self) -> None:
+        if not self.upload_id:
+            return
+        try:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.object_key,
+                UploadId=self.upload_id,
+            )
+        except Exception as e:
+            logger.warning(f"Failed to abort multipart upload {self.object_key}: {e}")
+
+
+class UploadTooLargeError(ValueError):
+    """上傳檔案超過大小限制"""
+
+
+def upload_fileobj_to_minio(
+    client,
+    bucket: str,
+    fileobj,
+    object_key: str,
+    content_type: str,
+    max_size: int,
+    read_size: int = 1024 * 1024,
+    copy_to=None
+) -> Tuple[int, str]:
+    """
+    從同步檔案物件串流上傳到 MinIO（multipart），同時計算大小與 SHA-256
+
+    同步函數，在 async 路由中應透過 run_in_threadpool 執行。記憶體中最多只保留一個分段。
+
+    Args:
+        client: S3 客戶端
+        bucket: bucket 名稱
+        fileobj: 可讀取的檔案物件（如 UploadFile.file 或 ZipFile.open 的結果）
+        object_key: 物件 key
+        content_type: Content-Type
+        max_size: 大小上限（bytes）
+        read_size: 每次讀取的大小
+        copy_to: 可寫入的檔案物件（可選），同時寫入一份副本（例如 background 模式的臨時檔案）
+
+    Returns:
+        Tuple[int, str]: (檔案大小, SHA-256)
+
+    Raises:
+        UploadTooLargeError: 超過大小上限
+    """
+    upload = S3MultipartUpload(client, bucket, object_key, content_type)
+    hasher = hashlib.sha256()
+    total_size = 0
+
+    upload.start()
+    try:
+        part = bytearray()
+        while True:
+            chunk = fileobj.read(read_size)
+            if not chunk:
+                break
+            total_size += len(chunk)
+            if total_size > max_size:
+                raise UploadTooLargeError(f"檔案大小超過限制 ({max_size // (1024 * 1024)} MB)")
+            hasher.update(chunk)
+            if copy_to is not None:
+                copy_to.write(chunk)
+            part += chunk
+            if len(part) >= MULTIPART_PART_SIZE:
+                upload.upload_part(bytes(part))
+                part = bytearray()
+
+        if part or not upload.parts:
+            upload.upload_part(bytes(part))
+        upload.complete()
+    except Exception:
+        upload.abort()
+        raise
+
+    return total_size, hasher.hexdigest()
+
+
 # --- Azure OpenAI ---
 class AzureOpenAIClient:
     def __init__(self) -> None:
@@ -0,0 +1,30 @@
+"""
+測試設定
+
+測試於 backend 目錄執行（python -m pytest -q），模組以 backend 為根目錄匯入。
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+import pytest
+
+
+def build_pdf(page_texts) -> bytes:
+    """以 PyMuPDF 產生每頁含指定文字的 PDF"""
+    doc = fitz.open()
+    for text in page_texts:
+        page = doc.new_page()
+        page.insert_text((72, 72), text)
+    try:
+        return doc.tobytes()
+    finally:
+        doc.close()
+
+
+@pytest.fixture
+def make_pdf():
+    return build_pdf
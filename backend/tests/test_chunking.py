@@ -0,0 +1,187 @@
+"""
+文本切分測試
+
+chunk_text 改為線性時間實作後，切分位置與內容須與原本的實作完全相同；
+頁碼則以移除標記後的位置計算（原實作在標記之後的頁碼對應有偏移）。
+"""
+
+import random
+import re
+
+import pytest
+
+from rag.chunking import ChunkingConfig, _TextWindow, chunk_text, iter_chunks
+from rag.parsers import build_content
+
+_MARKER_RE = re.compile(r"\[Page (\d+)\]\n?")
+
+_WORDS = ["研究", "文獻", "分析", "the", "study", "of", "data", "。", "，", ".", ",", "!", "？", "；", "\n", " ", " ", "x" * 30]
+
+
+def _baseline_boundary(text: str, start: int, end: int, min_size: int) -> int:
+    """原實作的 _find_sentence_boundary"""
+    search_start = max(start + min_size, end - 100)
+    for delimiter in ['。', '！', '？', '.', '!', '?', '；', ';', '，', ',', '\n', ' ']:
+        pos = text.rfind(delimiter, search_start, end)
+        if pos > start + min_size:
+            return pos + 1
+    return end
+
+
+def baseline_split(content: str, config: ChunkingConfig):
+    """原實作（二次方時間）的切分結果：[(content, char_start, char_end)]"""
+    clean = _MARKER_RE.sub("", content)
+    if not clean.strip():
+        return []
+    chunks = []
+    current_pos = 0
+    while current_pos < len(clean):
+        end_pos = min(current_pos + config.chunk_size, len(clean))
+        if end_pos < len(clean):
+            end_pos = _baseline_boundary(clean, current_pos, end_pos, config.min_chunk_size)
+        chunk_content = clean[current_pos:end_pos].strip()
+        if len(chunk_content) < config.min_chunk_size and current_pos + config.chunk_size < len(clean):
+            current_pos = end_pos
+            continue
+        if chunk_content:
+            chunks.append((chunk_content, current_pos, end_pos))
+        if end_pos >= len(clean):
+            break
+        current_pos = end_pos - config.chunk_overlap
+        last_chunk_start = chunks[-1][1] if chunks else 0
+        if current_pos <= last_chunk_start:
+            current_pos = end_pos
+    return chunks
+
+
+def reference_pages(content: str, start: int, end: int):
+    """以移除標記後的位置計算 [start, end) 涵蓋的頁碼"""
+    pages = []
+    removed = 0
+    for match in _MARKER_RE.finditer(content):
+        pages.append([int(match.group(1)), match.start() - removed])
+        removed += match.end() - match.start()
+    length = len(content) - removed
+    if not pages:
+        return [1]
+    found = set()
+    for i, (page, page_start) in enumerate(pages):
+        page_end = pages[i + 1][1] if i + 1 < len(pages) else length
+        if start < page_end and end > page_start:
+            found.add(page)
+    return sorted(found) or [1]
+
+
+def random_content(rng: random.Random) -> str:
+    prefix = "".join(rng.choice(_WORDS) for _ in range(rng.randint(0, 5))) if rng.random() < 0.2 else ""
+    pages = [
+        f"[Page {page + 1}]\n" + "".join(rng.choice(_WORDS) for _ in range(rng.randint(0, 200)))
+        for page in range(rng.randint(0, 12))
+    ]
+    return prefix + "\n\n".join(pages)
+
+
+def random_config(rng: random.Random) -> ChunkingConfig:
+    return ChunkingConfig(
+        chunk_size=rng.choice([50, 120, 500]),
+        chunk_overlap=rng.choice([0, 10, 50]),
+        min_chunk_size=rng.choice([0, 10, 30, 100]),
+    )
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_chunk_text_matches_baseline(seed):
+    """隨機文本與設定下，切分內容與位置和原實作相同"""
+    rng = random.Random(seed)
+    for _ in range(300):
+        content = random_content(rng)
+        config = random_config(rng)
+        chunks = chunk_text(content, None, config)
+        assert [(c.content, c.char_start, c.char_end) for c in chunks] == baseline_split(content, config)
+        assert [c.index for c in chunks] == list(range(len(chunks)))
+        for chunk in chunks:
+            assert chunk.page_numbers == reference_pages(content, chunk.char_start, chunk.char_end)
+
+
+def test_page_numbers_follow_clean_positions():
+    """標記移除後，第二頁開頭的 chunk 不會被誤判為第一頁"""
+    content = "[Page 1]\n" + "a" * 300 + "\n\n[Page 2]\n" + "b" * 300
+    chunks = chunk_text(content, None, ChunkingConfig(chunk_size=200, chunk_overlap=0, min_chunk_size=50))
+    assert [(c.char_start, c.page_numbers) for c in chunks] == [(0, [1]), (200, [1]), (302, [2]), (502, [2])]
+
+
+def random_pages(rng: random.Random):
+    return [
+        {"page_number": page + 1, "content": "".join(rng.choice(_WORDS) for _ in range(rng.choice([0, 1, 5, 50, 300])))}
+        for page in range(rng.randint(0, 15))
+    ]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_iter_chunks_matches_chunk_text(seed):
+    """逐頁切分的結果與 chunk_text(build_content(pages)) 相同（含空白頁）"""
+    rng = random.Random(100 + seed)
+    for _ in range(300):
+        pages = random_pages(rng)
+        config = random_config(rng)
+        expected = chunk_text(build_content(pages), None, config)
+        actual = list(iter_chunks(iter(pages), config))
+        assert [(c.index, c.content, c.char_start, c.char_end, c.page_numbers) for c in actual] == \
+            [(c.index, c.content, c.char_start, c.char_end, c.page_numbers) for c in expected]
+
+
+def test_iter_chunks_reads_pages_lazily():
+    """第一個 chunk 產出時只讀入了前幾頁"""
+    consumed = []
+
+    def pages():
+        for number in range(1, 10001):
+            consumed.append(number)
+            yield {"page_number": number, "content": f"第 {number} 頁。" * 40}
+
+    first = next(iter_chunks(pages(), ChunkingConfig()))
+    assert first.page_numbers[0] == 1
+    assert len(consumed) <= 5
+
+
+def test_text_window_discards_consumed_text():
+    """捨棄之後，位置仍以整份文本計算，索引只保留視窗內的部分"""
+    window = _TextWindow()
+    window.append(1, "第一句。" * 50)
+    window.append(None, "\n\n")
+    window.append(2, "second. " * 50)
+    total = window.end
+
+    window.discard_before(total - 10)
+    assert window.offset == total - 10
+    assert window.end == total
+    assert window.slice(total - 8, total) == "second. "
+    assert all(p >= total - 10 for positions in window.delimiters for p in positions)
+    assert window.pages_for_range(total - 10, total) == [2]
+
+
+def test_text_window_keeps_small_discards_in_place():
+    """可捨棄的部分未超過一半時不搬移文本"""
+    window = _TextWindow()
+    window.append(1, "abcdefghij")
+    window.discard_before(3)
+    assert window.offset == 0
+    assert window.slice(3, 6) == "def"
+
+
+def test_text_window_boundary_priority():
+    """句號優先於逗號，同一優先級取最靠後者"""
+    window = _TextWindow()
+    window.append(1, "aaaa。bbbb，cccc。dddd，eeee")
+    assert window.find_boundary(0, window.end, 0) == 15
+    assert window.find_boundary(0, window.end, 15) == 20
+
+
+def test_empty_content():
+    assert chunk_text("") == []
+    assert chunk_text("[Page 1]\n   \n") == []
+
+
+def test_invalid_size_unit():
+    with pytest.raises(ValueError):
+        chunk_text("[Page 1]\ntext", None, ChunkingConfig(size_unit="words"))
@@ -0,0 +1,69 @@
+"""
+文檔來源與解析器輸入測試
+"""
+
+import hashlib
+import io
+import os
+
+import pytest
+
+from rag.parsers.pymupdf_parser import iter_pages, parse_pdf
+from rag.parsers.source import DocumentSource, as_document_source
+
+
+def test_bytes_and_memoryview_are_not_copied(make_pdf):
+    data = make_pdf(["first page"])
+    assert DocumentSource.from_bytes(data).data is data
+    assert DocumentSource.from_bytes(memoryview(data)).data is data
+    # 部分 memoryview 與 bytearray 需要轉成 bytes
+    assert DocumentSource.from_bytes(memoryview(data)[:10]).data == data[:10]
+    assert DocumentSource.from_bytes(bytearray(data)).data == data
+
+
+def test_sources_agree_on_hash_size_and_pages(tmp_path, make_pdf):
+    data = make_pdf(["first page", "second page"])
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(data)
+    expected_hash = hashlib.sha256(data).hexdigest()
+
+    sources = [
+        DocumentSource.from_bytes(data),
+        DocumentSource.from_path(str(path)),
+        DocumentSource.from_mmap(str(path)),
+        DocumentSource.from_stream(io.BytesIO(data)),
+    ]
+    for source in sources:
+        with source:
+            assert source.content_hash() == expected_hash
+            assert source.size == len(data)
+            assert [p["content"].strip() for p in iter_pages(source)] == ["first page", "second page"]
+    assert path.exists()
+
+
+def test_owned_path_is_removed_on_close(tmp_path, make_pdf):
+    path = tmp_path / "spool.pdf"
+    path.write_bytes(make_pdf(["x"]))
+    with DocumentSource.from_mmap(str(path), owns_path=True) as source:
+        assert source.is_file_backed
+    assert not path.exists()
+
+
+def test_parse_pdf_accepts_bytes(make_pdf):
+    result = parse_pdf(make_pdf(["alpha", "beta"]))
+    assert result["success"]
+    assert result["metadata"]["file_path"] == "<memory>"
+    assert [p["content"].strip() for p in result["pages"]] == ["alpha", "beta"]
+
+
+def test_parse_pdf_reports_missing_and_corrupt_sources(tmp_path):
+    missing = parse_pdf(os.path.join(tmp_path, "missing.pdf"))
+    assert not missing["success"] and "檔案不存在" in missing["error"]
+    assert not parse_pdf(b"not a pdf")["success"]
+
+
+def test_unsupported_source_type():
+    with pytest.raises(TypeError):
+        as_document_source(123)
+    with pytest.raises(ValueError):
+        DocumentSource()
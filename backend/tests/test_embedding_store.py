@@ -0,0 +1,62 @@
+"""
+Embedding 向量儲存測試
+
+編碼與查詢邏輯以 SQLite 驗證；寫入使用 Postgres 的 ON CONFLICT，需在 Postgres 上執行。
+"""
+
+import math
+
+import pytest
+from sqlalchemy import create_engine, insert
+
+import models
+from rag.embedding_store import EmbeddingStore, decode_vector, encode_vector, text_hash
+
+
+def test_float16_roundtrip():
+    vector = [0.0, 1.0, -1.0, 0.5, -0.123456, 0.0009765625]
+    blob = encode_vector(vector)
+    assert len(blob) == 2 * len(vector)
+    decoded = decode_vector(blob)
+    assert len(decoded) == len(vector)
+    for original, restored in zip(vector, decoded):
+        assert math.isclose(original, restored, rel_tol=1e-3, abs_tol=1e-4)
+
+
+def test_float16_is_little_endian():
+    assert encode_vector([1.0]) == b"\x00\x3c"
+
+
+def test_text_hash_is_sha256_hex():
+    assert text_hash("abc") == "ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad"
+
+
+@pytest.fixture
+def store():
+    engine = create_engine("sqlite://")
+    table = models.EmbeddingVector.__table__
+    table.create(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(table), [
+            {"deployment": "dep", "dimensions": 2, "text_hash": text_hash("a"), "vector": encode_vector([1.0, 0.0])},
+            {"deployment": "dep", "dimensions": 2, "text_hash": text_hash("b"), "vector": encode_vector([0.0, 1.0])},
+            # 其他設定的向量不會被讀到
+            {"deployment": "dep", "dimensions": 3, "text_hash": text_hash("a"), "vector": encode_vector([1.0, 0.0, 0.0])},
+            {"deployment": "other", "dimensions": 2, "text_hash": text_hash("c"), "vector": encode_vector([0.5, 0.5])},
+        ])
+    return EmbeddingStore(engine, table, "dep", 2)
+
+
+def test_get_many_only_returns_hits_for_this_setting(store):
+    assert store.get_many(["a", "b", "c", "a"]) == {"a": [1.0, 0.0], "b": [0.0, 1.0]}
+    assert store.get_many([]) == {}
+
+
+def test_iter_vectors_and_count(store):
+    batches = list(store.iter_vectors(batch_size=1))
+    assert [keys for keys, _ in batches] == [[key] for key in sorted([text_hash("a"), text_hash("b")])]
+    assert store.count() == 2
+
+
+def test_put_hashed_skips_wrong_dimensions(store):
+    assert store.put_hashed({"x": [1.0, 2.0, 3.0]}) == 0
@@ -0,0 +1,62 @@
+"""
+PDF 控制代碼池與逐頁讀取測試
+"""
+
+import os
+
+import pytest
+
+from rag.parsers.handle_pool import DocumentHandlePool, get_handle_pool, reset_handle_pool
+from rag.parsers.pymupdf_parser import extract_page_text, extract_pages
+
+
+@pytest.fixture
+def pdf_path(tmp_path, make_pdf):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(make_pdf(["page one", "page two", "page three"]))
+    reset_handle_pool()
+    yield str(path)
+    reset_handle_pool()
+
+
+def test_extract_pages_reuses_handle_and_memo(pdf_path):
+    texts = extract_pages(pdf_path, [2, 1, 2, 9])
+    assert [t.strip() if t else t for t in texts] == ["page two", "page one", "page two", None]
+
+    pool = get_handle_pool()
+    key = pool.file_key(pdf_path)
+    assert len(pool._handles) == 1
+    assert pool.get_text(key, 0).strip() == "page one"
+    assert extract_page_text(pdf_path, 3).strip() == "page three"
+    assert len(pool._handles) == 1
+
+
+def test_changed_file_gets_new_key(pdf_path, make_pdf):
+    assert extract_page_text(pdf_path, 1).strip() == "page one"
+    stat = os.stat(pdf_path)
+    with open(pdf_path, "wb") as f:
+        f.write(make_pdf(["rewritten page"]))
+    os.utime(pdf_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert extract_page_text(pdf_path, 1).strip() == "rewritten page"
+
+
+def test_missing_file_returns_none(tmp_path):
+    assert extract_page_text(str(tmp_path / "missing.pdf"), 1) is None
+
+
+def test_pool_evicts_and_closes_oldest_handle(tmp_path, make_pdf):
+    pool = DocumentHandlePool(max_handles=1, max_pages=1)
+    keys = []
+    for name in ("a", "b"):
+        path = tmp_path / f"{name}.pdf"
+        path.write_bytes(make_pdf([name]))
+        keys.append(pool.file_key(str(path)))
+
+    first = pool.use(keys[0], lambda doc: doc)
+    assert pool.use(keys[1], lambda doc: len(doc)) == 1
+    assert first.is_closed and list(pool._handles) == [keys[1]]
+
+    pool.put_text(keys[0], 0, "a")
+    pool.put_text(keys[1], 0, "b")
+    assert pool.get_text(keys[0], 0) is None and pool.get_text(keys[1], 0) == "b"
+    pool.clear()
@@ -0,0 +1,143 @@
+"""
+增量索引測試
+"""
+
+from collections import Counter
+
+from rag.indexing import IncrementalIndexer, assign_chunk_ids, compute_chunk_hash
+
+
+class FakeEmbeddingClient:
+    deployment = "test-deployment"
+
+    def __init__(self):
+        self.embedded = []
+
+    def get_embedding_dimension(self):
+        return 4
+
+    def embed_texts(self, texts, usage=None):
+        self.embedded.extend(texts)
+        return [[float(len(text)), 0.0, 0.0, 1.0] for text in texts]
+
+
+class FakeVectorStore:
+    def __init__(self):
+        self.chunks = {}
+
+    def get_chunk_metadata(self, document_id):
+        return {
+            chunk_id: dict(metadata) for chunk_id, metadata in self.chunks.items()
+            if metadata["document_id"] == document_id
+        }
+
+    def _metadata(self, document_id, chunk):
+        return {
+            "document_id": document_id,
+            "chunk_index": chunk["index"],
+            "page_numbers": ",".join(map(str, chunk["page_numbers"])),
+            "content": chunk["content"],
+        }
+
+    def add_chunks(self, document_id, chunks, embeddings):
+        for chunk in chunks:
+            self.chunks[chunk["chunk_id"]] = self._metadata(document_id, chunk)
+        return len(chunks)
+
+    def update_chunk_metadata(self, document_id, chunks):
+        for chunk in chunks:
+            self.chunks[chunk["chunk_id"]] = self._metadata(document_id, chunk)
+
+    def delete_chunks(self, chunk_ids):
+        for chunk_id in chunk_ids:
+            del self.chunks[chunk_id]
+
+
+def make_chunks(contents_with_pages):
+    return [
+        {"index": i, "content": content, "page_numbers": pages}
+        for i, (content, pages) in enumerate(contents_with_pages)
+    ]
+
+
+def index_document(store, client, chunk_data, document_id="doc"):
+    indexer = IncrementalIndexer(document_id, store, client)
+    embeddings = indexer.embed(chunk_data)
+    indexer.store(chunk_data, embeddings)
+    indexer.finish()
+    return indexer
+
+
+def test_assign_chunk_ids_numbers_repeated_content():
+    chunks = [{"content": "same"}, {"content": "other"}, {"content": "same"}]
+    occurrences = Counter()
+    assign_chunk_ids("doc", chunks[:2], "dep:4", occurrences)
+    # 分批呼叫時共用出現次數
+    assign_chunk_ids("doc", chunks[2:], "dep:4", occurrences)
+
+    base = f"doc_{compute_chunk_hash('same', 'dep:4')[:24]}"
+    assert chunks[0]["chunk_id"] == base
+    assert chunks[2]["chunk_id"] == f"{base}_1"
+    assert chunks[0]["content_hash"] == chunks[2]["content_hash"]
+    assert compute_chunk_hash("same", "dep:4") != compute_chunk_hash("same", "dep:8")
+
+
+def test_unchanged_chunks_reuse_vectors_and_moved_chunks_update_metadata():
+    store, client = FakeVectorStore(), FakeEmbeddingClient()
+    first = index_document(store, client, make_chunks([("alpha", [1]), ("beta", [1]), ("gamma", [2])]))
+    assert first.embedded_count == 3 and first.reused_count == 0
+
+    client.embedded.clear()
+    # 在開頭插入段落：其餘 chunks 平移，只需計算新的一段
+    second = index_document(
+        store, client, make_chunks([("intro", [1]), ("alpha", [1]), ("beta", [2]), ("delta", [3])])
+    )
+    assert client.embedded == ["intro", "delta"]
+    assert second.reused_count == 2 and second.deleted_count == 1
+
+    by_content = {m["content"]: m for m in store.chunks.values()}
+    assert sorted(by_content) == ["alpha", "beta", "delta", "intro"]
+    assert by_content["alpha"]["chunk_index"] == 1
+    assert by_content["beta"]["page_numbers"] == "2"
+
+
+def test_other_documents_are_untouched():
+    store, client = FakeVectorStore(), FakeEmbeddingClient()
+    index_document(store, client, make_chunks([("alpha", [1])]), document_id="a")
+    index_document(store, client, make_chunks([("alpha", [1])]), document_id="b")
+    index_document(store, client, make_chunks([("beta", [1])]), document_id="a")
+    assert sorted((m["document_id"], m["content"]) for m in store.chunks.values()) == [
+        ("a", "beta"), ("b", "alpha")
+    ]
+
+
+def test_delete_stale_removes_replaced_pages_before_finish():
+    store, client = FakeVectorStore(), FakeEmbeddingClient()
+    index_document(store, client, make_chunks([("old-1", [1]), ("keep", [2]), ("old-3", [3]), ("moved", [3])]))
+
+    client.embedded.clear()
+    indexer = IncrementalIndexer("doc", store, client)
+    wave = make_chunks([("new-1", [1]), ("keep", [2])])
+    indexer.store(wave, indexer.embed(wave))
+
+    # 前兩頁已寫入：只刪除起始頁在範圍內的舊 chunks
+    assert indexer.delete_stale(2) == 1
+    assert sorted(m["content"] for m in store.chunks.values()) == ["keep", "moved", "new-1", "old-3"]
+
+    # 已刪除的內容在之後的頁面再次出現時重新計算 Embedding
+    rest = make_chunks([("keep", [2]), ("moved", [3]), ("old-1", [4])])[1:]
+    for i, chunk in enumerate(rest, start=2):
+        chunk["index"] = i
+    indexer.store(rest, indexer.embed(rest))
+    assert client.embedded == ["new-1", "old-1"]
+
+    assert indexer.finish() == 2
+    assert sorted(m["content"] for m in store.chunks.values()) == ["keep", "moved", "new-1", "old-1"]
+
+
+def test_chunks_without_pages_are_deleted_only_on_finish():
+    store, client = FakeVectorStore(), FakeEmbeddingClient()
+    store.chunks["doc_legacy"] = {"document_id": "doc", "chunk_index": 0, "page_numbers": "", "content": "x"}
+    indexer = IncrementalIndexer("doc", store, client)
+    assert indexer.delete_stale(100) == 0
+    assert indexer.finish() == 1 and not store.chunks
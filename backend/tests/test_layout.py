@@ -0,0 +1,86 @@
+"""
+版面感知解析與區塊索引測試
+"""
+
+import random
+from array import array
+
+import fitz  # PyMuPDF
+
+from rag.parsers.layout import BLOCK_SEPARATOR, PageLayout, parse_pdf_layout
+
+
+def make_layout(count: int, seed: int = 0) -> PageLayout:
+    rng = random.Random(seed)
+    parts, boxes, spans = [], array("f"), array("i")
+    offset = 0
+    for i in range(count):
+        text = f"block {i} " + "x" * rng.randint(0, 20)
+        if parts:
+            offset += len(BLOCK_SEPARATOR)
+        parts.append(text)
+        x0, y0 = rng.random() * 0.8, rng.random() * 0.9
+        boxes.extend((x0, y0, x0 + rng.random() * 0.2, y0 + rng.random() * 0.1))
+        spans.extend((offset, offset + len(text)))
+        offset += len(text)
+    return PageLayout(BLOCK_SEPARATOR.join(parts), boxes, spans)
+
+
+def test_blocks_in_rect_matches_full_scan():
+    layout = make_layout(200)
+    rng = random.Random(1)
+    for _ in range(300):
+        x, y, w, h = rng.random(), rng.random(), rng.random() * 0.3, rng.random() * 0.3
+        expected = [
+            i for i in range(len(layout))
+            if layout.boxes[i * 4 + 1] <= y + h and layout.boxes[i * 4 + 3] >= y
+            and layout.boxes[i * 4] <= x + w and layout.boxes[i * 4 + 2] >= x
+        ]
+        assert layout.blocks_in_rect(x, y, w, h) == expected
+
+
+def test_offsets_map_to_blocks():
+    layout = make_layout(20)
+    for i in range(len(layout)):
+        start, end = layout.span(i)
+        assert layout.content[start:end].startswith(f"block {i} ")
+        assert layout.block_at_offset(start) == i
+        assert layout.block_at_offset(end - 1) == i
+        assert layout.blocks_for_range(start, end) == [i]
+    # 分隔符不屬於任何區塊
+    assert layout.block_at_offset(layout.span(0)[1]) is None
+    assert layout.blocks_for_range(layout.span(1)[0], layout.span(3)[0] + 1) == [1, 2, 3]
+
+
+def test_find_text_ignores_whitespace_differences():
+    layout = PageLayout("alpha beta\ngamma", array("f", [0, 0, 1, 1]), array("i", [0, 16]))
+    assert layout.find_text("beta") == (6, 10)
+    assert layout.find_text("beta  gamma") == (6, 16)
+    assert layout.find_text("delta") is None and layout.find_text("  ") is None
+
+
+def test_serialization_round_trip():
+    layout = make_layout(5)
+    restored = PageLayout.from_dict(layout.content, layout.to_dict())
+    assert restored.spans == layout.spans
+    assert all(abs(a - b) < 1e-4 for a, b in zip(restored.boxes, layout.boxes))
+
+
+def test_parse_pdf_layout_indexes_blocks():
+    doc = fitz.open()
+    page = doc.new_page(width=600, height=800)
+    page.insert_text((60, 100), "Top paragraph")
+    page.insert_text((60, 700), "Bottom paragraph")
+    data = doc.tobytes()
+    doc.close()
+
+    result = parse_pdf_layout(data)
+    assert result["success"] and result["metadata"]["parser"] == "pymupdf_layout"
+    page = result["pages"][0]
+    assert page["content"] == f"Top paragraph{BLOCK_SEPARATOR}Bottom paragraph"
+
+    layout = PageLayout.from_dict(page["content"], page["layout"])
+    assert layout.text_in_rect(0, 0, 1, 0.5) == "Top paragraph"
+    assert layout.text_in_rect(0, 0.5, 1, 0.5) == "Bottom paragraph"
+    x, y, width, height = layout.box(1)
+    assert 0.05 < x < 0.15 and 0.8 < y < 0.9 and width > 0 and height > 0
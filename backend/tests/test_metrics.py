@@ -0,0 +1,52 @@
+"""
+RAG 處理指標測試
+"""
+
+import threading
+import time
+
+from rag.metrics import EmbeddingUsage, StageTimer, peak_rss_mb, stage_metrics
+
+
+def test_embedding_usage_counts_retries():
+    usage = EmbeddingUsage()
+
+    def worker():
+        for _ in range(1000):
+            usage.add_request()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for _ in range(3000):
+        usage.add_batch(2)
+    usage.add_throttle()
+    usage.add_store_hits(5)
+
+    assert usage.to_dict() == {
+        "embedding_batches": 3000,
+        "embedding_requests": 4000,
+        "embedding_tokens": 6000,
+        "retries": 1000,
+        "throttled": 1,
+        "embedding_store_hits": 5,
+    }
+    # 全部由儲存取得時沒有請求，重試數不為負
+    assert EmbeddingUsage(batches=2).retries == 0
+
+
+def test_stage_timer_accumulates_only_measured_time():
+    timer = StageTimer()
+    for _ in range(2):
+        with timer.measure():
+            time.sleep(0.02)
+        time.sleep(0.05)
+    assert 40 <= timer.duration_ms < 90
+
+
+def test_stage_metrics_includes_peak_memory():
+    metrics = stage_metrics(12, chunk_count=3)
+    assert metrics["duration_ms"] == 12 and metrics["chunk_count"] == 3
+    assert 0 < metrics["peak_rss_mb"] <= peak_rss_mb()
@@ -0,0 +1,90 @@
+"""
+文本正規化測試
+"""
+
+from rag.normalize import (
+    NormalizeConfig,
+    NormalizeStats,
+    detect_boilerplate,
+    normalize_page_text,
+    normalize_pages,
+)
+
+
+_BODY = ["Scaffolding", "Novice readers", "Prior studies", "Method", "Findings", "Discussion",
+         "Limitations", "Coding scheme", "Interviews", "Conclusion"]
+
+
+def make_pages(count: int = 6):
+    return [
+        {
+            "page_number": n,
+            "content": (
+                f"Journal of Learning Sciences, Vol. {n}\n"
+                f"{_BODY[n - 1]} opens the page\n"
+                f"{_BODY[n - 1].lower()} continues here\n"
+                f"and ends on this line about {_BODY[n - 1].lower()}\n"
+                f"Copyright 2024 Example Press\n"
+                f"- {n} -"
+            ),
+        }
+        for n in range(1, count + 1)
+    ]
+
+
+def test_detect_boilerplate_ignores_numbers_and_position():
+    boilerplate = detect_boilerplate(make_pages())
+    assert ("head", "journal of learning sciences, vol. #") in boilerplate
+    assert ("foot", "copyright # example press") in boilerplate
+    # 只出現在頁首的行不視為頁尾
+    assert ("foot", "journal of learning sciences, vol. #") not in boilerplate
+
+
+def test_detect_boilerplate_requires_min_pages():
+    assert detect_boilerplate(make_pages(2)) == set()
+
+
+def test_normalize_page_text_strips_boilerplate_and_page_numbers():
+    pages = make_pages()
+    stats = NormalizeStats()
+    text = normalize_page_text(pages[2]["content"], detect_boilerplate(pages), stats)
+    assert text == "Prior studies opens the page\nprior studies continues here\nand ends on this line about prior studies"
+    assert stats.boilerplate_lines == 2
+    assert stats.page_number_lines == 1
+    assert stats.removed_chars == len(pages[2]["content"]) - len(text)
+
+
+def test_normalize_page_text_joins_hyphenated_words():
+    stats = NormalizeStats()
+    text = normalize_page_text("line one\nan exam-\nple of this\nrange 1-\n5 items", set(), stats)
+    assert text == "line one\nan example of this\nrange 1-\n5 items"
+    assert stats.hyphen_joins == 1
+
+
+def test_normalize_page_text_applies_nfkc():
+    text = normalize_page_text("line one\nｆｕｌｌ ｗｉｄｔｈ ﬁle\nline three", set(), NormalizeStats())
+    assert text == "line one\nfull width file\nline three"
+
+
+def test_page_number_only_removed_at_edges():
+    """正文中單獨一行的數字不視為頁碼"""
+    content = "a\nb\nc\n42\nd\ne\nf"
+    text = normalize_page_text(content, set(), NormalizeStats(), NormalizeConfig(edge_lines=1))
+    assert text == content
+
+
+def test_normalize_pages_streaming_sample():
+    """只以前幾頁判斷頁首頁尾時，其後的頁面也套用同一組規則"""
+    pages = make_pages(10)
+    stats = NormalizeStats()
+    result = list(normalize_pages(iter(pages), stats, NormalizeConfig(sample_pages=5)))
+    assert [p["page_number"] for p in result] == list(range(1, 11))
+    assert result[9]["content"].startswith("Conclusion opens the page")
+    assert stats.boilerplate_lines == 20
+    # 不修改輸入
+    assert pages[0]["content"].startswith("Journal")
+
+
+def test_normalize_pages_keeps_layout_pages():
+    pages = [{**page, "layout": {"blocks": []}} for page in make_pages()]
+    assert list(normalize_pages(pages, NormalizeStats())) == pages
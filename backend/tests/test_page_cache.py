@@ -0,0 +1,65 @@
+"""
+解析結果快取測試
+"""
+
+import os
+
+from rag.page_cache import PageCache
+
+PAGES = [
+    {"page_number": 1, "content": "第一頁"},
+    {"page_number": 2, "content": "second page", "layout": {"boxes": [1.0, 2.0]}},
+]
+
+
+def test_round_trip_and_single_page(tmp_path):
+    cache = PageCache(str(tmp_path), max_bytes=1 << 20, memory_entries=0)
+    assert cache.get_pages("hash", "v1") is None
+
+    cache.put_pages("hash", "v1", PAGES)
+    assert cache.get_pages("hash", "v1") == PAGES
+    assert cache.get_page_text("hash", "v1", 1) == "第一頁"
+    assert cache.get_page_text("hash", "v1", 3) is None
+    # 解析器版本不同時不命中
+    assert cache.get_pages("hash", "v2") is None
+
+    cache.invalidate("hash", "v1")
+    assert cache.get_pages("hash", "v1") is None
+
+
+def test_tee_commits_only_complete_iterations(tmp_path):
+    cache = PageCache(str(tmp_path), max_bytes=1 << 20, memory_entries=0)
+
+    partial = cache.tee_pages(iter(PAGES), "partial", "v1")
+    next(partial)
+    partial.close()
+    assert cache.get_pages("partial", "v1") is None
+
+    assert list(cache.tee_pages(iter(PAGES), "full", "v1")) == PAGES
+    assert cache.get_pages("full", "v1") == PAGES
+    # 不留下臨時檔案
+    assert sorted(os.listdir(tmp_path)) == ["full-v1.jsonl.gz"]
+
+
+def test_evicts_least_recently_used_files(tmp_path):
+    cache = PageCache(str(tmp_path), max_bytes=1 << 20, memory_entries=0)
+    pages = [{"page_number": 1, "content": os.urandom(3000).hex()}]
+    cache.put_pages("a", "v1", pages)
+    size = os.path.getsize(cache._path(cache.make_key("a", "v1")))
+    cache.max_bytes = size * 2
+
+    cache.put_pages("b", "v1", pages)
+    os.utime(cache._path(cache.make_key("a", "v1")), (1, 1))
+    os.utime(cache._path(cache.make_key("b", "v1")), (2, 2))
+    cache.put_pages("c", "v1", pages)
+
+    assert cache.get_pages("a", "v1") is None
+    assert cache.get_pages("b", "v1") == pages
+    assert cache.get_pages("c", "v1") == pages
+
+
+def test_memory_entries_skip_disk(tmp_path):
+    cache = PageCache(str(tmp_path), max_bytes=1 << 20, memory_entries=1)
+    cache.put_pages("hash", "v1", PAGES)
+    os.unlink(cache._path(cache.make_key("hash", "v1")))
+    assert cache.get_pages("hash", "v1") == PAGES
@@ -0,0 +1,78 @@
+"""
+串流處理管線測試
+"""
+
+import random
+
+import pytest
+
+from rag.chunking import ChunkingConfig, chunk_text
+from rag.parsers.pymupdf_parser import build_content
+from rag.pipeline import PipelineConfig, run_streaming_pipeline
+
+
+def random_pages(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    words = ["alpha", "beta", "gamma.", "delta,", "epsilon!", "研究", "方法。"]
+    return [
+        {"page_number": i + 1, "content": " ".join(rng.choice(words) for _ in range(rng.randint(0, 300)))}
+        for i in range(count)
+    ]
+
+
+def fake_embed(chunk_data):
+    return [[float(c["index"])] for c in chunk_data]
+
+
+@pytest.mark.parametrize("config", [
+    PipelineConfig(queue_size=1, page_window=1, embed_batch_size=3),
+    PipelineConfig(queue_size=4, page_window=8, embed_batch_size=16, embed_batch_tokens=300, embed_concurrency=3),
+])
+def test_streaming_matches_batch_chunking(config):
+    pages = random_pages(30)
+    stored = []
+
+    def store(chunk_data, embeddings):
+        assert [e[0] for e in embeddings] == [float(c["index"]) for c in chunk_data]
+        stored.extend(chunk_data)
+        return len(chunk_data)
+
+    result = run_streaming_pipeline(iter(pages), fake_embed, store, ChunkingConfig(), config)
+    expected = chunk_text(build_content(pages), pages, ChunkingConfig())
+
+    assert [(c["content"], c["page_numbers"]) for c in stored] == [
+        (c.content, c.page_numbers) for c in expected
+    ]
+    assert [r["index"] for r in result.chunk_records] == list(range(len(expected)))
+    assert result.page_count == 30 and result.chunk_count == result.indexed_count == len(expected)
+    assert result.char_count == sum(len(p["content"]) for p in pages)
+
+
+def test_embed_error_stops_pipeline_and_closes_pages():
+    closed = []
+
+    def pages():
+        try:
+            yield from random_pages(1000)
+        finally:
+            closed.append(True)
+
+    def failing_embed(chunk_data):
+        raise RuntimeError("embedding failed")
+
+    with pytest.raises(RuntimeError, match="embedding failed"):
+        run_streaming_pipeline(pages(), failing_embed, lambda c, e: len(c), ChunkingConfig(), PipelineConfig())
+    assert closed == [True]
+
+
+def test_store_error_is_raised():
+    def failing_store(chunk_data, embeddings):
+        raise ValueError("store failed")
+
+    with pytest.raises(ValueError, match="store failed"):
+        run_streaming_pipeline(iter(random_pages(20)), fake_embed, failing_store)
+
+
+def test_embedding_count_mismatch():
+    with pytest.raises(ValueError):
+        run_streaming_pipeline(iter(random_pages(5)), lambda c: [], lambda c, e: len(c))
@@ -0,0 +1,165 @@
+"""
+量化向量索引與向量維度轉換測試
+"""
+
+import numpy as np
+import pytest
+
+from rag.quantized_index import (
+    QuantizedIndex,
+    bytes_per_vector,
+    normalize_rows,
+    quantize,
+    quantized_scores,
+)
+from rag.reproject import reproject_document
+
+
+def random_unit_vectors(count: int, dimensions: int, seed: int = 0) -> np.ndarray:
+    return normalize_rows(np.random.default_rng(seed).standard_normal((count, dimensions)))
+
+
+def test_normalize_rows_keeps_zero_vectors():
+    rows = normalize_rows([[3.0, 4.0], [0.0, 0.0]])
+    assert np.allclose(rows, [[0.6, 0.8], [0.0, 0.0]])
+
+
+def test_int8_quantization_preserves_dot_products():
+    vectors = random_unit_vectors(200, 64)
+    codes, scales = quantize(vectors, "int8")
+    assert codes.dtype == np.int8 and codes.shape == (200, 64)
+    assert np.abs(codes).max() == 127
+
+    query = vectors[0]
+    approx = quantized_scores(query, codes, scales, "int8")
+    assert np.allclose(approx, vectors @ query, atol=0.02)
+    assert int(np.argmax(approx)) == 0
+
+
+def test_binary_scores_are_negative_hamming_distances():
+    vectors = np.array([[1.0, -1.0, 1.0, -1.0], [-1.0, 1.0, -1.0, 1.0], [1.0, 1.0, 1.0, -1.0]])
+    codes, scales = quantize(vectors, "binary")
+    assert codes.shape == (3, 1) and scales.size == 0
+    assert quantized_scores(vectors[0], codes, scales, "binary").tolist() == [0.0, -4.0, -1.0]
+
+
+def test_zero_vector_int8():
+    codes, scales = quantize(np.zeros((1, 4)), "int8")
+    assert not codes.any() and scales.tolist() == [1.0]
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        quantize(np.ones((1, 4)), "pq")
+
+
+def test_bytes_per_vector():
+    assert bytes_per_vector(3072, "none") == 12288
+    assert bytes_per_vector(3072, "int8") == 3076
+    assert bytes_per_vector(3072, "binary") == 384
+    assert bytes_per_vector(10, "binary") == 2
+
+
+class CountingLoader:
+    def __init__(self, documents):
+        self.documents = documents
+        self.calls = 0
+
+    def __call__(self, document_id):
+        self.calls += 1
+        ids, vectors = self.documents.get(document_id, ([], np.empty((0, 8))))
+        return ids, vectors
+
+
+def test_quantized_index_candidates_and_rebuild(tmp_path):
+    vectors = random_unit_vectors(20, 8, seed=1)
+    documents = {
+        "doc-a": ([f"a{i}" for i in range(10)], vectors[:10]),
+        "doc-b": ([f"b{i}" for i in range(10)], vectors[10:]),
+    }
+    loader = CountingLoader(documents)
+    index = QuantizedIndex(str(tmp_path), "int8", loader)
+
+    candidates = index.candidates(["doc-a", "doc-b", "doc-a"], vectors[12].tolist(), limit=3)
+    assert len(candidates) == 3 and candidates[0] == "b2"
+    assert index.candidates(["doc-a"], vectors[3].tolist(), limit=50)[0] == "a3"
+    assert loader.calls == 2
+
+    # 其他行程寫入後更新版本檔：記憶體與磁碟上的結果都失效
+    documents["doc-a"] = (["a-new"], vectors[:1])
+    QuantizedIndex.touch(str(tmp_path), ["doc-a"])
+    assert index.candidates(["doc-a"], vectors[0].tolist(), limit=5) == ["a-new"]
+    assert loader.calls == 3
+
+    # 新的實例讀取磁碟上的量化結果，不需重新載入
+    fresh = QuantizedIndex(str(tmp_path), "int8", loader)
+    assert fresh.candidates(["doc-a"], vectors[0].tolist(), limit=5) == ["a-new"]
+    assert loader.calls == 3
+
+
+def test_quantized_index_empty_document(tmp_path):
+    index = QuantizedIndex(str(tmp_path), "binary", CountingLoader({}))
+    assert index.candidates(["missing"], [1.0] * 8, limit=3) == []
+
+
+class FakeCollection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def get(self, where, include):
+        rows = [row for row in self.rows if row[1]["document_id"] == where["document_id"]]
+        return {
+            "ids": [row[0] for row in rows],
+            "metadatas": [row[1] for row in rows],
+            "documents": [row[2] for row in rows],
+            "embeddings": [row[3] for row in rows],
+        }
+
+
+class FakeStore:
+    def __init__(self, dimensions, rows=()):
+        self.dimensions = dimensions
+        self.collection = FakeCollection(list(rows))
+        self.added = {}
+        self.deleted = []
+
+    def delete_document(self, document_id):
+        self.deleted.append(document_id)
+
+    def add_chunks(self, document_id, chunks, embeddings):
+        self.added[document_id] = (chunks, embeddings)
+        return len(chunks)
+
+
+def test_reproject_document_truncates_and_renormalizes():
+    full = random_unit_vectors(2, 16, seed=2)
+    source = FakeStore(16, [
+        ("old-1", {"document_id": "doc", "chunk_index": 1, "page_numbers": "2,3"}, "second", full[1].tolist()),
+        ("old-0", {"document_id": "doc", "chunk_index": 0, "page_numbers": "1"}, "first", full[0].tolist()),
+    ])
+    target = FakeStore(4)
+
+    assert reproject_document(source, target, "doc", "dep:4") == 2
+    chunks, embeddings = target.added["doc"]
+    assert target.deleted == ["doc"]
+    assert [c["content"] for c in chunks] == ["first", "second"]
+    assert chunks[1]["page_numbers"] == [2, 3]
+    assert all(c["chunk_id"].startswith("doc_") for c in chunks)
+    assert np.allclose(embeddings, normalize_rows(full[:, :4]))
+
+
+def test_vector_writes_skip_version_files_without_quantization(tmp_path, monkeypatch):
+    from rag.vector_store import VectorStore
+
+    monkeypatch.delenv("RAG_QUANTIZED_DIR", raising=False)
+    chunk = {"index": 0, "content": "x", "page_numbers": [1]}
+    store = VectorStore(persist_directory=str(tmp_path / "chroma"), dimensions=4, quantization="none")
+    store.add_chunks("doc-a", [chunk], [[1.0, 0.0, 0.0, 0.0]])
+    assert not (tmp_path / "chroma" / "quantized").exists()
+
+    # 量化目錄已存在（曾經或其他行程啟用量化檢索）時仍更新版本檔
+    quantized = VectorStore(persist_directory=str(tmp_path / "chroma"), dimensions=4, quantization="int8")
+    quantized.add_chunks("doc-b", [chunk], [[0.0, 1.0, 0.0, 0.0]])
+    store.add_chunks("doc-a", [chunk], [[0.0, 0.0, 1.0, 0.0]])
+    versions = sorted(p.name for p in (tmp_path / "chroma" / "quantized").rglob("*.version"))
+    assert versions == ["doc-a.version", "doc-b.version"]
@@ -0,0 +1,57 @@
+"""
+查詢向量微批次測試
+"""
+
+import asyncio
+
+from rag.query_batcher import QueryMicroBatcher
+
+
+class FakeBatchEmbedder:
+    def __init__(self, fail: bool = False):
+        self.batches = []
+        self.fail = fail
+
+    async def __call__(self, texts):
+        self.batches.append(list(texts))
+        if self.fail:
+            raise RuntimeError("batch failed")
+        return [[float(len(text))] for text in texts]
+
+
+def test_concurrent_queries_share_one_request():
+    async def run():
+        embed = FakeBatchEmbedder()
+        batcher = QueryMicroBatcher(embed, max_wait_ms=20, max_items=32)
+        results = await asyncio.gather(*(batcher.embed(text) for text in ["a", "bb", "a", "ccc"]))
+        return embed, results, batcher.stats()
+
+    embed, results, stats = asyncio.run(run())
+    assert embed.batches == [["a", "bb", "ccc"]]  # 相同文本只送出一次
+    assert results == [[1.0], [2.0], [1.0], [3.0]]
+    assert stats["batches"] == 1 and stats["max_batch_size"] == 4
+
+
+def test_max_items_flushes_immediately():
+    async def run():
+        embed = FakeBatchEmbedder()
+        batcher = QueryMicroBatcher(embed, max_wait_ms=10_000, max_items=2)
+        results = await asyncio.wait_for(
+            asyncio.gather(*(batcher.embed(text) for text in ["a", "b", "c", "d"])), timeout=5
+        )
+        return embed, results
+
+    embed, results = asyncio.run(run())
+    assert embed.batches == [["a", "b"], ["c", "d"]]
+    assert results == [[1.0]] * 4
+
+
+def test_batch_failure_reaches_every_caller():
+    async def run():
+        batcher = QueryMicroBatcher(FakeBatchEmbedder(fail=True), max_wait_ms=1)
+        results = await asyncio.gather(batcher.embed("a"), batcher.embed("b"), return_exceptions=True)
+        return results, batcher.stats()
+
+    results, stats = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert stats["errors"] == 1
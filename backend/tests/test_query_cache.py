@@ -0,0 +1,128 @@
+"""
+查詢向量快取測試
+"""
+
+import asyncio
+
+import pytest
+
+from rag.query_cache import QueryEmbeddingCache, normalize_query
+
+
+class FakeEmbedder:
+    """記錄呼叫次數的向量化函數（等待 release 後才返回）"""
+
+    def __init__(self):
+        self.calls = []
+        self.release = asyncio.Event()
+
+    async def __call__(self, query: str):
+        self.calls.append(query)
+        await self.release.wait()
+        if query == "boom":
+            raise RuntimeError("embedding failed")
+        return [float(len(self.calls)), 0.5]
+
+
+def test_normalize_query():
+    assert normalize_query("  Hello\t  World ") == "hello world"
+    assert normalize_query("ＡＢＣ　研究") == "abc 研究"
+
+
+def test_single_flight_coalesces_concurrent_requests():
+    async def run():
+        cache = QueryEmbeddingCache(max_entries=8, ttl_seconds=60)
+        embed = FakeEmbedder()
+        tasks = [
+            asyncio.create_task(cache.get_or_embed(query, "dep", embed))
+            for query in ["Hi  there", "hi there", "ＨＩ there"] * 5
+        ]
+        await asyncio.sleep(0)
+        embed.release.set()
+        results = await asyncio.gather(*tasks)
+        return embed, results, cache.stats()
+
+    embed, results, stats = asyncio.run(run())
+    assert len(embed.calls) == 1
+    assert all(result == [1.0, 0.5] for result in results)
+    assert stats["misses"] == 1 and stats["coalesced"] == 14
+    assert stats["inflight"] == 0 and stats["size"] == 1
+
+
+def test_errors_are_shared_and_not_cached():
+    async def run():
+        cache = QueryEmbeddingCache(max_entries=8, ttl_seconds=60)
+        embed = FakeEmbedder()
+        tasks = [asyncio.create_task(cache.get_or_embed("boom", "dep", embed)) for _ in range(3)]
+        await asyncio.sleep(0)
+        embed.release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        # 失敗不寫入快取，下一次重新呼叫
+        with pytest.raises(RuntimeError):
+            await cache.get_or_embed("boom", "dep", embed)
+        return embed, results, cache.stats()
+
+    embed, results, stats = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert len(embed.calls) == 2
+    assert stats["errors"] == 2 and stats["size"] == 0
+
+
+def test_ttl_lru_and_deployment_key():
+    async def run():
+        now = [0.0]
+        cache = QueryEmbeddingCache(max_entries=2, ttl_seconds=10, clock=lambda: now[0])
+        embed = FakeEmbedder()
+        embed.release.set()
+
+        await cache.get_or_embed("a", "dep", embed)
+        await cache.get_or_embed("a", "dep", embed)          # 命中
+        await cache.get_or_embed("a", "other-dep", embed)    # 不同部署
+        await cache.get_or_embed("b", "dep", embed)          # 超過上限，最久未使用的 (dep, a) 被淘汰
+        await cache.get_or_embed("a", "dep", embed)
+        now[0] = 11
+        await cache.get_or_embed("a", "dep", embed)          # 過期
+        return embed, cache.stats()
+
+    embed, stats = asyncio.run(run())
+    assert embed.calls == ["a", "a", "b", "a", "a"]
+    assert stats["hits"] == 1 and stats["expired"] == 1 and stats["evictions"] >= 1
+
+
+def test_disabled_cache_always_calls():
+    async def run():
+        cache = QueryEmbeddingCache(max_entries=0)
+        embed = FakeEmbedder()
+        embed.release.set()
+        for _ in range(3):
+            await cache.get_or_embed("a", "dep", embed)
+        return embed
+
+    assert len(asyncio.run(run()).calls) == 3
+
+
+def test_embedding_dimensions_are_part_of_the_key():
+    from rag.indexing import get_embedding_key
+
+    class FakeClient:
+        deployment = "dep"
+
+        def __init__(self, dimensions):
+            self.dimensions = dimensions
+
+        def get_embedding_dimension(self):
+            return self.dimensions
+
+    async def run():
+        cache = QueryEmbeddingCache(max_entries=8, ttl_seconds=60)
+        embed = FakeEmbedder()
+        embed.release.set()
+        # 同一部署、不同維度的向量不可互相重用
+        full = await cache.get_or_embed("a", get_embedding_key(FakeClient(3072)), embed)
+        reduced = await cache.get_or_embed("a", get_embedding_key(FakeClient(1024)), embed)
+        again = await cache.get_or_embed("a", get_embedding_key(FakeClient(1024)), embed)
+        return embed, full, reduced, again
+
+    embed, full, reduced, again = asyncio.run(run())
+    assert len(embed.calls) == 2
+    assert full != reduced and reduced == again
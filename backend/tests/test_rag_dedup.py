@@ -0,0 +1,102 @@
+"""
+內容相同文檔的去重測試（SQLite + 本地 ChromaDB）
+"""
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+
+import models
+import rag_services
+from rag.vector_store import VectorStore
+
+
+@compiles(JSONB, "sqlite")
+def _compile_jsonb_for_sqlite(type_, compiler, **kw):
+    # SQLite 沒有 JSONB，測試中以 JSON 欄位建立
+    return "JSON"
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = VectorStore(persist_directory=str(tmp_path / "chroma"), dimensions=4, quantization="none")
+    monkeypatch.setattr(rag_services, "get_vector_store", lambda: store)
+    return store
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(rag_services, "get_rag_fingerprint", lambda: "fp")
+    engine = create_engine("sqlite://")
+    for model in (models.Document, models.DocumentChunk, models.RagProcessingLog):
+        model.__table__.create(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def add_source(db, store, status="completed", fingerprint="fp"):
+    db.add(models.Document(
+        id="src", title="src", object_key="src.pdf", type="pdf", content_hash="h",
+        rag_status=status, rag_fingerprint=fingerprint, chunk_count=2, pages_indexed=3,
+    ))
+    db.add(models.Document(id="dup", title="dup", object_key="dup.pdf", type="pdf", content_hash="h"))
+    chunks = [
+        {"index": 0, "content": "first", "page_numbers": [1, 2], "content_hash": "c0", "chunk_id": "src_c0"},
+        {"index": 1, "content": "second", "page_numbers": [3], "content_hash": "c1", "chunk_id": "src_c1"},
+    ]
+    store.add_chunks("src", chunks, [[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0]])
+    rag_services.insert_chunk_records(db, "src", [
+        {"index": c["index"], "content_preview": c["content"], "page_numbers": c["page_numbers"],
+         "char_count": len(c["content"]), "content_hash": c["content_hash"]}
+        for c in chunks
+    ])
+    db.commit()
+
+
+def vectors(store, document_id):
+    results = store.collection.get(where={"document_id": document_id}, include=["embeddings", "metadatas"])
+    return {
+        chunk_id: (list(embedding), metadata["chunk_index"])
+        for chunk_id, embedding, metadata in zip(results["ids"], results["embeddings"], results["metadatas"])
+    }
+
+
+def test_clone_copies_chunk_rows_and_vectors_under_new_ids(db, store):
+    add_source(db, store)
+
+    assert rag_services.clone_rag_from_duplicate("dup", db)
+
+    doc = db.get(models.Document, "dup")
+    assert (doc.rag_status, doc.chunk_count, doc.pages_indexed, doc.rag_fingerprint) == ("completed", 2, 3, "fp")
+
+    rows = db.query(models.DocumentChunk).filter_by(document_id="dup").order_by(models.DocumentChunk.chunk_index).all()
+    assert [(r.id, r.content_preview, r.page_numbers, r.content_hash) for r in rows] == [
+        ("dup_0", "first", [1, 2], "c0"),
+        ("dup_1", "second", [3], "c1"),
+    ]
+    assert vectors(store, "dup") == {
+        "dup_c0": ([1.0, 0.0, 0.0, 0.0], 0),
+        "dup_c1": ([0.0, 1.0, 0.0, 0.0], 1),
+    }
+    # 來源文檔不受影響
+    assert set(vectors(store, "src")) == {"src_c0", "src_c1"}
+    assert db.query(models.DocumentChunk).filter_by(document_id="src").count() == 2
+
+    stages = [log.stage for log in db.query(models.RagProcessingLog).filter_by(document_id="dup")]
+    assert sorted(stages) == ["complete", "dedup"]
+
+
+@pytest.mark.parametrize("status, fingerprint", [("completed", "fp-old"), ("partial", "fp"), ("failed", "fp")])
+def test_clone_misses_without_completed_source_for_current_fingerprint(db, store, status, fingerprint):
+    add_source(db, store, status=status, fingerprint=fingerprint)
+
+    assert not rag_services.clone_rag_from_duplicate("dup", db)
+
+    doc = db.get(models.Document, "dup")
+    assert doc.rag_status != "completed" and not doc.chunk_count
+    assert vectors(store, "dup") == {}
+    assert db.query(models.DocumentChunk).filter_by(document_id="dup").count() == 0
+    assert db.query(models.RagProcessingLog).count() == 0
@@ -0,0 +1,71 @@
+"""
+RAG 事件與 chunk 記錄批次寫入測試（以記錄呼叫的假 session 驗證，不需要 Postgres）
+"""
+
+import pytest
+
+import models
+from rag_services import RagEventJournal, insert_chunk_records
+
+
+class RecordingSession:
+    def __init__(self, fail_commit: bool = False):
+        self.executed = []
+        self.commits = 0
+        self.fail_commit = fail_commit
+
+    def execute(self, statement, params):
+        self.executed.append((statement.table.name, params))
+
+    def commit(self):
+        if self.fail_commit:
+            raise RuntimeError("commit failed")
+        self.commits += 1
+
+
+def test_journal_writes_events_in_one_statement():
+    journal = RagEventJournal("doc")
+    journal.log("parsing", "success", "parsed", {"duration_ms": 5})
+    journal.log("chunking", "success")
+    db = RecordingSession()
+
+    assert journal.commit(db) == 2
+    (table, rows), = db.executed
+    assert table == models.RagProcessingLog.__tablename__
+    assert [(r["stage"], r["metadata_"]) for r in rows] == [("parsing", {"duration_ms": 5}), ("chunking", {})]
+    assert rows[0]["created_at"] <= rows[1]["created_at"]
+    assert len(journal) == 0 and db.commits == 1
+
+    # 沒有事件時仍提交 session 中的其他變更
+    assert journal.commit(db) == 0 and db.commits == 2 and len(db.executed) == 1
+
+
+def test_journal_keeps_events_when_commit_fails():
+    journal = RagEventJournal("doc")
+    journal.log("parsing", "success")
+    mark = len(journal)
+    journal.log("embedding", "success")
+
+    with pytest.raises(RuntimeError):
+        journal.commit(RecordingSession(fail_commit=True))
+    # rollback 後捨棄與被還原的變更對應的事件，其餘可再次寫入
+    journal.truncate(mark)
+    db = RecordingSession()
+    assert journal.commit(db) == 1
+    assert [r["stage"] for r in db.executed[0][1]] == ["parsing"]
+
+
+def test_insert_chunk_records_single_executemany():
+    db = RecordingSession()
+    assert insert_chunk_records(db, "doc", []) == 0 and not db.executed
+
+    records = [
+        {"index": 0, "content_preview": "a", "page_numbers": [1], "char_count": 1, "content_hash": "h0"},
+        {"index": 1, "content_preview": None, "page_numbers": [1, 2], "char_count": 0},
+    ]
+    assert insert_chunk_records(db, "doc", records) == 2
+    (table, rows), = db.executed
+    assert table == models.DocumentChunk.__tablename__
+    assert [r["id"] for r in rows] == ["doc_0", "doc_1"]
+    assert rows[1]["content_hash"] is None and rows[1]["page_numbers"] == [1, 2]
+    assert db.commits == 0
@@ -0,0 +1,147 @@
+"""
+RAG 任務佇列測試
+
+狀態轉換以 SQLite 驗證；SKIP LOCKED 與 advisory lock（RAG_MAX_RUNNING_JOBS）需在 Postgres 上執行。
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models
+import rag_jobs
+from rag_jobs import (
+    claim_rag_job,
+    complete_rag_job,
+    enqueue_rag_job,
+    enqueue_rag_jobs,
+    extend_rag_job_lease,
+    fail_rag_job,
+    RagJobLease,
+)
+
+
+@pytest.fixture
+def session_factory():
+    # 單一連線，讓不同 session（例如 heartbeat 執行緒）看到相同的資料
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    for model in (models.Document, models.RagJob):
+        model.__table__.create(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    for document_id in ("doc-a", "doc-b", "doc-c"):
+        session.add(models.Document(id=document_id, title=document_id, object_key=f"{document_id}.pdf", type="pdf"))
+    session.commit()
+    yield session
+    session.close()
+
+
+def test_enqueue_skips_documents_with_active_jobs(db):
+    job = enqueue_rag_job(db, "doc-a")
+    assert enqueue_rag_job(db, "doc-a").id == job.id
+    assert enqueue_rag_jobs(db, ["doc-a", "doc-b", "doc-c"]) == 2
+    assert enqueue_rag_jobs(db, []) == 0
+    assert db.query(models.RagJob).count() == 3
+
+
+def test_claim_sets_lease_and_reclaims_expired_jobs(db):
+    enqueue_rag_job(db, "doc-a")
+    job = claim_rag_job(db, "worker-1", visibility_timeout=60)
+    assert job.status == "running" and job.attempts == 1 and job.locked_by == "worker-1"
+    assert claim_rag_job(db, "worker-2") is None
+
+    # 前一個 worker 逾時未回報：其他 worker 可重新認領，原 worker 不再持有任務
+    job.locked_until = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+    reclaimed = claim_rag_job(db, "worker-2", visibility_timeout=60)
+    assert reclaimed.id == job.id and reclaimed.attempts == 2
+    assert not extend_rag_job_lease(db, job.id, "worker-1")
+    assert extend_rag_job_lease(db, job.id, "worker-2")
+
+    # 租約已遺失的 worker 不能覆寫任務狀態
+    assert not complete_rag_job(db, job, "worker-1")
+    assert not fail_rag_job(db, job, "worker-1", "stale")
+    assert reclaimed.status == "running" and reclaimed.last_error is None
+
+    assert complete_rag_job(db, reclaimed, "worker-2")
+    assert reclaimed.status == "succeeded" and reclaimed.locked_by is None
+    assert claim_rag_job(db, "worker-1") is None
+
+
+def test_failures_back_off_then_fail_permanently(db, monkeypatch):
+    monkeypatch.setattr(rag_jobs, "RETRY_BACKOFF_BASE", 30)
+    monkeypatch.setattr(rag_jobs, "RETRY_BACKOFF_MAX", 45)
+    enqueue_rag_job(db, "doc-a", max_attempts=3)
+    document = db.get(models.Document, "doc-a")
+    document.rag_status = "processing"
+    db.commit()
+
+    delays = []
+    for _ in range(2):
+        job = claim_rag_job(db, "worker-1")
+        before = datetime.utcnow()
+        assert fail_rag_job(db, job, "worker-1", "boom")
+        assert job.status == "queued" and document.rag_status == "pending"
+        delays.append(round((job.available_at - before).total_seconds()))
+        # 退避期間不可認領
+        assert claim_rag_job(db, "worker-1") is None
+        job.available_at = datetime.utcnow() - timedelta(seconds=1)
+        db.commit()
+    assert delays == [30, 45]
+
+    job = claim_rag_job(db, "worker-1")
+    assert fail_rag_job(db, job, "worker-1", "x" * 1000)
+    assert job.status == "failed" and job.attempts == 3 and len(job.last_error) == 500
+
+
+def test_expired_job_without_attempts_left_is_failed_instead_of_reclaimed(db):
+    enqueue_rag_job(db, "doc-a", max_attempts=2)
+    enqueue_rag_job(db, "doc-b")
+    for _ in range(2):
+        job = db.query(models.RagJob).filter_by(document_id="doc-a").one()
+        # worker 行程被終止：租約過期，fail_rag_job 沒有執行
+        job.status = "running"
+        job.attempts += 1
+        job.locked_until = datetime.utcnow() - timedelta(seconds=1)
+        job.available_at = datetime.utcnow() - timedelta(hours=1)
+        db.commit()
+
+    claimed = claim_rag_job(db, "worker-2")
+    assert claimed.document_id == "doc-b"
+
+    abandoned = db.query(models.RagJob).filter_by(document_id="doc-a").one()
+    assert abandoned.status == "failed" and abandoned.attempts == 2 and abandoned.locked_by is None
+    document = db.get(models.Document, "doc-a")
+    assert document.rag_status == "failed" and "異常結束" in document.rag_error
+    assert claim_rag_job(db, "worker-3") is None
+
+
+def test_fail_without_retry(db):
+    enqueue_rag_job(db, "doc-a")
+    job = claim_rag_job(db, "worker-1")
+    assert fail_rag_job(db, job, "worker-1", "文檔不存在", retry=False)
+    assert job.status == "failed" and job.attempts == 1
+
+
+def test_lease_is_lost_when_job_is_reclaimed(db, session_factory, monkeypatch):
+    import db as db_module
+
+    monkeypatch.setattr(db_module, "SessionLocal", session_factory)
+    enqueue_rag_job(db, "doc-a")
+    job = claim_rag_job(db, "worker-1", visibility_timeout=1)
+
+    with RagJobLease(job.id, "worker-1", visibility_timeout=1) as lease:
+        assert not lease.lost.wait(1.5)
+        db.refresh(job)
+        assert job.locked_until > datetime.utcnow()
+
+        job.locked_by = "worker-2"
+        db.commit()
+        assert lease.lost.wait(3)
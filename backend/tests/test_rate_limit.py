@@ -0,0 +1,212 @@
+"""
+Embedding 速率限制與 AIMD 並行上限測試
+"""
+
+import asyncio
+
+from sqlalchemy import create_engine
+
+import models
+from rag.rate_limit import AdaptiveConcurrencyLimiter, EmbeddingRateLimiter, SharedEmbeddingRateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def with_clock(limiter, clock):
+    limiter._clock = clock
+    limiter._updated = clock()
+    return limiter
+
+
+def test_rpm_budget_and_refill():
+    clock = FakeClock()
+    limiter = with_clock(EmbeddingRateLimiter(requests_per_minute=2), clock)
+    assert limiter._try_acquire(0) == 0
+    assert limiter._try_acquire(0) == 0
+    assert limiter._try_acquire(0) == 30.0
+
+    clock.now += 30
+    assert limiter._try_acquire(0) == 0
+    assert limiter.total_requests == 3
+
+
+def test_tpm_reservation_is_corrected_by_actual_usage():
+    clock = FakeClock()
+    limiter = with_clock(EmbeddingRateLimiter(tokens_per_minute=600), clock)
+    assert limiter._try_acquire(500) == 0
+    # 實際用量比預扣多，額度變為負值，下一個請求需等待補回
+    limiter.record_tokens(1200, reserved=500)
+    assert limiter._try_acquire(10) == 60.0
+
+    # 請求失敗時歸還預扣額度
+    limiter = with_clock(EmbeddingRateLimiter(tokens_per_minute=600), clock)
+    limiter._try_acquire(600)
+    limiter.record_tokens(0, reserved=600)
+    assert limiter._token_budget == 600
+    assert limiter.total_tokens == 0
+
+
+def test_unlimited_only_counts():
+    limiter = EmbeddingRateLimiter()
+    for _ in range(100):
+        limiter.acquire(1000)
+    limiter.record_tokens(42)
+    assert limiter.total_requests == 100 and limiter.total_tokens == 42
+
+
+def test_parent_budget_is_shared_by_children():
+    parent = EmbeddingRateLimiter(requests_per_minute=1000, tokens_per_minute=10000)
+    child = EmbeddingRateLimiter(requests_per_minute=1000, parent=parent)
+    child.acquire(100)
+    asyncio.run(child.acquire_async(200))
+    child.record_tokens(250, reserved=200)
+    assert parent.total_requests == 2
+    assert parent.total_tokens == 250 and child.total_tokens == 250
+    assert 9640 <= parent._token_budget <= 9660
+
+
+def test_shared_limiter_falls_back_to_process_budget(tmp_path, caplog):
+    engine = create_engine(f"sqlite:///{tmp_path}/missing/rate.db")
+    limiter = SharedEmbeddingRateLimiter(
+        engine, models.EmbeddingRateBucket.__table__, "embedding:test", requests_per_minute=1
+    )
+    with caplog.at_level("WARNING", logger="rag.rate_limit"):
+        assert limiter._try_acquire(0) == 0
+        assert limiter._try_acquire(0) > 0
+    assert limiter._degraded
+    assert sum("unavailable" in r.message for r in caplog.records) == 1
+
+
+def shared_limiter(engine, clock, **kwargs):
+    table = models.EmbeddingRateBucket.__table__
+    limiter = SharedEmbeddingRateLimiter(engine, table, "embedding:test", **kwargs)
+    limiter._clock = clock
+    table.create(bind=engine, checkfirst=True)
+    with engine.begin() as conn:
+        if conn.execute(table.select()).first() is None:
+            conn.execute(table.insert().values(
+                name="embedding:test",
+                request_budget=float(limiter.requests_per_minute),
+                token_budget=float(limiter.tokens_per_minute),
+                updated_at=clock(),
+            ))
+    limiter._row_ready = True
+    return limiter
+
+
+def shared_row(engine):
+    with engine.begin() as conn:
+        return conn.execute(models.EmbeddingRateBucket.__table__.select()).one()
+
+
+def count_leases(limiter):
+    calls = []
+    lease = limiter._lease_shared
+
+    def counting_lease(*args):
+        # 資料庫往返期間不持有執行緒鎖
+        calls.append(limiter._lock.locked())
+        return lease(*args)
+
+    limiter._lease_shared = counting_lease
+    return calls
+
+
+def test_shared_limiter_leases_blocks_and_spends_locally(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/rate.db")
+    clock = FakeClock()
+    limiter = shared_limiter(engine, clock, requests_per_minute=600, tokens_per_minute=60000, lease_seconds=2)
+    leases = count_leases(limiter)
+
+    # 每次租用 2 秒份量：20 個請求、2000 tokens
+    for _ in range(20):
+        assert limiter._try_acquire(50) == 0
+    assert leases == [False]
+    row = shared_row(engine)
+    assert (row.request_budget, row.token_budget) == (580, 58000)
+
+    # 額度用完時再租用一次，並歸還上一次未用完的 1000 tokens；查詢路徑（asyncio）同樣以租用的額度扣除
+    asyncio.run(limiter.acquire_async(50))
+    asyncio.run(limiter.acquire_async(50))
+    assert leases == [False, False] and limiter.total_requests == 22
+    row = shared_row(engine)
+    assert (row.request_budget, row.token_budget) == (560, 57000)
+
+    # 租期結束後歸還未用完的額度（18 個請求），共用額度補回 2 秒份量（上限 600）後再租用 20 個
+    limiter.record_tokens(10, reserved=50)
+    clock.now += 2
+    assert limiter._try_acquire(0) == 0
+    assert leases == [False, False, False]
+    assert shared_row(engine).request_budget == 598 - 20
+
+
+def test_shared_limiter_budget_is_shared_across_processes(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/rate.db")
+    clock = FakeClock()
+    first = shared_limiter(engine, clock, requests_per_minute=4, lease_seconds=30)
+    second = shared_limiter(engine, clock, requests_per_minute=4, lease_seconds=30)
+
+    assert first._try_acquire(0) == 0 and first._try_acquire(0) == 0
+    assert second._try_acquire(0) == 0 and second._try_acquire(0) == 0
+    # 兩個行程各租用 2 個請求，共用額度已用完
+    assert first._try_acquire(0) == 15.0
+    assert shared_row(engine).request_budget == 0
+
+
+def test_aimd_halves_once_per_round_and_recovers():
+    limiter = AdaptiveConcurrencyLimiter(max_limit=8, min_limit=1)
+    first_round = limiter._last_decrease + 1
+    limiter.on_throttle(first_round)
+    assert limiter.limit == 4
+    # 同一輪（減半之前取得名額）的其他 429 不再減半
+    limiter.on_throttle(first_round)
+    assert limiter.limit == 4 and limiter.throttled == 2
+
+    limiter.on_throttle(limiter._last_decrease + 1)
+    limiter.on_throttle(limiter._last_decrease + 1)
+    limiter.on_throttle(limiter._last_decrease + 1)
+    assert limiter.limit == 1
+
+    limiter.on_success()
+    limiter.on_success()
+    assert 2 < limiter.limit < 3
+    for _ in range(200):
+        limiter.on_success()
+    assert limiter.limit == 8
+
+
+def test_slot_limits_concurrency():
+    async def run():
+        limiter = AdaptiveConcurrencyLimiter(max_limit=3)
+        limiter.limit = 2
+        peak = 0
+
+        async def task():
+            nonlocal peak
+            async with limiter.slot():
+                peak = max(peak, limiter.in_flight)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(task() for _ in range(10)))
+        return peak, limiter.in_flight
+
+    assert asyncio.run(run()) == (2, 0)
+
+
+def test_retry_after_pauses_new_requests():
+    async def run():
+        limiter = AdaptiveConcurrencyLimiter(max_limit=4)
+        async with limiter.slot() as started_at:
+            limiter.on_throttle(started_at, retry_after=0.1)
+        loop = asyncio.get_running_loop()
+        before = loop.time()
+        async with limiter.slot():
+            return loop.time() - before
+
+    assert asyncio.run(run()) >= 0.09
@@ -0,0 +1,134 @@
+"""
+重建索引的文檔選擇與檢查點測試（SQLite）
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models
+import rag_services
+from rag import reindex
+from rag.reindex import completed_document_ids, save_checkpoint, select_documents
+from rag_jobs import claim_rag_job, enqueue_rag_job
+
+
+@pytest.fixture
+def db(monkeypatch):
+    # 目前設定的指紋需要 Embedding 客戶端設定，以固定值取代
+    monkeypatch.setattr(rag_services, "get_rag_fingerprint", lambda: "fp-current")
+    engine = create_engine("sqlite://")
+    for model in (models.Document, models.RagJob, models.RagReindexCheckpoint):
+        model.__table__.create(bind=engine)
+    session = sessionmaker(bind=engine)()
+    uploaded = datetime(2024, 1, 1)
+    rows = [
+        ("old", "p1", "completed", "fp-old"),
+        ("current", "p1", "completed", "fp-current"),
+        ("failed", "p2", "failed", None),
+        ("queued", "p2", "pending", None),
+    ]
+    for i, (document_id, project_id, status, fingerprint) in enumerate(rows):
+        session.add(models.Document(
+            id=document_id, project_id=project_id, title=document_id, object_key=document_id,
+            type="pdf", rag_status=status, rag_fingerprint=fingerprint,
+            uploaded_at=uploaded + timedelta(minutes=i),
+        ))
+    session.add(models.Document(id="note", title="note", object_key="note", type="text"))
+    session.add(models.RagJob(document_id="queued", status="queued"))
+    session.commit()
+    yield session
+    session.close()
+
+
+def test_select_documents_filters_and_skips_active_jobs(db):
+    assert select_documents(db, all_documents=True) == ["old", "current", "failed"]
+    assert select_documents(db, stale=True) == ["old", "failed"]
+    assert select_documents(db, project_id="p1", statuses=["completed"]) == ["old", "current"]
+    assert select_documents(db, fingerprint="fp-old") == ["old"]
+    assert select_documents(db, document_ids=["failed", "queued", "note"]) == ["failed"]
+    with pytest.raises(ValueError):
+        select_documents(db)
+
+
+def test_checkpoints_are_overwritten_per_run(db):
+    save_checkpoint(db, "run-1", "old", "failed", "timeout", 10, 0)
+    assert completed_document_ids(db, "run-1") == set()
+
+    save_checkpoint(db, "run-1", "old", "succeeded", None, 20, 300)
+    save_checkpoint(db, "run-2", "failed", "succeeded", None, 5, 0)
+    assert completed_document_ids(db, "run-1") == {"old"}
+
+    checkpoint = db.query(models.RagReindexCheckpoint).filter_by(run_id="run-1").one()
+    assert checkpoint.error is None and checkpoint.embedding_tokens == 300
+
+
+@pytest.fixture
+def session_factory(monkeypatch):
+    import db as db_module
+
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    for model in (models.Document, models.RagJob, models.RagReindexCheckpoint):
+        model.__table__.create(bind=engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(db_module, "SessionLocal", factory)
+    monkeypatch.setattr(rag_services, "has_cached_pages", lambda content_hash: True)
+    monkeypatch.setattr(reindex, "_embedding_tokens", lambda db, document_id, since: 0)
+    session = factory()
+    session.add(models.Document(id="doc", title="doc", object_key="doc.pdf", type="pdf", content_hash="h"))
+    session.commit()
+    session.close()
+    return factory
+
+
+def test_reindex_holds_a_rag_job_while_processing(session_factory, monkeypatch):
+    seen = {}
+
+    def process(document_id, file_content, db, source=None, cancel=None):
+        other = session_factory()
+        # 處理期間 worker 無法認領，API 也不會再為此文檔建立任務
+        seen["claimed"] = claim_rag_job(other, "worker-1")
+        seen["enqueued"] = enqueue_rag_job(other, document_id).locked_by
+        other.close()
+        return True, None
+
+    monkeypatch.setattr(rag_services, "process_document_rag", process)
+    assert reindex.reindex_document("doc", "run-1") == ("succeeded", None, 0)
+
+    assert seen["claimed"] is None and seen["enqueued"].startswith("reindex:")
+    db = session_factory()
+    job = db.query(models.RagJob).one()
+    assert job.status == "succeeded" and job.locked_by is None
+    assert completed_document_ids(db, "run-1") == {"doc"}
+    db.close()
+
+
+def test_reindex_skips_documents_queued_for_the_worker(session_factory, monkeypatch):
+    def process(*args, **kwargs):
+        raise AssertionError("佇列中的文檔應由 worker 處理")
+
+    monkeypatch.setattr(rag_services, "process_document_rag", process)
+    db = session_factory()
+    enqueue_rag_job(db, "doc")
+
+    status, error, tokens = reindex.reindex_document("doc", "run-1")
+
+    assert status == "skipped" and tokens == 0
+    assert db.query(models.RagJob).one().status == "queued"
+    # 不寫入檢查點，以相同 run_id 重新執行時會再處理
+    assert db.query(models.RagReindexCheckpoint).count() == 0
+    db.close()
+
+
+def test_reindex_failure_does_not_requeue_the_job(session_factory, monkeypatch):
+    monkeypatch.setattr(rag_services, "process_document_rag", lambda *args, **kwargs: (False, "boom"))
+    assert reindex.reindex_document("doc", "run-1")[:2] == ("failed", "boom")
+
+    db = session_factory()
+    job = db.query(models.RagJob).one()
+    assert (job.status, job.last_error) == ("failed", "boom")
+    assert db.query(models.RagReindexCheckpoint).one().status == "failed"
+    db.close()
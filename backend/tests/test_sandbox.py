@@ -0,0 +1,171 @@
+"""
+PDF 解析沙箱測試（沙箱以 spawn 啟動子行程）
+"""
+
+import glob
+import os
+import tempfile
+
+import pytest
+
+from rag.parsers.sandbox import ParseSandbox, ParseSandboxError, SandboxLimits, get_sandbox_stats
+
+
+def spool_files():
+    return set(glob.glob(os.path.join(tempfile.gettempdir(), "pdf-sandbox-*")))
+
+
+@pytest.fixture(scope="module")
+def sandbox():
+    sandbox = ParseSandbox(processes=1, limits=SandboxLimits(cpu_seconds=30, memory_mb=0, timeout_seconds=60))
+    yield sandbox
+    sandbox.shutdown()
+
+
+def test_parse_bytes_reuses_process_and_removes_spool(sandbox, make_pdf):
+    before = spool_files()
+    result = sandbox.parse("pymupdf", make_pdf(["alpha", "beta"]))
+    assert result["success"]
+    assert [p["content"].strip() for p in result["pages"]] == ["alpha", "beta"]
+    worker = sandbox._idle.queue[-1]
+
+    pages = list(sandbox.iter_pages("pymupdf", make_pdf(["one", "two", "three"])))
+    assert [p["content"].strip() for p in pages] == ["one", "two", "three"]
+    assert sandbox._idle.queue[-1] is worker and worker.alive
+    assert spool_files() == before
+
+
+def test_file_path_is_parsed_in_place(sandbox, tmp_path, make_pdf):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(make_pdf(["on disk"]))
+    before = spool_files()
+    assert sandbox.parse("pymupdf", str(path))["metadata"]["file_path"] == str(path)
+    assert spool_files() == before
+
+
+def test_iterator_errors_are_raised_in_parent(sandbox, tmp_path):
+    with pytest.raises(Exception, match="檔案不存在"):
+        list(sandbox.iter_pages("pymupdf", str(tmp_path / "missing.pdf")))
+    # 一般解析錯誤不終止沙箱行程
+    assert sandbox._idle.queue[-1].alive
+
+
+def test_timeout_kills_sandbox_process(make_pdf):
+    sandbox = ParseSandbox(processes=1, limits=SandboxLimits(cpu_seconds=0, memory_mb=0, timeout_seconds=0))
+    timeouts = get_sandbox_stats()["timeout"]
+    try:
+        with pytest.raises(ParseSandboxError) as excinfo:
+            sandbox.parse("pymupdf", make_pdf(["slow"]))
+        assert excinfo.value.kind == "timeout"
+        assert get_sandbox_stats()["timeout"] == timeouts + 1
+        assert sandbox._idle.empty()
+    finally:
+        sandbox.shutdown()
+
+
+@pytest.mark.parametrize("parser_type", ["pymupdf", "pymupdf_layout"])
+def test_parallel_parse_matches_serial_parse(parser_type, make_pdf):
+    from rag.parsers import get_parser
+
+    data = make_pdf([f"page {i} text" if i % 5 else "" for i in range(1, 22)])
+    serial = get_parser(parser_type)(data)
+    sandbox = ParseSandbox(
+        processes=3,
+        limits=SandboxLimits(cpu_seconds=30, memory_mb=0, timeout_seconds=60),
+        parse_workers=3,
+        parallel_min_pages=0,
+    )
+    try:
+        before = spool_files()
+        parallel = sandbox.parse(parser_type, data)
+        assert spool_files() == before
+    finally:
+        sandbox.shutdown()
+
+    assert parallel["success"]
+    assert parallel["metadata"]["parse_workers"] == 3
+    assert parallel["metadata"]["page_count"] == serial["metadata"]["page_count"] == 21
+    assert parallel["pages"] == serial["pages"]
+    assert parallel["content"] == serial["content"]
+
+
+def test_parallel_parse_reports_parser_errors(tmp_path):
+    sandbox = ParseSandbox(processes=2, parse_workers=2, parallel_min_pages=0)
+    try:
+        result = sandbox.parse("pymupdf", str(tmp_path / "missing.pdf"))
+    finally:
+        sandbox.shutdown()
+    assert not result["success"]
+    assert "檔案不存在" in result["error"]
+
+
+class FakeBody:
+    """模擬 MinIO get_object 的 StreamingBody"""
+
+    def __init__(self, data):
+        self.data = data
+        self.closed = False
+
+    def iter_chunks(self, size):
+        for start in range(0, len(self.data), size):
+            yield self.data[start:start + size]
+
+    def read(self, size=-1):
+        raise AssertionError("沙箱模式不應將物件讀入記憶體")
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def spool_calls(monkeypatch):
+    from rag.parsers import sandbox as sandbox_module
+
+    calls = []
+    spool = sandbox_module._spool_to_file
+
+    def counting_spool(data):
+        calls.append(len(data))
+        return spool(data)
+
+    monkeypatch.setattr(sandbox_module, "_spool_to_file", counting_spool)
+    return calls
+
+
+def test_storage_source_is_streamed_to_one_file_for_sandbox(monkeypatch, make_pdf, spool_calls):
+    import rag_services
+    import services
+
+    data = make_pdf([f"page {i}" for i in range(1, 7)])
+    body = FakeBody(data)
+
+    class FakeS3:
+        def get_object(self, Bucket, Key):
+            return {"Body": body, "ContentLength": len(data)}
+
+    monkeypatch.setattr(services, "get_s3_client", lambda: FakeS3())
+    monkeypatch.setattr(rag_services, "SANDBOX_ENABLED", True)
+
+    source = rag_services.open_storage_source("docs/a.pdf")
+    sandbox = ParseSandbox(processes=2, parse_workers=2, parallel_min_pages=0)
+    try:
+        assert body.closed and source.is_file_backed and source.data is None
+        result = sandbox.parse("pymupdf", source)
+    finally:
+        sandbox.shutdown()
+        source.close()
+
+    assert result["success"] and result["metadata"]["page_count"] == 6
+    # 物件只寫入一次（下載），沙箱直接使用該檔案
+    assert spool_calls == []
+    assert not os.path.exists(source.path)
+
+
+def test_memory_source_is_spooled_once_per_parallel_parse(make_pdf, spool_calls):
+    sandbox = ParseSandbox(processes=2, parse_workers=2, parallel_min_pages=0)
+    try:
+        result = sandbox.parse("pymupdf", make_pdf([f"page {i}" for i in range(1, 9)]))
+    finally:
+        sandbox.shutdown()
+    assert result["success"] and result["metadata"]["parse_workers"] == 2
+    assert len(spool_calls) == 1
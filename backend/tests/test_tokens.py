@@ -0,0 +1,57 @@
+"""
+token 估計與批次打包測試
+"""
+
+import random
+
+import pytest
+
+from rag.chunking import ChunkingConfig, chunk_text, iter_chunks
+from rag.parsers import build_content
+from rag.tokens import TokenEstimator, pack_by_tokens
+
+ESTIMATOR = TokenEstimator(cjk_tokens_per_char=1.2, latin_chars_per_token=4.0)
+
+
+def test_estimate_by_script():
+    assert ESTIMATOR.estimate("") == 0
+    assert ESTIMATOR.estimate("abcdefgh") == 2
+    assert ESTIMATOR.estimate("研究方法") == 5  # 4 × 1.2 = 4.8
+    assert ESTIMATOR.estimate("研究 method") == 5  # 2 × 1.2 + 7 / 4 = 4.15
+
+
+def test_full_width_punctuation_counts_as_cjk():
+    assert list(ESTIMATOR.cjk_spans("ab，。cd")) == [(2, 4)]
+
+
+def test_pack_by_tokens_limits():
+    items = [3, 3, 3, 10, 1, 1]
+    assert list(pack_by_tokens(items, lambda x: x, max_tokens=6, max_items=10)) == [[3, 3], [3], [10], [1, 1]]
+    assert list(pack_by_tokens(items, lambda x: x, max_tokens=100, max_items=4)) == [[3, 3, 3, 10], [1, 1]]
+    assert list(pack_by_tokens(items, lambda x: x, max_tokens=0, max_items=5)) == [[3, 3, 3, 10, 1], [1]]
+    assert list(pack_by_tokens([], lambda x: x, max_tokens=6, max_items=10)) == []
+
+
+@pytest.mark.parametrize("seed", range(2))
+def test_token_chunks_respect_budget_and_match_streaming(seed):
+    """token 模式下每個 chunk 不超過預算，逐頁切分與完整文本切分結果相同"""
+    rng = random.Random(seed)
+    words = ["研究", "文獻", "the", "study", "。", "，", ".", ",", "\n", " ", "x" * 30]
+    for _ in range(300):
+        pages = [
+            {"page_number": page + 1, "content": "".join(rng.choice(words) for _ in range(rng.choice([0, 5, 50, 300])))}
+            for page in range(rng.randint(0, 10))
+        ]
+        config = ChunkingConfig(
+            chunk_size=rng.choice([10, 40, 120]),
+            chunk_overlap=rng.choice([0, 5]),
+            min_chunk_size=rng.choice([0, 5]),
+            size_unit="tokens",
+            token_estimator=ESTIMATOR,
+        )
+        chunks = chunk_text(build_content(pages), None, config)
+        streamed = list(iter_chunks(pages, config))
+        assert [(c.content, c.char_start, c.char_end, c.page_numbers) for c in streamed] == \
+            [(c.content, c.char_start, c.char_end, c.page_numbers) for c in chunks]
+        for chunk in chunks:
+            assert ESTIMATOR.estimate(chunk.content) <= config.chunk_size + 1
@@ -0,0 +1,60 @@
+"""
+串流上傳到 MinIO 的測試（以記錄呼叫的假 S3 客戶端取代 MinIO）
+"""
+
+import hashlib
+import io
+
+import pytest
+
+import services
+from services import UploadTooLargeError, upload_fileobj_to_minio
+
+
+class FakeS3Client:
+    def __init__(self):
+        self.parts = []
+        self.completed = None
+        self.aborted = False
+
+    def create_multipart_upload(self, Bucket, Key, ContentType):
+        return {"UploadId": "upload-1"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.parts.append(Body)
+        return {"ETag": f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.completed = MultipartUpload["Parts"]
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted = True
+
+
+def test_streams_in_parts_and_hashes(monkeypatch):
+    monkeypatch.setattr(services, "MULTIPART_PART_SIZE", 10)
+    data = bytes(range(256)) * 3
+    client, copy = FakeS3Client(), io.BytesIO()
+
+    size, sha256 = upload_fileobj_to_minio(
+        client, "bucket", io.BytesIO(data), "key.pdf", "application/pdf",
+        max_size=len(data), read_size=7, copy_to=copy
+    )
+
+    assert size == len(data) and sha256 == hashlib.sha256(data).hexdigest()
+    assert b"".join(client.parts) == data and copy.getvalue() == data
+    assert all(len(part) >= 10 for part in client.parts[:-1])
+    assert [p["PartNumber"] for p in client.completed] == list(range(1, len(client.parts) + 1))
+
+
+def test_empty_file_uploads_single_part():
+    client = FakeS3Client()
+    assert upload_fileobj_to_minio(client, "b", io.BytesIO(b""), "k", "application/pdf", max_size=10)[0] == 0
+    assert client.parts == [b""] and client.completed
+
+
+def test_too_large_aborts_upload():
+    client = FakeS3Client()
+    with pytest.raises(UploadTooLargeError):
+        upload_fileobj_to_minio(client, "b", io.BytesIO(b"x" * 100), "k", "application/pdf", max_size=50, read_size=8)
+    assert client.aborted and client.completed is None
@@ -0,0 +1,60 @@
+"""
+批次上傳檔案展開測試
+"""
+
+import io
+import zipfile
+
+from fastapi import UploadFile
+from starlette.datastructures import Headers
+
+import routes.documents as documents
+from routes.documents import _expand_upload_files
+
+
+def upload(filename: str, data: bytes, content_type: str) -> UploadFile:
+    return UploadFile(io.BytesIO(data), filename=filename, headers=Headers({"content-type": content_type}))
+
+
+def make_zip(files: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def test_expands_pdfs_and_zip_entries():
+    archive = make_zip({
+        "papers/a.pdf": b"%PDF-a",
+        "papers/notes.txt": b"text",
+        "__MACOSX/._a.pdf": b"",
+        "papers/": b"",
+    })
+    files = [
+        upload("direct.pdf", b"%PDF-direct", "application/pdf"),
+        upload("bundle.zip", archive, "application/zip"),
+        upload("broken.zip", b"not a zip", "application/zip"),
+        upload("image.png", b"png", "image/png"),
+    ]
+    entries, rejected, archives = [], [], []
+    try:
+        _expand_upload_files(files, entries, rejected, archives)
+        assert [name for name, _ in entries] == ["direct.pdf", "a.pdf"]
+        assert [open_entry().read() for _, open_entry in entries] == [b"%PDF-direct", b"%PDF-a"]
+        assert [(r.filename, r.error) for r in rejected] == [
+            ("papers/notes.txt", "僅支援 PDF 檔案"),
+            ("broken.zip", "無效的 ZIP 檔案"),
+            ("image.png", "僅支援 PDF 檔案"),
+        ]
+        assert len(archives) == 1
+    finally:
+        for archive in archives:
+            archive.close()
+
+
+def test_rejects_oversized_zip_entries(monkeypatch):
+    monkeypatch.setattr(documents, "MAX_FILE_SIZE", 4)
+    entries, rejected, archives = [], [], []
+    _expand_upload_files([upload("b.zip", make_zip({"big.pdf": b"x" * 5}), "application/zip")], entries, rejected, archives)
+    assert not entries and rejected[0].filename == "big.pdf"
@@ -0,0 +1,87 @@
+"""
+worker 任務執行測試（SQLite；RAG 處理流程以假函數取代）
+"""
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models
+import rag_services
+import worker
+from rag_jobs import claim_rag_job, enqueue_rag_job
+
+
+@pytest.fixture
+def session_factory(monkeypatch):
+    import db as db_module
+
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    for model in (models.Document, models.RagJob):
+        model.__table__.create(bind=engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(db_module, "SessionLocal", factory)
+    return factory
+
+
+@pytest.fixture
+def db(session_factory, monkeypatch):
+    monkeypatch.setattr(rag_services, "clone_rag_from_duplicate", lambda document_id, db: False)
+    monkeypatch.setattr(rag_services, "has_cached_pages", lambda content_hash: True)
+    session = session_factory()
+    session.add(models.Document(id="doc-a", title="a", object_key="a.pdf", type="pdf", content_hash="h"))
+    session.commit()
+    yield session
+    session.close()
+
+
+def test_run_job_completes_owned_job(db, monkeypatch):
+    monkeypatch.setattr(rag_services, "process_document_rag", lambda *args, **kwargs: (True, None))
+    enqueue_rag_job(db, "doc-a")
+    job = claim_rag_job(db, "worker-1", visibility_timeout=60)
+    worker._run_job(db, job, "worker-1", 60)
+    assert job.status == "succeeded"
+
+
+def test_run_job_skips_download_for_duplicate_content(db, monkeypatch):
+    cloned = []
+
+    def clone(document_id, db):
+        cloned.append(document_id)
+        return True
+
+    def fail(*args, **kwargs):
+        raise AssertionError("去重命中時不應下載或處理文檔")
+
+    monkeypatch.setattr(rag_services, "clone_rag_from_duplicate", clone)
+    monkeypatch.setattr(rag_services, "open_storage_source", fail)
+    monkeypatch.setattr(rag_services, "process_document_rag", fail)
+    enqueue_rag_job(db, "doc-a")
+    job = claim_rag_job(db, "worker-1", visibility_timeout=60)
+    worker._run_job(db, job, "worker-1", 60)
+
+    assert cloned == ["doc-a"]
+    assert job.status == "succeeded"
+
+
+def test_run_job_stops_and_keeps_new_owner_state_after_losing_lease(db, session_factory, monkeypatch):
+    enqueue_rag_job(db, "doc-a")
+    job = claim_rag_job(db, "worker-1", visibility_timeout=1)
+    seen = {}
+
+    def process(document_id, file_content, db, source=None, cancel=None):
+        # 處理期間租約過期，任務被其他 worker 重新認領
+        other = session_factory()
+        other.get(models.RagJob, job.id).locked_by = "worker-2"
+        other.commit()
+        other.close()
+        seen["cancelled"] = cancel.wait(5)
+        return False, "cancelled"
+
+    monkeypatch.setattr(rag_services, "process_document_rag", process)
+    worker._run_job(db, job, "worker-1", 1)
+
+    assert seen["cancelled"]
+    db.refresh(job)
+    assert job.status == "running" and job.locked_by == "worker-2" and job.last_error is None
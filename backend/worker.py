@@ -0,0 +1,221 @@
+"""
+RAG Worker
+
+在 API 行程之外執行 RAG 處理任務（Parse → Chunk → Embed → Store），
+讓文檔處理吞吐量與 API 延遲各自獨立擴展。
+
+worker 與 API 必須透過 Chroma 伺服器（CHROMA_HOST）共用向量庫，未設定時拒絕啟動。
+
+使用方式：
+    python -m worker                  # 依 RAG_WORKER_PROCESSES 啟動 worker 行程
+    python -m worker --processes 4    # 指定 worker 行程數
+"""
+
+import os
+import argparse
+import logging
+import multiprocessing
+import signal
+import socket
+import threading
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+# 載入環境變數（需在匯入 db 之前，DATABASE_URL 於匯入時讀取）
+_env_paths = [
+    ".env",
+    "backend/.env",
+    os.path.join(os.path.dirname(__file__), ".env"),
+    "env.local",
+    "backend/env.local",
+    os.path.join(os.path.dirname(__file__), "env.local"),
+]
+for _env_path in _env_paths:
+    if os.path.exists(_env_path):
+        load_dotenv(_env_path)
+        break
+
+logger = logging.getLogger("worker")
+
+
+def _run_job(db, job, worker_id: str, visibility_timeout: int) -> None:
+    """
+    執行單一任務並更新任務狀態
+
+    處理期間以背景 heartbeat 延長租約；租約遺失（任務已被其他 worker 重新認領）時
+    在下一次寫入前中止處理，且不寫入任務狀態。
+    """
+    import models
+    from rag_jobs import RagJobLease, complete_rag_job, fail_rag_job
+    from rag_services import process_document_rag, clone_rag_from_duplicate, open_storage_source, has_cached_pages
+
+    doc = db.query(models.Document).filter(models.Document.id == job.document_id).first()
+    if not doc:
+        # 文檔已刪除，不需重試
+        fail_rag_job(db, job, worker_id, "文檔不存在", retry=False)
+        return
+
+    # 內容相同的文檔直接重用既有結果，不需下載檔案
+    if doc.content_hash and clone_rag_from_duplicate(doc.id, db):
+        if complete_rag_job(db, job, worker_id):
+            logger.info(f"RAG job deduplicated: job_id={job.id}, document_id={job.document_id}")
+        return
+
+    # 從 MinIO 串流讀取，一般大小的 PDF 直接在記憶體中解析，不落地
+    source = None
+    with RagJobLease(job.id, worker_id, visibility_timeout) as lease:
+        try:
+            # 解析結果快取命中時不需要取得 PDF
+            if not has_cached_pages(doc.content_hash):
+                source = open_storage_source(doc.object_key)
+            success, error = process_document_rag(doc.id, None, db, source=source, cancel=lease.lost)
+        except Exception as e:
+            db.rollback()
+            success, error = False, str(e)
+        finally:
+            if source is not None:
+                source.close()
+
+    if lease.lost.is_set():
+        logger.warning(f"RAG job abandoned after losing its lease: job_id={job.id}, document_id={job.document_id}")
+        return
+
+    if success:
+        if complete_rag_job(db, job, worker_id):
+            logger.info(f"RAG job completed: job_id={job.id}, document_id={job.document_id}")
+    else:
+        fail_rag_job(db, job, worker_id, error or "未知錯誤")
+
+
+def _setup_logging() -> None:
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO"),
+        format="%(asctime)s %(levelname)s [%(processName)s] %(name)s: %(message)s",
+    )
+
+
+def worker_loop(worker_index: int, poll_interval: float, visibility_timeout: int) -> None:
+    """
+    單一 worker 行程的主迴圈：認領 → 執行 → 回報，沒有任務時休眠 poll_interval 秒
+
+    收到 SIGTERM/SIGINT 時會完成目前任務後結束。
+    """
+    _setup_logging()
+
+    from db import SessionLocal
+    from rag_jobs import claim_rag_job
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{worker_index}:{uuid.uuid4().hex[:8]}"
+    stop_event = threading.Event()
+
+    def _request_stop(signum, _frame):
+        logger.info(f"Worker {worker_id} received signal {signum}, stopping after current job")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    logger.info(f"RAG worker started: {worker_id}")
+
+    try:
+        while not stop_event.is_set():
+            db = SessionLocal()
+            try:
+                job = claim_rag_job(db, worker_id, visibility_timeout)
+                if job is None:
+                    db.close()
+                    stop_event.wait(poll_interval)
+                    continue
+                logger.info(
+                    f"Claimed RAG job: job_id={job.id}, document_id={job.document_id}, attempt={job.attempts}"
+                )
+                _run_job(db, job, worker_id, visibility_timeout)
+            except Exception as e:
+                logger.exception(f"RAG worker loop error: {e}")
+                stop_event.wait(poll_interval)
+            finally:
+                db.close()
+    finally:
+        # 明確關閉閒置的沙箱行程，不依賴直譯器結束時的清理
+        from rag.parsers.sandbox import reset_parse_sandbox
+        reset_parse_sandbox()
+
+    logger.info(f"RAG worker stopped: {worker_id}")
+
+
+def main(argv=None) -> None:
+    from rag_jobs import DEFAULT_VISIBILITY_TIMEOUT
+
+    parser = argparse.ArgumentParser(description="ThesisFlow RAG worker")
+    parser.add_argument(
+        "--processes", "-p",
+        type=int,
+        default=int(os.getenv("RAG_WORKER_PROCESSES", "2")),
+        help="worker 行程數（預設 RAG_WORKER_PROCESSES 或 2）",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=float(os.getenv("RAG_WORKER_POLL_INTERVAL", "2")),
+        help="沒有任務時的輪詢間隔（秒）",
+    )
+    parser.add_argument(
+        "--visibility-timeout",
+        type=int,
+        default=DEFAULT_VISIBILITY_TIMEOUT,
+        help="任務可見性逾時（秒），逾時未回報的任務會被重新認領",
+    )
+    args = parser.parse_args(argv)
+
+    _setup_logging()
+
+    from rag.vector_store import require_shared_vector_store
+    try:
+        require_shared_vector_store("RAG worker")
+    except RuntimeError as e:
+        parser.error(str(e))
+
+    if args.processes <= 1:
+        worker_loop(0, args.poll_interval, args.visibility_timeout)
+        return
+
+    # 使用 spawn 讓每個行程建立自己的 DB 連線池與 Azure/Chroma 客戶端
+    ctx = multiprocessing.get_context("spawn")
+    stopping = False
+
+    def _spawn(index: int):
+        proc = ctx.Process(
+            target=worker_loop,
+            args=(index, args.poll_interval, args.visibility_timeout),
+            name=f"rag-worker-{index}",
+        )
+        proc.start()
+        return proc
+
+    def _shutdown(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()  # 送出 SIGTERM，子行程完成目前任務後結束
+
+    procs = [_spawn(i) for i in range(args.processes)]
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    # 監督子行程：異常結束時重新啟動
+    while not stopping:
+        for i, proc in enumerate(procs):
+            if not proc.is_alive() and not stopping:
+                logger.warning(f"Worker {proc.name} exited with code {proc.exitcode}, restarting")
+                procs[i] = _spawn(i)
+        time.sleep(1)
+
+    for proc in procs:
+        proc.join()
+
+
+if __name__ == "__main__":
+    main()
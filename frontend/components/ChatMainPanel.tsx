@@ -84,10 +84,11 @@ export const ChatMainPanel: React.FC<ChatMainPanelProps> = ({ currentNode }) =>
   // 取得當前文檔資訊
   const currentDoc = documents.find((d) => d.id === currentDocId);
 
-  // 檢查 RAG 是否就緒，決定是否允許聊天
+  // 檢查 RAG 是否就緒，決定是否允許聊天（partial：已索引的頁面可先查詢）
   const isRagNotReady =
     currentDoc?.type === 'pdf' &&
     currentDoc.rag_status !== 'completed' &&
+    currentDoc.rag_status !== 'partial' &&
     currentDoc.rag_status !== 'not_applicable';
 
   const [inputMessage, setInputMessage] = useState('');
@@ -645,6 +646,16 @@ export const ChatMainPanel: React.FC<ChatMainPanelProps> = ({ currentNode }) =>
           </div>
         )}
 
+        {/* RAG 部分索引提示 */}
+        {currentDoc?.type === 'pdf' && currentDoc.rag_status === 'partial' && (
+          <div className="flex items-center gap-2 p-2 bg-info/10 rounded-lg text-info text-sm mb-2">
+            <Loader2 size={16} className="animate-spin shrink-0" />
+            <span>
+              文件仍在處理中，目前可查詢前 {currentDoc.pages_indexed ?? 0} 頁的內容
+            </span>
+          </div>
+        )}
+
         {/* RAG 處理中警告 */}
         {isRagNotReady && (
           <div className="flex items-center gap-2 p-2 bg-warning/10 rounded-lg text-warning text-sm mb-2">
@@ -1159,7 +1159,7 @@ const DocCard = ({
           <RagStatusBadge status={doc.rag_status} chunkCount={doc.chunk_count} compact />
         )}
       </div>
-      {doc.rag_status === 'processing' && (
+      {(doc.rag_status === 'processing' || doc.rag_status === 'partial') && (
         <progress className="progress progress-primary w-full h-1 mt-1" />
       )}
     </div>
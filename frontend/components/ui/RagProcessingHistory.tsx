@@ -25,6 +25,7 @@ interface RagProcessingHistoryProps {
 const STAGE_CONFIG: Record<string, { icon: React.ReactNode; label: string }> = {
   upload: { icon: <Upload size={14} />, label: '檔案上傳' },
   start: { icon: <Clock size={14} />, label: '開始處理' },
+  dedup: { icon: <Database size={14} />, label: '重用既有索引' },
   parsing: { icon: <FileText size={14} />, label: 'PDF 解析' },
   chunking: { icon: <Cpu size={14} />, label: '文本切分' },
   embedding: { icon: <Cpu size={14} />, label: '向量生成' },
@@ -5,6 +5,7 @@ import { RagProcessingHistory } from './RagProcessingHistory';
 interface RagStatusBadgeProps {
   status?: RagStatus;
   chunkCount?: number;
+  pagesIndexed?: number;
   compact?: boolean;
   docId?: string;
 }
@@ -40,6 +41,16 @@ const statusConfig: Record<
     showProgress: true,
     animate: true,
   },
+  partial: {
+    label: '部分可查詢',
+    shortLabel: '部分就緒',
+    bgGradient: 'bg-gradient-to-r from-teal-50 to-sky-50',
+    textColor: 'text-teal-700',
+    borderColor: 'border-teal-200/60',
+    dotColor: 'bg-teal-400',
+    showProgress: true,
+    animate: true,
+  },
   completed: {
     label: '可供查詢',
     shortLabel: '就緒',
@@ -61,6 +72,7 @@ const statusConfig: Record<
 export function RagStatusBadge({
   status,
   chunkCount,
+  pagesIndexed,
   compact = false,
   docId,
 }: RagStatusBadgeProps) {
@@ -150,6 +162,9 @@ export function RagStatusBadge({
           {status === 'completed' && chunkCount !== undefined && chunkCount > 0 && (
             <span className="opacity-60 font-normal">· {chunkCount} 段落</span>
           )}
+          {status === 'partial' && pagesIndexed !== undefined && pagesIndexed > 0 && (
+            <span className="opacity-60 font-normal">· 前 {pagesIndexed} 頁</span>
+          )}
         </span>
         {config.showProgress && (
           <div className="w-full h-1 bg-sky-100 rounded-full overflow-hidden">
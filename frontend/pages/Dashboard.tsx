@@ -191,7 +191,7 @@ export function Dashboard() {
                   <p className="text-xs text-gray-500">
                     {new Date(doc.uploaded_at || Date.now()).toLocaleDateString()}
                   </p>
-                  {doc.rag_status === 'processing' && (
+                  {(doc.rag_status === 'processing' || doc.rag_status === 'partial') && (
                     <progress className="progress progress-primary w-full h-1 mt-1" />
                   )}
                 </div>
@@ -247,7 +247,7 @@ export function LiteraturePage() {
                       {new Date(item.uploaded_at || Date.now()).toLocaleDateString()}
                       {item.size && ` • ${(item.size / 1024 / 1024).toFixed(2)} MB`}
                     </p>
-                    {item.rag_status === 'processing' && (
+                    {(item.rag_status === 'processing' || item.rag_status === 'partial') && (
                       <progress className="progress progress-primary w-full h-1 mt-1" />
                     )}
                   </div>
@@ -448,7 +448,7 @@ export default function StudentHome() {
                     <p className="text-xs text-slate-400">
                       Added {new Date(doc.uploaded_at || Date.now()).toLocaleDateString()}
                     </p>
-                    {doc.rag_status === 'processing' && (
+                    {(doc.rag_status === 'processing' || doc.rag_status === 'partial') && (
                       <progress className="progress progress-primary w-full h-1 mt-1" />
                     )}
                   </div>
@@ -730,7 +730,9 @@ export const useStore = create<AppState>((set, get) => ({
     // 如果是 PDF 且 RAG 狀態為 pending 或 processing，啟動輪詢
     if (
       created.type === 'pdf' &&
-      (created.rag_status === 'pending' || created.rag_status === 'processing')
+      (created.rag_status === 'pending' ||
+        created.rag_status === 'processing' ||
+        created.rag_status === 'partial')
     ) {
       const pollRagStatus = async () => {
         const maxAttempts = 60; // 最多輪詢 60 次（約 3 分鐘）
@@ -746,7 +748,12 @@ export const useStore = create<AppState>((set, get) => ({
             set((state) => ({
               documents: state.documents.map((d) =>
                 d.id === created.id
-                  ? { ...d, rag_status: updatedDoc.rag_status, chunk_count: updatedDoc.chunk_count }
+                  ? {
+                      ...d,
+                      rag_status: updatedDoc.rag_status,
+                      chunk_count: updatedDoc.chunk_count,
+                      pages_indexed: updatedDoc.pages_indexed,
+                    }
                   : d
               ),
             }));
@@ -1131,7 +1138,11 @@ export const useStore = create<AppState>((set, get) => ({
         if (currentDoc.rag_status === 'failed') {
           throw new Error('文件處理失敗，無法使用 AI 對話功能');
         }
-        if (currentDoc.rag_status !== 'completed' && currentDoc.rag_status !== 'not_applicable') {
+        if (
+          currentDoc.rag_status !== 'completed' &&
+          currentDoc.rag_status !== 'partial' &&
+          currentDoc.rag_status !== 'not_applicable'
+        ) {
           throw new Error('文件正在處理中，請等待處理完成後再開始對話');
         }
       }
@@ -79,7 +79,13 @@ export interface Highlight {
   created_at: number;
 }
 
-export type RagStatus = 'pending' | 'processing' | 'completed' | 'failed' | 'not_applicable';
+export type RagStatus =
+  | 'pending'
+  | 'processing'
+  | 'partial'
+  | 'completed'
+  | 'failed'
+  | 'not_applicable';
 
 export interface Document {
   id: string;
@@ -102,6 +108,7 @@ export interface Document {
    * RAG 處理狀態
    * - pending: 等待處理
    * - processing: 處理中
+   * - partial: 處理中，前 pages_indexed 頁已可查詢
    * - completed: 處理完成
    * - failed: 處理失敗
    * - not_applicable: 非 PDF 文件，不適用
@@ -109,6 +116,8 @@ export interface Document {
   rag_status?: RagStatus;
   /** RAG 處理後的 chunk 數量 */
   chunk_count?: number;
+  /** 已索引（可供查詢）的頁數 */
+  pages_indexed?: number;
 }
 
 export interface RagProcessingLog {